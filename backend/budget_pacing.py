@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+预算节奏控制模块
+按租户在时间窗口内控制累计支出：在线调整一个影子价格（对偶变量），
+路由器在每次路由时以O(1)读取并从P2L系数中扣减 λ * 相对成本，
+无需对历史请求重新求解LP即可让整体支出贴合预算
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+
+class BudgetPacer:
+    """
+    单个租户的预算节奏控制器
+
+    每记录一笔支出c，按对偶梯度更新影子价格：
+        λ ← clip(λ + learning_rate * clip((c - ρ) / ρ, -1, 1), 0, max_shadow_price)
+    其中 ρ = 剩余预算 / 预计剩余请求数（按窗口内已观测的请求速率外推），
+    即保持窗口结束时恰好花完预算的单次请求目标支出。预算耗尽时λ取上限。
+    窗口结束后支出清零重新计算，λ保留作为下一窗口的初值。
+    """
+
+    def __init__(
+        self,
+        budget: float,
+        window: float = 30 * 24 * 3600.0,
+        learning_rate: float = 0.2,
+        max_shadow_price: float = 30.0,
+        min_elapsed: float = 60.0,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            budget: 时间窗口内的支出目标（美元）
+            window: 时间窗口（秒），默认30天
+            learning_rate: 影子价格的步长
+            max_shadow_price: 影子价格上限（P2L系数单位，λ=上限时最贵模型扣减该值）
+            min_elapsed: 估计请求速率时的最短观测时间（秒），避免窗口开始时速率估计发散
+            clock: 时钟（测试时可替换）
+        """
+        if budget <= 0:
+            raise ValueError("预算必须大于0")
+        self.budget = budget
+        self.window = window
+        self.learning_rate = learning_rate
+        self.max_shadow_price = max_shadow_price
+        self.min_elapsed = min_elapsed
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.window_start = clock()
+        self.spent = 0.0
+        self.requests = 0
+        self.shadow_price = 0.0
+
+    def _roll_window(self, now: float):
+        if now - self.window_start >= self.window:
+            windows = (now - self.window_start) // self.window
+            self.window_start += windows * self.window
+            self.spent = 0.0
+            self.requests = 0
+
+    def target_spend(self, now: Optional[float] = None) -> float:
+        """单次请求的目标支出ρ（剩余预算按预计剩余请求数均摊）"""
+        now = self._clock() if now is None else now
+        remaining_budget = self.budget - self.spent
+        if remaining_budget <= 0:
+            return 0.0
+        elapsed = max(now - self.window_start, self.min_elapsed)
+        remaining_time = max(self.window_start + self.window - now, 0.0)
+        expected_requests = max(self.requests / elapsed * remaining_time, 1.0)
+        return remaining_budget / expected_requests
+
+    def record_spend(self, cost: float):
+        """记录一次已路由请求的实际支出并更新影子价格"""
+        with self._lock:
+            now = self._clock()
+            self._roll_window(now)
+            target = self.target_spend(now)
+            self.spent += cost
+            self.requests += 1
+            if target <= 0:
+                self.shadow_price = self.max_shadow_price
+                return
+            error = min(max((cost - target) / target, -1.0), 1.0)
+            self.shadow_price = min(max(self.shadow_price + self.learning_rate * error, 0.0), self.max_shadow_price)
+
+    def current_shadow_price(self) -> float:
+        """路由使用的影子价格（新窗口开始时预算重新可用）"""
+        with self._lock:
+            self._roll_window(self._clock())
+            if self.spent >= self.budget:
+                return self.max_shadow_price
+            return self.shadow_price
+
+    def snapshot(self) -> Dict:
+        now = self._clock()
+        with self._lock:
+            self._roll_window(now)
+            elapsed = now - self.window_start
+            return {
+                "budget": self.budget,
+                "spent": round(self.spent, 6),
+                "requests": self.requests,
+                "shadow_price": round(self.max_shadow_price if self.spent >= self.budget else self.shadow_price, 4),
+                "target_spend_per_request": round(self.target_spend(now), 6),
+                "window_elapsed": round(elapsed / self.window, 4),
+                "budget_used": round(self.spent / self.budget, 4)
+            }
+
+
+class BudgetPacingRegistry:
+    """按租户管理预算节奏控制器，未配置预算的租户不做节奏控制"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        tenants: Optional[Dict[str, float]] = None,
+        default_budget: Optional[float] = None,
+        **pacer_kwargs
+    ):
+        """
+        Args:
+            enabled: 是否启用
+            tenants: 各租户在时间窗口内的预算 {tenant_id: budget}
+            default_budget: 未单独配置的租户的预算（None表示不控制）
+            pacer_kwargs: BudgetPacer参数（window、learning_rate等），所有租户共用
+        """
+        self.enabled = enabled
+        self.default_budget = default_budget
+        self._pacer_kwargs = pacer_kwargs
+        self._pacers: Dict[str, BudgetPacer] = {}
+        self._lock = threading.Lock()
+        for tenant_id, budget in (tenants or {}).items():
+            self.set_budget(tenant_id, budget)
+
+    def get(self, tenant_id: Optional[str]) -> Optional[BudgetPacer]:
+        """租户的控制器（未配置预算时为None）"""
+        if not self.enabled or not tenant_id:
+            return None
+        with self._lock:
+            pacer = self._pacers.get(tenant_id)
+            if pacer is None and self.default_budget:
+                pacer = self._pacers[tenant_id] = BudgetPacer(self.default_budget, **self._pacer_kwargs)
+            return pacer
+
+    def set_budget(self, tenant_id: str, budget: float) -> BudgetPacer:
+        """设置或更新租户预算（已有控制器保留支出和影子价格）"""
+        with self._lock:
+            pacer = self._pacers.get(tenant_id)
+            if pacer is None:
+                pacer = self._pacers[tenant_id] = BudgetPacer(budget, **self._pacer_kwargs)
+            elif budget <= 0:
+                raise ValueError("预算必须大于0")
+            else:
+                pacer.budget = budget
+            return pacer
+
+    def shadow_price(self, tenant_id: Optional[str]) -> float:
+        """租户当前的影子价格（未控制时为0）"""
+        pacer = self.get(tenant_id)
+        return pacer.current_shadow_price() if pacer is not None else 0.0
+
+    def record_spend(self, tenant_id: Optional[str], cost: float):
+        pacer = self.get(tenant_id)
+        if pacer is not None:
+            pacer.record_spend(cost)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """所有租户的预算节奏状态（用于监控接口）"""
+        with self._lock:
+            pacers = dict(self._pacers)
+        return {tenant_id: pacer.snapshot() for tenant_id, pacer in pacers.items()}
+
+
+@process_singleton
+def get_budget_pacing() -> BudgetPacingRegistry:
+    """进程级预算节奏控制（首次调用时按服务配置创建）"""
+    return BudgetPacingRegistry(**get_service_section("budget_pacing"))
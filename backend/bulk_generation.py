@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+批量生成模块
+把大量(模型, 消息, 参数)任务通过UnifiedLLMClient并发发出：按提供商限制并发、整体限制并发，
+结果按完成顺序流式返回，并逐条写入检查点文件，中断后用同一检查点重新运行时跳过已完成的任务
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Union
+
+try:
+    from .config import get_model_config
+    from .unified_client import UnifiedLLMClient
+    from .rate_limiting import BULK_QUEUE_PRIORITY
+except ImportError:
+    from config import get_model_config
+    from unified_client import UnifiedLLMClient
+    from rate_limiting import BULK_QUEUE_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BulkJob:
+    """单个生成任务（job_id用于检查点续跑，未指定时为任务在列表中的序号）"""
+    model: str
+    prompt: str = ""
+    messages: Optional[List[Dict[str, Any]]] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+    job_id: Optional[str] = None
+
+    @classmethod
+    def coerce(cls, job: Union["BulkJob", Dict[str, Any]], index: int) -> "BulkJob":
+        """接受BulkJob或字典（字段同BulkJob，id可写作"id"），补全job_id"""
+        if isinstance(job, dict):
+            job = dict(job)
+            job_id = job.pop("id", None) or job.pop("job_id", None)
+            job = cls(job_id=job_id, **job)
+        if job.job_id is None:
+            job.job_id = str(index)
+        return job
+
+
+class BulkGenerator:
+    """
+    批量生成调度器
+
+    每个提供商一个任务队列，由不超过该提供商并发上限的worker消费，所有worker共享一个全局并发上限；
+    某个提供商较慢时不会阻塞其他提供商的任务。每个任务在限流队列中使用批量优先级，
+    不与在线请求争抢配额。失败的任务也会返回（error=True），续跑时重新执行。
+    """
+
+    def __init__(
+        self,
+        client: Optional[UnifiedLLMClient] = None,
+        max_concurrency: int = 32,
+        provider_concurrency: int = 8,
+        provider_limits: Optional[Dict[str, int]] = None,
+        checkpoint_path: Optional[str] = None
+    ):
+        """
+        Args:
+            client: 上游客户端（默认新建，使用进程级连接池、限流与缓存）
+            max_concurrency: 全局同时进行的上游调用数
+            provider_concurrency: 单个提供商同时进行的上游调用数
+            provider_limits: 按提供商覆盖并发上限
+            checkpoint_path: 检查点文件（JSONL，每行一个已完成任务的结果），None表示不保存
+        """
+        self.client = client or UnifiedLLMClient()
+        self.max_concurrency = max_concurrency
+        self.provider_concurrency = provider_concurrency
+        self.provider_limits = dict(provider_limits or {})
+        self.checkpoint_path = checkpoint_path
+        self.stats = {"total": 0, "resumed": 0, "completed": 0, "failed": 0, "cost": 0.0, "elapsed": 0.0}
+
+    def load_checkpoint(self) -> Dict[str, Dict[str, Any]]:
+        """读取检查点中已成功完成的任务结果 {job_id: result}"""
+        completed = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return completed
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue  # 中断时写了一半的行
+                if result.get("error"):
+                    completed.pop(result.get("id"), None)
+                else:
+                    completed[result.get("id")] = result
+        return completed
+
+    def _write_checkpoint(self, result: Dict[str, Any]):
+        if not self.checkpoint_path:
+            return
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def _provider(self, model: str) -> Optional[str]:
+        model_config = get_model_config(model)
+        return model_config.get("provider") if model_config else None
+
+    async def _run_job(self, job: BulkJob, index: int) -> Dict[str, Any]:
+        kwargs = {"queue_priority": BULK_QUEUE_PRIORITY, **job.params}
+        if job.messages:
+            kwargs["messages"] = job.messages
+        try:
+            response = await self.client.generate_response(job.model, job.prompt, **kwargs)
+        except Exception as e:
+            logger.error(f"❌ 批量任务失败: {job.job_id} - {e}")
+            return {"id": job.job_id, "index": index, "model": job.model, "error": True, "content": str(e)}
+        return {
+            "id": job.job_id,
+            "index": index,
+            "model": response.model,
+            "content": response.content,
+            "tokens_used": response.tokens_used,
+            "cost": response.cost,
+            "response_time": round(response.response_time, 3),
+            "provider": response.provider,
+            "cached": response.cached,
+            "error": response.provider == "error"
+        }
+
+    async def run(self, jobs: Iterable[Union[BulkJob, Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        执行全部任务，按完成顺序逐个产出结果
+
+        检查点中已成功完成的任务不再执行，直接产出其结果（resumed=True）。
+        调用方中途停止迭代时取消尚未完成的任务。
+        """
+        start_time = time.time()
+        jobs = [BulkJob.coerce(job, i) for i, job in enumerate(jobs)]
+        completed = self.load_checkpoint()
+        self.stats.update(total=len(jobs), resumed=0, completed=0, failed=0, cost=0.0)
+
+        queues: Dict[str, deque] = {}
+        for index, job in enumerate(jobs):
+            if job.job_id in completed:
+                self.stats["resumed"] += 1
+                yield {**completed[job.job_id], "index": index, "resumed": True}
+                continue
+            provider = self._provider(job.model)
+            if provider is None:
+                result = {"id": job.job_id, "index": index, "model": job.model, "error": True,
+                          "content": f"不支持的模型: {job.model}"}
+                self.stats["failed"] += 1
+                yield result
+                continue
+            queues.setdefault(provider, deque()).append((index, job))
+
+        remaining = sum(len(queue) for queue in queues.values())
+        logger.info(f"📦 批量生成: {len(jobs)} 个任务, 续跑跳过 {self.stats['resumed']} 个, 待执行 {remaining} 个")
+        results: asyncio.Queue = asyncio.Queue()
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+
+        async def worker(queue: deque):
+            while queue:
+                index, job = queue.popleft()
+                async with global_limit:
+                    result = await self._run_job(job, index)
+                self._write_checkpoint(result)
+                await results.put(result)
+
+        workers = [
+            asyncio.create_task(worker(queue))
+            for provider, queue in queues.items()
+            for _ in range(min(self.provider_limits.get(provider, self.provider_concurrency), len(queue)))
+        ]
+        try:
+            for _ in range(remaining):
+                result = await results.get()
+                self.stats["failed" if result["error"] else "completed"] += 1
+                self.stats["cost"] += result.get("cost") or 0.0
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
+            if workers:
+                await asyncio.gather(*workers, return_exceptions=True)
+            self.stats["elapsed"] = round(time.time() - start_time, 3)
+            self.stats["cost"] = round(self.stats["cost"], 6)
+
+    async def run_all(self, jobs: Iterable[Union[BulkJob, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """执行全部任务，按任务顺序返回结果列表"""
+        results = [result async for result in self.run(jobs)]
+        return sorted(results, key=lambda result: result["index"])
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+聊天会话模块
+WebSocket聊天的服务端会话状态：对话历史、P2L系数缓存、上一轮选中的模型
+以及会话期间保持打开的上游LLM客户端连接
+"""
+
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+try:
+    from .unified_client import UnifiedLLMClient
+except ImportError:
+    from unified_client import UnifiedLLMClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatSession:
+    """单个WebSocket聊天会话的服务端状态"""
+    session_id: str
+    priority: str = "balanced"
+    enabled_models: Optional[List[str]] = None
+    budget: Optional[float] = None
+    tenant_id: Optional[str] = None  # 租户：路由使用其影子价格，每轮支出计入其预算节奏
+    max_history_messages: int = 40
+    coefficient_cache_size: int = 32
+
+    history: List[Dict[str, str]] = field(default_factory=list)
+    previous_model: Optional[str] = None
+    turns: int = 0
+    total_tokens: int = 0
+    total_cost: float = 0.0
+    connected: bool = False
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+
+    # P2L系数按(引擎, 提示词)缓存：重试/重新生成同一问题时不再重复推理
+    _coefficients: "OrderedDict[Hashable, np.ndarray]" = field(default_factory=OrderedDict)
+    _client: Optional[UnifiedLLMClient] = None
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def get_cached_coefficients(self, key: Hashable) -> Optional[np.ndarray]:
+        """获取缓存的P2L系数"""
+        coefficients = self._coefficients.get(key)
+        if coefficients is not None:
+            self._coefficients.move_to_end(key)
+        return coefficients
+
+    def cache_coefficients(self, key: Hashable, coefficients: np.ndarray):
+        """缓存P2L系数，超出容量时淘汰最久未使用的"""
+        self._coefficients[key] = coefficients
+        self._coefficients.move_to_end(key)
+        while len(self._coefficients) > self.coefficient_cache_size:
+            self._coefficients.popitem(last=False)
+
+    def build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """历史消息加上本轮用户消息，作为上游请求的messages"""
+        return self.history + [{"role": "user", "content": prompt}]
+
+    def add_turn(self, prompt: str, answer: str, model: str, tokens_used: int = 0, cost: float = 0.0):
+        """记录一轮完整对话，历史超出上限时丢弃最早的消息"""
+        self.history.append({"role": "user", "content": prompt})
+        self.history.append({"role": "assistant", "content": answer})
+        if len(self.history) > self.max_history_messages:
+            self.history = self.history[-self.max_history_messages:]
+        self.previous_model = model
+        self.turns += 1
+        self.total_tokens += tokens_used
+        self.total_cost += cost
+        self.touch()
+
+    def reset(self):
+        """清空对话历史（保留系数缓存和上游连接）"""
+        self.history = []
+        self.previous_model = None
+        self.touch()
+
+    async def get_client(self) -> UnifiedLLMClient:
+        """获取会话专属的上游客户端，连接在多轮对话间复用"""
+        if self._client is None:
+            self._client = UnifiedLLMClient()
+            await self._client.__aenter__()
+        return self._client
+
+    async def close(self):
+        """关闭上游连接"""
+        if self._client is not None:
+            client = self._client
+            self._client = None
+            await client.__aexit__(None, None, None)
+
+    def get_info(self) -> Dict:
+        """会话摘要"""
+        return {
+            "session_id": self.session_id,
+            "priority": self.priority,
+            "enabled_models": self.enabled_models,
+            "budget": self.budget,
+            "tenant_id": self.tenant_id,
+            "previous_model": self.previous_model,
+            "history_messages": len(self.history),
+            "turns": self.turns,
+            "total_tokens": self.total_tokens,
+            "total_cost": round(self.total_cost, 6),
+            "cached_coefficients": len(self._coefficients)
+        }
+
+
+class ChatSessionManager:
+    """
+    聊天会话管理器
+    断开连接后会话保留idle_timeout秒，客户端可携带session_id重连恢复
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800,
+        max_history_messages: int = 40,
+        coefficient_cache_size: int = 32
+    ):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_history_messages = max_history_messages
+        self.coefficient_cache_size = coefficient_cache_size
+        self.sessions: Dict[str, ChatSession] = {}
+        self.created = 0
+        self.resumed = 0
+        self.evicted = 0
+
+    async def open(self, session_id: Optional[str] = None, tenant_id: Optional[str] = None) -> ChatSession:
+        """恢复已有会话或创建新会话（指定tenant_id时设置会话的租户）"""
+        await self.evict_idle()
+
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None:
+            if session.connected:
+                raise ValueError(f"会话已在其他连接中使用: {session_id}")
+            self.resumed += 1
+        else:
+            if len(self.sessions) >= self.max_sessions:
+                await self._evict_oldest_detached()
+            if len(self.sessions) >= self.max_sessions:
+                raise ValueError(f"会话数已达上限 ({self.max_sessions})")
+            session = ChatSession(
+                session_id=uuid.uuid4().hex,
+                max_history_messages=self.max_history_messages,
+                coefficient_cache_size=self.coefficient_cache_size
+            )
+            self.sessions[session.session_id] = session
+            self.created += 1
+
+        if tenant_id is not None:
+            session.tenant_id = tenant_id
+        session.connected = True
+        session.touch()
+        return session
+
+    def detach(self, session: ChatSession):
+        """连接断开：会话保留以便重连"""
+        session.connected = False
+        session.touch()
+
+    async def close(self, session_id: str):
+        """删除会话并关闭其上游连接"""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.close()
+
+    async def evict_idle(self):
+        """淘汰空闲超时且未连接的会话"""
+        now = time.time()
+        expired = [
+            sid for sid, session in self.sessions.items()
+            if not session.connected and now - session.last_active > self.idle_timeout
+        ]
+        for sid in expired:
+            await self.close(sid)
+            self.evicted += 1
+        if expired:
+            logger.info(f"🧹 淘汰 {len(expired)} 个空闲聊天会话")
+
+    async def _evict_oldest_detached(self):
+        """会话数达到上限时淘汰最久未活跃的已断开会话"""
+        detached = [s for s in self.sessions.values() if not s.connected]
+        if detached:
+            oldest = min(detached, key=lambda s: s.last_active)
+            await self.close(oldest.session_id)
+            self.evicted += 1
+
+    async def close_all(self):
+        """关闭所有会话（服务关闭时调用）"""
+        for sid in list(self.sessions):
+            await self.close(sid)
+
+    def get_stats(self) -> Dict:
+        """会话统计"""
+        return {
+            "sessions": len(self.sessions),
+            "connected": sum(1 for s in self.sessions.values() if s.connected),
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "resumed": self.resumed,
+            "evicted": self.evicted
+        }
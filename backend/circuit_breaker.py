@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+熔断器模块
+按模型和提供商统计上游调用结果，错误率过高或连续超时时熔断，冷却后半开放行少量探测请求，
+UnifiedLLMClient在熔断期间直接失败，路由器排除熔断中的模型并对不稳定的模型降权
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断期间拒绝的调用"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    单个模型或提供商的熔断器
+
+    closed：正常放行，滑动窗口内错误率超过阈值（且请求数足够）或连续超时达到上限时熔断；
+    open：拒绝所有调用，冷却时间过后进入half_open；
+    half_open：最多放行half_open_probes个探测请求，成功则恢复closed，失败则再次熔断且冷却时间加倍。
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        min_requests: int = 5,
+        window: float = 60.0,
+        consecutive_timeouts: int = 3,
+        open_duration: float = 30.0,
+        max_open_duration: float = 300.0,
+        half_open_probes: int = 1,
+        min_failing_sources: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            failure_rate_threshold: 滑动窗口内触发熔断的错误率
+            min_requests: 按错误率判断前窗口内至少需要的请求数
+            window: 错误率的滑动窗口（秒）
+            consecutive_timeouts: 触发熔断的连续超时次数
+            open_duration: 首次熔断的冷却时间（秒）
+            max_open_duration: 探测失败后冷却时间加倍的上限（秒）
+            half_open_probes: 半开状态同时放行的探测请求数
+            min_failing_sources: 熔断前窗口内至少需要出错的来源数（提供商熔断器按模型区分来源）
+            clock: 时钟（测试时可替换）
+        """
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.consecutive_timeouts = consecutive_timeouts
+        self.open_duration = open_duration
+        self.max_open_duration = max_open_duration
+        self.half_open_probes = half_open_probes
+        self.min_failing_sources = min_failing_sources
+        self._clock = clock
+
+        self._state = CLOSED
+        self._outcomes = deque()  # (时间, 是否失败, 来源)
+        self._failures = 0
+        self._timeouts_in_row = 0
+        self._opened_at = 0.0
+        self._current_open_duration = open_duration
+        self._probes_in_flight = 0
+        self.trips = 0
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            _, failed, _ = self._outcomes.popleft()
+            self._failures -= failed
+
+    @property
+    def state(self) -> str:
+        """当前状态（冷却结束的open在读取时转为half_open）"""
+        if self._state == OPEN and self._clock() - self._opened_at >= self._current_open_duration:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    @property
+    def error_rate(self) -> float:
+        """滑动窗口内的错误率"""
+        self._prune(self._clock())
+        return self._failures / len(self._outcomes) if self._outcomes else 0.0
+
+    @property
+    def health(self) -> float:
+        """健康度：open为0，half_open为0.25，closed为 1 - 窗口错误率 / 2（不低于0.5）"""
+        state = self.state
+        if state == OPEN:
+            return 0.0
+        if state == HALF_OPEN:
+            return 0.25
+        return 1.0 - 0.5 * self.error_rate
+
+    def allow_request(self) -> bool:
+        """是否放行一次调用（half_open时占用一个探测名额）"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def _trip(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self.trips += 1
+
+    def record_success(self):
+        now = self._clock()
+        self._timeouts_in_row = 0
+        if self.state == HALF_OPEN:
+            # 探测成功：恢复并清空窗口，避免旧错误立即再次触发熔断
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._failures = 0
+            self._current_open_duration = self.open_duration
+            return
+        self._outcomes.append((now, False, None))
+        self._prune(now)
+
+    def _failing_sources(self) -> int:
+        return len({source for _, failed, source in self._outcomes if failed})
+
+    def record_failure(self, timeout: bool = False, source: Optional[str] = None):
+        now = self._clock()
+        state = self.state
+        if state == HALF_OPEN:
+            # 探测失败：再次熔断，冷却时间加倍
+            self._current_open_duration = min(self._current_open_duration * 2, self.max_open_duration)
+            self._trip(now)
+            return
+        if state == OPEN:
+            return
+
+        self._outcomes.append((now, True, source))
+        self._failures += 1
+        self._prune(now)
+        self._timeouts_in_row = self._timeouts_in_row + 1 if timeout else 0
+
+        if (self._timeouts_in_row >= self.consecutive_timeouts or (
+            len(self._outcomes) >= self.min_requests and self.error_rate >= self.failure_rate_threshold
+        )) and self._failing_sources() >= self.min_failing_sources:
+            self._timeouts_in_row = 0
+            self._trip(now)
+
+    def release(self):
+        """调用结束但结果不计入统计（如请求本身的错误），归还half_open的探测名额"""
+        if self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def snapshot(self) -> Dict:
+        state = self.state
+        snapshot = {
+            "state": state,
+            "error_rate": round(self.error_rate, 4),
+            "requests": len(self._outcomes),
+            "trips": self.trips
+        }
+        if state == OPEN:
+            snapshot["retry_in"] = round(self._current_open_duration - (self._clock() - self._opened_at), 2)
+        return snapshot
+
+
+class CircuitBreakerRegistry:
+    """
+    按模型和提供商管理熔断器
+
+    一次调用同时计入模型熔断器和提供商熔断器：单个模型故障只熔断该模型，
+    提供商整体故障（至少provider_min_failing_models个模型出错）会熔断该提供商的全部模型。
+    """
+
+    def __init__(self, enabled: bool = True, provider_min_failing_models: int = 2, **breaker_kwargs):
+        """
+        Args:
+            enabled: 是否启用（关闭时放行所有调用且不记录统计）
+            provider_min_failing_models: 提供商熔断前窗口内至少需要出错的模型数
+            breaker_kwargs: CircuitBreaker参数，模型与提供商熔断器共用
+        """
+        self.enabled = enabled
+        self._breaker_kwargs = breaker_kwargs
+        self._provider_kwargs = {**breaker_kwargs, "min_failing_sources": provider_min_failing_models}
+        self._models: Dict[str, CircuitBreaker] = {}
+        self._providers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, registry: Dict[str, CircuitBreaker], key: str) -> CircuitBreaker:
+        breaker = registry.get(key)
+        if breaker is None:
+            kwargs = self._provider_kwargs if registry is self._providers else self._breaker_kwargs
+            breaker = registry[key] = CircuitBreaker(**kwargs)
+        return breaker
+
+    def allow(self, model: str, provider: str) -> bool:
+        """模型和提供商都放行时才放行（half_open时占用探测名额）"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            provider_breaker = self._get(self._providers, provider)
+            model_breaker = self._get(self._models, model)
+            if not provider_breaker.allow_request():
+                return False
+            if not model_breaker.allow_request():
+                provider_breaker.release()
+                return False
+            return True
+
+    def record_success(self, model: str, provider: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(self._models, model).record_success()
+            self._get(self._providers, provider).record_success()
+
+    def record_failure(self, model: str, provider: str, timeout: bool = False):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(self._models, model).record_failure(timeout)
+            self._get(self._providers, provider).record_failure(timeout, source=model)
+
+    def release(self, model: str, provider: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(self._models, model).release()
+            self._get(self._providers, provider).release()
+
+    def state(self, model: str, provider: str) -> str:
+        """模型的有效状态：任一熔断器open即为open，其次half_open"""
+        with self._lock:
+            states = {self._get(self._models, model).state, self._get(self._providers, provider).state}
+        for state in (OPEN, HALF_OPEN):
+            if state in states:
+                return state
+        return CLOSED
+
+    def health(self, models: Sequence[str], providers: Sequence[str]) -> np.ndarray:
+        """
+        与models对齐的健康度 [M]，熔断中为0
+
+        模型健康度包含其错误率；提供商只在熔断或半开时生效，
+        避免单个模型出错拖累同一提供商的其他模型
+        """
+        result = np.ones(len(models))
+        with self._lock:
+            for i, (model, provider) in enumerate(zip(models, providers)):
+                model_breaker = self._models.get(model)
+                provider_breaker = self._providers.get(provider)
+                if model_breaker is not None:
+                    result[i] = model_breaker.health
+                if provider_breaker is not None and provider_breaker.state != CLOSED:
+                    result[i] = min(result[i], provider_breaker.health)
+        return result
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """所有熔断器的状态（用于监控接口）"""
+        with self._lock:
+            return {
+                "providers": {key: breaker.snapshot() for key, breaker in self._providers.items()},
+                "models": {key: breaker.snapshot() for key, breaker in self._models.items()}
+            }
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
+            self._providers.clear()
+
+
+@process_singleton
+def get_circuit_breakers() -> CircuitBreakerRegistry:
+    """进程级熔断器注册表（首次调用时按服务配置创建）"""
+    config = get_service_section("circuit_breaker")
+    config.pop("health_penalty", None)
+    return CircuitBreakerRegistry(**config)
@@ -7,7 +7,9 @@ Backend配置文件 - 统一版本
 import os
 import sys
 import logging
-from typing import Dict, Any
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, TypeVar
 
 # 添加model_p2l目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -68,6 +70,140 @@ def get_production_service_config() -> Dict[str, Any]:
             "timeout": 60,  # 增加超时时间
             "max_retries": 3,
         },
+        "requests": {
+            "default_timeout": float(os.getenv("P2L_REQUEST_TIMEOUT", 150)),  # 未携带截止时间请求头时的默认超时
+            "max_timeout": 600,           # 客户端可请求的最大超时
+            "inference_concurrency": 1,   # 同时进行的P2L推理数
+            "inference_max_pending": 64,  # 推理队列最大排队数
+        },
+        "p2l_checkpoints": {
+            "dir": os.getenv("P2L_CHECKPOINT_DIR", "/app/model_p2l/models"),  # 管理接口只能加载该目录下的checkpoint
+        },
+        "shadow": {
+            "model_path": os.getenv("P2L_SHADOW_MODEL_PATH"),  # 设置后启动时自动开启影子评估
+            "sample_rate": float(os.getenv("P2L_SHADOW_SAMPLE_RATE", 0.05)),
+            "cpu_budget": 0.2,            # 影子推理最多占用的时间比例
+            "batch_size": 8,
+            "max_queue": 256,
+            "log_path": "/app/logs/p2l_shadow.jsonl",
+        },
+        "chat_sessions": {
+            "max_sessions": 1000,         # 同时保留的WebSocket聊天会话上限
+            "idle_timeout": 1800,         # 断开后会话保留时间（秒），期间可携带session_id重连
+            "max_history_messages": 40,   # 每个会话保留的历史消息数
+            "coefficient_cache_size": 32, # 每个会话缓存的P2L系数条数
+        },
+        "latency_telemetry": {
+            "enabled": True,              # 速度评分使用实测延迟（样本不足时回退到avg_response_time）
+            "half_life": 3600,            # 样本权重半衰期（秒）
+            "quantile": 0.5,              # 路由使用的总延迟分位数
+            "prior_weight": 5,            # 配置值作为先验的等效样本数
+            "relative_accuracy": 0.02,    # 分位数草图相对误差
+            "refresh_interval": 1.0,      # 路由估计缓存时间（秒）
+        },
+        "circuit_breaker": {
+            "enabled": True,                   # 上游故障时快速失败，路由排除熔断中的模型
+            "failure_rate_threshold": 0.5,     # 滑动窗口内触发熔断的错误率
+            "min_requests": 5,                 # 按错误率判断前窗口内至少需要的请求数
+            "window": 60,                      # 错误率滑动窗口（秒）
+            "consecutive_timeouts": 3,         # 触发熔断的连续超时次数
+            "open_duration": 30,               # 熔断冷却时间（秒），探测失败后加倍
+            "max_open_duration": 300,          # 冷却时间上限（秒）
+            "half_open_probes": 1,             # 半开状态同时放行的探测请求数
+            "provider_min_failing_models": 2,  # 提供商熔断前至少需要出错的模型数
+            "health_penalty": 1.0,             # 不健康模型的P2L系数降权: penalty * (1 - 健康度)
+        },
+        "load_balancing": {
+            "enabled": True,                   # 按进行中请求数和近期429估计排队延迟，负载高峰时分散路由
+            "model_concurrency": 8,            # 单个模型的默认并发上限
+            "provider_concurrency": 32,        # 单个提供商的默认并发上限
+            "concurrency_limits": {},          # 按模型名或提供商名覆盖并发上限
+            "rate_limit_penalty": 2.0,         # 每次近期429增加的排队延迟（秒）
+            "rate_limit_half_life": 60,        # 429计数的半衰期（秒）
+            "max_utilization": 0.95,           # 利用率上限，避免延迟估计发散
+        },
+        "hedging": {
+            "enabled": True,                   # 主模型超过p90未返回首token时对冲到P2L排名中的下一个模型
+            "quantile": 0.9,                   # 对冲延迟使用的实测分位数
+            "min_delay": 0.5,                  # 对冲延迟下限（秒）
+            "max_hedge_rate": 0.1,             # 对冲请求占全部请求的比例上限
+            "burst": 5,                        # 允许短时间内连续对冲的次数
+        },
+        "budget_pacing": {
+            "enabled": True,                   # 按租户控制时间窗口内的累计支出（影子价格）
+            "tenants": {},                     # 各租户的预算（美元），例如 {"team-a": 500.0}
+            "default_budget": None,            # 未单独配置的租户的预算（None表示不控制）
+            "window": 30 * 24 * 3600,          # 预算时间窗口（秒）
+            "learning_rate": 0.2,              # 影子价格步长
+            "max_shadow_price": 30.0,          # 影子价格上限（预算耗尽时取该值）
+            "min_elapsed": 60,                 # 估计请求速率的最短观测时间（秒）
+        },
+        "connection_pool": {
+            "enabled": True,                   # 上游连接在请求之间共享（连接上限和超时见API配置）
+            "keepalive_timeout": 60,           # 空闲连接保留时间（秒）
+            "http2": False,                    # 通过httpx使用HTTP/2（需要安装httpx[http2]）
+            "prewarm": True,                   # 启动时预先建立到已配置密钥的提供商的连接
+            "prewarm_timeout": 5,              # 单个提供商预热的超时（秒）
+        },
+        "rate_limiting": {
+            "enabled": True,                   # 按提供商令牌桶限流排队，429/5xx按退避重试
+            "limits": {},                      # 各提供商限额，例如 {"openai": {"requests_per_minute": 500, "tokens_per_minute": 200000}}
+            "default_requests_per_minute": None,  # 未单独配置的提供商的每分钟请求数上限（None表示不限制）
+            "default_tokens_per_minute": None,    # 未单独配置的提供商的每分钟token数上限
+            "burst_seconds": 10,               # 令牌桶容量（按秒计的补充量）
+            "max_retries": 3,                  # 单次调用的最大重试次数
+            "backoff_base": 0.5,               # 指数退避初始等待（秒）
+            "backoff_max": 20,                 # 指数退避等待上限（秒）
+            "max_retry_after": 60,             # 可接受的Retry-After上限（秒）
+        },
+        "response_cache": {
+            "enabled": False,                  # temperature=0的相同请求直接返回缓存结果（默认关闭，按需开启）
+            "max_entries": 1024,               # 内存LRU层容量
+            "disk_path": None,                 # SQLite磁盘层路径，例如 "cache/llm_responses.sqlite"（None表示只用内存）
+            "max_disk_entries": 100000,        # 磁盘层容量（按最近访问时间淘汰）
+            "ttl": None,                       # 缓存有效期（秒），None表示不过期
+        },
+        "bulk_generation": {
+            "max_jobs": 10000,                 # 单次批量请求的任务数上限
+            "max_concurrency": 32,             # 全局同时进行的上游调用数
+            "provider_concurrency": 8,         # 单个提供商同时进行的上游调用数
+            "provider_limits": {},             # 按提供商覆盖并发上限
+            "checkpoint_dir": "/app/checkpoints/bulk",  # 检查点目录（请求中的checkpoint为文件名）
+        },
+        "cassette": {
+            "mode": "off",                     # 上游流量磁带：off / record（录制真实交互）/ replay（离线回放）
+            "path": None,                      # 磁带文件（.jsonl，以.gz结尾时压缩）
+            "time_scale": 1.0,                 # 回放时间缩放（1为原始时间，0为不等待）
+            "strict": False,                   # 回放时是否只接受请求内容完全一致的记录
+        },
+        "context_budget": {
+            "enabled": True,                   # 调用上游前按context_window/max_tokens预检并裁剪历史
+            "safety_margin": 0.05,             # 为token估算误差预留的上下文比例
+            "max_input_tokens": None,          # 输入token预算上限（None表示只受上下文窗口限制）
+            "min_output_tokens": 256,          # 收紧max_tokens时的下限，低于该值直接拒绝
+            "summarize": True,                 # 把被裁剪的轮次压缩成摘要保留
+            "summary_max_tokens": 200,         # 摘要的token上限
+            "calibration": {},                 # 各提供商的估算校准系数，例如 {"anthropic": 1.1}
+            "learn_calibration": True,         # 根据上游返回的实际输入token数修正校准系数
+        },
+        "compare": {
+            "max_k": 5,                        # 多模型对比接口一次最多并发生成的模型数
+        },
+        "routing": {
+            # 自定义优先模式：在performance/cost/speed/balanced之外按权重综合评分，all_modes请求中一并返回
+            # 例如 {"quality_value": {"p2l": 0.7, "cost": 0.3, "speed": 0.0}}
+            "custom_modes": {},
+            # 延迟SLO模式（priority="latency"）的完成时间预测参数
+            "latency_slo": {
+                "quantile": 0.9,                    # 首token延迟取p90、输出速度取p10
+                "ttft_ratio": 0.3,                  # 无实测数据时首token延迟占avg_response_time的比例
+                "reference_output_tokens": 300,     # avg_response_time对应的典型输出长度
+                "default_output_tokens": 400,       # 请求未给出expected_output_tokens时使用
+                "prefill_tokens_per_second": 2000,  # 提示词预填充速度
+            },
+            # 各模式的排队延迟权重（0表示不受负载影响），覆盖路由器默认值
+            "load_weights": {"performance": 0.0, "cost": 0.5, "speed": 1.0, "balanced": 0.5, "latency": 1.0},
+        },
         "resources": {
             "max_memory_mb": 3000,  # 最大内存使用
             "max_cpu_percent": 80,  # 最大CPU使用率
@@ -100,6 +236,136 @@ def get_development_service_config() -> Dict[str, Any]:
             "mock_mode": False,
             "timeout": 30,
             "max_retries": 2,
+        },
+        "requests": {
+            "default_timeout": 150,
+            "max_timeout": 600,
+            "inference_concurrency": 1,
+            "inference_max_pending": 64,
+        },
+        "p2l_checkpoints": {
+            "dir": os.getenv("P2L_CHECKPOINT_DIR", os.path.join(current_dir, "model_p2l", "models")),
+        },
+        "shadow": {
+            "model_path": os.getenv("P2L_SHADOW_MODEL_PATH"),
+            "sample_rate": 0.1,
+            "cpu_budget": 0.25,
+            "batch_size": 8,
+            "max_queue": 256,
+            "log_path": os.path.join(current_dir, "logs", "p2l_shadow.jsonl"),
+        },
+        "chat_sessions": {
+            "max_sessions": 100,
+            "idle_timeout": 1800,
+            "max_history_messages": 40,
+            "coefficient_cache_size": 32,
+        },
+        "latency_telemetry": {
+            "enabled": True,
+            "half_life": 3600,
+            "quantile": 0.5,
+            "prior_weight": 5,
+            "relative_accuracy": 0.02,
+            "refresh_interval": 1.0,
+        },
+        "circuit_breaker": {
+            "enabled": True,
+            "failure_rate_threshold": 0.5,
+            "min_requests": 5,
+            "window": 60,
+            "consecutive_timeouts": 3,
+            "open_duration": 30,
+            "max_open_duration": 300,
+            "half_open_probes": 1,
+            "provider_min_failing_models": 2,
+            "health_penalty": 1.0,
+        },
+        "load_balancing": {
+            "enabled": True,
+            "model_concurrency": 8,
+            "provider_concurrency": 32,
+            "concurrency_limits": {},
+            "rate_limit_penalty": 2.0,
+            "rate_limit_half_life": 60,
+            "max_utilization": 0.95,
+        },
+        "hedging": {
+            "enabled": True,
+            "quantile": 0.9,
+            "min_delay": 0.5,
+            "max_hedge_rate": 0.1,
+            "burst": 5,
+        },
+        "budget_pacing": {
+            "enabled": True,
+            "tenants": {},
+            "default_budget": None,
+            "window": 30 * 24 * 3600,
+            "learning_rate": 0.2,
+            "max_shadow_price": 30.0,
+            "min_elapsed": 60,
+        },
+        "connection_pool": {
+            "enabled": True,
+            "keepalive_timeout": 60,
+            "http2": False,
+            "prewarm": True,
+            "prewarm_timeout": 5,
+        },
+        "rate_limiting": {
+            "enabled": True,
+            "limits": {},
+            "default_requests_per_minute": None,
+            "default_tokens_per_minute": None,
+            "burst_seconds": 10,
+            "max_retries": 3,
+            "backoff_base": 0.5,
+            "backoff_max": 20,
+            "max_retry_after": 60,
+        },
+        "response_cache": {
+            "enabled": False,
+            "max_entries": 1024,
+            "disk_path": None,
+            "max_disk_entries": 100000,
+            "ttl": None,
+        },
+        "bulk_generation": {
+            "max_jobs": 10000,
+            "max_concurrency": 32,
+            "provider_concurrency": 8,
+            "provider_limits": {},
+            "checkpoint_dir": os.path.join(current_dir, "checkpoints", "bulk"),
+        },
+        "cassette": {
+            "mode": "off",
+            "path": None,
+            "time_scale": 1.0,
+            "strict": False,
+        },
+        "context_budget": {
+            "enabled": True,
+            "safety_margin": 0.05,
+            "max_input_tokens": None,
+            "min_output_tokens": 256,
+            "summarize": True,
+            "summary_max_tokens": 200,
+            "calibration": {},
+            "learn_calibration": True,
+        },
+        "compare": {
+            "max_k": 5,
+        },
+        "routing": {
+            "custom_modes": {},
+            "latency_slo": {
+                "quantile": 0.9,
+                "ttft_ratio": 0.3,
+                "reference_output_tokens": 300,
+                "default_output_tokens": 400,
+                "prefill_tokens_per_second": 2000,
+            },
+            "load_weights": {"performance": 0.0, "cost": 0.5, "speed": 1.0, "balanced": 0.5, "latency": 1.0},
         }
     }
 
@@ -216,6 +482,27 @@ def get_service_config() -> Dict[str, Any]:
             print(f"🛠️ 使用开发环境内置配置 (P2L_ENV={env})")
             return config
 
+def get_service_section(section: str) -> Dict[str, Any]:
+    """获取服务配置中的一节（副本，调用方可以修改）"""
+    return dict(get_service_config().get(section, {}))
+
+T = TypeVar("T")
+
+def process_singleton(factory: Callable[[], T]) -> Callable[[], T]:
+    """进程级实例装饰器：首次调用时执行factory创建实例（加锁保证只创建一次），之后返回同一实例"""
+    instance = []
+    lock = threading.Lock()
+
+    @wraps(factory)
+    def get_instance() -> T:
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    return get_instance
+
 # 初始化环境配置
 load_env_config()
 
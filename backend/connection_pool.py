@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+上游连接池模块
+按提供商（上游地址）维护长期存在的HTTP会话，在请求之间复用keep-alive连接，
+避免每次LLM调用重新进行DNS解析、TCP握手和TLS握手；支持启动预热与连接复用统计，
+可选通过httpx使用HTTP/2（需要安装h2）
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+try:
+    from .config import get_api_config, get_service_section, process_singleton
+except ImportError:
+    from config import get_api_config, get_service_section, process_singleton
+
+logger = logging.getLogger(__name__)
+
+
+class _PoolStats:
+    """单个上游的请求与连接计数"""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connect_time = 0.0
+        self.errors = 0
+        self.prewarmed = False
+
+    def snapshot(self, limit_per_host: int) -> Dict[str, Any]:
+        connections = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": round(self.in_flight / limit_per_host, 4) if limit_per_host else 0.0,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": round(self.connections_reused / connections, 4) if connections else 0.0,
+            "avg_connect_time": round(self.connect_time / self.connections_created, 4) if self.connections_created else 0.0,
+            "errors": self.errors,
+            "prewarmed": self.prewarmed
+        }
+
+
+class _TrackedRequest:
+    """包装会话的请求上下文，统计进行中的请求数"""
+
+    def __init__(self, request_context, stats: _PoolStats):
+        self._request_context = request_context
+        self._stats = stats
+
+    async def __aenter__(self):
+        self._stats.requests += 1
+        self._stats.in_flight += 1
+        self._stats.peak_in_flight = max(self._stats.peak_in_flight, self._stats.in_flight)
+        try:
+            return await self._request_context.__aenter__()
+        except BaseException:
+            self._stats.in_flight -= 1
+            self._stats.errors += 1
+            raise
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._stats.in_flight -= 1
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self._stats.errors += 1
+        return await self._request_context.__aexit__(exc_type, exc_val, exc_tb)
+
+
+class _HttpxResponse:
+    """把httpx响应适配为UnifiedLLMClient使用的aiohttp响应接口（status/text/json/按行迭代content）"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.content = self._iter_lines()
+
+    async def text(self) -> str:
+        await self._response.aread()
+        return self._response.text
+
+    async def json(self) -> Any:
+        await self._response.aread()
+        return json.loads(self._response.content)
+
+    async def _iter_lines(self):
+        async for line in self._response.aiter_lines():
+            yield line.encode("utf-8") + b"\n"
+
+
+class _HttpxRequest:
+    """httpx流式请求的异步上下文"""
+
+    def __init__(self, client, url: str, headers: Dict[str, str], json_body: Any, timeout=None):
+        self._client = client
+        self._request = client.build_request("POST", url, headers=headers, json=json_body,
+                                             timeout=_httpx_timeout(timeout))
+        self._response = None
+
+    async def __aenter__(self) -> _HttpxResponse:
+        self._response = await self._client.send(self._request, stream=True)
+        return _HttpxResponse(self._response)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._response is not None:
+            await self._response.aclose()
+
+
+class _HttpxSession:
+    """httpx HTTP/2客户端，接口与aiohttp.ClientSession的post/head一致"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def post(self, url: str, headers: Dict[str, str] = None, json: Any = None, timeout=None) -> _HttpxRequest:
+        return _HttpxRequest(self._client, url, headers or {}, json, timeout)
+
+    async def head(self, url: str, timeout=None):
+        return await self._client.head(url, timeout=_httpx_timeout(timeout))
+
+    @property
+    def closed(self) -> bool:
+        return self._client.is_closed
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def _httpx_timeout(timeout):
+    """aiohttp.ClientTimeout → httpx超时（httpx没有总超时，按读超时处理）"""
+    if timeout is None:
+        return None
+    import httpx
+    return httpx.Timeout(timeout.total, connect=timeout.connect)
+
+
+def _http2_available() -> bool:
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ConnectionPoolManager:
+    """
+    按上游地址（scheme://host:port）共享的连接池
+
+    每个上游一个会话和连接器，连接上限为limit_per_host、空闲连接保留keepalive_timeout秒；
+    会话绑定创建它的事件循环，在其他事件循环中使用时自动重建。
+    通过aiohttp的TraceConfig统计新建连接与复用连接次数。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        limit: int = 100,
+        limit_per_host: int = 30,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 60.0,
+        http2: bool = False,
+        prewarm: bool = True,
+        prewarm_timeout: float = 5.0,
+        connect_timeout: float = 30.0,
+        total_timeout: float = 180.0,
+        base_urls: Optional[Dict[str, str]] = None
+    ):
+        """
+        Args:
+            enabled: 是否在请求之间共享连接（关闭时UnifiedLLMClient每次进入上下文新建会话）
+            limit: 每个上游的连接总上限
+            limit_per_host: 每个上游主机的连接上限
+            ttl_dns_cache: DNS缓存时间（秒）
+            keepalive_timeout: 空闲连接保留时间（秒）
+            http2: 是否通过httpx使用HTTP/2（未安装httpx/h2时回退到aiohttp）
+            prewarm: 启动时是否预先建立到各提供商的连接
+            prewarm_timeout: 单个提供商预热的超时（秒）
+            connect_timeout: 建立连接的超时（秒）
+            total_timeout: 单次请求的默认总超时（秒）
+            base_urls: 提供商名称到上游地址的映射，用于预热和统计展示
+        """
+        self.enabled = enabled
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.prewarm_enabled = prewarm
+        self.prewarm_timeout = prewarm_timeout
+        self.connect_timeout = connect_timeout
+        self.total_timeout = total_timeout
+        self.base_urls = dict(base_urls or {})
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("⚠️ 未安装httpx[http2]，连接池回退到aiohttp（HTTP/1.1）")
+        self._sessions: Dict[str, Any] = {}
+        self._stats: Dict[str, _PoolStats] = {}
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def origin(url: str) -> str:
+        """上游地址（连接池的键）"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def provider_name(self, origin: str) -> str:
+        """上游地址对应的提供商名称（多个提供商共用地址时以逗号连接）"""
+        names = [name for name, url in self.base_urls.items() if url and self.origin(url) == origin]
+        return ",".join(names) or origin
+
+    def _stats_for(self, origin: str) -> _PoolStats:
+        stats = self._stats.get(origin)
+        if stats is None:
+            stats = self._stats[origin] = _PoolStats()
+        return stats
+
+    def _trace_config(self, stats: _PoolStats) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_start = time.monotonic()
+
+        async def on_connection_create_end(session, context, params):
+            stats.connections_created += 1
+            stats.connect_time += time.monotonic() - getattr(context, "connect_start", time.monotonic())
+
+        async def on_connection_reuseconn(session, context, params):
+            stats.connections_reused += 1
+
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def _create_session(self, stats: _PoolStats):
+        if self.http2:
+            import httpx
+            client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.limit_per_host,
+                    max_keepalive_connections=self.limit_per_host,
+                    keepalive_expiry=self.keepalive_timeout
+                ),
+                timeout=httpx.Timeout(self.total_timeout, connect=self.connect_timeout)
+            )
+            return _HttpxSession(client)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout),
+            trace_configs=[self._trace_config(stats)]
+        )
+
+    def session_for(self, url: str):
+        """上游地址对应的共享会话（首次使用时创建）"""
+        loop = asyncio.get_running_loop()
+        origin = self.origin(url)
+        with self._lock:
+            if self._loop is not loop:
+                # 会话不能跨事件循环使用：旧循环的会话随循环一起废弃
+                self._sessions = {}
+                self._loop = loop
+            session = self._sessions.get(origin)
+            if session is None or session.closed:
+                session = self._sessions[origin] = self._create_session(self._stats_for(origin))
+            return session
+
+    def post(self, url: str, headers: Dict[str, str], data: Dict[str, Any], timeout=None) -> _TrackedRequest:
+        """通过共享会话发送POST请求（用法与aiohttp.ClientSession.post相同）"""
+        session = self.session_for(url)
+        if timeout is None:
+            request_context = session.post(url, headers=headers, json=data)
+        else:
+            request_context = session.post(url, headers=headers, json=data, timeout=timeout)
+        return _TrackedRequest(request_context, self._stats_for(self.origin(url)))
+
+    async def prewarm(self, providers: Optional[Dict[str, str]] = None) -> Dict[str, bool]:
+        """
+        预先建立到各提供商的连接（DNS + TCP + TLS），之后的首次调用直接复用
+
+        Args:
+            providers: 提供商名称到上游地址的映射，默认使用配置中的全部地址
+
+        Returns:
+            各上游地址是否预热成功（服务端返回任何HTTP状态都视为成功）
+        """
+        origins = {self.origin(url) for url in (providers or self.base_urls).values() if url}
+        timeout = aiohttp.ClientTimeout(total=self.prewarm_timeout, connect=self.prewarm_timeout)
+
+        async def warm(origin: str) -> bool:
+            try:
+                session = self.session_for(origin)
+                if self.http2:
+                    await session.head(origin, timeout=timeout)
+                else:
+                    async with session.head(origin, timeout=timeout) as resp:
+                        await resp.read()
+                self._stats_for(origin).prewarmed = True
+                return True
+            except Exception as e:
+                logger.warning(f"⚠️ 连接预热失败 {origin}: {e}")
+                return False
+
+        results = await asyncio.gather(*(warm(origin) for origin in sorted(origins)))
+        warmed = dict(zip(sorted(origins), results))
+        logger.info(f"🔥 连接预热完成: {sum(results)}/{len(results)} 个上游")
+        return warmed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各上游的连接复用与利用率统计（用于监控接口）"""
+        with self._lock:
+            stats = dict(self._stats)
+            open_sessions = {origin for origin, session in self._sessions.items() if not session.closed}
+        return {
+            "enabled": self.enabled,
+            "http2": self.http2,
+            "keepalive_timeout": self.keepalive_timeout,
+            "limit_per_host": self.limit_per_host,
+            "upstreams": {
+                origin: {
+                    "provider": self.provider_name(origin),
+                    "open": origin in open_sessions,
+                    **item.snapshot(self.limit_per_host)
+                }
+                for origin, item in stats.items()
+            }
+        }
+
+    async def close(self):
+        """关闭全部共享会话（应用关闭时调用）"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions = {}
+            self._loop = None
+        for session in sessions:
+            try:
+                await session.close()
+            except Exception as e:
+                logger.warning(f"⚠️ 关闭上游连接失败: {e}")
+
+
+@process_singleton
+def get_connection_pool() -> ConnectionPoolManager:
+    """进程级共享连接池（首次调用时按API配置（连接上限、超时、上游地址）和服务配置（共享、预热、HTTP/2）创建）"""
+    api_config = get_api_config()
+    pool_config = dict(api_config.get("connection_pool", {}))
+    timeouts = api_config.get("timeouts", {})
+    pool_config.update(get_service_section("connection_pool"))
+    pool_config.setdefault("connect_timeout", timeouts.get("connect", 30))
+    pool_config.setdefault("total_timeout", timeouts.get("total", 180))
+    pool_config["base_urls"] = api_config.get("base_urls", {})
+    return ConnectionPoolManager(**pool_config)
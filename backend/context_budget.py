@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+上下文预算模块
+在调用上游之前按模型配置的context_window与max_tokens检查请求：历史过长时从最早的轮次开始裁剪
+（可选把被裁剪的轮次压缩成一段摘要），生成长度超过模型上限时收紧max_tokens，
+裁剪后仍无法放入上下文窗口的请求直接拒绝，不再等上游返回错误
+
+token数沿用token_estimator的字符类别估算，并按提供商乘以校准系数；
+校准系数可以在配置中给定，也可以根据上游返回的实际输入token数持续修正
+"""
+
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .config import get_service_section, process_singleton
+    from .token_estimator import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+except ImportError:
+    from config import get_service_section, process_singleton
+    from token_estimator import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# 校准系数的取值范围（防止个别异常用量把估算带偏）
+MIN_CALIBRATION = 0.5
+MAX_CALIBRATION = 2.0
+
+# 输入估算低于该值时不用于校准（短请求的格式开销占比过大）
+MIN_CALIBRATION_SAMPLE_TOKENS = 50
+
+# 摘要中每条被裁剪消息最多保留的字符数
+SUMMARY_CHARS_PER_MESSAGE = 200
+
+
+class ContextLimitExceeded(ValueError):
+    """请求在裁剪历史、收紧生成长度后仍超出模型上下文窗口"""
+
+
+@dataclass
+class PreflightResult:
+    """预检结果：实际发送的消息与max_tokens，以及裁剪情况"""
+    messages: Optional[List[Dict[str, Any]]]
+    max_tokens: int
+    input_tokens: int           # 校准后的输入token估算
+    raw_input_tokens: int       # 未校准的输入token估算（用于根据实际用量校准）
+    dropped_messages: int = 0
+    summarized: bool = False
+    clamped: bool = False
+
+
+class ContextBudget:
+    """
+    上下文预算
+
+    可用输入 = context_window × (1 - safety_margin) - max_tokens，另可用max_input_tokens再收紧；
+    超出时按轮次（以user消息开始）从最早的开始丢弃，system消息和最后一轮始终保留。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        safety_margin: float = 0.05,
+        max_input_tokens: Optional[int] = None,
+        min_output_tokens: int = 256,
+        summarize: bool = True,
+        summary_max_tokens: int = 200,
+        calibration: Optional[Dict[str, float]] = None,
+        learn_calibration: bool = True,
+        calibration_alpha: float = 0.1
+    ):
+        """
+        Args:
+            enabled: 是否启用预检（关闭时原样发送）
+            safety_margin: 上下文窗口中为估算误差预留的比例
+            max_input_tokens: 输入token预算上限（None表示只受上下文窗口限制）
+            min_output_tokens: 为放下输入而收紧max_tokens时，生成长度不低于该值，否则拒绝
+            summarize: 是否把被裁剪的轮次压缩成摘要附在保留的第一轮之前
+            summary_max_tokens: 摘要的token上限
+            calibration: 各提供商的初始校准系数（实际token数 / 估算token数）
+            learn_calibration: 是否根据上游返回的实际输入token数修正校准系数
+            calibration_alpha: 校准系数的指数滑动平均权重
+        """
+        self.enabled = enabled
+        self.safety_margin = safety_margin
+        self.max_input_tokens = max_input_tokens
+        self.min_output_tokens = min_output_tokens
+        self.summarize = summarize
+        self.summary_max_tokens = summary_max_tokens
+        self.calibration: Dict[str, float] = dict(calibration or {})
+        self.learn_calibration = learn_calibration
+        self.calibration_alpha = calibration_alpha
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "trimmed": 0, "dropped_messages": 0, "tokens_trimmed": 0,
+            "summarized": 0, "clamped": 0, "rejected": 0
+        }
+
+    # ---------- 估算与校准 ----------
+
+    def factor(self, provider: Optional[str]) -> float:
+        return self.calibration.get(provider, 1.0)
+
+    @staticmethod
+    def _raw_tokens(message: Dict[str, Any]) -> int:
+        return estimate_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+
+    def estimate(self, messages: List[Dict[str, Any]], provider: Optional[str] = None) -> int:
+        """按提供商校准后的消息token估算"""
+        return math.ceil(sum(self._raw_tokens(m) for m in messages) * self.factor(provider))
+
+    def observe(self, provider: str, raw_estimate: int, actual_input_tokens: Optional[int]):
+        """用上游返回的实际输入token数修正提供商的校准系数"""
+        if not self.learn_calibration or not actual_input_tokens or raw_estimate < MIN_CALIBRATION_SAMPLE_TOKENS:
+            return
+        ratio = min(max(actual_input_tokens / raw_estimate, MIN_CALIBRATION), MAX_CALIBRATION)
+        with self._lock:
+            current = self.calibration.get(provider, 1.0)
+            self.calibration[provider] = round(current + self.calibration_alpha * (ratio - current), 4)
+
+    # ---------- 预检 ----------
+
+    def preflight(
+        self,
+        model: str,
+        model_config: Dict[str, Any],
+        prompt: str,
+        messages: Optional[List[Dict[str, Any]]],
+        max_tokens: int
+    ) -> PreflightResult:
+        """
+        检查并裁剪请求
+
+        Args:
+            model: 模型名（用于日志和错误信息）
+            model_config: 模型配置（context_window、max_tokens、provider）
+            prompt: 提示词（没有messages时作为唯一一条user消息）
+            messages: 对话消息（已去除空消息）
+            max_tokens: 请求的生成长度上限
+
+        Raises:
+            ContextLimitExceeded: 裁剪和收紧生成长度后仍放不下
+        """
+        provider = model_config.get("provider")
+        sent = list(messages) if messages else [{"role": "user", "content": prompt}]
+        raw = sum(self._raw_tokens(m) for m in sent)
+        result = PreflightResult(messages=messages, max_tokens=max_tokens,
+                                 input_tokens=self.estimate(sent, provider), raw_input_tokens=raw)
+        with self._lock:
+            self.stats["requests"] += 1
+        if not self.enabled:
+            return result
+
+        # 生成长度不能超过模型输出上限
+        model_max_output = model_config.get("max_tokens")
+        if model_max_output and max_tokens > model_max_output:
+            result.max_tokens = model_max_output
+            result.clamped = True
+
+        context_window = model_config.get("context_window")
+        usable = int(context_window * (1 - self.safety_margin)) if context_window else None
+        budget = self._input_budget(usable, result.max_tokens)
+        if budget is not None and result.input_tokens > budget:
+            if messages:
+                # 需要摘要时为它预留空间
+                target = budget - self.summary_max_tokens if self.summarize else budget
+                kept, dropped = self._trim(sent, target, provider)
+                if dropped:
+                    if self.summarize:
+                        kept, result.summarized = self._summarize(kept, dropped, budget, provider)
+                    result.messages = kept
+                    result.dropped_messages = len(dropped)
+                    result.raw_input_tokens = sum(self._raw_tokens(m) for m in kept)
+                    result.input_tokens = self.estimate(kept, provider)
+
+            if result.input_tokens > budget and usable is not None:
+                # 裁剪到只剩最后一轮仍放不下：在生成长度不低于下限时收紧max_tokens
+                available = usable - result.input_tokens
+                input_cap = self.max_input_tokens if self.max_input_tokens is not None else math.inf
+                if available >= min(self.min_output_tokens, result.max_tokens) and result.input_tokens <= input_cap:
+                    result.max_tokens = min(result.max_tokens, available)
+                    result.clamped = True
+                else:
+                    self._record(result, rejected=True)
+                    raise ContextLimitExceeded(
+                        f"{model} 请求约 {result.input_tokens} 个输入token，加上生成长度 {result.max_tokens} "
+                        f"超出上下文窗口 {context_window}（输入预算 {budget}），请缩短最后一条消息"
+                    )
+            elif result.input_tokens > budget:
+                self._record(result, rejected=True)
+                raise ContextLimitExceeded(
+                    f"{model} 请求约 {result.input_tokens} 个输入token，超出输入预算 {budget}，请缩短最后一条消息"
+                )
+
+        self._record(result, trimmed_tokens=self.estimate(sent, provider) - result.input_tokens)
+        if result.dropped_messages or result.clamped:
+            logger.info(
+                f"✂️ {model} 上下文预检: 裁剪 {result.dropped_messages} 条消息, 输入约 {result.input_tokens} tokens, "
+                f"max_tokens={result.max_tokens}"
+            )
+        return result
+
+    def _input_budget(self, usable: Optional[int], max_tokens: int) -> Optional[int]:
+        budgets = []
+        if usable is not None:
+            budgets.append(usable - max_tokens)
+        if self.max_input_tokens is not None:
+            budgets.append(self.max_input_tokens)
+        return min(budgets) if budgets else None
+
+    def _trim(
+        self, messages: List[Dict[str, Any]], budget: int, provider: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """从最早的轮次开始丢弃，直到放入预算或只剩最后一轮；返回(保留的消息, 丢弃的消息)"""
+        system = [m for m in messages if m.get("role") == "system"]
+        turns: List[List[Dict[str, Any]]] = []
+        for message in messages:
+            if message.get("role") == "system":
+                continue
+            if message.get("role") == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+
+        factor = self.factor(provider)
+        total = sum(self._raw_tokens(m) for m in messages)
+        dropped = []
+        while len(turns) > 1 and math.ceil(total * factor) > budget:
+            turn = turns.pop(0)
+            dropped.extend(turn)
+            total -= sum(self._raw_tokens(m) for m in turn)
+        kept = system + [m for turn in turns for m in turn]
+        return kept, dropped
+
+    def _summarize(
+        self, kept: List[Dict[str, Any]], dropped: List[Dict[str, Any]], budget: int, provider: Optional[str]
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """把被丢弃的轮次压缩成摘要，附在保留的第一条非system消息之前（预算不足时不附加）"""
+        room = min(self.summary_max_tokens, budget - self.estimate(kept, provider))
+        header = f"[已省略较早的 {len(dropped)} 条对话，摘要如下]"
+        lines = []
+        used = estimate_tokens(header)
+        # 越近的轮次越相关：从后往前加入，直到用完摘要预算
+        for message in reversed(dropped):
+            content = " ".join(str(message.get("content", "")).split())
+            if len(content) > SUMMARY_CHARS_PER_MESSAGE:
+                content = content[:SUMMARY_CHARS_PER_MESSAGE] + "…"
+            line = f"{message.get('role')}: {content}"
+            cost = math.ceil((estimate_tokens(line) + 1) * self.factor(provider))
+            if used + cost > room:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return kept, False
+
+        summary = "\n".join([header] + list(reversed(lines)))
+        index = next(i for i, m in enumerate(kept) if m.get("role") != "system")
+        first = kept[index]
+        kept = list(kept)
+        kept[index] = {**first, "content": f"{summary}\n\n{first.get('content', '')}"}
+        return kept, True
+
+    def _record(self, result: PreflightResult, rejected: bool = False, trimmed_tokens: int = 0):
+        with self._lock:
+            if rejected:
+                self.stats["rejected"] += 1
+                return
+            if result.dropped_messages:
+                self.stats["trimmed"] += 1
+                self.stats["dropped_messages"] += result.dropped_messages
+                self.stats["tokens_trimmed"] += max(trimmed_tokens, 0)
+            self.stats["summarized"] += int(result.summarized)
+            self.stats["clamped"] += int(result.clamped)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """预检统计与各提供商的校准系数（用于监控接口）"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "safety_margin": self.safety_margin,
+                "max_input_tokens": self.max_input_tokens,
+                "calibration": dict(self.calibration),
+                **self.stats
+            }
+
+
+@process_singleton
+def get_context_budget() -> ContextBudget:
+    """进程级上下文预算（首次调用时按服务配置创建）"""
+    return ContextBudget(**get_service_section("context_budget"))
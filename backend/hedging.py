@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+请求对冲（hedging）模块
+主模型在其实测p90时间内仍未返回首个token时，向P2L排名中的下一个模型发送相同请求，
+采用先返回的结果并取消另一个，用对冲比例上限控制额外成本
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+
+class HedgingPolicy:
+    """
+    对冲策略与计数
+
+    对冲延迟取主模型实测分位数（流式调用为首token延迟，非流式为总延迟），不低于min_delay；
+    没有实测数据的模型不对冲。对冲比例用令牌桶限制：每个请求积累max_hedge_rate个令牌
+    （上限burst），每次对冲消耗1个，长期对冲比例不超过max_hedge_rate。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        quantile: float = 0.9,
+        min_delay: float = 0.5,
+        max_hedge_rate: float = 0.1,
+        burst: float = 5.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            enabled: 是否启用（关闭时只调用主模型）
+            quantile: 对冲延迟使用的实测分位数
+            min_delay: 对冲延迟下限（秒）
+            max_hedge_rate: 对冲请求占全部请求的比例上限
+            burst: 令牌桶容量（允许短时间内连续对冲的次数）
+            clock: 时钟（测试时可替换）
+        """
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_suppressed = 0
+
+    def hedge_delay(self, telemetry, model: str, streaming: bool = False) -> Optional[float]:
+        """主模型的对冲延迟（秒），没有实测数据时为None（不对冲）"""
+        observed = telemetry.estimate(model, "ttft" if streaming else "total", self.quantile)
+        if observed is None:
+            return None
+        return max(observed, self.min_delay)
+
+    def register_request(self):
+        """记录一个可对冲的请求（积累对冲令牌）"""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self._tokens + self.max_hedge_rate, self.burst)
+
+    def try_hedge(self) -> bool:
+        """是否允许发起一次对冲（允许时消耗一个令牌）"""
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.hedges_fired += 1
+                return True
+            self.hedges_suppressed += 1
+            return False
+
+    def record_win(self):
+        """对冲请求先于主模型返回"""
+        with self._lock:
+            self.hedges_won += 1
+
+    def snapshot(self) -> Dict:
+        """对冲计数（用于监控接口）"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self.requests,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "hedges_suppressed": self.hedges_suppressed,
+                "hedge_rate": round(self.hedges_fired / self.requests, 4) if self.requests else 0.0
+            }
+
+    def reset(self):
+        with self._lock:
+            self._tokens = self.burst
+            self.requests = self.hedges_fired = self.hedges_won = self.hedges_suppressed = 0
+
+
+@process_singleton
+def get_hedging_policy() -> HedgingPolicy:
+    """进程级对冲策略（首次调用时按服务配置创建）"""
+    return HedgingPolicy(**get_service_section("hedging"))
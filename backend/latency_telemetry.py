@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+延迟遥测模块
+按模型记录首token延迟、总延迟和输出速度（tokens/s），使用带时间衰减的流式分位数草图，
+路由器据此估计当前的响应时间，数据不足时回退到model_configs中的avg_response_time
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+# 记录的指标
+METRICS = ("ttft", "total", "tokens_per_second")
+
+
+class DecayingQuantileSketch:
+    """
+    带指数时间衰减的对数分桶分位数草图
+
+    第i个桶覆盖 (gamma^(i-1), gamma^i]，gamma = (1+a)/(1-a)，分位数的相对误差不超过a。
+    每个样本的权重按半衰期指数衰减，旧数据逐渐失去影响，内存固定为桶数。
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = 0.02,
+        half_life: float = 3600.0,
+        min_value: float = 1e-3,
+        max_value: float = 1e4,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            relative_accuracy: 分位数相对误差
+            half_life: 样本权重的半衰期（秒）
+            min_value / max_value: 可记录的取值范围，超出时截断到边界
+            clock: 时钟（测试时可替换）
+        """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.half_life = half_life
+        self.min_value = min_value
+        self.max_value = max_value
+        self._clock = clock
+        self._offset = self._bucket(min_value)
+        self._counts = np.zeros(self._bucket(max_value) - self._offset + 1)
+        self._last_decay = clock()
+
+    def _bucket(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _decay(self):
+        now = self._clock()
+        elapsed = now - self._last_decay
+        if elapsed > 0:
+            self._counts *= 0.5 ** (elapsed / self.half_life)
+            self._last_decay = now
+
+    def add(self, value: float, weight: float = 1.0):
+        """记录一个样本"""
+        self._decay()
+        value = min(max(value, self.min_value), self.max_value)
+        self._counts[self._bucket(value) - self._offset] += weight
+
+    @property
+    def weight(self) -> float:
+        """衰减后的有效样本数"""
+        self._decay()
+        return float(self._counts.sum())
+
+    def quantile(self, q: float) -> Optional[float]:
+        """分位数估计（无数据时为None）"""
+        self._decay()
+        cumulative = np.cumsum(self._counts)
+        total = cumulative[-1]
+        if total <= 0:
+            return None
+        i = int(np.searchsorted(cumulative, q * total, side="left"))
+        i = min(i, len(cumulative) - 1)
+        # 桶的代表值：区间 (gamma^(k-1), gamma^k] 的相对误差中点
+        return 2 * self.gamma ** (i + self._offset) / (self.gamma + 1)
+
+
+class ModelLatencyStats:
+    """单个模型的三项延迟指标"""
+
+    def __init__(self, **sketch_kwargs):
+        self.sketches = {
+            "ttft": DecayingQuantileSketch(**sketch_kwargs),
+            "total": DecayingQuantileSketch(**sketch_kwargs),
+            "tokens_per_second": DecayingQuantileSketch(**{**sketch_kwargs, "min_value": 0.1, "max_value": 1e5}),
+        }
+        self.requests = 0
+
+    def record(self, total_time: float, ttft: Optional[float] = None, output_tokens: Optional[int] = None):
+        self.requests += 1
+        self.sketches["total"].add(total_time)
+        if ttft is not None:
+            self.sketches["ttft"].add(ttft)
+        if output_tokens:
+            # 输出速度：流式调用排除首token前的等待，非流式按总耗时计算
+            generation_time = total_time - ttft if ttft is not None else total_time
+            if generation_time > 0:
+                self.sketches["tokens_per_second"].add(output_tokens / generation_time)
+
+
+class LatencyTelemetry:
+    """
+    按模型汇总的延迟遥测
+
+    UnifiedLLMClient在每次成功调用后记录；路由器通过estimate_response_times获取
+    与model_list对齐的响应时间估计，样本不足的模型向配置值收缩。
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: float = 0.02,
+        half_life: float = 3600.0,
+        quantile: float = 0.5,
+        prior_weight: float = 5.0,
+        refresh_interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            relative_accuracy: 分位数相对误差
+            half_life: 样本权重的半衰期（秒）
+            quantile: 路由使用的响应时间分位数（0.5为中位数）
+            prior_weight: 配置值作为先验的等效样本数，有效样本数越多越信任实测值
+            refresh_interval: 路由估计的缓存时间（秒），避免每次请求都重新计算分位数
+            clock: 时钟（测试时可替换）
+        """
+        self._sketch_kwargs = {"relative_accuracy": relative_accuracy, "half_life": half_life, "clock": clock}
+        self.quantile = quantile
+        self.prior_weight = prior_weight
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._models: Dict[str, ModelLatencyStats] = {}
+        self._lock = threading.Lock()
+        self._estimate_cache: Dict[tuple, tuple] = {}
+
+    def record(
+        self,
+        model: str,
+        total_time: float,
+        ttft: Optional[float] = None,
+        output_tokens: Optional[int] = None
+    ):
+        """
+        记录一次成功调用
+
+        Args:
+            model: 模型名
+            total_time: 总延迟（秒）
+            ttft: 首token延迟（秒，仅流式调用）
+            output_tokens: 输出token数（可选）
+        """
+        if total_time is None or total_time <= 0:
+            return
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                stats = self._models[model] = ModelLatencyStats(**self._sketch_kwargs)
+            stats.record(total_time, ttft, output_tokens)
+
+    def estimate(self, model: str, metric: str = "total", quantile: Optional[float] = None) -> Optional[float]:
+        """单个模型某项指标的分位数（无数据时为None）"""
+        if metric not in METRICS:
+            raise ValueError(f"未知的延迟指标: {metric}，可选: {list(METRICS)}")
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                return None
+            return stats.sketches[metric].quantile(self.quantile if quantile is None else quantile)
+
+    def estimate_metrics(self, models: Sequence[str], metric: str = "total", quantile: Optional[float] = None) -> tuple:
+        """
+        与models对齐的某项指标实测分位数和有效样本数（按refresh_interval缓存）
+
+        Returns:
+            (values [M]，无数据为NaN, weights [M])
+        """
+        if metric not in METRICS:
+            raise ValueError(f"未知的延迟指标: {metric}，可选: {list(METRICS)}")
+        quantile = self.quantile if quantile is None else quantile
+        key = (tuple(models), metric, quantile)
+        now = self._clock()
+        cached = self._estimate_cache.get(key)
+        if cached is not None and now - cached[0] < self.refresh_interval:
+            return cached[1], cached[2]
+
+        values = np.full(len(models), np.nan)
+        weights = np.zeros(len(models))
+        with self._lock:
+            for i, model in enumerate(models):
+                stats = self._models.get(model)
+                if stats is None:
+                    continue
+                sketch = stats.sketches[metric]
+                weight = sketch.weight
+                if weight > 0:
+                    values[i] = sketch.quantile(quantile)
+                    weights[i] = weight
+        self._estimate_cache[key] = (now, values, weights)
+        return values, weights
+
+    def estimate_response_times(self, models: Sequence[str], fallback: np.ndarray) -> np.ndarray:
+        """
+        路由使用的响应时间估计 [M]
+
+        实测分位数与配置值按有效样本数加权：(w * 实测 + prior_weight * 配置) / (w + prior_weight)，
+        没有实测数据的模型直接使用配置值。
+        """
+        return self.blend_metric(models, fallback, "total")
+
+    def blend_metric(
+        self,
+        models: Sequence[str],
+        fallback: np.ndarray,
+        metric: str,
+        quantile: Optional[float] = None
+    ) -> np.ndarray:
+        """某项指标的实测分位数按有效样本数向fallback收缩 [M]"""
+        values, weights = self.estimate_metrics(models, metric, quantile)
+        fallback = np.asarray(fallback, dtype=float)
+        blended = (np.nan_to_num(values) * weights + fallback * self.prior_weight) / (weights + self.prior_weight)
+        return np.where(weights > 0, blended, fallback)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各模型的延迟统计（用于健康检查与监控接口）"""
+        with self._lock:
+            result = {}
+            for model, stats in self._models.items():
+                entry = {"requests": stats.requests, "weight": round(stats.sketches["total"].weight, 2)}
+                for metric, sketch in stats.sketches.items():
+                    p50, p90 = sketch.quantile(0.5), sketch.quantile(0.9)
+                    entry[metric] = None if p50 is None else {"p50": round(p50, 4), "p90": round(p90, 4)}
+                result[model] = entry
+            return result
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self._models.clear()
+            self._estimate_cache.clear()
+
+
+@process_singleton
+def get_latency_telemetry() -> LatencyTelemetry:
+    """进程级延迟遥测实例（首次调用时按服务配置创建）"""
+    config = get_service_section("latency_telemetry")
+    config.pop("enabled", None)
+    return LatencyTelemetry(**config)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+上游LLM流量录制/回放模块
+record模式把真实的上游请求与响应（状态码、关键响应头、按到达时间标记的响应分块）逐条写入磁带文件，
+replay模式不访问网络，按原始或缩放后的时间重放这些响应，用于离线的端到端性能回归：
+同一盘磁带在改动前后各回放一次，比较服务本身的耗时变化
+
+磁带为JSONL（路径以.gz结尾时gzip压缩），每行一次交互，不保存请求头（API Key不会落盘）：
+    {"key": ..., "endpoint": "completions", "model": ..., "stream": true, "status": 200,
+     "headers": {"content-type": ...}, "headers_at": 0.21, "chunks": [[0.35, "data: {...}\\n"], ...]}
+
+UnifiedLLMClient通过 _post 使用本模块；p2l/route/chat.py的OpenAI/Anthropic SDK客户端通过
+Cassette.httpx_transport() 得到的httpx传输层使用（见 route.chat.set_http_client）
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from multidict import CIMultiDict
+
+try:
+    from .config import get_service_section, process_singleton
+    from .response_cache import normalize_messages, CACHE_KEY_PARAMS
+except ImportError:
+    from config import get_service_section, process_singleton
+    from response_cache import normalize_messages, CACHE_KEY_PARAMS
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODES = ("off", "record", "replay")
+
+# 录制的响应头（Retry-After用于回放限流，Content-Type用于SDK解析）
+RECORDED_HEADERS = ("content-type", "retry-after")
+
+
+class CassetteMiss(LookupError):
+    """回放时磁带中没有匹配的请求"""
+
+
+def interaction_key(endpoint: str, body: Dict[str, Any]) -> str:
+    """请求的匹配键：接口类型、模型、规范化消息、生成参数和是否流式"""
+    material = {
+        "endpoint": endpoint,
+        "model": body.get("model"),
+        "system": body.get("system"),
+        "messages": normalize_messages(body.get("messages")),
+        "params": {name: body[name] for name in CACHE_KEY_PARAMS if body.get(name) is not None},
+        "stream": bool(body.get("stream"))
+    }
+    encoded = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _endpoint(url: str) -> str:
+    """接口类型（URL路径最后一段：completions或messages），与BASE_URL无关"""
+    return urlsplit(str(url)).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+class Cassette:
+    """
+    上游流量磁带
+
+    回放时先按匹配键查找；同一请求录制了多次时按录制顺序依次返回，用完后重复最后一次。
+    非严格模式下匹配键未命中（例如改动了提示词）时，按录制顺序使用同一模型、同一流式类型的下一条记录，
+    这样请求内容有差异时仍能得到相同的上游时间特征。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        mode: str = "off",
+        time_scale: float = 1.0,
+        strict: bool = False
+    ):
+        """
+        Args:
+            path: 磁带文件路径（.jsonl或.jsonl.gz）
+            mode: off（不录制也不回放）、record（调用上游并追加录制）、replay（只从磁带回放）
+            time_scale: 回放时所有时间乘以该系数（1为原始时间，0为不等待）
+            strict: 回放时是否只接受匹配键完全一致的记录
+        """
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"未知的磁带模式: {mode}（可选 {', '.join(CASSETTE_MODES)}）")
+        if mode != "off" and not path:
+            raise ValueError(f"磁带模式 {mode} 需要指定磁带路径")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, deque] = defaultdict(deque)
+        self._by_model: Dict[Tuple[str, bool], deque] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self.loaded = 0
+        self.stats = {"recorded": 0, "replayed": 0, "fallback": 0, "misses": 0}
+        if mode == "replay":
+            self.load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    # ---------- 磁带文件 ----------
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def load(self) -> int:
+        """读取磁带，返回交互数"""
+        self._by_key.clear()
+        self._by_model.clear()
+        self._last.clear()
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"磁带文件不存在: {self.path}")
+        count = 0
+        with self._open("r") as f:
+            for line in f:
+                try:
+                    interaction = json.loads(line)
+                except ValueError:
+                    continue  # 录制中断时写了一半的行
+                self._by_key[interaction["key"]].append(interaction)
+                self._by_model[(interaction.get("model"), bool(interaction.get("stream")))].append(interaction)
+                count += 1
+        self.loaded = count
+        logger.info(f"📼 已加载磁带: {self.path} ({count} 次交互)")
+        return count
+
+    def _append(self, interaction: Dict[str, Any]):
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._open("a") as f:
+                f.write(json.dumps(interaction, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.stats["recorded"] += 1
+
+    # ---------- 录制 ----------
+
+    def _new_interaction(self, url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        endpoint = _endpoint(url)
+        return {
+            "key": interaction_key(endpoint, body),
+            "endpoint": endpoint,
+            "model": body.get("model"),
+            "stream": bool(body.get("stream")),
+            "status": None,
+            "headers": {},
+            "headers_at": 0.0,
+            "chunks": []
+        }
+
+    @staticmethod
+    def _recorded_headers(headers) -> Dict[str, str]:
+        return {name: headers[name] for name in RECORDED_HEADERS if headers.get(name) is not None}
+
+    def record(self, url: str, body: Dict[str, Any], request_context) -> "_RecordingRequest":
+        """包装真实请求的异步上下文（aiohttp风格），响应读取完毕后写入磁带"""
+        return _RecordingRequest(self, self._new_interaction(url, body), request_context)
+
+    # ---------- 回放 ----------
+
+    def find(self, url: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """查找请求对应的录制记录"""
+        endpoint = _endpoint(url)
+        key = interaction_key(endpoint, body)
+        with self._lock:
+            queue = self._by_key.get(key)
+            if queue:
+                interaction = queue.popleft()
+                self._last[key] = interaction
+                self.stats["replayed"] += 1
+                return interaction
+            if key in self._last:
+                self.stats["replayed"] += 1
+                return self._last[key]
+            if not self.strict:
+                queue = self._by_model.get((body.get("model"), bool(body.get("stream"))))
+                if queue:
+                    interaction = queue.popleft()
+                    queue.append(interaction)  # 循环使用
+                    self.stats["fallback"] += 1
+                    return interaction
+            self.stats["misses"] += 1
+        raise CassetteMiss(f"磁带中没有匹配的请求: {endpoint} {body.get('model')}")
+
+    def replay(self, url: str, body: Dict[str, Any], timeout=None) -> "_ReplayRequest":
+        """回放请求的异步上下文（aiohttp风格），超时取timeout.total"""
+        total = getattr(timeout, "total", None)
+        return _ReplayRequest(self, url, body, total)
+
+    # ---------- httpx传输层（OpenAI/Anthropic SDK） ----------
+
+    def httpx_transport(self, wrapped=None):
+        """
+        同步httpx传输层，用于 httpx.Client(transport=...)
+
+        record模式通过wrapped（默认httpx.HTTPTransport()）访问上游并录制，replay模式直接回放
+        """
+        return _make_httpx_transport(self, wrapped)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """录制/回放统计（用于监控接口）"""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "time_scale": self.time_scale,
+                "strict": self.strict,
+                "loaded": self.loaded,
+                **self.stats
+            }
+
+
+class _RecordingContent:
+    """按行迭代上游响应内容，同时记录每行的到达时间"""
+
+    def __init__(self, content, interaction: Dict[str, Any], start: float):
+        self._content = content
+        self._interaction = interaction
+        self._start = start
+        self.completed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        async for line in self._content:
+            self._interaction["chunks"].append(
+                [round(time.monotonic() - self._start, 4), line.decode("utf-8", errors="replace")]
+            )
+            yield line
+        self.completed = True
+
+
+class _RecordingResponse:
+    """录制中的响应，接口与aiohttp响应一致（status/headers/text/json/content）"""
+
+    def __init__(self, response, interaction: Dict[str, Any], start: float):
+        self._response = response
+        self._interaction = interaction
+        self._start = start
+        self.status = response.status
+        self.headers = response.headers
+        self.content = _RecordingContent(response.content, interaction, start)
+
+    @property
+    def completed(self) -> bool:
+        return self.content.completed
+
+    async def text(self) -> str:
+        text = await self._response.text()
+        self._interaction["chunks"].append([round(time.monotonic() - self._start, 4), text])
+        self.content.completed = True
+        return text
+
+    async def json(self) -> Any:
+        return json.loads(await self.text())
+
+
+class _RecordingRequest:
+    def __init__(self, cassette: Cassette, interaction: Dict[str, Any], request_context):
+        self._cassette = cassette
+        self._interaction = interaction
+        self._request_context = request_context
+        self._start = 0.0
+        self._response = None
+
+    async def __aenter__(self) -> _RecordingResponse:
+        self._start = time.monotonic()
+        response = await self._request_context.__aenter__()
+        self._interaction["status"] = response.status
+        self._interaction["headers"] = Cassette._recorded_headers(response.headers)
+        self._interaction["headers_at"] = round(time.monotonic() - self._start, 4)
+        self._response = _RecordingResponse(response, self._interaction, self._start)
+        return self._response
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._response is not None and exc_type is None and not self._response.completed:
+                # 正常退出但未读到末尾（如读到[DONE]即停止）：读完剩余内容一并录制
+                try:
+                    async for _ in self._response.content:
+                        pass
+                except Exception as e:
+                    logger.warning(f"⚠️ 录制时读取剩余响应失败，本次交互不写入磁带: {e}")
+            return await self._request_context.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            # 只写入完整读取的响应（含错误响应），调用方中途放弃的流（如对冲落败）不写入磁带
+            if self._response is not None and self._response.completed:
+                self._cassette._append(self._interaction)
+
+
+class _ReplayResponse:
+    """回放的响应：按录制的时间偏移产出内容"""
+
+    def __init__(self, interaction: Dict[str, Any], wait: Callable):
+        self._interaction = interaction
+        self._wait = wait
+        self.status = interaction["status"]
+        self.headers = CIMultiDict(interaction.get("headers") or {})
+        self.content = self._iter_lines()
+
+    async def _iter_lines(self):
+        for offset, chunk in self._interaction["chunks"]:
+            await self._wait(offset)
+            for line in chunk.splitlines(keepends=True):
+                yield line.encode("utf-8")
+
+    async def text(self) -> str:
+        chunks = self._interaction["chunks"]
+        if chunks:
+            await self._wait(chunks[-1][0])
+        return "".join(chunk for _, chunk in chunks)
+
+    async def json(self) -> Any:
+        return json.loads(await self.text())
+
+
+class _ReplayRequest:
+    def __init__(self, cassette: Cassette, url: str, body: Dict[str, Any], timeout: Optional[float]):
+        self._cassette = cassette
+        self._url = url
+        self._body = body
+        self._timeout = timeout
+        self._start = 0.0
+
+    async def _wait(self, offset: float):
+        """等待到请求开始后的offset（按time_scale缩放），超过超时时间时抛出TimeoutError"""
+        target = offset * self._cassette.time_scale
+        if self._timeout is not None and target > self._timeout:
+            await asyncio.sleep(max(0.0, self._start + self._timeout - time.monotonic()))
+            raise asyncio.TimeoutError()
+        delay = self._start + target - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __aenter__(self) -> _ReplayResponse:
+        self._start = time.monotonic()
+        interaction = self._cassette.find(self._url, self._body)
+        await self._wait(interaction.get("headers_at", 0.0))
+        return _ReplayResponse(interaction, self._wait)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+def _make_httpx_transport(cassette: Cassette, wrapped=None):
+    import httpx
+
+    class _RecordingStream(httpx.SyncByteStream):
+        """边读取上游响应边记录分块，关闭时写入磁带"""
+
+        def __init__(self, stream, interaction: Dict[str, Any], start: float):
+            self._stream = stream
+            self._interaction = interaction
+            self._start = start
+            self._completed = False
+
+        def __iter__(self) -> Iterator[bytes]:
+            for chunk in self._stream:
+                self._interaction["chunks"].append(
+                    [round(time.monotonic() - self._start, 4), chunk.decode("utf-8", errors="replace")]
+                )
+                yield chunk
+            self._completed = True
+
+        def close(self):
+            try:
+                self._stream.close()
+            finally:
+                if self._completed:
+                    cassette._append(self._interaction)
+
+    class _ReplayStream(httpx.SyncByteStream):
+        def __init__(self, chunks: List, start: float):
+            self._chunks = chunks
+            self._start = start
+
+        def __iter__(self) -> Iterator[bytes]:
+            for offset, chunk in self._chunks:
+                delay = self._start + offset * cassette.time_scale - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                yield chunk.encode("utf-8")
+
+    class CassetteTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._wrapped = wrapped
+
+        def handle_request(self, request: "httpx.Request") -> "httpx.Response":
+            start = time.monotonic()
+            try:
+                body = json.loads(request.read() or b"{}")
+            except ValueError:
+                body = {}
+
+            if cassette.replaying:
+                interaction = cassette.find(str(request.url), body)
+                delay = start + interaction.get("headers_at", 0.0) * cassette.time_scale - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                return httpx.Response(
+                    interaction["status"], headers=interaction.get("headers") or {},
+                    stream=_ReplayStream(interaction["chunks"], start), request=request
+                )
+
+            if self._wrapped is None:
+                self._wrapped = httpx.HTTPTransport()
+            response = self._wrapped.handle_request(request)
+            if not cassette.recording:
+                return response
+            interaction = cassette._new_interaction(str(request.url), body)
+            interaction["status"] = response.status_code
+            interaction["headers"] = Cassette._recorded_headers(response.headers)
+            interaction["headers_at"] = round(time.monotonic() - start, 4)
+            # 录制的是解码后的内容，去掉压缩相关的响应头
+            headers = [(k, v) for k, v in response.headers.items() if k.lower() not in ("content-encoding", "content-length")]
+            return httpx.Response(
+                response.status_code, headers=headers,
+                stream=_RecordingStream(_decoded(response), interaction, start),
+                request=request, extensions=response.extensions
+            )
+
+        def close(self):
+            if self._wrapped is not None:
+                self._wrapped.close()
+
+    return CassetteTransport()
+
+
+def _decoded(response) -> Iterator[bytes]:
+    """上游响应解码后的字节流（读取完毕后关闭底层连接）"""
+    try:
+        for chunk in response.iter_bytes():
+            yield chunk
+    finally:
+        response.close()
+
+
+@process_singleton
+def get_cassette() -> Cassette:
+    """进程级磁带（首次调用时按服务配置创建，默认关闭）"""
+    config = get_service_section("cassette")
+    try:
+        return Cassette(**config)
+    except (ValueError, OSError) as e:
+        logger.error(f"❌ 磁带配置无效，已关闭录制/回放: {e}")
+        return Cassette()
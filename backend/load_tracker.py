@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+负载跟踪模块
+按模型和提供商统计进行中的请求数和近期429次数，估计排队延迟，
+路由器据此在负载高峰时把请求分散到相近的模型上
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+
+class LoadTracker:
+    """
+    进行中请求数与限流统计
+
+    UnifiedLLMClient在调用开始时acquire、结束时release（429时标记rate_limited）。
+    排队延迟按单服务台近似：利用率 rho = 进行中请求数 / 并发上限（取模型与提供商的较大值），
+    延迟 = 服务时间 * rho / (1 - rho)，再加上每次近期429的惩罚（429计数按半衰期指数衰减）。
+    """
+
+    def __init__(
+        self,
+        model_concurrency: int = 8,
+        provider_concurrency: int = 32,
+        concurrency_limits: Optional[Dict[str, int]] = None,
+        rate_limit_penalty: float = 2.0,
+        rate_limit_half_life: float = 60.0,
+        max_utilization: float = 0.95,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            model_concurrency: 单个模型的默认并发上限
+            provider_concurrency: 单个提供商的默认并发上限
+            concurrency_limits: 按模型名或提供商名覆盖并发上限（可选）
+            rate_limit_penalty: 每次近期429增加的排队延迟（秒）
+            rate_limit_half_life: 429计数的半衰期（秒）
+            max_utilization: 利用率上限，避免延迟估计发散
+            clock: 时钟（测试时可替换）
+        """
+        self.model_concurrency = model_concurrency
+        self.provider_concurrency = provider_concurrency
+        self.concurrency_limits = dict(concurrency_limits or {})
+        self.rate_limit_penalty = rate_limit_penalty
+        self.rate_limit_half_life = rate_limit_half_life
+        self.max_utilization = max_utilization
+        self._clock = clock
+        self._in_flight: Dict[str, int] = {}
+        self._rate_limits: Dict[str, tuple] = {}  # 键 -> (衰减后的计数, 更新时间)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _provider_key(provider: str) -> str:
+        return f"provider:{provider}"
+
+    def _decayed(self, key: str, now: float) -> float:
+        count, updated = self._rate_limits.get(key, (0.0, now))
+        return count * 0.5 ** ((now - updated) / self.rate_limit_half_life)
+
+    def acquire(self, model: str, provider: str):
+        """记录一个开始的请求"""
+        with self._lock:
+            for key in (model, self._provider_key(provider)):
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+    def release(self, model: str, provider: str, rate_limited: bool = False):
+        """记录一个结束的请求（rate_limited表示上游返回了429）"""
+        with self._lock:
+            for key in (model, self._provider_key(provider)):
+                self._in_flight[key] = max(self._in_flight.get(key, 0) - 1, 0)
+            if rate_limited:
+                self._record_rate_limit(model, provider)
+
+    def record_rate_limit(self, model: str, provider: str):
+        """记录一次429（请求随后被重试、尚未结束时使用）"""
+        with self._lock:
+            self._record_rate_limit(model, provider)
+
+    def _record_rate_limit(self, model: str, provider: str):
+        now = self._clock()
+        for key in (model, self._provider_key(provider)):
+            self._rate_limits[key] = (self._decayed(key, now) + 1.0, now)
+
+    def in_flight(self, name: str, provider: bool = False) -> int:
+        """模型（或提供商）当前进行中的请求数"""
+        with self._lock:
+            return self._in_flight.get(self._provider_key(name) if provider else name, 0)
+
+    def _limit(self, name: str, default: int) -> int:
+        return max(int(self.concurrency_limits.get(name, default)), 1)
+
+    def queueing_delays(
+        self,
+        models: Sequence[str],
+        providers: Sequence[str],
+        service_times: np.ndarray
+    ) -> np.ndarray:
+        """
+        与models对齐的排队延迟估计（秒）[M]
+
+        Args:
+            models: 模型列表
+            providers: 与models对齐的提供商
+            service_times: 与models对齐的服务时间（响应时间估计）
+        """
+        now = self._clock()
+        utilization = np.zeros(len(models))
+        rate_limits = np.zeros(len(models))
+        with self._lock:
+            if not self._in_flight and not self._rate_limits:
+                return utilization
+            for i, (model, provider) in enumerate(zip(models, providers)):
+                provider_key = self._provider_key(provider)
+                utilization[i] = max(
+                    self._in_flight.get(model, 0) / self._limit(model, self.model_concurrency),
+                    self._in_flight.get(provider_key, 0) / self._limit(provider, self.provider_concurrency)
+                )
+                rate_limits[i] = self._decayed(model, now) + self._decayed(provider_key, now)
+
+        rho = np.minimum(utilization, self.max_utilization)
+        return np.asarray(service_times, dtype=float) * rho / (1 - rho) + self.rate_limit_penalty * rate_limits
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """进行中请求数与近期429计数（用于监控接口）"""
+        now = self._clock()
+        with self._lock:
+            keys = set(self._in_flight) | set(self._rate_limits)
+            result = {"models": {}, "providers": {}}
+            for key in sorted(keys):
+                provider = key.startswith("provider:")
+                name = key[len("provider:"):] if provider else key
+                result["providers" if provider else "models"][name] = {
+                    "in_flight": self._in_flight.get(key, 0),
+                    "recent_rate_limits": round(self._decayed(key, now), 3)
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._in_flight.clear()
+            self._rate_limits.clear()
+
+
+@process_singleton
+def get_load_tracker() -> LoadTracker:
+    """进程级负载跟踪实例（首次调用时按服务配置创建）"""
+    config = get_service_section("load_balancing")
+    config.pop("enabled", None)
+    return LoadTracker(**config)
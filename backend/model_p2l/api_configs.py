@@ -128,6 +128,174 @@ SERVICE_CONFIG = {
     "logging": {
         "level": "INFO",
         "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    },
+    
+    # 请求控制配置 - 截止时间与P2L推理队列
+    "requests": {
+        "default_timeout": float(os.getenv("P2L_REQUEST_TIMEOUT", "150")),  # 未携带截止时间请求头时的默认超时（秒）
+        "max_timeout": 600,           # 客户端可请求的最大超时（秒）
+        "inference_concurrency": int(os.getenv("P2L_INFERENCE_CONCURRENCY", "1")),  # 同时进行的P2L推理数
+        "inference_max_pending": 64   # 推理队列最大排队数
+    },
+    
+    # P2L checkpoint目录 - 热切换与影子评估只能加载MODEL_MAPPING中的模型或该目录下的checkpoint
+    "p2l_checkpoints": {
+        "dir": os.getenv("P2L_CHECKPOINT_DIR", str(Path(__file__).parent / "models"))  # 管理接口只能加载该目录下的checkpoint
+    },
+    
+    # 影子评估配置 - 候选P2L checkpoint在线对比
+    "shadow": {
+        "model_path": os.getenv("P2L_SHADOW_MODEL_PATH"),  # 设置后启动时自动开启影子评估
+        "sample_rate": float(os.getenv("P2L_SHADOW_SAMPLE_RATE", "0.05")),  # 抽样比例
+        "cpu_budget": 0.2,       # 影子推理最多占用的时间比例
+        "batch_size": 8,         # 每批评估的提示词数
+        "max_queue": 256,        # 待评估队列上限，满时丢弃样本
+        "log_path": str(Path(__file__).parent.parent / "logs" / "p2l_shadow.jsonl")
+    },
+    
+    # WebSocket聊天会话配置
+    "chat_sessions": {
+        "max_sessions": 100,            # 同时保留的会话上限
+        "idle_timeout": 1800,           # 断开后会话保留时间（秒），期间可重连
+        "max_history_messages": 40,     # 每个会话保留的历史消息数
+        "coefficient_cache_size": 32    # 每个会话缓存的P2L系数条数
+    },
+    
+    # 延迟遥测配置 - 速度评分使用实测延迟
+    "latency_telemetry": {
+        "enabled": os.getenv("P2L_LIVE_LATENCY", "true").lower() == "true",
+        "half_life": 3600,          # 样本权重半衰期（秒）
+        "quantile": 0.5,            # 路由使用的总延迟分位数
+        "prior_weight": 5,          # 配置值作为先验的等效样本数，样本不足时回退到avg_response_time
+        "relative_accuracy": 0.02,  # 分位数草图相对误差
+        "refresh_interval": 1.0     # 路由估计缓存时间（秒）
+    },
+    
+    # 熔断器配置 - 上游故障时快速失败，路由排除熔断中的模型
+    "circuit_breaker": {
+        "enabled": os.getenv("P2L_CIRCUIT_BREAKER", "true").lower() == "true",
+        "failure_rate_threshold": 0.5,      # 滑动窗口内触发熔断的错误率
+        "min_requests": 5,                  # 按错误率判断前窗口内至少需要的请求数
+        "window": 60,                       # 错误率滑动窗口（秒）
+        "consecutive_timeouts": 3,          # 触发熔断的连续超时次数
+        "open_duration": 30,                # 熔断冷却时间（秒），探测失败后加倍
+        "max_open_duration": 300,           # 冷却时间上限（秒）
+        "half_open_probes": 1,              # 半开状态同时放行的探测请求数
+        "provider_min_failing_models": 2,   # 提供商熔断前至少需要出错的模型数
+        "health_penalty": 1.0               # 不健康模型的P2L系数降权
+    },
+    
+    # 负载均衡配置 - 按进行中请求数和近期429估计排队延迟，负载高峰时分散路由
+    "load_balancing": {
+        "enabled": os.getenv("P2L_LOAD_BALANCING", "true").lower() == "true",
+        "model_concurrency": 8,             # 单个模型的默认并发上限
+        "provider_concurrency": 32,         # 单个提供商的默认并发上限
+        "concurrency_limits": {},           # 按模型名或提供商名覆盖并发上限
+        "rate_limit_penalty": 2.0,          # 每次近期429增加的排队延迟（秒）
+        "rate_limit_half_life": 60,         # 429计数的半衰期（秒）
+        "max_utilization": 0.95             # 利用率上限，避免延迟估计发散
+    },
+    
+    # 请求对冲配置 - 主模型超过p90未返回首token时对冲到P2L排名中的下一个模型
+    "hedging": {
+        "enabled": os.getenv("P2L_HEDGING", "true").lower() == "true",
+        "quantile": 0.9,                    # 对冲延迟使用的实测分位数
+        "min_delay": 0.5,                   # 对冲延迟下限（秒）
+        "max_hedge_rate": 0.1,              # 对冲请求占全部请求的比例上限
+        "burst": 5                          # 允许短时间内连续对冲的次数
+    },
+    
+    # 预算节奏配置 - 按租户控制时间窗口内的累计支出
+    "budget_pacing": {
+        "enabled": os.getenv("P2L_BUDGET_PACING", "true").lower() == "true",
+        "tenants": {},                      # 各租户的预算（美元），例如 {"team-a": 500.0}
+        "default_budget": None,             # 未单独配置的租户的预算（None表示不控制）
+        "window": 30 * 24 * 3600,           # 预算时间窗口（秒）
+        "learning_rate": 0.2,               # 影子价格步长
+        "max_shadow_price": 30.0,           # 影子价格上限（预算耗尽时取该值）
+        "min_elapsed": 60                   # 估计请求速率的最短观测时间（秒）
+    },
+    
+    # 上游连接池配置 - 请求之间共享keep-alive连接（连接上限和超时见API_CONFIGS）
+    "connection_pool": {
+        "enabled": os.getenv("P2L_SHARED_POOL", "true").lower() == "true",
+        "keepalive_timeout": 60,            # 空闲连接保留时间（秒）
+        "http2": os.getenv("P2L_HTTP2", "false").lower() == "true",  # 需要安装httpx[http2]
+        "prewarm": True,                    # 启动时预先建立到已配置密钥的提供商的连接
+        "prewarm_timeout": 5                # 单个提供商预热的超时（秒）
+    },
+    
+    # 上游限流配置 - 按提供商令牌桶排队，429/5xx按带抖动的指数退避重试并遵守Retry-After
+    "rate_limiting": {
+        "enabled": os.getenv("P2L_RATE_LIMITING", "true").lower() == "true",
+        "limits": {},                       # 各提供商限额，例如 {"openai": {"requests_per_minute": 500, "tokens_per_minute": 200000}}
+        "default_requests_per_minute": None,  # 未单独配置的提供商的每分钟请求数上限（None表示不限制）
+        "default_tokens_per_minute": None,    # 未单独配置的提供商的每分钟token数上限
+        "burst_seconds": 10,                # 令牌桶容量（按秒计的补充量）
+        "max_retries": 3,                   # 单次调用的最大重试次数
+        "backoff_base": 0.5,                # 指数退避初始等待（秒）
+        "backoff_max": 20,                  # 指数退避等待上限（秒）
+        "max_retry_after": 60               # 可接受的Retry-After上限（秒）
+    },
+    
+    # 响应缓存配置 - temperature=0的相同请求直接返回缓存结果（回归与评测任务使用）
+    "response_cache": {
+        "enabled": os.getenv("P2L_RESPONSE_CACHE", "false").lower() == "true",
+        "max_entries": 1024,                # 内存LRU层容量
+        "disk_path": os.getenv("P2L_RESPONSE_CACHE_PATH"),  # SQLite磁盘层路径（未设置时只用内存）
+        "max_disk_entries": 100000,         # 磁盘层容量（按最近访问时间淘汰）
+        "ttl": None                         # 缓存有效期（秒），None表示不过期
+    },
+    
+    # 批量生成配置 - 按提供商限制并发，结果写入检查点以便续跑
+    "bulk_generation": {
+        "max_jobs": 10000,                  # 单次批量请求的任务数上限
+        "max_concurrency": 32,              # 全局同时进行的上游调用数
+        "provider_concurrency": 8,          # 单个提供商同时进行的上游调用数
+        "provider_limits": {},              # 按提供商覆盖并发上限
+        "checkpoint_dir": str(Path(__file__).parent.parent / "checkpoints" / "bulk")  # 检查点目录
+    },
+    
+    # 上游流量磁带 - 录制真实交互，离线按原始或缩放后的时间回放
+    "cassette": {
+        "mode": os.getenv("P2L_CASSETTE_MODE", "off").lower(),  # off / record / replay
+        "path": os.getenv("P2L_CASSETTE_PATH"),                   # 磁带文件（.jsonl，以.gz结尾时压缩）
+        "time_scale": float(os.getenv("P2L_CASSETTE_TIME_SCALE", "1.0")),  # 回放时间缩放（0为不等待）
+        "strict": os.getenv("P2L_CASSETTE_STRICT", "false").lower() == "true"  # 只接受请求内容完全一致的记录
+    },
+    
+    # 上下文预算 - 调用上游前按模型的context_window/max_tokens裁剪历史，放不下的请求直接拒绝
+    "context_budget": {
+        "enabled": os.getenv("P2L_CONTEXT_BUDGET", "true").lower() == "true",
+        "safety_margin": 0.05,              # 为token估算误差预留的上下文比例
+        "max_input_tokens": int(os.getenv("P2L_MAX_INPUT_TOKENS")) if os.getenv("P2L_MAX_INPUT_TOKENS") else None,  # 输入token预算上限
+        "min_output_tokens": 256,           # 收紧max_tokens时的下限，低于该值直接拒绝
+        "summarize": True,                  # 把被裁剪的轮次压缩成摘要保留
+        "summary_max_tokens": 200,          # 摘要的token上限
+        "calibration": {},                  # 各提供商的估算校准系数，例如 {"anthropic": 1.1}
+        "learn_calibration": True           # 根据上游返回的实际输入token数修正校准系数
+    },
+    
+    # 多模型对比配置
+    "compare": {
+        "max_k": int(os.getenv("P2L_COMPARE_MAX_K", "5"))  # 一次最多并发生成的模型数
+    },
+    
+    # 路由配置 - 自定义优先模式
+    "routing": {
+        # 在performance/cost/speed/balanced之外按权重综合评分，all_modes请求中一并返回
+        # 例如 {"quality_value": {"p2l": 0.7, "cost": 0.3, "speed": 0.0}}
+        "custom_modes": {},
+        # 延迟SLO模式（priority="latency"）的完成时间预测参数
+        "latency_slo": {
+            "quantile": 0.9,                    # 首token延迟取p90、输出速度取p10
+            "ttft_ratio": 0.3,                  # 无实测数据时首token延迟占avg_response_time的比例
+            "reference_output_tokens": 300,     # avg_response_time对应的典型输出长度
+            "default_output_tokens": 400,       # 请求未给出expected_output_tokens时使用
+            "prefill_tokens_per_second": 2000   # 提示词预填充速度
+        },
+        # 各模式的排队延迟权重（0表示不受负载影响）
+        "load_weights": {"performance": 0.0, "cost": 0.5, "speed": 1.0, "balanced": 0.5, "latency": 1.0}
     }
 }
 
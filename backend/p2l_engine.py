@@ -4,13 +4,17 @@ P2L引擎 - 加载并使用真实的P2L模型
 基于下载的 p2l-135m-grk 模型进行Bradley-Terry系数计算
 """
 
+import gc
 import json
 import logging
+import threading
+import time
 import numpy as np
 import torch
 import torch.nn.functional as F
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass
+from contextlib import contextmanager
 import os
 import sys
 from pathlib import Path
@@ -23,6 +27,9 @@ if str(p2l_project_dir) not in sys.path:
 
 logger = logging.getLogger(__name__)
 
+# 胜率张量最后一维的结果顺序，见 P2LEngine.calculate_win_probability_matrix
+WIN_PROBABILITY_OUTCOMES = ("win", "lose", "tie", "tie_bothbad")
+
 @dataclass
 class P2LCoefficients:
     """P2L系数数据结构"""
@@ -205,6 +212,58 @@ class P2LEngine:
             logger.error(f"P2L推理失败: {e}")
             return self._generate_mock_coefficients(len(model_list))
     
+    def get_bradley_terry_coefficients_batch(self, prompts: List[str], model_list: List[str]) -> np.ndarray:
+        """
+        批量获取Bradley-Terry系数（单次前向计算）
+        
+        Args:
+            prompts: 提示词列表
+            model_list: 要评估的模型列表
+            
+        Returns:
+            np.ndarray: 系数矩阵 [len(prompts), len(model_list)]
+        """
+        if not self.is_loaded:
+            return np.stack([self._generate_mock_coefficients(len(model_list)) for _ in prompts])
+        
+        formatted_prompts = [
+            self.tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}],
+                tokenize=False,
+                add_generation_prompt=False,
+                add_special_tokens=False,
+            ) + self.tokenizer.cls_token
+            for prompt in prompts
+        ]
+        
+        # 右侧填充，每行只有一个CLS token，P2L头按CLS位置取隐藏状态
+        inputs = self.tokenizer(
+            formatted_prompts,
+            return_tensors="pt",
+            max_length=8192,
+            padding=True,
+            truncation=True,
+            add_special_tokens=False
+        )
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"]
+            )
+        
+        coefs = outputs.coefs.cpu().float().numpy()  # [batch, num_models]
+        
+        # 按model_list取列，不在P2L模型列表中的模型使用0.5（与单条推理一致）
+        model_index = {model: i for i, model in enumerate(self.model_list)}
+        result = np.full((len(prompts), len(model_list)), 0.5)
+        for j, model in enumerate(model_list):
+            if model in model_index:
+                result[:, j] = coefs[:, model_index[model]]
+        
+        return result
+    
     def get_coefficients_for_prompt(self, prompt: str, models: List[str] = None) -> P2LCoefficients:
         """
         使用真实P2L模型计算Bradley-Terry系数
@@ -330,39 +389,59 @@ class P2LEngine:
                                   model_pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, float]]:
         """
         使用P2L系数计算模型对之间的胜率概率
-        使用GRK (Generalized Rao-Kupper) 模型
+        使用GRK (Generalized Rao-Kupper) 模型，概率取自 calculate_win_probability_matrix
         """
-        probabilities = {}
-        
-        # 使用真实的eta参数
-        eta = coefficients.eta if coefficients.eta is not None else 0.1
-        theta = np.exp(eta) + 1.000001
+        models = list(coefficients.model_coefficients)
+        index = {model: i for i, model in enumerate(models)}
+        matrix = self.calculate_win_probability_matrix(coefficients)
         
+        probabilities = {}
         for model_a, model_b in model_pairs:
-            if model_a in coefficients.model_coefficients and model_b in coefficients.model_coefficients:
-                coef_a = coefficients.model_coefficients[model_a]
-                coef_b = coefficients.model_coefficients[model_b]
-                
-                # GRK模型计算概率
-                pi_a = np.exp(coef_a)
-                pi_b = np.exp(coef_b)
-                pi_gamma = 1.0  # bag模型中gamma固定为1
-                
-                # 计算各种结果的概率
-                p_win = pi_a / (pi_a + theta * pi_b + pi_gamma)
-                p_lose = pi_b / (pi_b + theta * pi_a + pi_gamma)
-                p_tie_bb = pi_gamma / (pi_gamma + pi_a + pi_b)  # 双方都不好的平局
-                p_tie = 1.0 - p_win - p_lose - p_tie_bb  # 正常平局
-                
+            if model_a in index and model_b in index:
+                outcome = matrix[index[model_a], index[model_b]]
                 probabilities[(model_a, model_b)] = {
-                    "win": float(p_win),
-                    "lose": float(p_lose),
-                    "tie": float(p_tie),
-                    "tie_bothbad": float(p_tie_bb)
+                    name: float(outcome[k]) for k, name in enumerate(WIN_PROBABILITY_OUTCOMES)
                 }
         
         return probabilities
     
+    @staticmethod
+    def calculate_win_probability_matrix(coefficients, eta=None) -> np.ndarray:
+        """
+        所有模型对的GRK结果概率张量（广播计算，无逐对循环）
+        
+        对模型a、b（pi = exp(系数)，theta = exp(eta) + 1.000001，bag模型中gamma固定为1）：
+            win = pi_a / (pi_a + theta * pi_b + 1)
+            lose = pi_b / (pi_b + theta * pi_a + 1)
+            tie_bothbad = 1 / (1 + pi_a + pi_b)
+            tie = 1 - win - lose - tie_bothbad
+        实现中分子分母同除以分子，避免系数较大时exp溢出。
+        
+        Args:
+            coefficients: P2LCoefficients（按model_coefficients的顺序），系数向量 [M] 或批量系数 [N, M]
+            eta: 平局参数，标量或长度为N的数组（可选）。默认取P2LCoefficients.eta，缺省为0.1
+        
+        Returns:
+            [M, M, 4] 或 [N, M, M, 4]，[..., a, b, :] 为a对b的 (win, lose, tie, tie_bothbad)，
+            顺序见 WIN_PROBABILITY_OUTCOMES
+        """
+        if isinstance(coefficients, P2LCoefficients):
+            if eta is None:
+                eta = coefficients.eta
+            coefficients = np.fromiter(coefficients.model_coefficients.values(), dtype=float)
+        coefficients = np.asarray(coefficients, dtype=float)
+        eta = np.asarray(0.1 if eta is None else eta, dtype=float)
+        theta = (np.exp(eta) + 1.000001).reshape(eta.shape + (1, 1)) if eta.ndim else np.exp(eta) + 1.000001
+        
+        a = coefficients[..., :, None]  # [..., M, 1]
+        b = coefficients[..., None, :]  # [..., 1, M]
+        with np.errstate(over='ignore'):
+            p_win = 1.0 / (1.0 + theta * np.exp(b - a) + np.exp(-a))
+            p_lose = 1.0 / (1.0 + theta * np.exp(a - b) + np.exp(-b))
+            p_tie_bb = 1.0 / (1.0 + np.exp(a) + np.exp(b))
+        p_tie = 1.0 - p_win - p_lose - p_tie_bb
+        return np.stack([p_win, p_lose, p_tie, p_tie_bb], axis=-1)
+    
     def get_model_rankings(self, coefficients: P2LCoefficients) -> List[Tuple[str, float]]:
         """获取基于P2L系数的模型排名"""
         rankings = [(model, coef) for model, coef in coefficients.model_coefficients.items()]
@@ -494,19 +573,236 @@ class P2LEngine:
     
 
 
-# 全局P2L引擎实例
-_p2l_engine = None
+def _resolve_model_path(model_path: Optional[str]) -> Path:
+    """解析P2L模型路径，None表示默认checkpoint"""
+    if model_path is None:
+        return (current_dir / "model_p2l" / "models" / "p2l-135m-grk").resolve()
+    return Path(model_path).resolve()
+
+@dataclass
+class _EngineEntry:
+    """注册表中的引擎条目"""
+    engine: P2LEngine
+    refcount: int = 0
+    loaded_at: float = 0.0
+
+class P2LEngineRegistry:
+    """
+    进程级P2L引擎注册表
+    
+    - 每个 (checkpoint, 设备) 只保留一份常驻权重，引用计数归零且不再活跃时释放
+    - 活跃引擎本身持有一个引用，进行中的请求通过 lease() 再持有一个引用
+    - load_and_swap() 在后台加载并预热新checkpoint，然后原子切换活跃引擎，
+      旧引擎在进行中的请求结束后释放
+    """
+    
+    WARMUP_PROMPTS = [
+        "写一个Python快速排序算法",
+        "Explain the basic concepts of machine learning."
+    ]
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[Tuple[str, str], _EngineEntry] = {}
+        self._engine_keys: Dict[int, Tuple[str, str]] = {}
+        self._loading: Dict[Tuple[str, str], threading.Event] = {}
+        self._active_key: Optional[Tuple[str, str]] = None
+        self.swap_count = 0
+    
+    def acquire(self, model_path: str = None, device: str = "cpu") -> P2LEngine:
+        """
+        获取指定checkpoint的引擎并增加引用计数，不存在时加载
+        
+        调用方用完后应调用 release()
+        """
+        key = (str(_resolve_model_path(model_path)), str(device))
+        
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refcount += 1
+                    return entry.engine
+                
+                loading = self._loading.get(key)
+                if loading is None:
+                    # 由当前线程负责加载，其他线程等待，避免同一checkpoint加载两份
+                    loading = threading.Event()
+                    self._loading[key] = loading
+                    break
+            loading.wait()
+        
+        try:
+            logger.info(f"📦 注册表加载P2L引擎: {key[0]} ({key[1]})")
+            engine = P2LEngine(model_path=key[0], device=key[1])
+            with self._lock:
+                self._entries[key] = _EngineEntry(engine=engine, refcount=1, loaded_at=time.time())
+                self._engine_keys[id(engine)] = key
+            return engine
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+    
+    def release(self, engine: P2LEngine):
+        """释放引擎引用，引用归零且非活跃引擎时卸载权重"""
+        with self._lock:
+            key = self._engine_keys.get(id(engine))
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry.refcount -= 1
+            if entry.refcount > 0 or key == self._active_key:
+                return
+            del self._entries[key]
+            del self._engine_keys[id(engine)]
+        
+        self._unload(key, engine)
+    
+    def _unload(self, key: Tuple[str, str], engine: P2LEngine):
+        """卸载引擎权重"""
+        logger.info(f"🗑️ 卸载P2L引擎: {key[0]} ({key[1]})")
+        engine.model = None
+        engine.tokenizer = None
+        engine.is_loaded = False
+        gc.collect()
+        if key[1].startswith("cuda") and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    
+    def activate(self, model_path: str = None, device: str = "cpu") -> P2LEngine:
+        """加载（或复用）checkpoint并设为活跃引擎"""
+        engine = self.acquire(model_path, device)
+        self._set_active(engine)
+        return engine
+    
+    def _set_active(self, engine: P2LEngine):
+        """原子切换活跃引擎，engine的一个引用转移给活跃槽位"""
+        with self._lock:
+            new_key = self._engine_keys[id(engine)]
+            old_key = self._active_key
+            if old_key == new_key:
+                # 已是活跃引擎，归还多余的引用
+                self._entries[new_key].refcount -= 1
+                return
+            self._active_key = new_key
+            old_entry = self._entries.get(old_key) if old_key is not None else None
+            if old_key is not None:
+                self.swap_count += 1
+        
+        if old_entry is not None:
+            logger.info(f"🔄 活跃P2L引擎切换: {old_key[0]} → {new_key[0]}")
+            # 活跃槽位的引用交还，进行中的请求结束后旧引擎才会被卸载
+            self.release(old_entry.engine)
+    
+    def peek_active(self) -> Optional[P2LEngine]:
+        """获取活跃引擎，没有时返回None（不触发加载）"""
+        with self._lock:
+            if self._active_key is None:
+                return None
+            return self._entries[self._active_key].engine
+    
+    def get_active(self, device: str = "cpu") -> P2LEngine:
+        """获取活跃引擎（不增加引用），没有活跃引擎时加载默认checkpoint"""
+        with self._lock:
+            if self._active_key is not None:
+                return self._entries[self._active_key].engine
+        return self.activate(device=device)
+    
+    @contextmanager
+    def lease(self, device: str = "cpu"):
+        """在请求期间持有活跃引擎，切换不会卸载正在使用的引擎"""
+        with self._lock:
+            if self._active_key is None:
+                engine = None
+            else:
+                entry = self._entries[self._active_key]
+                entry.refcount += 1
+                engine = entry.engine
+        if engine is None:
+            self.get_active(device)
+            with self.lease(device) as engine:
+                yield engine
+            return
+        try:
+            yield engine
+        finally:
+            self.release(engine)
+    
+    def load_and_swap(self, model_path: str, device: str = "cpu", warmup: bool = True) -> Dict[str, Any]:
+        """
+        加载新checkpoint，预热后原子切换为活跃引擎
+        
+        Args:
+            model_path: 新checkpoint路径
+            device: 计算设备
+            warmup: 是否在切换前进行预热推理
+            
+        Returns:
+            Dict: 切换结果
+        """
+        start = time.time()
+        engine = self.acquire(model_path, device)
+        
+        if not engine.is_loaded:
+            # 加载失败的引擎会退化为模拟模式，不能切换上线
+            self.release(engine)
+            raise RuntimeError(f"P2L模型加载失败，保持当前引擎: {model_path}")
+        
+        load_time = time.time() - start
+        
+        warmup_time = 0.0
+        if warmup:
+            warmup_start = time.time()
+            for prompt in self.WARMUP_PROMPTS:
+                engine.get_coefficients_for_prompt(prompt)
+            warmup_time = time.time() - warmup_start
+        
+        self._set_active(engine)
+        
+        return {
+            "model_path": str(engine.model_path),
+            "device": str(device),
+            "load_time": round(load_time, 3),
+            "warmup_time": round(warmup_time, 3),
+            "swap_count": self.swap_count
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取注册表状态"""
+        with self._lock:
+            return {
+                "active": {
+                    "model_path": self._active_key[0],
+                    "device": self._active_key[1]
+                } if self._active_key else None,
+                "swap_count": self.swap_count,
+                "engines": [
+                    {
+                        "model_path": key[0],
+                        "device": key[1],
+                        "refcount": entry.refcount,
+                        "is_loaded": entry.engine.is_loaded,
+                        "active": key == self._active_key,
+                        "loaded_at": entry.loaded_at
+                    }
+                    for key, entry in self._entries.items()
+                ]
+            }
+
+# 全局P2L引擎注册表
+_engine_registry = P2LEngineRegistry()
+
+def get_engine_registry() -> P2LEngineRegistry:
+    """获取进程级P2L引擎注册表"""
+    return _engine_registry
 
 def get_p2l_engine() -> P2LEngine:
-    """获取全局P2L引擎实例"""
-    global _p2l_engine
-    if _p2l_engine is None:
-        _p2l_engine = P2LEngine()
-    return _p2l_engine
+    """获取全局活跃P2L引擎实例"""
+    return _engine_registry.get_active()
 
 def create_p2l_engine(model_path: str = None, device: str = "cpu") -> P2LEngine:
-    """创建新的P2L引擎实例"""
-    return P2LEngine(model_path, device)
+    """获取指定checkpoint的P2L引擎（同一checkpoint在进程内只加载一次）"""
+    return _engine_registry.acquire(model_path, device)
 
 # 测试函数
 def test_p2l_engine():
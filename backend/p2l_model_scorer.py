@@ -11,70 +11,114 @@ import numpy as np
 try:
     from .config import get_task_config, get_model_config
     from .p2l_router import P2LRouter
+    from .p2l_engine import get_engine_registry
+    from .token_estimator import estimate_output_tokens, estimate_tokens
 except ImportError:
     from config import get_task_config, get_model_config
     from p2l_router import P2LRouter
+    from p2l_engine import get_engine_registry
+    from token_estimator import estimate_output_tokens, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
 class P2LModelScorer:
     """P2L原生模型评分器"""
     
-    def __init__(self, model_configs: Dict, p2l_engine=None):
+    def __init__(
+        self,
+        model_configs: Dict,
+        p2l_engine=None,
+        engine_registry=None,
+        custom_mode_weights: Optional[Dict] = None,
+        latency_telemetry=None,
+        latency_slo_config: Optional[Dict] = None,
+        circuit_breakers=None,
+        health_penalty: float = 1.0,
+        load_tracker=None,
+        load_weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            model_configs: 模型配置
+            p2l_engine: 固定使用的P2L引擎（可选）。不提供时每次推理从注册表
+                        租用当前活跃引擎，checkpoint热切换后自动生效
+            engine_registry: P2L引擎注册表（可选），默认使用进程级注册表
+            custom_mode_weights: 自定义优先模式权重（可选），见P2LRouter
+            latency_telemetry: 延迟遥测（可选），提供时速度评分使用实测响应时间
+            latency_slo_config: 延迟SLO模式的完成时间预测参数（可选），见P2LRouter.LATENCY_SLO_DEFAULTS
+            circuit_breakers: 熔断器注册表（可选），提供时路由排除熔断中的模型
+            health_penalty: 不健康模型的P2L系数降权系数
+            load_tracker: 负载跟踪器（可选），提供时按排队延迟分散路由
+            load_weights: 各模式的排队延迟权重（可选），见P2LRouter.LOAD_WEIGHTS
+        """
         self.model_configs = model_configs
         self.task_config = get_task_config()
-        self.p2l_router = P2LRouter()
+        self.p2l_router = P2LRouter(
+            custom_mode_weights=custom_mode_weights,
+            latency_telemetry=latency_telemetry,
+            latency_slo_config=latency_slo_config,
+            circuit_breakers=circuit_breakers,
+            health_penalty=health_penalty,
+            load_tracker=load_tracker,
+            load_weights=load_weights
+        )
         
         # 模型列表（按固定顺序）
         self.model_list = list(model_configs.keys())
         logger.info(f"🎯 P2L评分器初始化，支持模型: {self.model_list}")
         
-        # 初始化P2L引擎
+        self._pinned_engine = p2l_engine
+        self.engine_registry = engine_registry or get_engine_registry()
+        
+        # 未指定引擎时确保注册表中有活跃引擎（同一checkpoint进程内只加载一次）
         if p2l_engine is None:
             try:
-                # 添加路径以确保能找到P2L模块
-                import sys
-                import os
-                from pathlib import Path
-                
-                # 添加p2l项目路径
-                current_dir = Path(__file__).parent
-                p2l_project_dir = current_dir.parent / 'p2l'
-                if str(p2l_project_dir) not in sys.path:
-                    sys.path.insert(0, str(p2l_project_dir))
+                engine = self.engine_registry.get_active(device='cpu')
+                logger.info(f"✅ 使用注册表中的P2L引擎，加载状态: {engine.is_loaded}")
                 
-                from p2l_engine import P2LEngine
-                self.p2l_engine = P2LEngine(device='cpu')  # 明确指定设备
-                logger.info(f"✅ P2L引擎创建成功，加载状态: {self.p2l_engine.is_loaded}")
-                
-                if self.p2l_engine.is_loaded:
-                    logger.info(f"🎉 真实P2L模型已加载，支持{len(self.p2l_engine.model_list)}个模型")
+                if engine.is_loaded:
+                    logger.info(f"🎉 真实P2L模型已加载，支持{len(engine.model_list)}个模型")
                 else:
                     logger.warning(f"⚠️ P2L模型未加载，将使用模拟系数")
                     
             except Exception as e:
-                logger.error(f"❌ P2L引擎创建失败: {e}")
+                logger.error(f"❌ P2L引擎获取失败: {e}")
                 import traceback
                 traceback.print_exc()
-                self.p2l_engine = None
-        else:
-            self.p2l_engine = p2l_engine
+    
+    @property
+    def p2l_engine(self):
+        """当前使用的P2L引擎：固定引擎或注册表中的活跃引擎"""
+        if self._pinned_engine is not None:
+            return self._pinned_engine
+        try:
+            return self.engine_registry.get_active()
+        except Exception:
+            return None
     
     def calculate_p2l_scores(
         self, 
         prompt: str, 
         priority: str, 
         enabled_models: Optional[List[str]] = None,
-        budget: Optional[float] = None
+        budget: Optional[float] = None,
+        p2l_coefficients: Optional[np.ndarray] = None,
+        latency_budget: Optional[float] = None,
+        expected_output_tokens: Optional[int] = None,
+        shadow_price: float = 0.0
     ) -> Tuple[List[Dict], Dict]:
         """
         使用P2L模型计算原生评分
         
         Args:
             prompt: 用户输入的提示词
-            priority: 优先级模式 (performance/cost/speed/balanced)
+            priority: 优先级模式 (performance/cost/speed/balanced/latency)
             enabled_models: 启用的模型列表
             budget: 预算约束（可选）
+            p2l_coefficients: 已计算好的P2L系数（可选），提供时跳过P2L推理
+            latency_budget: 延迟预算（秒，latency模式）
+            expected_output_tokens: 预期输出token数（latency模式，可选）
+            shadow_price: 租户预算节奏的影子价格（可选），见BudgetPacer
         
         Returns:
             (rankings, routing_info)
@@ -92,20 +136,34 @@ class P2LModelScorer:
         try:
             # 1. 获取P2L模型的Bradley-Terry系数
             print(f"\n🔍 【步骤1】获取P2L模型的Bradley-Terry系数...")
-            p2l_coefficients = self._get_p2l_coefficients(prompt)
+            if p2l_coefficients is None:
+                p2l_coefficients = self.get_p2l_coefficients(prompt)
             print(f"📊 Bradley-Terry系数: {p2l_coefficients}")
             print(f"📈 系数统计: 最大={p2l_coefficients.max():.3f}, 最小={p2l_coefficients.min():.3f}, 平均={p2l_coefficients.mean():.3f}")
             
             # 2. 使用P2L路由器进行智能路由
             print(f"\n🎯 【步骤2】P2L路由器智能路由...")
             print(f"🔄 路由模式: {priority}")
+            # 延迟SLO模式按提示词长度和预期输出长度预测完成时间
+            latency_kwargs = {}
+            if latency_budget is not None:
+                latency_kwargs = {
+                    "latency_budget": latency_budget,
+                    "prompt_tokens": estimate_tokens(prompt),
+                    "output_tokens": estimate_output_tokens(
+                        expected_output_tokens, default=self.p2l_router.latency_slo_config['default_output_tokens']
+                    )
+                }
+                print(f"⏱️ 延迟预算: {latency_budget}s, 提示词≈{latency_kwargs['prompt_tokens']} tokens, 预期输出≈{latency_kwargs['output_tokens']} tokens")
             selected_model, routing_info = self.p2l_router.route_models(
                 p2l_coefficients=p2l_coefficients,
                 model_list=self.model_list,
                 model_configs=self.model_configs,
                 mode=priority,
                 budget=budget,
-                enabled_models=enabled_models
+                enabled_models=enabled_models,
+                shadow_price=shadow_price,
+                **latency_kwargs
             )
             print(f"🏆 路由结果: {selected_model}")
             print(f"📋 路由信息: {routing_info}")
@@ -117,7 +175,10 @@ class P2LModelScorer:
                 model_list=self.model_list,
                 model_configs=self.model_configs,
                 mode=priority,  # 传递优先模式
-                enabled_models=enabled_models
+                enabled_models=enabled_models,
+                budget=budget,
+                shadow_price=shadow_price,
+                **latency_kwargs
             )
             print(f"📈 排名生成完成，共{len(rankings)}个模型")
             
@@ -153,12 +214,79 @@ class P2LModelScorer:
                 "explanation": "P2L评分失败，使用降级评分"
             }
     
-    def _get_p2l_coefficients(self, prompt: str) -> np.ndarray:
+    def calculate_p2l_scores_all_modes(
+        self,
+        prompt: str,
+        enabled_models: Optional[List[str]] = None,
+        budget: Optional[float] = None,
+        p2l_coefficients: Optional[np.ndarray] = None,
+        shadow_price: float = 0.0
+    ) -> Dict[str, Tuple[List[Dict], Dict]]:
+        """
+        一次P2L推理得到所有优先模式（内置 + 自定义）的排名和路由结果
+        
+        前端切换优先模式时直接使用对应模式的结果，无需重新推理
+        
+        Returns:
+            {mode: (rankings, routing_info)}
+        """
+        logger.info(f"🧠 开始P2L全模式评分")
+        
+        try:
+            if p2l_coefficients is None:
+                p2l_coefficients = self.get_p2l_coefficients(prompt)
+            
+            results = self.p2l_router.route_all_modes(
+                p2l_coefficients=p2l_coefficients,
+                model_list=self.model_list,
+                model_configs=self.model_configs,
+                budget=budget,
+                enabled_models=enabled_models,
+                shadow_price=shadow_price
+            )
+            
+            for rankings, routing_info in results.values():
+                routing_info["explanation"] = self.p2l_router.get_routing_explanation(routing_info)
+                routing_info["prompt_length"] = len(prompt)
+            
+            logger.info(f"✅ P2L全模式评分完成: " + ", ".join(
+                f"{mode}={info['selected_model']}" for mode, (_, info) in results.items()
+            ))
+            return results
+            
+        except Exception as e:
+            logger.error(f"❌ P2L全模式评分失败: {e}")
+            # 降级到基础评分（所有模式相同）
+            fallback_result = self._fallback_scoring(enabled_models)
+            return {
+                mode: (fallback_result, {
+                    "strategy": "fallback",
+                    "mode": mode,
+                    "error": str(e),
+                    "explanation": "P2L评分失败，使用降级评分"
+                })
+                for mode in self.p2l_router.get_mode_weights()
+            }
+    
+    def get_p2l_coefficients(self, prompt: str) -> np.ndarray:
         """获取P2L模型的Bradley-Terry系数"""
         print(f"\n🔍 【获取P2L系数】")
         print(f"📝 提示词长度: {len(prompt)} 字符")
         
-        if not self.p2l_engine:
+        if self._pinned_engine is not None:
+            return self._compute_coefficients(self._pinned_engine, prompt)
+        
+        try:
+            # 租用活跃引擎，推理期间发生的checkpoint切换不会卸载它
+            with self.engine_registry.lease() as engine:
+                return self._compute_coefficients(engine, prompt)
+        except Exception as e:
+            logger.error(f"❌ P2L引擎获取失败: {e}")
+            return self._compute_coefficients(None, prompt)
+    
+    def _compute_coefficients(self, engine, prompt: str) -> np.ndarray:
+        """使用指定引擎计算系数，失败时使用模拟系数"""
+        if not engine:
             print(f"⚠️ P2L引擎未加载，使用模拟系数")
             logger.warning("⚠️ P2L引擎未加载，使用模拟系数")
             coefficients = self._generate_mock_coefficients()
@@ -170,7 +298,7 @@ class P2LModelScorer:
             logger.info("🎯 调用P2L模型获取Bradley-Terry系数")
             
             # 使用P2L引擎计算系数
-            coefficients = self.p2l_engine.get_bradley_terry_coefficients(
+            coefficients = engine.get_bradley_terry_coefficients(
                 prompt=prompt,
                 model_list=self.model_list
             )
@@ -304,6 +432,8 @@ class P2LModelScorer:
             "strict": "成本效益最优",
             "simple-lp": "综合优化最佳",
             "optimal-lp": "Bradley-Terry最优",
+            "weighted": "自定义权重综合最佳",
+            "latency_slo": "延迟预算内性能最优" if routing_info.get("slo_met", True) else "预测完成最快",
             "fallback": "降级选择"
         }
         
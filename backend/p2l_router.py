@@ -4,18 +4,33 @@ P2L原生路由器模块
 实现基于Bradley-Terry系数的智能路由和成本优化
 """
 
+import importlib.util
 import numpy as np
 import logging
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
 from abc import ABC, abstractmethod
 
 try:
-    import cvxpy as cp
+    from .routing_table import RoutingTable, get_routing_table
+    from .latency_telemetry import LatencyTelemetry
+    from .circuit_breaker import CircuitBreakerRegistry
+    from .load_tracker import LoadTracker
+except ImportError:
+    from routing_table import RoutingTable, get_routing_table
+    from latency_telemetry import LatencyTelemetry
+    from circuit_breaker import CircuitBreakerRegistry
+    from load_tracker import LoadTracker
+
+try:
     from scipy.special import expit
-    CVXPY_AVAILABLE = True
 except ImportError:
-    CVXPY_AVAILABLE = False
-    logging.warning("cvxpy或scipy未安装，成本优化功能将不可用")
+    def expit(x):
+        """logistic函数（tanh形式，避免溢出）"""
+        return 0.5 * (1.0 + np.tanh(0.5 * np.asarray(x)))
+
+# cvxpy仅作为LP闭式解的回退，按需导入，不在请求路径上加载
+CVXPY_AVAILABLE = importlib.util.find_spec("cvxpy") is not None
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +38,256 @@ class UnfulfillableException(Exception):
     """预算无法满足异常"""
     pass
 
+@dataclass(frozen=True)
+class BudgetFrontier:
+    """
+    预算-得分前沿：点集 (cost, value) 的上凸包
+
+    任意预算下的最优混合策略都是前沿上相邻两个顶点的线性插值，
+    因此一次 O(M log M) 构建后，所有预算的查询都只需一次二分查找。
+    """
+    model_indices: np.ndarray  # 前沿顶点对应的模型索引（成本和得分都严格递增）
+    costs: np.ndarray          # 顶点成本
+    values: np.ndarray         # 顶点得分
+    num_models: int
+
+    @property
+    def min_budget(self) -> float:
+        """最低可满足预算（最便宜模型的成本）"""
+        return float(self.costs[0])
+
+    @property
+    def saturation_budget(self) -> float:
+        """饱和预算：超过后得分不再提高（得分最高模型的成本）"""
+        return float(self.costs[-1])
+
+    @property
+    def slopes(self) -> np.ndarray:
+        """每段的边际得分（每增加单位预算的得分提升），单调递减"""
+        return np.diff(self.values) / np.diff(self.costs)
+
+    def value_at(self, budgets) -> np.ndarray:
+        """预算对应的最优期望得分（可向量化），低于min_budget为NaN"""
+        budgets = np.asarray(budgets, dtype=float)
+        values = np.interp(budgets, self.costs, self.values)
+        return np.where(budgets < self.costs[0], np.nan, values)
+
+    def strategy_at(self, budget: float) -> np.ndarray:
+        """
+        预算对应的最优混合策略
+
+        Returns:
+            np.ndarray: 模型选择概率 [M]
+
+        Raises:
+            UnfulfillableException: 预算低于最便宜模型的成本
+        """
+        if budget < self.costs[0]:
+            raise UnfulfillableException(f"预算 {budget} 无法满足，最低成本: {self.costs[0]}")
+
+        ps = np.zeros(self.num_models)
+        # 预算内前沿上最后一个顶点
+        k = int(np.searchsorted(self.costs, budget, side="right")) - 1
+        if k == len(self.costs) - 1:
+            ps[self.model_indices[k]] = 1.0
+            return ps
+
+        weight = (budget - self.costs[k]) / (self.costs[k + 1] - self.costs[k])
+        ps[self.model_indices[k]] = 1.0 - weight
+        ps[self.model_indices[k + 1]] = weight
+        return ps
+
+    def to_dict(self, model_list: Sequence[str]) -> Dict:
+        """
+        序列化为分段函数：vertices为前沿顶点，segments[k]表示预算在
+        [budget_min, budget_max) 内按比例混合两个相邻顶点
+        """
+        models = [model_list[i] for i in self.model_indices]
+        slopes = self.slopes
+        return {
+            "vertices": [
+                {"model": model, "cost_per_1k": float(cost), "value": float(value)}
+                for model, cost, value in zip(models, self.costs, self.values)
+            ],
+            "segments": [
+                {
+                    "budget_min": float(self.costs[k]),
+                    "budget_max": float(self.costs[k + 1]),
+                    "models": [models[k], models[k + 1]],
+                    "marginal_value": float(slopes[k])  # 每增加单位预算的得分提升
+                }
+                for k in range(len(models) - 1)
+            ],
+            "min_budget": self.min_budget,
+            "saturation_budget": self.saturation_budget
+        }
+
+
+def compute_budget_frontier(costs: np.ndarray, values: np.ndarray) -> BudgetFrontier:
+    """
+    构建预算-得分前沿（上凸包），复杂度 O(M log M)
+
+    Args:
+        costs: 模型成本 [M]
+        values: 模型得分 [M]（SimpleLP为P2L系数，OptimalLP为 W @ q）
+    """
+    costs = np.asarray(costs, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(costs) == 0:
+        raise ValueError("模型列表为空")
+    if not (np.all(np.isfinite(costs)) and np.all(np.isfinite(values))):
+        raise ValueError("成本和得分必须是有限值")
+
+    # 成本升序，同成本时得分降序
+    order = np.lexsort((-values, costs))
+
+    # 上凸包（只保留成本更高且得分更高的非支配点）
+    hull: List[int] = []
+    best_value = -np.inf
+    for idx in order:
+        if values[idx] <= best_value:
+            continue
+        best_value = values[idx]
+        while len(hull) >= 2:
+            a, b = hull[-2], hull[-1]
+            # b 不在 a→idx 连线上方时移除
+            if (values[b] - values[a]) * (costs[idx] - costs[a]) <= (values[idx] - values[a]) * (costs[b] - costs[a]):
+                hull.pop()
+            else:
+                break
+        hull.append(int(idx))
+
+    hull = np.array(hull, dtype=int)
+    return BudgetFrontier(
+        model_indices=hull, costs=costs[hull], values=values[hull], num_models=len(costs)
+    )
+
+def solve_budget_lp(costs: np.ndarray, values: np.ndarray, budget: float) -> np.ndarray:
+    """
+    闭式求解预算约束下的线性规划
+
+        max  values @ p   s.t.  costs @ p <= budget,  sum(p) == 1,  p >= 0
+
+    最优值是点集 (cost, value) 上凸包络在 budget 处的取值，因此最优解最多混合
+    上凸包上相邻的两个模型（见compute_budget_frontier）。
+
+    Args:
+        costs: 模型成本 [M]
+        values: 模型得分 [M]（SimpleLP为P2L系数，OptimalLP为 W @ q）
+        budget: 预算
+
+    Returns:
+        np.ndarray: 模型选择概率 [M]
+
+    Raises:
+        UnfulfillableException: 最便宜的模型也超出预算
+    """
+    return compute_budget_frontier(costs, values).strategy_at(budget)
+
+def solve_budget_lp_cvxpy(costs: np.ndarray, values: np.ndarray, budget: float) -> np.ndarray:
+    """使用cvxpy求解同一线性规划（回退方案与验证基准）"""
+    import cvxpy as cp
+
+    p = cp.Variable(len(costs))
+    prob = cp.Problem(
+        cp.Maximize(values @ p),
+        [costs.T @ p <= budget, cp.sum(p) == 1, p >= 0],
+    )
+    prob.solve()
+
+    if prob.status in (cp.INFEASIBLE, cp.INFEASIBLE_INACCURATE) or p.value is None:
+        raise UnfulfillableException(f"预算 {budget} 无法满足，成本: {costs}")
+
+    ps = np.clip(p.value, a_min=0.0, a_max=1.0)
+    return ps / ps.sum()
+
+def solve_budget_lp_batch(
+    costs: np.ndarray,
+    values: np.ndarray,
+    budgets,
+    chunk_size: Optional[int] = None
+) -> np.ndarray:
+    """
+    批量求解预算LP：每行一个得分向量和预算，纯numpy向量化
+
+    最优解要么是预算内得分最高的单个模型，要么是预算两侧一对模型 (c_i <= B < c_j)
+    恰好用满预算的混合。按行分块枚举所有 (i, j) 对，块内为 [n, M, M] 张量运算。
+
+    Args:
+        costs: 模型成本 [M]（所有行共享）
+        values: 得分矩阵 [N, M]
+        budgets: 预算，标量或 [N]；NaN表示无预算约束
+        chunk_size: 每块行数（默认按 M*M 自动选择，单块约32MB）
+
+    Returns:
+        np.ndarray: 选择概率 [N, M]；预算无法满足的行全为0
+    """
+    costs = np.asarray(costs, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_rows, n_models = values.shape
+    budgets = np.broadcast_to(np.asarray(budgets, dtype=float), (n_rows,))
+    probs = np.zeros((n_rows, n_models))
+
+    # 无预算或预算覆盖所有模型：直接选得分最高的模型
+    unconstrained = np.isnan(budgets) | (budgets >= costs.max())
+    free_rows = np.flatnonzero(unconstrained)
+    probs[free_rows, values[free_rows].argmax(axis=1)] = 1.0
+
+    constrained = np.flatnonzero(~unconstrained)
+    if len(constrained) == 0:
+        return probs
+
+    if chunk_size is None:
+        chunk_size = max(1, (1 << 22) // (n_models * n_models))
+
+    # inv_dc[i, j] = 1 / (c_j - c_i)，只对 c_j > c_i 的对有意义
+    dc = costs[None, :] - costs[:, None]
+    inv_dc = np.divide(1.0, dc, out=np.zeros_like(dc), where=dc > 0)
+    diag = np.arange(n_models)
+
+    for start in range(0, len(constrained), chunk_size):
+        rows = constrained[start:start + chunk_size]
+        v = values[rows]
+        b = budgets[rows]
+        n = len(rows)
+
+        affordable = costs[None, :] <= b[:, None]                             # [n, M]
+        weight = (b[:, None, None] - costs[None, :, None]) * inv_dc[None]     # j的混合权重 [n, M, M]
+        objective = v[:, :, None] + weight * (v[:, None, :] - v[:, :, None])
+        valid = affordable[:, :, None] & ~affordable[:, None, :]
+        objective = np.where(valid, objective, -np.inf)
+        objective[:, diag, diag] = np.where(affordable, v, -np.inf)          # 单个模型
+
+        flat = objective.reshape(n, -1).argmax(axis=1)
+        feasible = np.isfinite(objective.reshape(n, -1)[np.arange(n), flat])
+        i, j = np.divmod(flat, n_models)
+        w = np.where(i == j, 0.0, weight[np.arange(n), i, j])
+
+        rows, i, j, w = rows[feasible], i[feasible], j[feasible], w[feasible]
+        probs[rows, i] += 1.0 - w
+        probs[rows, j] += w
+
+    return probs
+
+def sample_from_probabilities(probs: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """按行从混合策略中采样模型索引 [N]"""
+    rng = rng or np.random.default_rng()
+    u = rng.random(len(probs))[:, None]
+    indices = (np.cumsum(probs, axis=1) < u).sum(axis=1)
+    return np.minimum(indices, probs.shape[1] - 1)
+
+def _solve_lp(costs: np.ndarray, values: np.ndarray, budget: float) -> np.ndarray:
+    """优先使用闭式解，异常时回退到cvxpy"""
+    try:
+        return solve_budget_lp(costs, values, budget)
+    except UnfulfillableException:
+        raise
+    except Exception as e:
+        if not CVXPY_AVAILABLE:
+            raise
+        logger.warning(f"⚠️ LP闭式求解失败，回退到cvxpy: {e}")
+        return solve_budget_lp_cvxpy(costs, values, budget)
+
 class BaseCostOptimizer(ABC):
     """成本优化器基类"""
     
@@ -89,29 +354,10 @@ class SimpleLPCostOptimizer(BaseCostOptimizer):
         model_scores: np.ndarray,
         **kwargs,
     ) -> str:
-        if not CVXPY_AVAILABLE:
-            logger.warning("cvxpy不可用，降级到严格成本优化")
-            return StrictCostOptimizer.select_model(cost, model_list, model_costs, model_scores)
-        
         if cost is None:
             return StrictCostOptimizer.select_max_score_model(model_list, model_scores)
 
-        p = cp.Variable(len(model_costs))
-
-        prob = cp.Problem(
-            cp.Maximize(cp.sum(model_scores @ p)),
-            [model_costs.T @ p <= cost, cp.sum(p) == 1, p >= 0],
-        )
-
-        status = prob.solve()
-
-        if status < 0.0:
-            raise UnfulfillableException(
-                f"预算 {cost} 无法满足，可用模型: {model_list}，成本: {model_costs}"
-            )
-
-        ps = np.clip(p.value, a_min=0.0, a_max=1.0)
-        ps = ps / ps.sum()
+        ps = _solve_lp(model_costs, model_scores, cost)
 
         return np.random.choice(model_list, p=ps)
 
@@ -128,10 +374,6 @@ class OptimalLPCostOptimizer(BaseCostOptimizer):
         opponent_distribution: Optional[np.ndarray] = None,
         **kwargs,
     ) -> str:
-        if not CVXPY_AVAILABLE:
-            logger.warning("cvxpy不可用，降级到严格成本优化")
-            return StrictCostOptimizer.select_model(cost, model_list, model_costs, model_scores)
-        
         if cost is None:
             return StrictCostOptimizer.select_max_score_model(model_list, model_scores)
 
@@ -143,22 +385,7 @@ class OptimalLPCostOptimizer(BaseCostOptimizer):
         W = OptimalLPCostOptimizer._construct_W(model_scores, opponent_scores)
         Wq = W @ opponent_distribution
 
-        p = cp.Variable(len(model_costs))
-
-        prob = cp.Problem(
-            cp.Maximize(p @ Wq), 
-            [model_costs.T @ p <= cost, cp.sum(p) == 1, p >= 0]
-        )
-
-        status = prob.solve()
-
-        if status < 0.0:
-            raise UnfulfillableException(
-                f"预算 {cost} 无法满足，可用模型: {model_list}，成本: {model_costs}"
-            )
-
-        ps = np.clip(p.value, a_min=0.0, a_max=1.0)
-        ps = ps / ps.sum()
+        ps = _solve_lp(model_costs, Wq, cost)
 
         return np.random.choice(model_list, p=ps)
 
@@ -218,7 +445,68 @@ class P2LRouter:
         "qwen2.5-coder-32b-instruct": 3,     # 代码专用，中等权重
     }
     
-    def __init__(self):
+    # 各优先模式的综合评分权重（标准化P2L系数 / 成本分数 / 速度分数），极端差异化配置
+    MODE_WEIGHTS = {
+        'performance': {'p2l': 0.95, 'cost': 0.025, 'speed': 0.025},  # 性能优先：几乎完全依赖P2L系数
+        'cost': {'p2l': 0.1, 'cost': 0.85, 'speed': 0.05},            # 成本优先：几乎完全依赖成本效益
+        'speed': {'p2l': 0.1, 'cost': 0.05, 'speed': 0.85},           # 速度优先：几乎完全依赖响应速度
+        'balanced': {'p2l': 0.5, 'cost': 0.25, 'speed': 0.25},        # 平衡模式：相对均衡但仍有侧重
+    }
+    
+    # 延迟SLO模式的完成时间预测参数
+    LATENCY_SLO_DEFAULTS = {
+        'quantile': 0.9,                   # 保守估计：首token延迟取p90，输出速度取p10
+        'ttft_ratio': 0.3,                 # 无实测数据时，首token延迟占avg_response_time的比例
+        'reference_output_tokens': 300,    # avg_response_time对应的典型输出长度
+        'default_output_tokens': 400,      # 请求未给出预期输出长度时使用
+        'prefill_tokens_per_second': 2000  # 提示词预填充速度
+    }
+    
+    # 各模式的排队延迟权重：0表示忽略负载，1表示完整计入排队延迟
+    LOAD_WEIGHTS = {
+        'performance': 0.0,  # 性能优先：只看P2L系数
+        'cost': 0.5,
+        'speed': 1.0,        # 速度优先：排队延迟直接计入响应时间
+        'balanced': 0.5,
+        'latency': 1.0,      # 延迟SLO：排队延迟计入预测完成时间
+    }
+    DEFAULT_LOAD_WEIGHT = 0.5  # 自定义模式
+    
+    def __init__(
+        self,
+        custom_mode_weights: Optional[Dict[str, Dict[str, float]]] = None,
+        latency_telemetry: Optional[LatencyTelemetry] = None,
+        latency_slo_config: Optional[Dict] = None,
+        circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+        health_penalty: float = 1.0,
+        load_tracker: Optional[LoadTracker] = None,
+        load_weights: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            custom_mode_weights: 自定义模式权重（可选），如 {"quality_value": {"p2l": 0.7, "cost": 0.3, "speed": 0.0}}
+            latency_telemetry: 延迟遥测（可选）。提供时速度评分使用实测响应时间，
+                               样本不足的模型回退到配置的avg_response_time
+            latency_slo_config: 延迟SLO模式的预测参数（可选），覆盖LATENCY_SLO_DEFAULTS
+            circuit_breakers: 熔断器注册表（可选）。提供时排除熔断中的模型，
+                              并按 health_penalty * (1 - 健康度) 降低半开或错误率升高模型的P2L系数
+            health_penalty: 健康度降权系数
+            load_tracker: 负载跟踪（可选）。提供时按进行中请求数和近期429估计排队延迟，
+                          按模式权重计入评分、成本和响应时间
+            load_weights: 各模式的排队延迟权重（可选），覆盖LOAD_WEIGHTS
+        """
+        self.latency_telemetry = latency_telemetry
+        self.circuit_breakers = circuit_breakers
+        self.health_penalty = health_penalty
+        self.load_tracker = load_tracker
+        self.load_weights = {**self.LOAD_WEIGHTS, **(load_weights or {})}
+        self.latency_slo_config = {**self.LATENCY_SLO_DEFAULTS, **(latency_slo_config or {})}
+        self.custom_mode_weights = dict(custom_mode_weights or {})
+        for name, weights in self.custom_mode_weights.items():
+            missing = {'p2l', 'cost', 'speed'}.difference(weights)
+            if missing:
+                raise ValueError(f"自定义模式 {name} 缺少权重: {sorted(missing)}")
+        
         self.cost_optimizers = {
             'strict': StrictCostOptimizer(),
             'simple-lp': SimpleLPCostOptimizer(),
@@ -230,33 +518,195 @@ class P2LRouter:
             'performance': 'max_score',      # 性能优先：选择最高分
             'cost': 'strict',                # 成本优先：严格成本约束
             'speed': 'speed_weighted',       # 速度优先：速度权重调整
-            'balanced': 'simple-lp'          # 平衡模式：简单线性规划
+            'balanced': 'simple-lp',         # 平衡模式：简单线性规划
+            'latency': 'latency_slo'         # 延迟SLO：预计在延迟预算内完成的最高分模型
         }
         
         # 初始化采样权重和对手分布
         self.opponent_distribution = None
         self.opponent_scores = None
     
-    def setup_opponent_distribution(self, model_list: List[str], p2l_coefficients: np.ndarray):
+    def get_routing_table(self, model_list: List[str], model_configs: Dict[str, Dict]) -> RoutingTable:
+        """获取模型列表对应的路由表（每份配置只构建一次）"""
+        return get_routing_table(model_list, model_configs, self.SAMPLING_WEIGHTS)
+    
+    def get_response_times(self, table: RoutingTable) -> np.ndarray:
+        """与路由表列对齐的响应时间估计 [M]：实测值（如有遥测）或配置值"""
+        if self.latency_telemetry is None:
+            return table.response_times
+        return self.latency_telemetry.estimate_response_times(table.models, table.response_times)
+    
+    def get_model_health(self, table: RoutingTable) -> Optional[np.ndarray]:
+        """与路由表列对齐的健康度 [M]（熔断中为0，未配置熔断器时为None）"""
+        if self.circuit_breakers is None:
+            return None
+        return self.circuit_breakers.health(table.models, [table.providers[i] for i in table.provider_ids])
+    
+    def _apply_circuit_breakers(
+        self,
+        table: RoutingTable,
+        columns: np.ndarray,
+        p2l_coefficients: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        排除熔断中的模型，并对不健康的模型降权
+        
+        Args:
+            table: 路由表
+            columns: 启用模型的列索引
+            p2l_coefficients: 与路由表列对齐的P2L系数 [M] 或 [N, M]
+        
+        Returns:
+            (可路由的列索引, 降权后的系数, 被排除的模型)。所有启用模型都在熔断时不排除，
+            避免无模型可用，此时系数统一降权，相对顺序不变
+        """
+        health = self.get_model_health(table)
+        if health is None:
+            return columns, p2l_coefficients, []
+        
+        available = health[columns] > 0
+        excluded = [table.models[i] for i in columns[~available]]
+        if excluded and available.any():
+            columns = columns[available]
+            logger.warning(f"⚡ 熔断中的模型已排除: {excluded}")
+        else:
+            excluded = []
+        return columns, p2l_coefficients - self.health_penalty * (1.0 - health), excluded
+    
+    @staticmethod
+    def _apply_shadow_price(table: RoutingTable, p2l_coefficients: np.ndarray, shadow_price) -> np.ndarray:
+        """
+        预算节奏控制的影子价格：P2L系数减去 λ * cost / max_cost
+        
+        λ由BudgetPacer按租户的累计支出在线调整，路由时只读取（O(1)），
+        超支时λ升高使路由偏向便宜的模型，支出落后于目标时λ回落。
+        
+        Args:
+            table: 路由表
+            p2l_coefficients: P2L系数 [M] 或 [N, M]
+            shadow_price: 影子价格，标量或长度为N的数组（None或0表示不调整）
+        """
+        if shadow_price is None:
+            return p2l_coefficients
+        shadow_price = np.asarray(shadow_price, dtype=float)
+        if not shadow_price.any():
+            return p2l_coefficients
+        relative_costs = table.costs / max(float(table.costs.max()), 1e-12)
+        if shadow_price.ndim == 0:
+            return p2l_coefficients - shadow_price * relative_costs
+        return p2l_coefficients - shadow_price[:, None] * relative_costs[None, :]
+    
+    def get_queueing_delays(self, table: RoutingTable) -> Optional[np.ndarray]:
+        """与路由表列对齐的排队延迟估计（秒）[M]，未配置负载跟踪时为None"""
+        if self.load_tracker is None:
+            return None
+        return self.load_tracker.queueing_delays(
+            table.models, [table.providers[i] for i in table.provider_ids], self.get_response_times(table)
+        )
+    
+    def get_load_weight(self, mode: str) -> float:
+        """模式的排队延迟权重"""
+        return self.load_weights.get(mode, self.DEFAULT_LOAD_WEIGHT)
+    
+    def _apply_load(
+        self,
+        table: RoutingTable,
+        mode: str,
+        p2l_coefficients: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        把排队延迟d按模式权重w计入路由的三个输入（均与路由表列对齐）
+        
+        - 评分：P2L系数减去 w * d / (d + 服务时间)，即排队时间在总时间中的占比；
+        - 成本：cost * (1 + w * d / 服务时间)，LP的预算约束随负载收紧；
+        - 响应时间：服务时间 + w * d。
+        
+        Args:
+            table: 路由表
+            mode: 路由模式
+            p2l_coefficients: P2L系数 [M] 或 [N, M]
+        
+        Returns:
+            (系数, 成本 [M], 响应时间 [M], 计入的排队延迟 w * d [M])
+        """
+        response_times = self.get_response_times(table)
+        delays = self.get_queueing_delays(table)
+        weight = self.get_load_weight(mode)
+        if delays is None or weight == 0 or not delays.any():
+            return p2l_coefficients, table.costs, response_times, np.zeros(len(table))
+        
+        weighted = weight * delays
+        return (
+            p2l_coefficients - weight * delays / (delays + response_times),
+            table.costs * (1 + weighted / response_times),
+            response_times + weighted,
+            weighted
+        )
+    
+    def predict_completion_times(
+        self,
+        table: RoutingTable,
+        prompt_tokens=0,
+        output_tokens=None
+    ) -> np.ndarray:
+        """
+        预测各模型完成一次请求的时间（秒），与路由表列对齐
+        
+        完成时间 = 首token延迟 + 提示词token数 / 预填充速度 + 输出token数 / 输出速度。
+        首token延迟和输出速度取遥测的保守分位数（按有效样本数向配置值收缩）；
+        没有遥测时由avg_response_time按ttft_ratio和reference_output_tokens拆分得到。
+        
+        Args:
+            table: 路由表
+            prompt_tokens: 提示词token数，标量或长度为N的数组
+            output_tokens: 预期输出token数，标量或长度为N的数组（默认default_output_tokens）
+        
+        Returns:
+            [M]（标量输入）或 [N, M]（数组输入）
+        """
+        config = self.latency_slo_config
+        if output_tokens is None:
+            output_tokens = config['default_output_tokens']
+        
+        # 配置值拆分：avg_response_time = 首token延迟 + reference_output_tokens / 输出速度
+        ttft = config['ttft_ratio'] * table.response_times
+        tokens_per_second = config['reference_output_tokens'] / ((1 - config['ttft_ratio']) * table.response_times)
+        if self.latency_telemetry is not None:
+            quantile = config['quantile']
+            ttft = self.latency_telemetry.blend_metric(table.models, ttft, "ttft", quantile)
+            tokens_per_second = self.latency_telemetry.blend_metric(
+                table.models, tokens_per_second, "tokens_per_second", 1 - quantile
+            )
+        
+        prompt_tokens = np.asarray(prompt_tokens, dtype=float)
+        output_tokens = np.asarray(output_tokens, dtype=float)
+        if prompt_tokens.ndim or output_tokens.ndim:
+            prompt_tokens = np.atleast_1d(prompt_tokens)[:, None]
+            output_tokens = np.atleast_1d(output_tokens)[:, None]
+        return ttft + prompt_tokens / config['prefill_tokens_per_second'] + output_tokens / tokens_per_second
+    
+    def setup_opponent_distribution(
+        self,
+        model_list: List[str],
+        p2l_coefficients: np.ndarray,
+        opponent_distribution: Optional[np.ndarray] = None
+    ):
         """
         设置对手分布，用于博弈论优化
         
         Args:
             model_list: 模型列表
             p2l_coefficients: P2L系数
+            opponent_distribution: 预先归一化的对手分布（可选，来自路由表）
         """
         print(f"\n🎲 【设置对手分布】")
         
-        # 构建对手分布权重
-        opponent_weights = []
-        for model in model_list:
-            weight = self.SAMPLING_WEIGHTS.get(model, 1)  # 默认权重为1
-            opponent_weights.append(weight)
-            print(f"   {model}: 权重={weight}")
+        if opponent_distribution is None:
+            # 由采样权重构建对手分布（默认权重为1）并标准化为概率分布
+            opponent_weights = np.array([self.SAMPLING_WEIGHTS.get(model, 1) for model in model_list], dtype=float)
+            opponent_distribution = opponent_weights / opponent_weights.sum()
         
-        # 标准化为概率分布
-        opponent_weights = np.array(opponent_weights, dtype=float)
-        self.opponent_distribution = opponent_weights / opponent_weights.sum()
+        self.opponent_distribution = opponent_distribution
         self.opponent_scores = p2l_coefficients.copy()
         
         print(f"   🎯 对手分布: {self.opponent_distribution}")
@@ -271,7 +721,11 @@ class P2LRouter:
         model_configs: Dict[str, Dict],
         mode: str = 'balanced',
         budget: Optional[float] = None,
-        enabled_models: Optional[List[str]] = None
+        enabled_models: Optional[List[str]] = None,
+        latency_budget: Optional[float] = None,
+        prompt_tokens: int = 0,
+        output_tokens: Optional[int] = None,
+        shadow_price: float = 0.0
     ) -> Tuple[str, Dict]:
         """
         P2L原生路由主方法
@@ -280,9 +734,13 @@ class P2LRouter:
             p2l_coefficients: P2L模型输出的Bradley-Terry系数
             model_list: 可用模型列表
             model_configs: 模型配置信息
-            mode: 路由模式 (performance/cost/speed/balanced)
+            mode: 路由模式 (performance/cost/speed/balanced/latency)
             budget: 预算约束（可选）
             enabled_models: 启用的模型列表（可选）
+            latency_budget: 延迟预算（秒，latency模式必需）
+            prompt_tokens: 提示词token数（latency模式）
+            output_tokens: 预期输出token数（latency模式，可选）
+            shadow_price: 预算节奏控制的影子价格（可选），见BudgetPacer
         
         Returns:
             (selected_model, routing_info)
@@ -296,22 +754,31 @@ class P2LRouter:
         
         logger.info(f"🎯 P2L路由开始: 模式={mode}, 预算={budget}")
         
-        # 过滤启用的模型
+        # 过滤启用的模型（路由表缓存的列索引）
         print(f"\n🔍 【模型过滤】")
-        if enabled_models:
-            filtered_indices = [i for i, model in enumerate(model_list) if model in enabled_models]
-            if not filtered_indices:
-                print(f"❌ 没有启用的模型可用！")
-                raise ValueError("没有启用的模型可用")
-            
-            original_models = model_list.copy()
-            original_coefficients = p2l_coefficients.copy()
-            
-            model_list = [model_list[i] for i in filtered_indices]
-            p2l_coefficients = p2l_coefficients[filtered_indices]
+        table = self.get_routing_table(model_list, model_configs)
+        columns = table.columns(enabled_models)
+        if enabled_models and len(columns) == 0:
+            print(f"❌ 没有启用的模型可用！")
+            raise ValueError("没有启用的模型可用")
+        
+        # 熔断中的模型不参与路由，不健康的模型降权
+        columns, p2l_coefficients, excluded_models = self._apply_circuit_breakers(
+            table, columns, np.asarray(p2l_coefficients, dtype=float)
+        )
+        if excluded_models:
+            print(f"⚡ 熔断排除: {excluded_models}")
+        
+        # 租户预算节奏：按影子价格扣减成本
+        p2l_coefficients = self._apply_shadow_price(table, p2l_coefficients, shadow_price)
+        
+        # 排队延迟按模式权重计入评分、成本和响应时间
+        p2l_coefficients, costs, response_times, queue_delays = self._apply_load(table, mode, p2l_coefficients)
+        
+        if len(columns) < len(table):
+            model_list = [table.models[i] for i in columns]
+            p2l_coefficients = p2l_coefficients[columns]
             
-            print(f"📋 原始模型: {original_models}")
-            print(f"📊 原始系数: {original_coefficients}")
             print(f"✂️ 过滤后模型: {model_list}")
             print(f"📊 过滤后系数: {p2l_coefficients}")
             
@@ -321,22 +788,22 @@ class P2LRouter:
         
         print(f"✅ 最终可用模型数: {len(model_list)}")
         
-        # 提取模型成本和其他属性
+        # 模型成本和响应时间直接取自路由表的列（含排队延迟项）
         print(f"\n📊 【模型属性提取】")
-        model_costs = np.array([model_configs[model]["cost_per_1k"] for model in model_list])
-        model_response_times = np.array([model_configs[model]["avg_response_time"] for model in model_list])
+        model_costs = costs[columns]
+        model_response_times = response_times[columns]
         
         print(f"💰 模型成本: {model_costs}")
         print(f"⚡ 响应时间: {model_response_times}")
+        if queue_delays.any():
+            print(f"🚦 排队延迟: {queue_delays[columns]}")
         
         # 打印每个模型的详细信息
         for i, model in enumerate(model_list):
-            config = model_configs[model]
             print(f"   {i+1}. {model}:")
             print(f"      P2L系数: {p2l_coefficients[i]:.3f}")
             print(f"      成本: ${model_costs[i]:.4f}/1k")
             print(f"      响应时间: {model_response_times[i]:.1f}s")
-            print(f"      成本: ${config['cost_per_1k']:.4f}/1k")
         
         # 根据模式选择路由策略
         strategy = self.mode_mapping.get(mode, 'simple-lp')
@@ -374,13 +841,39 @@ class P2LRouter:
                     "response_times": model_response_times.tolist()
                 }
                 
+            elif strategy == 'latency_slo':
+                print(f"⏱️ 执行延迟SLO策略...")
+                if latency_budget is None:
+                    raise ValueError("latency模式需要提供latency_budget")
+                predicted_times = (self.predict_completion_times(table, prompt_tokens, output_tokens) + queue_delays)[columns]
+                selected_index, slo_met = self._select_latency_slo(
+                    p2l_coefficients, predicted_times, latency_budget, model_costs, budget
+                )
+                selected_model = model_list[selected_index]
+                print(f"   ⏱️ 预测完成时间: {predicted_times}")
+                print(f"   🎯 选择模型: {selected_model} (预计 {predicted_times[selected_index]:.2f}s, 满足SLO: {slo_met})")
+                
+                routing_info = {
+                    "strategy": "latency_slo",
+                    "latency_budget": latency_budget,
+                    "budget": budget,
+                    "prompt_tokens": int(prompt_tokens),
+                    "output_tokens": int(self.latency_slo_config['default_output_tokens'] if output_tokens is None else output_tokens),
+                    "p2l_scores": p2l_coefficients.tolist(),
+                    "predicted_times": predicted_times.tolist(),
+                    "predicted_time": float(predicted_times[selected_index]),
+                    "slo_met": slo_met
+                }
+                
             elif strategy in self.cost_optimizers:
                 print(f"💰 执行成本优化策略: {strategy}")
                 print(f"   💵 预算约束: {budget}")
                 print(f"   🔧 优化器: {type(self.cost_optimizers[strategy]).__name__}")
                 
                 # 设置对手分布（用于博弈论优化）
-                self.setup_opponent_distribution(model_list, p2l_coefficients)
+                self.setup_opponent_distribution(
+                    model_list, p2l_coefficients, table.opponent_distribution(model_list)
+                )
                 
                 # 成本优化策略
                 optimizer = self.cost_optimizers[strategy]
@@ -425,6 +918,12 @@ class P2LRouter:
                 "total_models": len(model_list),
                 "cvxpy_available": CVXPY_AVAILABLE
             })
+            if excluded_models:
+                routing_info["excluded_models"] = excluded_models
+            if queue_delays.any():
+                routing_info["queueing_delays"] = queue_delays[columns].tolist()
+            if shadow_price:
+                routing_info["shadow_price"] = float(shadow_price)
             
             logger.info(f"✅ P2L路由完成: 选择模型={selected_model}, 策略={strategy}")
             return selected_model, routing_info
@@ -440,11 +939,180 @@ class P2LRouter:
             }
             return fallback_model, routing_info
     
+    def route_models_batch(
+        self,
+        coefficient_matrix: np.ndarray,
+        model_list: List[str],
+        model_configs: Dict[str, Dict],
+        modes='balanced',
+        budgets=None,
+        enabled_models: Optional[List[str]] = None,
+        rng: Optional[np.random.Generator] = None,
+        latency_budgets=None,
+        prompt_tokens=0,
+        output_tokens=None,
+        shadow_prices=None
+    ) -> Dict:
+        """
+        批量路由：对 [N, M] 系数矩阵逐行执行与 route_models 相同的策略，不做逐行Python循环
+        
+        Args:
+            coefficient_matrix: P2L系数矩阵 [N, M]，列顺序与model_list一致
+            model_list: 模型列表
+            model_configs: 模型配置信息
+            modes: 路由模式，字符串（所有行相同）或长度为N的序列
+            budgets: 预算，None / 标量 / 长度为N的数组（NaN或None表示无预算）
+            enabled_models: 启用的模型列表（可选，所有行相同）
+            rng: 混合策略采样使用的随机数生成器（可选）
+            latency_budgets: 延迟预算（秒），标量或长度为N的数组（latency模式的行必需）
+            prompt_tokens: 提示词token数，标量或长度为N的数组（latency模式）
+            output_tokens: 预期输出token数，标量或长度为N的数组（latency模式，可选）
+            shadow_prices: 预算节奏控制的影子价格，标量或长度为N的数组（可选）
+        
+        Returns:
+            Dict: selected_models [N]、selected_indices [N]（对应model_list）、
+                  probabilities [N, M]、strategies [N]
+        """
+        coefficient_matrix = np.asarray(coefficient_matrix, dtype=float)
+        n_rows = coefficient_matrix.shape[0]
+        rng = rng or np.random.default_rng()
+        
+        # 启用模型的列索引（所有行共享，路由表缓存）
+        table = self.get_routing_table(model_list, model_configs)
+        columns = table.columns(enabled_models)
+        if len(columns) == 0:
+            raise ValueError("没有启用的模型可用")
+        
+        # 熔断状态对所有行相同：排除熔断中的模型，不健康的模型降权
+        columns, penalized, excluded_models = self._apply_circuit_breakers(table, columns, coefficient_matrix)
+        if shadow_prices is not None:
+            penalized = self._apply_shadow_price(
+                table, penalized, np.broadcast_to(np.asarray(shadow_prices, dtype=float), (n_rows,))
+            )
+        scores = penalized[:, columns]
+        
+        if budgets is None:
+            budgets = np.full(n_rows, np.nan)
+        else:
+            budgets = np.broadcast_to(np.asarray(budgets, dtype=float), (n_rows,))
+        
+        # 模式 → 策略：只对去重后的模式查表
+        if isinstance(modes, str):
+            unique_modes, inverse = np.array([modes]), np.zeros(n_rows, dtype=int)
+        else:
+            unique_modes, inverse = np.unique(np.asarray(modes, dtype=object).astype(str), return_inverse=True)
+        mapped = np.array([self.mode_mapping.get(m, 'simple-lp') for m in unique_modes], dtype=object)
+        strategies = mapped[inverse]
+        
+        # 逐模式分组：排队延迟项按模式权重计入评分、成本和响应时间
+        sub_probs = np.zeros(scores.shape)
+        for m, mode in enumerate(unique_modes):
+            rows = np.flatnonzero(inverse == m) if len(unique_modes) > 1 else np.arange(n_rows)
+            strategy = mapped[m]
+            group_coefficients, costs, response_times, queue_delays = self._apply_load(table, mode, penalized[rows])
+            group_scores = group_coefficients[:, columns]
+            model_costs = costs[columns]
+            model_response_times = response_times[columns]
+            
+            if strategy == 'max_score':
+                sub_probs[rows, group_scores.argmax(axis=1)] = 1.0
+            
+            elif strategy == 'speed_weighted':
+                # 与 _select_speed_weighted 相同：行内标准化P2L分数 0.6 + 速度分数 0.4
+                max_time = np.max(model_response_times)
+                speed_scores = (max_time - model_response_times) / max_time
+                row_min = group_scores.min(axis=1, keepdims=True)
+                row_max = group_scores.max(axis=1, keepdims=True)
+                normalized = (group_scores - row_min) / (row_max - row_min + 1e-8)
+                combined = 0.6 * normalized + 0.4 * speed_scores[None, :]
+                sub_probs[rows, combined.argmax(axis=1)] = 1.0
+            
+            elif strategy == 'strict':
+                group_budgets = budgets[rows]
+                affordable = np.isnan(group_budgets)[:, None] | (model_costs[None, :] <= group_budgets[:, None])
+                masked = np.where(affordable, group_scores, -np.inf)
+                feasible = affordable.any(axis=1)
+                sub_probs[rows[feasible], masked[feasible].argmax(axis=1)] = 1.0
+            
+            elif strategy == 'simple-lp':
+                sub_probs[rows] = solve_budget_lp_batch(model_costs, group_scores, budgets[rows])
+            
+            elif strategy == 'latency_slo':
+                if latency_budgets is None:
+                    raise ValueError("latency模式需要提供latency_budgets")
+                # 与 _select_latency_slo 相同：预计在延迟预算内完成（且不超成本预算）的最高分模型，
+                # 没有满足的模型时选择预测最快的模型
+                predicted = np.broadcast_to(
+                    self.predict_completion_times(
+                        table,
+                        np.broadcast_to(np.asarray(prompt_tokens, dtype=float), (n_rows,))[rows],
+                        None if output_tokens is None else np.broadcast_to(np.asarray(output_tokens, dtype=float), (n_rows,))[rows]
+                    ) + queue_delays, (len(rows), len(table))
+                )[:, columns]
+                group_latency = np.broadcast_to(np.asarray(latency_budgets, dtype=float), (n_rows,))[rows]
+                group_budgets = budgets[rows]
+                feasible = (
+                    (predicted <= group_latency[:, None])
+                    & (np.isnan(group_budgets)[:, None] | (model_costs[None, :] <= group_budgets[:, None]))
+                )
+                selected = np.where(
+                    feasible.any(axis=1),
+                    np.where(feasible, group_scores, -np.inf).argmax(axis=1),
+                    predicted.argmin(axis=1)
+                )
+                sub_probs[rows, selected] = 1.0
+            
+            else:
+                raise ValueError(f"未知的路由策略: {strategy}")
+        
+        # 预算无法满足的行：与 route_models 一致，降级到最高分模型
+        infeasible = sub_probs.sum(axis=1) == 0
+        if infeasible.any():
+            sub_probs[infeasible, scores[infeasible].argmax(axis=1)] = 1.0
+            strategies = strategies.copy()
+            strategies[infeasible] = 'fallback_max_score'
+        
+        probabilities = np.zeros(coefficient_matrix.shape)
+        probabilities[:, columns] = sub_probs
+        selected_indices = columns[sample_from_probabilities(sub_probs, rng)]
+        
+        logger.info(f"✅ P2L批量路由完成: {n_rows} 行, 降级 {int(infeasible.sum())} 行")
+        return {
+            "selected_models": np.asarray(model_list, dtype=object)[selected_indices].tolist(),
+            "selected_indices": selected_indices,
+            "probabilities": probabilities,
+            "strategies": strategies.tolist(),
+            "excluded_models": excluded_models
+        }
+    
     def _select_max_score(self, model_list: List[str], scores: np.ndarray) -> str:
         """选择评分最高的模型"""
         max_idx = np.argmax(scores)
         return model_list[max_idx]
     
+    @staticmethod
+    def _select_latency_slo(
+        p2l_scores: np.ndarray,
+        predicted_times: np.ndarray,
+        latency_budget: float,
+        model_costs: Optional[np.ndarray] = None,
+        budget: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """
+        延迟SLO选择：预计在延迟预算内完成（且不超成本预算）的模型中P2L评分最高者
+        
+        没有满足条件的模型时选择预测完成时间最短的模型（尽力而为）
+        
+        Returns:
+            (所选模型的下标, 是否满足SLO)
+        """
+        feasible = predicted_times <= latency_budget
+        if budget is not None and model_costs is not None:
+            feasible &= model_costs <= budget
+        if feasible.any():
+            return int(np.where(feasible, p2l_scores, -np.inf).argmax()), True
+        return int(np.argmin(predicted_times)), False
+    
     def _select_speed_weighted(
         self, 
         model_list: List[str], 
@@ -492,7 +1160,12 @@ class P2LRouter:
         model_list: List[str],
         model_configs: Dict[str, Dict],
         mode: str = 'balanced',
-        enabled_models: Optional[List[str]] = None
+        enabled_models: Optional[List[str]] = None,
+        latency_budget: Optional[float] = None,
+        prompt_tokens: int = 0,
+        output_tokens: Optional[int] = None,
+        budget: Optional[float] = None,
+        shadow_price: float = 0.0
     ) -> List[Dict]:
         """
         生成基于优先模式调整的模型排名
@@ -503,47 +1176,59 @@ class P2LRouter:
             model_configs: 模型配置
             mode: 优先模式，影响评分计算
             enabled_models: 启用的模型列表
+            latency_budget / prompt_tokens / output_tokens / budget: latency模式的排名参数，见route_models
+            shadow_price: 预算节奏控制的影子价格（可选），见route_models
         
         Returns:
             排序后的模型列表，包含调整后的评分
         """
         print(f"\n📊 【生成模型排名】优先模式: {mode}")
         
-        # 过滤启用的模型
-        if enabled_models:
-            filtered_data = [
-                (model, coef, model_configs[model]) 
-                for model, coef in zip(model_list, p2l_coefficients) 
-                if model in enabled_models
-            ]
-            if not filtered_data:
-                return []
-            
-            model_list, p2l_coefficients, configs = zip(*filtered_data)
-            p2l_coefficients = np.array(p2l_coefficients)
-        else:
-            configs = [model_configs[model] for model in model_list]
+        # 过滤启用的模型（路由表缓存的列索引）
+        table = self.get_routing_table(model_list, model_configs)
+        columns = table.columns(enabled_models)
+        if len(columns) == 0:
+            return []
         
-        # 根据优先模式计算调整后的评分
-        adjusted_scores = self._calculate_mode_adjusted_scores(
-            p2l_coefficients, model_list, model_configs, mode
-        )
+        # 与route_models一致：熔断中的模型不参与排名，不健康的模型按降权后的系数评分
+        raw_coefficients = np.asarray(p2l_coefficients, dtype=float)
+        columns, penalized, _ = self._apply_circuit_breakers(table, columns, raw_coefficients)
+        penalized = self._apply_shadow_price(table, penalized, shadow_price)
+        penalized, costs, loaded_times, queue_delays = self._apply_load(table, mode, penalized)
+        p2l_coefficients = penalized[columns]
+        raw_coefficients = raw_coefficients[columns]
+        response_times = self.get_response_times(table)
         
-        # 创建排名列表
+        # 根据优先模式计算调整后的评分（含排队延迟项）
+        predicted_times = None
+        if mode == 'latency' and latency_budget is not None:
+            predicted_times = (self.predict_completion_times(table, prompt_tokens, output_tokens) + queue_delays)[columns]
+            adjusted_scores = self._latency_slo_scores(
+                p2l_coefficients, predicted_times, latency_budget, costs[columns], budget
+            )
+        else:
+            adjusted_scores = self._calculate_mode_adjusted_scores(
+                p2l_coefficients, [table.models[i] for i in columns], model_configs, mode,
+                costs=costs[columns], response_times=loaded_times[columns]
+            )
+        
+        # 按调整后的评分排序（稳定排序，同分时保持模型列表顺序），只为结果构建字典
+        order = np.argsort(-adjusted_scores, kind="stable")
         rankings = []
-        for i, (model, p2l_coef, adj_score, config) in enumerate(zip(model_list, p2l_coefficients, adjusted_scores, configs)):
+        for k in order:
+            column = columns[k]
+            config = table.config(column)
             rankings.append({
-                "model": model,
-                "score": float(adj_score),  # 调整后的综合评分
-                "p2l_coefficient": float(p2l_coef),  # 原始P2L系数
+                "model": table.models[column],
+                "score": float(adjusted_scores[k]),  # 调整后的综合评分
+                "p2l_coefficient": float(raw_coefficients[k]),  # 原始P2L系数
                 "config": config,
                 "provider": config["provider"],
-                "cost_per_1k": config["cost_per_1k"],
-                "avg_response_time": config["avg_response_time"]
+                "cost_per_1k": float(table.costs[column]),
+                "avg_response_time": float(response_times[column])
             })
-        
-        # 按调整后的评分排序
-        rankings.sort(key=lambda x: x["score"], reverse=True)
+            if predicted_times is not None:
+                rankings[-1]["predicted_time"] = float(predicted_times[k])
         
         print(f"📈 排名调整完成:")
         for i, ranking in enumerate(rankings[:3], 1):
@@ -552,12 +1237,39 @@ class P2LRouter:
         logger.info(f"📊 模式调整的模型排名生成完成，共{len(rankings)}个模型")
         return rankings
     
+    @staticmethod
+    def _latency_slo_scores(
+        p2l_coefficients: np.ndarray,
+        predicted_times: np.ndarray,
+        latency_budget: float,
+        costs: Optional[np.ndarray] = None,
+        budget: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        延迟SLO模式的排名评分：满足条件的模型在 [0.5, 1] 内按标准化P2L系数排序，
+        其余模型在 [0, 0.5) 内按预测完成时间排序，排名第一与_select_latency_slo的选择一致
+        """
+        feasible = predicted_times <= latency_budget
+        if budget is not None and costs is not None:
+            feasible &= costs <= budget
+        
+        p2l_min, p2l_max = np.min(p2l_coefficients), np.max(p2l_coefficients)
+        if p2l_max > p2l_min:
+            normalized_p2l = (p2l_coefficients - p2l_min) / (p2l_max - p2l_min)
+        else:
+            normalized_p2l = np.full(len(p2l_coefficients), 0.5)
+        
+        timeliness = np.min(predicted_times) / np.maximum(predicted_times, 1e-9)
+        return np.where(feasible, 0.5 + 0.5 * normalized_p2l, 0.499 * timeliness)
+    
     def _calculate_mode_adjusted_scores(
         self,
         p2l_coefficients: np.ndarray,
         model_list: List[str],
         model_configs: Dict[str, Dict],
-        mode: str
+        mode: str,
+        costs: Optional[np.ndarray] = None,
+        response_times: Optional[np.ndarray] = None
     ) -> np.ndarray:
         """
         根据优先模式计算调整后的模型评分
@@ -567,6 +1279,8 @@ class P2LRouter:
             model_list: 模型列表
             model_configs: 模型配置
             mode: 优先模式
+            costs: 与model_list对齐的成本列（可选，默认从路由表获取）
+            response_times: 与model_list对齐的响应时间列（可选，默认从路由表获取）
             
         Returns:
             调整后的评分数组
@@ -574,44 +1288,20 @@ class P2LRouter:
         print(f"🔧 【评分调整】模式: {mode}")
         
         # 提取模型属性
-        costs = np.array([model_configs[model]["cost_per_1k"] for model in model_list])
-        response_times = np.array([model_configs[model]["avg_response_time"] for model in model_list])
-        
-        # 标准化P2L系数到0-1范围
-        p2l_min, p2l_max = np.min(p2l_coefficients), np.max(p2l_coefficients)
-        if p2l_max > p2l_min:
-            normalized_p2l = (p2l_coefficients - p2l_min) / (p2l_max - p2l_min)
-        else:
-            normalized_p2l = np.ones_like(p2l_coefficients) * 0.5
+        if costs is None or response_times is None:
+            table = self.get_routing_table(model_list, model_configs)
+            costs, response_times = table.costs, self.get_response_times(table)
         
-        # 标准化成本分数（成本越低分数越高）
-        max_cost = np.max(costs)
-        cost_scores = (max_cost - costs) / max_cost if max_cost > 0 else np.ones_like(costs)
-        
-        # 标准化速度分数（时间越短分数越高）
-        max_time = np.max(response_times)
-        speed_scores = (max_time - response_times) / max_time if max_time > 0 else np.ones_like(response_times)
+        normalized_p2l, cost_scores, speed_scores = self._mode_score_features(
+            p2l_coefficients, costs, response_times
+        )
         
         print(f"   📊 标准化P2L: {normalized_p2l}")
         print(f"   💰 成本分数: {cost_scores}")
         print(f"   ⚡ 速度分数: {speed_scores}")
         
-        # 根据模式设置权重 - 极端差异化配置
-        if mode == 'performance':
-            # 性能优先：几乎完全依赖P2L系数
-            weights = {'p2l': 0.95, 'cost': 0.025, 'speed': 0.025}
-        elif mode == 'cost':
-            # 成本优先：几乎完全依赖成本效益
-            weights = {'p2l': 0.1, 'cost': 0.85, 'speed': 0.05}
-        elif mode == 'speed':
-            # 速度优先：几乎完全依赖响应速度
-            weights = {'p2l': 0.1, 'cost': 0.05, 'speed': 0.85}
-        elif mode == 'balanced':
-            # 平衡模式：相对均衡但仍有侧重
-            weights = {'p2l': 0.5, 'cost': 0.25, 'speed': 0.25}
-        else:
-            # 默认平衡模式
-            weights = {'p2l': 0.5, 'cost': 0.25, 'speed': 0.25}
+        # 根据模式设置权重（未知模式使用平衡模式）
+        weights = self.get_mode_weights().get(mode, self.MODE_WEIGHTS['balanced'])
         
         print(f"   ⚖️ 权重设置: P2L={weights['p2l']}, 成本={weights['cost']}, 速度={weights['speed']}")
         
@@ -632,6 +1322,202 @@ class P2LRouter:
         
         return adjusted_scores
     
+    @staticmethod
+    def _mode_score_features(
+        p2l_coefficients: np.ndarray,
+        costs: np.ndarray,
+        response_times: np.ndarray
+    ) -> np.ndarray:
+        """
+        模式评分的三个标准化特征 [3, M]：P2L系数、成本分数、速度分数（均在0-1之间）
+        """
+        # 标准化P2L系数到0-1范围
+        p2l_min, p2l_max = np.min(p2l_coefficients), np.max(p2l_coefficients)
+        if p2l_max > p2l_min:
+            normalized_p2l = (p2l_coefficients - p2l_min) / (p2l_max - p2l_min)
+        else:
+            normalized_p2l = np.ones_like(p2l_coefficients, dtype=float) * 0.5
+        
+        # 标准化成本分数（成本越低分数越高）
+        max_cost = np.max(costs)
+        cost_scores = (max_cost - costs) / max_cost if max_cost > 0 else np.ones_like(costs)
+        
+        # 标准化速度分数（时间越短分数越高）
+        max_time = np.max(response_times)
+        speed_scores = (max_time - response_times) / max_time if max_time > 0 else np.ones_like(response_times)
+        
+        return np.stack([normalized_p2l, cost_scores, speed_scores])
+    
+    def get_mode_weights(self) -> Dict[str, Dict[str, float]]:
+        """全部模式的权重：内置四种模式 + 自定义模式"""
+        return {**self.MODE_WEIGHTS, **self.custom_mode_weights}
+    
+    def route_all_modes(
+        self,
+        p2l_coefficients: np.ndarray,
+        model_list: List[str],
+        model_configs: Dict[str, Dict],
+        budget: Optional[float] = None,
+        enabled_models: Optional[List[str]] = None,
+        modes: Optional[List[str]] = None,
+        shadow_price: float = 0.0
+    ) -> Dict[str, Tuple[List[Dict], Dict]]:
+        """
+        一次计算所有优先模式的排名和选择
+        
+        排名：权重矩阵 [K, 3] 乘以特征 [3, M] 得到全部模式的综合评分 [K, M]；
+        选择：内置模式复用 route_models_batch（同一系数向量的K行），自定义模式选择排名第一的模型。
+        
+        Args:
+            p2l_coefficients: P2L系数（与model_list对齐）
+            model_list: 模型列表
+            model_configs: 模型配置
+            budget: 预算约束（可选）
+            enabled_models: 启用的模型列表（可选）
+            modes: 需要计算的模式（可选，默认全部内置和自定义模式）
+            shadow_price: 预算节奏控制的影子价格（可选），见route_models
+        
+        Returns:
+            {mode: (rankings, routing_info)}，与 generate_model_ranking / route_models 的结构一致
+        """
+        mode_weights = self.get_mode_weights()
+        modes = list(modes or mode_weights)
+        unknown = [mode for mode in modes if mode not in mode_weights]
+        if unknown:
+            raise ValueError(f"未知的优先模式: {unknown}，可选: {list(mode_weights)}")
+        
+        table = self.get_routing_table(model_list, model_configs)
+        columns = table.columns(enabled_models)
+        if len(columns) == 0:
+            raise ValueError("没有启用的模型可用")
+        
+        # 排名使用降权后的系数；批量路由内部自行应用熔断状态，传入原始系数
+        p2l_coefficients = np.asarray(p2l_coefficients, dtype=float)
+        columns, penalized, excluded_models = self._apply_circuit_breakers(table, columns, p2l_coefficients)
+        penalized = self._apply_shadow_price(table, penalized, shadow_price)
+        coefficients = p2l_coefficients[columns]
+        costs = table.costs[columns]
+        response_times = self.get_response_times(table)
+        
+        # 所有模式的综合评分 [K, M] 与排序
+        weight_matrix = np.array([[mode_weights[m]['p2l'], mode_weights[m]['cost'], mode_weights[m]['speed']] for m in modes])
+        queue_delays = self.get_queueing_delays(table)
+        if queue_delays is None or not queue_delays.any():
+            features = self._mode_score_features(penalized[columns], costs, response_times[columns])
+            adjusted_scores = weight_matrix @ features
+        else:
+            # 有排队延迟时各模式的特征不同（按模式权重计入），逐模式计算
+            adjusted_scores = np.empty((len(modes), len(columns)))
+            for k, mode in enumerate(modes):
+                loaded_coefficients, loaded_costs, loaded_times, _ = self._apply_load(table, mode, penalized)
+                adjusted_scores[k] = weight_matrix[k] @ self._mode_score_features(
+                    loaded_coefficients[columns], loaded_costs[columns], loaded_times[columns]
+                )
+        orders = np.argsort(-adjusted_scores, axis=1, kind="stable")
+        
+        # 内置模式的路由选择：K行相同系数一次批量路由
+        builtin = [mode for mode in modes if mode in self.mode_mapping]
+        batch = None
+        if builtin:
+            batch = self.route_models_batch(
+                np.broadcast_to(p2l_coefficients, (len(builtin), len(p2l_coefficients))),
+                model_list, model_configs, modes=builtin,
+                budgets=np.nan if budget is None else budget, enabled_models=enabled_models,
+                shadow_prices=shadow_price
+            )
+        
+        # 每个模型的公共字段只构建一次
+        entries = []
+        for column in columns:
+            config = table.config(column)
+            entries.append({
+                "model": table.models[column],
+                "config": config,
+                "provider": config["provider"],
+                "cost_per_1k": float(table.costs[column]),
+                "avg_response_time": float(response_times[column])
+            })
+        
+        results = {}
+        for k, mode in enumerate(modes):
+            rankings = [
+                {**entries[i], "score": float(adjusted_scores[k, i]), "p2l_coefficient": float(coefficients[i])}
+                for i in orders[k]
+            ]
+            
+            if mode in self.mode_mapping:
+                row = builtin.index(mode)
+                selected_model = batch["selected_models"][row]
+                strategy = batch["strategies"][row]
+            else:
+                selected_model = rankings[0]["model"]
+                strategy = "weighted"
+            
+            routing_info = {
+                "strategy": strategy,
+                "mode": mode,
+                "budget": budget,
+                "selected_model": selected_model,
+                "total_models": len(columns),
+                "mode_weights": mode_weights[mode]
+            }
+            if excluded_models:
+                routing_info["excluded_models"] = excluded_models
+            if shadow_price:
+                routing_info["shadow_price"] = float(shadow_price)
+            if strategy == "simple-lp" and batch is not None:
+                routing_info["probabilities"] = batch["probabilities"][builtin.index(mode), columns].tolist()
+            results[mode] = (rankings, routing_info)
+        
+        logger.info(f"✅ 全模式路由完成: {len(modes)} 个模式, {len(columns)} 个模型")
+        return results
+    
+    def budget_frontier(
+        self,
+        p2l_coefficients: np.ndarray,
+        model_list: List[str],
+        model_configs: Dict[str, Dict],
+        enabled_models: Optional[List[str]] = None,
+        strategy: str = 'simple-lp'
+    ) -> BudgetFrontier:
+        """
+        由一个系数向量计算完整的预算-得分前沿
+        
+        前沿的strategy_at(budget)与对应成本优化器在该预算下的混合策略一致，
+        前端预算滑块和容量规划可直接在本地查询任意预算，无需重新请求。
+        
+        Args:
+            p2l_coefficients: P2L系数（与model_list对齐）
+            model_list: 模型列表
+            model_configs: 模型配置
+            enabled_models: 启用的模型列表（可选）
+            strategy: simple-lp（得分为P2L系数）或 optimal-lp（得分为对采样分布的期望胜率 W @ q）
+        
+        Returns:
+            BudgetFrontier: model_indices 为 model_list 中的索引
+        """
+        if strategy not in ('simple-lp', 'optimal-lp'):
+            raise ValueError(f"预算前沿只支持 simple-lp / optimal-lp 策略: {strategy}")
+        
+        table = self.get_routing_table(model_list, model_configs)
+        columns = table.columns(enabled_models)
+        if len(columns) == 0:
+            raise ValueError("没有启用的模型可用")
+        
+        scores = np.asarray(p2l_coefficients, dtype=float)[columns]
+        if strategy == 'optimal-lp':
+            # 与route_models一致：对手为同一组启用模型，按采样权重分布
+            scores = OptimalLPCostOptimizer._construct_W(scores, scores) @ table.opponent_distribution(enabled_models)
+        
+        frontier = compute_budget_frontier(table.costs[columns], scores)
+        # 将启用子集中的索引映射回model_list
+        return BudgetFrontier(
+            model_indices=columns[frontier.model_indices],
+            costs=frontier.costs,
+            values=frontier.values,
+            num_models=len(model_list)
+        )
+    
     def get_routing_explanation(self, routing_info: Dict) -> str:
         """生成路由选择的解释"""
         strategy = routing_info.get("strategy", "unknown")
@@ -643,10 +1529,21 @@ class P2LRouter:
             "strict": f"成本优先模式：在预算约束内选择最佳模型 {selected_model}",
             "simple-lp": f"平衡模式：使用线性规划优化选择 {selected_model}",
             "optimal-lp": f"最优模式：使用Bradley-Terry优化选择 {selected_model}",
-            "fallback_max_score": f"降级模式：选择P2L评分最高的模型 {selected_model}"
+            "fallback_max_score": f"降级模式：选择P2L评分最高的模型 {selected_model}",
+            "weighted": f"自定义模式：按配置权重综合评分选择 {selected_model}",
+            "latency_slo": (
+                f"延迟SLO模式：选择预计在{routing_info.get('latency_budget')}s内完成的最高分模型 {selected_model}"
+                if routing_info.get("slo_met", True) else
+                f"延迟SLO模式：没有模型预计能在{routing_info.get('latency_budget')}s内完成，选择预测最快的模型 {selected_model}"
+            )
         }
         
-        return explanations.get(strategy, f"选择了模型 {selected_model}")
+        explanation = explanations.get(strategy, f"选择了模型 {selected_model}")
+        if routing_info.get("excluded_models"):
+            explanation += f"（已排除熔断中的模型: {', '.join(routing_info['excluded_models'])}）"
+        if routing_info.get("shadow_price"):
+            explanation += f"（预算节奏影子价格 {routing_info['shadow_price']:.2f}）"
+        return explanation
     
     def _strict_cost_optimization(
         self, 
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+P2L影子评估模块
+在线上流量中抽样，使用候选checkpoint在关键路径之外重新评分，
+记录与主引擎的系数差异、Top-1一致率和排名相关性
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _rank(values: np.ndarray) -> np.ndarray:
+    """计算排名（0为最小值）"""
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="stable")] = np.arange(len(values))
+    return ranks
+
+
+def compare_coefficients(primary: np.ndarray, candidate: np.ndarray) -> Dict:
+    """
+    比较主引擎与候选引擎的系数
+
+    Args:
+        primary: 主引擎系数 [M]
+        candidate: 候选引擎系数 [M]
+
+    Returns:
+        Dict: 系数差异、Top-1一致性和Spearman排名相关系数
+    """
+    primary = np.asarray(primary, dtype=float)
+    candidate = np.asarray(candidate, dtype=float)
+    deltas = candidate - primary
+
+    primary_ranks = _rank(primary)
+    candidate_ranks = _rank(candidate)
+    if np.std(primary_ranks) > 0 and np.std(candidate_ranks) > 0:
+        spearman = float(np.corrcoef(primary_ranks, candidate_ranks)[0, 1])
+    else:
+        spearman = 1.0
+
+    primary_top1 = int(np.argmax(primary))
+    candidate_top1 = int(np.argmax(candidate))
+
+    return {
+        "deltas": deltas,
+        "mean_abs_delta": float(np.mean(np.abs(deltas))),
+        "max_abs_delta": float(np.max(np.abs(deltas))),
+        "primary_top1": primary_top1,
+        "candidate_top1": candidate_top1,
+        "top1_agreement": primary_top1 == candidate_top1,
+        "spearman": spearman
+    }
+
+
+class ShadowEvaluator:
+    """
+    候选P2L checkpoint的影子评估器
+
+    - 按 sample_rate 抽样分析请求，入队不阻塞主请求，队列满时丢弃
+    - 后台任务批量调用候选引擎，使用独立的单线程执行器
+    - CPU预算：每批推理耗时 t 后休眠 t * (1/cpu_budget - 1)，
+      保证影子推理占用不超过 cpu_budget 比例的时间
+    """
+
+    def __init__(
+        self,
+        candidate_engine,
+        model_list: List[str],
+        log_path: str,
+        sample_rate: float = 0.1,
+        batch_size: int = 8,
+        max_queue: int = 256,
+        cpu_budget: float = 0.25,
+        flush_interval: float = 2.0
+    ):
+        self.candidate_engine = candidate_engine
+        self.model_list = list(model_list)
+        self.log_path = log_path
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.flush_interval = flush_interval
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="p2l-shadow")
+        self._task: Optional[asyncio.Task] = None
+
+        self.sampled = 0
+        self.dropped = 0
+        self.evaluated = 0
+        self.failed_batches = 0
+        self.top1_agreements = 0
+        self.spearman_sum = 0.0
+        self.busy_time = 0.0
+        self.started_at = None
+
+    def maybe_submit(self, prompt: str, primary_coefficients: np.ndarray) -> bool:
+        """按抽样率提交影子评估，不阻塞调用方"""
+        if self._task is None or random.random() >= self.sample_rate:
+            return False
+
+        self.sampled += 1
+        try:
+            self._queue.put_nowait((prompt, np.asarray(primary_coefficients, dtype=float), time.time()))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def start(self):
+        """启动后台评估任务"""
+        if self._task is None:
+            log_dir = os.path.dirname(self.log_path)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            self.started_at = time.time()
+            self._task = asyncio.create_task(self._worker())
+            logger.info(f"👥 影子评估已启动: 抽样率={self.sample_rate}, CPU预算={self.cpu_budget}, 日志={self.log_path}")
+
+    async def stop(self):
+        """停止后台评估任务，丢弃未处理的样本"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+        logger.info(f"👥 影子评估已停止: {self.get_stats()}")
+
+    async def _next_batch(self) -> List:
+        """收集一批样本：凑满batch_size或等待flush_interval"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self):
+        """后台批量评估循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            prompts = [prompt for prompt, _, _ in batch]
+
+            start = time.monotonic()
+            try:
+                candidate_matrix = await loop.run_in_executor(
+                    self._executor,
+                    lambda: self.candidate_engine.get_bradley_terry_coefficients_batch(prompts, self.model_list)
+                )
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"❌ 影子评估批次失败: {e}")
+                candidate_matrix = None
+            elapsed = time.monotonic() - start
+            self.busy_time += elapsed
+
+            if candidate_matrix is not None:
+                self._record_batch(batch, candidate_matrix)
+
+            # 按CPU预算让出时间，避免与主推理争抢
+            await asyncio.sleep(elapsed * (1.0 / self.cpu_budget - 1.0))
+
+    def _record_batch(self, batch: List, candidate_matrix: np.ndarray):
+        """计算对比指标并追加写入本地日志"""
+        lines = []
+        for (prompt, primary, submitted_at), candidate in zip(batch, candidate_matrix):
+            comparison = compare_coefficients(primary, candidate)
+            self.evaluated += 1
+            self.top1_agreements += int(comparison["top1_agreement"])
+            self.spearman_sum += comparison["spearman"]
+
+            lines.append(json.dumps({
+                "timestamp": submitted_at,
+                "prompt_sha1": hashlib.sha1(prompt.encode("utf-8")).hexdigest(),
+                "prompt_length": len(prompt),
+                "primary_top1": self.model_list[comparison["primary_top1"]],
+                "candidate_top1": self.model_list[comparison["candidate_top1"]],
+                "top1_agreement": comparison["top1_agreement"],
+                "spearman": round(comparison["spearman"], 4),
+                "mean_abs_delta": round(comparison["mean_abs_delta"], 4),
+                "max_abs_delta": round(comparison["max_abs_delta"], 4),
+                "deltas": {
+                    model: round(float(delta), 4)
+                    for model, delta in zip(self.model_list, comparison["deltas"])
+                }
+            }, ensure_ascii=False))
+
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def get_stats(self) -> Dict:
+        """获取影子评估统计"""
+        running_time = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "running": self._task is not None,
+            "candidate_model_path": str(getattr(self.candidate_engine, "model_path", "")),
+            "sample_rate": self.sample_rate,
+            "cpu_budget": self.cpu_budget,
+            "log_path": self.log_path,
+            "sampled": self.sampled,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "evaluated": self.evaluated,
+            "failed_batches": self.failed_batches,
+            "top1_agreement_rate": self.top1_agreements / self.evaluated if self.evaluated else None,
+            "mean_spearman": self.spearman_sum / self.evaluated if self.evaluated else None,
+            "cpu_utilization": self.busy_time / running_time if running_time > 0 else 0.0
+        }
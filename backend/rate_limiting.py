@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+上游限流模块
+按提供商用令牌桶限制每分钟请求数和token数，请求在提供商前的优先级队列中排队，
+上游返回429/5xx时按带抖动的指数退避重试，并遵守Retry-After（整个提供商暂停到该时间），
+使突发流量平滑地落在提供商配额以内，而不是触发成批的429
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+# 队列优先级：数值越小越先出队
+INTERACTIVE_QUEUE_PRIORITY = 0   # 交互式流式请求（WebSocket聊天）
+DEFAULT_QUEUE_PRIORITY = 1       # 普通生成请求
+BULK_QUEUE_PRIORITY = 2          # 离线批量生成请求
+HEDGE_QUEUE_PRIORITY_OFFSET = 1  # 对冲请求在原请求优先级上的降级
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    解析Retry-After响应头（秒数或HTTP日期），返回需要等待的秒数
+
+    无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(0.0, retry_at - (time.time() if now is None else now))
+
+
+class TokenBucket:
+    """
+    令牌桶：每分钟补充rate_per_minute个令牌，容量为burst_seconds秒的补充量
+
+    单次请求需要的令牌数超过容量时按容量等待，之后桶内余额可以为负（欠账由后续补充抵消），
+    因此大请求不会永远排不上。
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        if rate_per_minute <= 0:
+            raise ValueError("限流速率必须大于0")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self._clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """取得amount个令牌还需等待的秒数"""
+        now = self._clock() if now is None else now
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        self._refill(self._clock())
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        """归还多扣的令牌（实际用量低于预估时）"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _QueueEntry:
+    __slots__ = ("priority", "seq", "tokens", "future", "enqueued")
+
+    def __init__(self, priority: int, seq: int, tokens: float, future: asyncio.Future, enqueued: float):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = enqueued
+
+    def __lt__(self, other: "_QueueEntry") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ProviderRateLimiter:
+    """
+    单个提供商的限流器与优先级队列
+
+    acquire按(优先级, 到达顺序)出队：只有队首请求同时满足请求数和token数令牌桶、
+    且提供商不在Retry-After暂停期内时才放行。未配置限额且队列为空时直接放行。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 10.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数上限（None表示不限制）
+            tokens_per_minute: 每分钟token数上限（None表示不限制）
+            burst_seconds: 令牌桶容量（按秒计的补充量），允许短时间突发
+            clock: 时钟（测试时可替换）
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self.request_bucket = TokenBucket(requests_per_minute, burst_seconds, clock) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, burst_seconds, clock) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+        self.admitted = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_queue = 0
+        self.retries = 0
+        self.retry_after_pauses = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._queue if not entry.future.done())
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = self.blocked_until - now
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None and tokens:
+            wait = max(wait, self.token_bucket.wait_time(tokens, now))
+        return wait
+
+    def _admit(self, tokens: float, waited: float):
+        if self.request_bucket is not None:
+            self.request_bucket.consume(1)
+        if self.token_bucket is not None and tokens:
+            self.token_bucket.consume(tokens)
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > 1e-3:
+            self.throttled += 1
+
+    async def acquire(self, tokens: float = 0, priority: int = DEFAULT_QUEUE_PRIORITY, timeout: Optional[float] = None) -> float:
+        """
+        排队等待放行
+
+        Args:
+            tokens: 本次请求预计消耗的token数（输入 + 最大输出）
+            priority: 队列优先级，数值越小越先出队
+            timeout: 最长排队时间（秒），超时抛出asyncio.TimeoutError
+
+        Returns:
+            排队等待的秒数
+        """
+        loop = asyncio.get_running_loop()
+        if self._pump_task is not None and self._pump_task.get_loop() is not loop:
+            # 旧事件循环中排队的请求已随循环废弃
+            self._queue = [entry for entry in self._queue if entry.future.get_loop() is loop]
+            self._pump_task = None
+
+        now = self._clock()
+        if not self._queue and self._wait_time(tokens, now) <= 0:
+            self._admit(tokens, 0.0)
+            return 0.0
+
+        entry = _QueueEntry(priority, next(self._seq), tokens, loop.create_future(), now)
+        heapq.heappush(self._queue, entry)
+        self.peak_queue = max(self.peak_queue, self.queued)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        try:
+            if timeout is None:
+                return await entry.future
+            return await asyncio.wait_for(entry.future, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _pump(self):
+        """按队列顺序放行请求，队首未满足限额时睡眠到预计可放行的时刻"""
+        while self._queue:
+            entry = self._queue[0]
+            if entry.future.done():
+                # 已取消或排队超时
+                heapq.heappop(self._queue)
+                continue
+            now = self._clock()
+            wait = self._wait_time(entry.tokens, now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._queue)
+            waited = now - entry.enqueued
+            self._admit(entry.tokens, waited)
+            entry.future.set_result(waited)
+
+    def settle(self, estimated: float, actual: Optional[float]):
+        """按实际用量修正token桶（预估时计入了最大输出token数）"""
+        if self.token_bucket is not None and actual and estimated > actual:
+            self.token_bucket.refund(estimated - actual)
+
+    def pause(self, seconds: float):
+        """上游返回Retry-After时暂停整个提供商的放行"""
+        self.blocked_until = max(self.blocked_until, self._clock() + seconds)
+        self.retry_after_pauses += 1
+
+    def snapshot(self) -> Dict:
+        now = self._clock()
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queued": self.queued,
+            "peak_queue": self.peak_queue,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "avg_wait": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait": round(self.max_wait, 4),
+            "queue_timeouts": self.timeouts,
+            "retries": self.retries,
+            "retry_after_pauses": self.retry_after_pauses,
+            "paused_for": round(max(0.0, self.blocked_until - now), 3),
+            "available_requests": round(self.request_bucket.tokens, 2) if self.request_bucket else None,
+            "available_tokens": round(self.token_bucket.tokens, 1) if self.token_bucket else None
+        }
+
+
+class RateLimitRegistry:
+    """按提供商管理限流器，并给出重试等待时间"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        limits: Optional[Dict[str, Dict[str, float]]] = None,
+        default_requests_per_minute: Optional[float] = None,
+        default_tokens_per_minute: Optional[float] = None,
+        burst_seconds: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        max_retry_after: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[], float] = random.random
+    ):
+        """
+        Args:
+            enabled: 是否启用（关闭时不排队、不重试）
+            limits: 各提供商的限额 {provider: {"requests_per_minute": ..., "tokens_per_minute": ...}}
+            default_requests_per_minute: 未单独配置的提供商的每分钟请求数上限
+            default_tokens_per_minute: 未单独配置的提供商的每分钟token数上限
+            burst_seconds: 令牌桶容量（按秒计的补充量）
+            max_retries: 单次调用的最大重试次数
+            backoff_base: 指数退避的初始等待（秒），第n次重试的上限为 base * 2^n
+            backoff_max: 指数退避的等待上限（秒）
+            max_retry_after: 可接受的Retry-After上限（秒），超过时不重试
+            clock: 时钟（测试时可替换）
+            rng: [0, 1) 随机数（测试时可替换）
+        """
+        self.enabled = enabled
+        self.limits = dict(limits or {})
+        self.default_requests_per_minute = default_requests_per_minute
+        self.default_tokens_per_minute = default_tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self._clock = clock
+        self._rng = rng
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> ProviderRateLimiter:
+        """提供商的限流器（首次使用时按配置创建）"""
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None:
+                limits = self.limits.get(provider, {})
+                limiter = self._limiters[provider] = ProviderRateLimiter(
+                    requests_per_minute=limits.get("requests_per_minute", self.default_requests_per_minute),
+                    tokens_per_minute=limits.get("tokens_per_minute", self.default_tokens_per_minute),
+                    burst_seconds=limits.get("burst_seconds", self.burst_seconds),
+                    clock=self._clock
+                )
+            return limiter
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        第attempt次重试（从0开始）前的等待秒数，不再重试时返回None
+
+        有Retry-After时等待该时间再加少量抖动（避免同时到期的请求一起重试）；
+        否则使用全抖动指数退避：uniform(0, min(backoff_max, backoff_base * 2^attempt))
+        """
+        if attempt >= self.max_retries:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            return retry_after + self._rng() * self.backoff_base
+        return self._rng() * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+
+    def snapshot(self) -> Dict:
+        """各提供商的限额、队列与重试统计（用于监控接口）"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            "enabled": self.enabled,
+            "max_retries": self.max_retries,
+            "providers": {provider: limiter.snapshot() for provider, limiter in limiters.items()}
+        }
+
+    def reset(self):
+        with self._lock:
+            self._limiters = {}
+
+
+@process_singleton
+def get_rate_limits() -> RateLimitRegistry:
+    """进程级上游限流（首次调用时按服务配置创建）"""
+    return RateLimitRegistry(**get_service_section("rate_limiting"))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+请求控制模块
+端到端截止时间传递、P2L推理排队以及客户端断开时的取消
+"""
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# 请求头：绝对截止时间（Unix时间戳，秒）或相对超时（秒）
+DEADLINE_HEADER = "x-request-deadline"
+TIMEOUT_HEADER = "x-request-timeout"
+
+
+class DeadlineExceeded(Exception):
+    """请求截止时间已过"""
+    pass
+
+
+class ClientDisconnected(Exception):
+    """客户端已断开连接"""
+    pass
+
+
+class InferenceQueueFull(Exception):
+    """推理队列已满"""
+    pass
+
+
+@dataclass
+class RequestDeadline:
+    """请求截止时间（基于单调时钟）"""
+    expires_at: float
+    timeout: float
+
+    @classmethod
+    def after(cls, timeout: float) -> "RequestDeadline":
+        """从现在起timeout秒后到期"""
+        return cls(expires_at=time.monotonic() + timeout, timeout=timeout)
+
+    @classmethod
+    def from_headers(
+        cls,
+        headers: Mapping[str, str],
+        default_timeout: float,
+        max_timeout: Optional[float] = None
+    ) -> "RequestDeadline":
+        """
+        从请求头解析截止时间
+
+        Args:
+            headers: 请求头（键不区分大小写的映射）
+            default_timeout: 请求头缺失或无效时使用的超时（秒）
+            max_timeout: 允许的最大超时（秒），防止客户端无限延长
+
+        Returns:
+            RequestDeadline: 截止时间对象
+        """
+        timeout = default_timeout
+
+        deadline_value = headers.get(DEADLINE_HEADER)
+        timeout_value = headers.get(TIMEOUT_HEADER)
+        try:
+            if deadline_value is not None:
+                timeout = float(deadline_value) - time.time()
+            elif timeout_value is not None:
+                timeout = float(timeout_value)
+            if not math.isfinite(timeout):
+                # nan会让过期判断永远为False，inf则绕过默认超时
+                raise ValueError(f"非有限值: {timeout}")
+        except ValueError:
+            logger.warning(f"⚠️ 无效的截止时间请求头: deadline={deadline_value}, timeout={timeout_value}")
+            timeout = default_timeout
+
+        if max_timeout is not None:
+            timeout = min(timeout, max_timeout)
+
+        return cls.after(timeout)
+
+    def remaining(self) -> float:
+        """剩余时间（秒），已过期时为0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str):
+        """如果已过期则抛出DeadlineExceeded"""
+        if self.expired:
+            raise DeadlineExceeded(f"请求在{stage}阶段前已超过截止时间 ({self.timeout:.1f}s)")
+
+    def clamp(self, timeout: float) -> float:
+        """将给定超时限制在剩余时间以内"""
+        return min(timeout, self.remaining())
+
+
+class InferenceQueue:
+    """
+    P2L推理队列
+    限制并发推理数量，在推理开始前丢弃已过期的请求
+    """
+
+    def __init__(self, max_concurrency: int = 1, max_pending: int = 64):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="p2l-inference"
+        )
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.dropped_expired = 0
+        self.rejected_full = 0
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        deadline: Optional[RequestDeadline] = None
+    ) -> Any:
+        """
+        排队执行推理函数
+
+        Args:
+            fn: 在线程池中执行的同步推理函数
+            deadline: 请求截止时间（可选）
+
+        Returns:
+            推理函数的返回值
+        """
+        if deadline is not None:
+            deadline.check("排队")
+
+        if self.pending >= self.max_pending:
+            self.rejected_full += 1
+            raise InferenceQueueFull(f"推理队列已满 ({self.pending}/{self.max_pending})")
+
+        self.pending += 1
+        try:
+            if deadline is not None:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=deadline.remaining())
+                except asyncio.TimeoutError:
+                    self.dropped_expired += 1
+                    raise DeadlineExceeded(f"请求在排队期间超过截止时间 ({deadline.timeout:.1f}s)")
+            else:
+                await self._semaphore.acquire()
+        finally:
+            self.pending -= 1
+
+        # 排队期间过期的请求直接丢弃，不再占用推理资源
+        if deadline is not None and deadline.expired:
+            self._semaphore.release()
+            self.dropped_expired += 1
+            raise DeadlineExceeded(f"请求在推理开始前超过截止时间 ({deadline.timeout:.1f}s)")
+
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, lambda: fn(*args))
+
+        def _on_done(_):
+            # 推理线程真正结束后才释放并发槽位
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+        future.add_done_callback(_on_done)
+
+        # shield：调用方被取消时线程仍会跑完，但槽位计数保持准确
+        return await asyncio.shield(future)
+
+    def get_stats(self) -> dict:
+        """获取队列统计信息"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "running": self.running,
+            "completed": self.completed,
+            "dropped_expired": self.dropped_expired,
+            "rejected_full": self.rejected_full
+        }
+
+
+async def run_until_disconnect(
+    http_request,
+    awaitable: Awaitable,
+    deadline: Optional[RequestDeadline] = None,
+    poll_interval: float = 0.25
+) -> Any:
+    """
+    执行协程，客户端断开或截止时间到达时取消
+
+    Args:
+        http_request: Starlette请求对象（需支持is_disconnected）
+        awaitable: 要执行的协程
+        deadline: 请求截止时间（可选）
+        poll_interval: 断开检测间隔（秒）
+
+    Returns:
+        协程的返回值
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            wait_time = poll_interval
+            if deadline is not None:
+                wait_time = min(wait_time, deadline.remaining())
+
+            done, _ = await asyncio.wait({task}, timeout=wait_time)
+            if done:
+                return task.result()
+
+            if await http_request.is_disconnected():
+                logger.info("🔌 客户端已断开，取消进行中的请求")
+                raise ClientDisconnected("客户端已断开连接")
+
+            if deadline is not None and deadline.expired:
+                logger.info(f"⏰ 请求超过截止时间 ({deadline.timeout:.1f}s)，取消进行中的请求")
+                raise DeadlineExceeded(f"请求超过截止时间 ({deadline.timeout:.1f}s)")
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+确定性调用响应缓存模块
+temperature=0 的相同请求（同一提供商、同一上游模型名、相同消息与生成参数）直接返回缓存结果，
+内存LRU为第一层、SQLite为可选的第二层（进程重启后仍然有效），回归与评测任务重复运行时
+不再重复等待上游、也不再重复计费；非确定性采样的请求自动绕过缓存
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from .config import get_service_section, process_singleton
+except ImportError:
+    from config import get_service_section, process_singleton
+
+logger = logging.getLogger(__name__)
+
+# 参与缓存键的生成参数（其余字段如stream不影响结果）
+CACHE_KEY_PARAMS = ("max_tokens", "temperature", "top_p", "top_k", "stop", "seed", "presence_penalty", "frequency_penalty")
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """规范化消息：角色小写、文本去除首尾空白、丢弃空消息，使格式差异不影响缓存命中"""
+    normalized = []
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            content = content.strip()
+        if not content:
+            continue
+        normalized.append({"role": str(message.get("role", "user")).lower(), "content": content})
+    return normalized
+
+
+def is_deterministic(params: Dict[str, Any]) -> bool:
+    """是否为确定性采样（temperature为0；top_k=1同样视为贪心解码）"""
+    temperature = params.get("temperature")
+    return (temperature is not None and float(temperature) == 0.0) or params.get("top_k") == 1
+
+
+class ResponseCache:
+    """
+    两层响应缓存
+
+    键为 sha256(提供商, 上游请求体中的模型名、规范化消息和生成参数)。内存层按LRU淘汰，
+    磁盘层（SQLite）按最近访问时间淘汰；内存未命中而磁盘命中时提升到内存层。
+    值为上游返回的响应字段（content、tokens_used、output_tokens等），不含成本。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 1024,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 100000,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            enabled: 是否启用（默认关闭，需显式开启；单次调用也可用use_cache覆盖）
+            max_entries: 内存层最多保存的响应数
+            disk_path: SQLite文件路径（None表示只用内存层）
+            max_disk_entries: 磁盘层最多保存的响应数
+            ttl: 缓存有效期（秒），None表示不过期
+            clock: 时钟（测试时可替换）
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path: str):
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ 响应缓存磁盘层不可用，只使用内存层: {e}")
+            self._db = None
+
+    @staticmethod
+    def make_key(provider: str, request_body: Dict[str, Any]) -> str:
+        """由提供商和上游请求体计算缓存键"""
+        material = {
+            "provider": provider,
+            "model": request_body.get("model"),
+            "messages": normalize_messages(request_body.get("messages")),
+            "params": {name: request_body[name] for name in CACHE_KEY_PARAMS if request_body.get(name) is not None}
+        }
+        encoded = json.dumps(material, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def should_use(self, request_body: Dict[str, Any], use_cache: Optional[bool] = None) -> bool:
+        """本次调用是否使用缓存（use_cache为None时跟随enabled），非确定性采样一律绕过"""
+        if not (self.enabled if use_cache is None else use_cache):
+            return False
+        if not is_deterministic(request_body):
+            with self._lock:
+                self.stats["bypassed"] += 1
+            return False
+        return True
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查找缓存的响应字段"""
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    value = json.loads(row[0])
+                    self._put_memory(key, value, row[1])
+                    self.stats["disk_hits"] += 1
+                    return dict(value)
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """保存响应字段"""
+        now = self._clock()
+        with self._lock:
+            self._put_memory(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                self._evict_disk()
+            self.stats["stores"] += 1
+
+    def _put_memory(self, key: str, value: Dict[str, Any], created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self):
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            self.stats["evictions"] += excess
+
+    def clear(self):
+        """清空两层缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """命中率与容量统计（用于监控接口）"""
+        with self._lock:
+            stats = dict(self.stats)
+            memory_entries = len(self._memory)
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self._db is not None else None
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "memory_entries": memory_entries,
+            "max_entries": self.max_entries,
+            "disk_path": self.disk_path if self._db is not None else None,
+            "disk_entries": disk_entries,
+            "max_disk_entries": self.max_disk_entries,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            **stats
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+@process_singleton
+def get_response_cache() -> ResponseCache:
+    """进程级响应缓存（首次调用时按服务配置创建）"""
+    return ResponseCache(**get_service_section("response_cache"))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+响应格式模块
+P2L分析接口的紧凑响应（字段选择、Top-K、float32数组）与快速JSON序列化
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi.responses import Response
+
+# orjson为可选依赖：可直接序列化numpy数组，未安装时回退到标准库json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# 紧凑模式可选字段
+COMPACT_FIELDS = (
+    "recommended_model",  # 推荐模型
+    "confidence",         # 推荐模型的综合评分
+    "ranking",            # Top-K排名（列式：models / scores / p2l_coefficients）
+    "routing",            # 路由摘要（策略、模式、预算，不含数组）
+    "scores",             # 全部模型的P2L系数（float32数组）
+    "reasoning",          # 推荐理由
+    "processing_time",
+)
+DEFAULT_COMPACT_FIELDS = ("recommended_model", "confidence", "ranking", "routing", "processing_time")
+
+# 路由摘要保留的标量字段
+ROUTING_SUMMARY_KEYS = (
+    "strategy", "mode", "budget", "selected_model", "total_models",
+    "latency_budget", "predicted_time", "slo_met"  # 仅latency模式
+)
+
+# all_modes请求中每个模式的紧凑字段
+MODE_COMPACT_FIELDS = ("recommended_model", "confidence", "ranking", "routing")
+
+
+def _numpy_default(obj: Any) -> Any:
+    """标准库json的numpy回退处理"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def encode_json(content: Any) -> bytes:
+    """快速JSON序列化，支持numpy数组与标量"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=_numpy_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """使用encode_json序列化的JSON响应，跳过FastAPI的jsonable_encoder"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def build_full_analysis(
+    rankings: List[Dict],
+    routing_info: Dict,
+    reasoning: str,
+    processing_time: float,
+    device: str
+) -> Dict:
+    """构建完整的分析响应（默认模式，兼容现有前端）"""
+    recommendations = _build_recommendations(rankings)
+
+    return {
+        "model_ranking": rankings,
+        "recommendations": recommendations,
+        "recommended_model": rankings[0]["model"] if rankings else None,
+        "confidence": rankings[0]["score"] if rankings else 0,
+        "reasoning": reasoning,
+        "processing_time": processing_time,
+        "device": device,
+        "p2l_native": True,  # 标识这是P2L原生结果
+        "routing_info": routing_info,  # 完整的路由信息
+        # 兼容旧版本前端
+        "recommendation": {
+            "model": rankings[0]["model"] if rankings else None,
+            "score": rankings[0]["score"] if rankings else 0,
+            "reasoning": reasoning
+        }
+    }
+
+
+def _build_recommendations(rankings: List[Dict]) -> List[Dict]:
+    """转换为前端期望的推荐列表格式"""
+    return [
+        {
+            "model": ranking["model"],
+            "score": ranking["score"],
+            "p2l_coefficient": ranking.get("p2l_coefficient", 0),
+            "provider": ranking["provider"],
+            "cost_per_1k": ranking["cost_per_1k"],
+            "avg_response_time": ranking["avg_response_time"]
+        }
+        for ranking in rankings
+    ]
+
+
+def build_mode_analyses(
+    mode_results: Dict[str, tuple],
+    reasonings: Dict[str, str],
+    top_k: Optional[int] = None
+) -> Dict[str, Dict]:
+    """
+    构建all_modes请求中每个优先模式的结果（前端切换模式时直接替换推荐列表）
+
+    只包含推荐列表和路由信息，不重复每个模型的完整排名与config，避免响应大小随模式数成倍增长
+
+    Args:
+        mode_results: {mode: (rankings, routing_info)}
+        reasonings: {mode: 推荐理由}
+        top_k: 排名只保留前K个（None表示全部）
+    """
+    analyses = {}
+    for mode, (rankings, routing_info) in mode_results.items():
+        top = rankings[:top_k] if top_k else rankings
+        analyses[mode] = {
+            "recommended_model": rankings[0]["model"] if rankings else None,
+            "confidence": rankings[0]["score"] if rankings else 0,
+            "recommendations": _build_recommendations(top),
+            "routing_info": routing_info,
+            "reasoning": reasonings.get(mode)
+        }
+    return analyses
+
+
+def build_compact_mode_analyses(
+    mode_results: Dict[str, tuple],
+    model_list: List[str],
+    p2l_coefficients: np.ndarray,
+    top_k: Optional[int] = None
+) -> Dict[str, Dict]:
+    """构建all_modes请求中每个优先模式的紧凑结果（字段见MODE_COMPACT_FIELDS）"""
+    analyses = {}
+    for mode, (rankings, routing_info) in mode_results.items():
+        analyses[mode] = build_compact_analysis(
+            rankings, routing_info, model_list, p2l_coefficients, 0.0,
+            top_k=top_k, fields=list(MODE_COMPACT_FIELDS)
+        )
+    return analyses
+
+
+def validate_fields(fields: Optional[List[str]]) -> set:
+    """校验紧凑模式字段，返回实际使用的字段集合"""
+    selected = set(fields or DEFAULT_COMPACT_FIELDS)
+    unknown = selected.difference(COMPACT_FIELDS)
+    if unknown:
+        raise ValueError(f"未知的响应字段: {sorted(unknown)}，可选: {list(COMPACT_FIELDS)}")
+    return selected
+
+
+def build_compact_analysis(
+    rankings: List[Dict],
+    routing_info: Dict,
+    model_list: List[str],
+    p2l_coefficients: np.ndarray,
+    processing_time: float,
+    top_k: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    reasoning: Optional[str] = None
+) -> Dict:
+    """
+    构建紧凑的分析响应
+
+    Args:
+        rankings: 已排序的模型排名
+        routing_info: 路由信息
+        model_list: P2L系数对应的模型列表
+        p2l_coefficients: P2L系数 [M]
+        processing_time: 处理耗时（秒）
+        top_k: 排名只保留前K个（None表示全部）
+        fields: 需要返回的字段（None表示DEFAULT_COMPACT_FIELDS）
+        reasoning: 推荐理由（仅在请求reasoning字段时需要）
+
+    Returns:
+        Dict: 紧凑响应，数组为float32
+    """
+    selected = validate_fields(fields)
+    top = rankings[:top_k] if top_k else rankings
+    result: Dict[str, Any] = {}
+
+    if "recommended_model" in selected:
+        result["recommended_model"] = rankings[0]["model"] if rankings else None
+    if "confidence" in selected:
+        result["confidence"] = np.float32(rankings[0]["score"]) if rankings else 0
+    if "ranking" in selected:
+        result["ranking"] = {
+            "models": [r["model"] for r in top],
+            "scores": np.array([r["score"] for r in top], dtype=np.float32),
+            "p2l_coefficients": np.array([r.get("p2l_coefficient", 0) for r in top], dtype=np.float32)
+        }
+    if "routing" in selected:
+        result["routing"] = {
+            key: routing_info[key] for key in ROUTING_SUMMARY_KEYS if key in routing_info
+        }
+    if "scores" in selected:
+        result["scores"] = {
+            "models": list(model_list),
+            "p2l_coefficients": np.asarray(p2l_coefficients, dtype=np.float32)
+        }
+    if "reasoning" in selected:
+        result["reasoning"] = reasoning
+    if "processing_time" in selected:
+        result["processing_time"] = processing_time
+
+    return result
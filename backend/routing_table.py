@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+路由表模块
+从模型配置一次性构建不可变的列式路由表（成本、响应时间、采样权重、提供商编号）
+启用模型子集以布尔掩码表示，按frozenset缓存
+"""
+
+import logging
+import threading
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 未在采样权重表中的模型使用的默认权重
+DEFAULT_SAMPLING_WEIGHT = 1.0
+
+# 每张路由表缓存的启用模型子集数量
+MASK_CACHE_SIZE = 256
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    """将数组设为只读，防止调用方修改共享列"""
+    array.setflags(write=False)
+    return array
+
+
+class RoutingTable:
+    """
+    不可变的列式路由表
+
+    列顺序与model_list一致（即P2L系数的顺序），每次路由只需对这些数组做向量运算，
+    不再逐个查询model_configs字典。
+    """
+
+    __slots__ = (
+        "models", "index", "costs", "response_times", "sampling_weights",
+        "providers", "provider_ids", "_model_configs", "_sampling_weights", "_mask_cache", "__weakref__"
+    )
+
+    def __init__(
+        self,
+        model_list: Sequence[str],
+        model_configs: Mapping[str, Dict],
+        sampling_weights: Optional[Mapping[str, float]] = None
+    ):
+        """
+        Args:
+            model_list: 模型列表（列顺序）
+            model_configs: 模型配置，每个模型需要cost_per_1k、avg_response_time和provider
+            sampling_weights: 对手分布的采样权重（可选，缺失的模型权重为1）
+        """
+        missing = [model for model in model_list if model not in model_configs]
+        if missing:
+            raise KeyError(f"模型配置缺失: {missing}")
+
+        configs = [model_configs[model] for model in model_list]
+
+        self.models: Tuple[str, ...] = tuple(model_list)
+        self.index: Mapping[str, int] = MappingProxyType({model: i for i, model in enumerate(self.models)})
+        self.costs = _readonly(np.array([c["cost_per_1k"] for c in configs], dtype=float))
+        self.response_times = _readonly(np.array([c["avg_response_time"] for c in configs], dtype=float))
+        self.sampling_weights = _readonly(np.array(
+            [float((sampling_weights or {}).get(model, DEFAULT_SAMPLING_WEIGHT)) for model in self.models]
+        ))
+
+        # 提供商编号：providers[provider_ids[i]] 为第i个模型的提供商
+        self.providers: Tuple[str, ...] = tuple(dict.fromkeys(c.get("provider", "unknown") for c in configs))
+        provider_index = {provider: i for i, provider in enumerate(self.providers)}
+        self.provider_ids = _readonly(np.array(
+            [provider_index[c.get("provider", "unknown")] for c in configs], dtype=np.int32
+        ))
+
+        # 保留配置引用：排名结果中的config字段直接复用，且保证按id缓存时不会被回收复用
+        self._model_configs = model_configs
+        self._sampling_weights = sampling_weights
+        self._mask_cache = lru_cache(maxsize=MASK_CACHE_SIZE)(self._build_mask)
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def __repr__(self) -> str:
+        return f"RoutingTable(models={len(self.models)}, providers={list(self.providers)})"
+
+    def config(self, column: int) -> Dict:
+        """第column列模型的原始配置"""
+        return self._model_configs[self.models[column]]
+
+    def _build_mask(self, enabled: Optional[frozenset]) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        if enabled is None:
+            mask = np.ones(len(self.models), dtype=bool)
+        else:
+            # 不在路由表中的模型直接忽略
+            mask = np.zeros(len(self.models), dtype=bool)
+            mask[[self.index[model] for model in enabled if model in self.index]] = True
+        columns = np.flatnonzero(mask)
+
+        # 对手分布随子集一起预先归一化
+        weights = self.sampling_weights[columns]
+        opponents = _readonly(weights / weights.sum()) if len(columns) else None
+        return _readonly(mask), _readonly(columns), opponents
+
+    def _lookup(self, enabled_models: Optional[Iterable[str]]):
+        return self._mask_cache(frozenset(enabled_models) if enabled_models else None)
+
+    def mask(self, enabled_models: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        启用模型的布尔掩码 [M]（按frozenset缓存）
+
+        Args:
+            enabled_models: 启用的模型（None或空表示全部启用）
+        """
+        return self._lookup(enabled_models)[0]
+
+    def columns(self, enabled_models: Optional[Iterable[str]] = None) -> np.ndarray:
+        """启用模型的列索引（升序，与model_list顺序一致）"""
+        return self._lookup(enabled_models)[1]
+
+    def opponent_distribution(self, enabled_models: Optional[Iterable[str]] = None) -> Optional[np.ndarray]:
+        """启用模型上由采样权重归一化得到的对手分布（子集为空时为None）"""
+        return self._lookup(enabled_models)[2]
+
+    def cache_info(self):
+        """掩码缓存统计"""
+        return self._mask_cache.cache_info()
+
+
+_tables: Dict[Tuple, RoutingTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_routing_table(
+    model_list: Sequence[str],
+    model_configs: Mapping[str, Dict],
+    sampling_weights: Optional[Mapping[str, float]] = None
+) -> RoutingTable:
+    """
+    获取（或构建并缓存）路由表
+
+    以模型列表、配置对象和采样权重对象的身份为键，同一份配置只构建一次。
+    配置被原地修改后需调用clear_routing_tables()。
+    """
+    key = (tuple(model_list), id(model_configs), id(sampling_weights))
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = RoutingTable(model_list, model_configs, sampling_weights)
+            _tables[key] = table
+            logger.info(f"📋 路由表构建完成: {len(table)} 个模型, {len(table.providers)} 个提供商")
+    return table
+
+
+def clear_routing_tables():
+    """清空路由表缓存"""
+    with _tables_lock:
+        _tables.clear()
@@ -5,8 +5,11 @@ P2L原生后端服务
 """
 
 import os
+import re
 import sys
 import asyncio
+import hmac
+import json
 import logging
 import time
 import torch
@@ -14,9 +17,10 @@ import warnings
 
 # 抑制urllib3的OpenSSL警告
 warnings.filterwarnings("ignore", message="urllib3 v2 only supports OpenSSL 1.1.1+")
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from typing import Dict, List, Optional
 
 # 导入项目核心模块
@@ -36,9 +40,9 @@ except ImportError:
 
 # 配置日志
 try:
-    from .config import get_service_config, load_env_config, get_all_models, get_model_config
+    from .config import get_service_config, load_env_config, get_all_models, get_model_config, get_api_config
 except ImportError:
-    from config import get_service_config, load_env_config, get_all_models, get_model_config
+    from config import get_service_config, load_env_config, get_all_models, get_model_config, get_api_config
 
 # 加载环境配置
 load_env_config()
@@ -50,19 +54,64 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# MODEL_MAPPING中的P2L模型下载到的目录
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_p2l", "models")
+
 # 导入P2L原生模块
 try:
     # 尝试相对导入
-    from .p2l_engine import P2LEngine
+    from .p2l_engine import P2LEngine, get_engine_registry
     from .p2l_model_scorer import P2LModelScorer  # 新的P2L原生评分器
     from .unified_client import UnifiedLLMClient
+    from .p2l_shadow import ShadowEvaluator
+    from .chat_session import ChatSessionManager
+    from .latency_telemetry import get_latency_telemetry
+    from .circuit_breaker import get_circuit_breakers
+    from .load_tracker import get_load_tracker
+    from .hedging import get_hedging_policy
+    from .budget_pacing import get_budget_pacing
+    from .connection_pool import get_connection_pool
+    from .rate_limiting import get_rate_limits, INTERACTIVE_QUEUE_PRIORITY
+    from .response_cache import get_response_cache
+    from .llm_cassette import get_cassette
+    from .context_budget import get_context_budget, ContextLimitExceeded
+    from .bulk_generation import BulkGenerator
+    from .response_format import (
+        FastJSONResponse, build_full_analysis, build_compact_analysis, validate_fields,
+        build_mode_analyses, build_compact_mode_analyses
+    )
+    from .request_control import (
+        RequestDeadline, InferenceQueue, run_until_disconnect,
+        DeadlineExceeded, ClientDisconnected, InferenceQueueFull
+    )
     logger.info("✅ P2L原生模块导入成功")
 except ImportError as e:
     # 如果相对导入失败，尝试绝对导入
     try:
-        from p2l_engine import P2LEngine
+        from p2l_engine import P2LEngine, get_engine_registry
         from p2l_model_scorer import P2LModelScorer
         from unified_client import UnifiedLLMClient
+        from p2l_shadow import ShadowEvaluator
+        from chat_session import ChatSessionManager
+        from latency_telemetry import get_latency_telemetry
+        from circuit_breaker import get_circuit_breakers
+        from load_tracker import get_load_tracker
+        from hedging import get_hedging_policy
+        from budget_pacing import get_budget_pacing
+        from connection_pool import get_connection_pool
+        from rate_limiting import get_rate_limits, INTERACTIVE_QUEUE_PRIORITY
+        from response_cache import get_response_cache
+        from llm_cassette import get_cassette
+        from context_budget import get_context_budget, ContextLimitExceeded
+        from bulk_generation import BulkGenerator
+        from response_format import (
+            FastJSONResponse, build_full_analysis, build_compact_analysis, validate_fields,
+            build_mode_analyses, build_compact_mode_analyses
+        )
+        from request_control import (
+            RequestDeadline, InferenceQueue, run_until_disconnect,
+            DeadlineExceeded, ClientDisconnected, InferenceQueueFull
+        )
         logger.info("✅ P2L原生模块导入成功 (绝对导入)")
     except ImportError as e2:
         logger.error(f"❌ P2L原生模块导入失败: {e2}")
@@ -78,6 +127,19 @@ class P2LAnalysisRequest(BaseModel):
     priority: str = "balanced"
     enabled_models: Optional[List[str]] = None
     budget: Optional[float] = None  # 新增：预算约束
+    response_mode: str = "full"  # full: 完整响应; compact: 字段选择 + float32数组 + 快速序列化
+    top_k: Optional[int] = None  # 排名只返回前K个模型
+    fields: Optional[List[str]] = None  # compact模式返回的字段，见response_format.COMPACT_FIELDS
+    all_modes: bool = False  # 同时返回所有优先模式（含自定义模式）的排名，前端切换模式无需重新推理
+    latency_budget: Optional[float] = None  # 延迟预算（秒），priority="latency"时必需
+    expected_output_tokens: Optional[int] = None  # 预期输出token数，用于预测完成时间
+    tenant_id: Optional[str] = None  # 租户，配置了预算时按影子价格进行预算节奏控制
+
+class P2LFrontierRequest(BaseModel):
+    prompt: str
+    enabled_models: Optional[List[str]] = None
+    strategy: str = "simple-lp"  # simple-lp: 得分为P2L系数; optimal-lp: 得分为期望胜率
+    budgets: Optional[List[float]] = None  # 可选：同时返回这些预算下的最优策略
 
 class LLMRequest(BaseModel):
     model: str
@@ -85,12 +147,76 @@ class LLMRequest(BaseModel):
     messages: Optional[List[dict]] = None
     max_tokens: Optional[int] = 2000
     temperature: Optional[float] = 0.7
+    hedge_models: Optional[List[str]] = None  # P2L排名中的后续模型（由调用方给出，未给出时不对冲），主模型超过p90未返回时对冲
+    tenant_id: Optional[str] = None  # 租户，实际支出计入该租户的预算节奏
+    use_cache: Optional[bool] = None  # 是否使用响应缓存（None跟随服务配置，只对temperature=0生效）
+
+class BulkJobRequest(BaseModel):
+    model: str
+    prompt: str = ""
+    messages: Optional[List[dict]] = None
+    max_tokens: Optional[int] = 2000
+    temperature: Optional[float] = 0.7
+    id: Optional[str] = None  # 任务ID（续跑时据此跳过已完成的任务，默认为序号）
+
+class BulkGenerationRequest(BaseModel):
+    jobs: List[BulkJobRequest]
+    max_concurrency: Optional[int] = None  # 全局并发上限（不超过服务配置）
+    checkpoint: Optional[str] = None  # 检查点文件名，相同名称再次提交时跳过已完成的任务
+    tenant_id: Optional[str] = None  # 租户，实际支出计入该租户的预算节奏
+    use_cache: Optional[bool] = None  # 是否使用响应缓存
+
+class CompareRequest(BaseModel):
+    prompt: str
+    k: int = 3  # 对比P2L排名前k的模型
+    priority: str = "balanced"
+    enabled_models: Optional[List[str]] = None
+    budget: Optional[float] = None
+    messages: Optional[List[dict]] = None
+    max_tokens: Optional[int] = 2000
+    temperature: Optional[float] = 0.7
+    tenant_id: Optional[str] = None  # 租户，实际支出计入该租户的预算节奏
+
+class BudgetPacingRequest(BaseModel):
+    budget: float  # 时间窗口内的支出目标（美元）
 
 class P2LInferenceRequest(BaseModel):
     code: str
     max_length: int = 512
     temperature: float = 0.7
 
+class ChatTurnMessage(BaseModel):
+    """WebSocket聊天客户端消息：一轮对话"""
+    type: str = "message"
+    content: str = ""
+    model: Optional[str] = None  # 指定模型（不经过P2L路由）
+    keep_model: bool = False  # 沿用上一轮的模型
+    max_tokens: int = Field(2000, gt=0)
+    temperature: float = Field(0.7, ge=0.0, le=2.0)
+
+class ChatConfigMessage(BaseModel):
+    """WebSocket聊天客户端消息：修改会话的路由配置（只修改消息中出现的字段）"""
+    type: str = "config"
+    priority: Optional[str] = None
+    enabled_models: Optional[List[str]] = None
+    budget: Optional[float] = Field(None, ge=0)
+    tenant_id: Optional[str] = None
+
+class ShadowStartRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # 允许model_path字段名
+
+    model_path: str  # 候选checkpoint路径，或MODEL_MAPPING中的模型名
+    sample_rate: Optional[float] = None
+    cpu_budget: Optional[float] = None
+    batch_size: Optional[int] = None
+
+class P2LReloadRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())  # 允许model_path字段名
+
+    model_path: str  # checkpoint路径，或MODEL_MAPPING中的模型名
+    device: Optional[str] = None
+    warmup: bool = True
+
 # P2L原生后端服务
 class P2LNativeBackendService:
     """P2L原生后端服务 - 完全基于Bradley-Terry系数的智能路由"""
@@ -102,7 +228,7 @@ class P2LNativeBackendService:
         
         # 初始化各个模块
         self.all_models = get_all_models()
-        self.p2l_engine = None  # 延迟初始化
+        self.engine_registry = get_engine_registry()  # 进程级P2L引擎注册表，延迟加载
         self.p2l_model_scorer = None  # P2L原生评分器，需要p2l_engine初始化后创建
         
         # 初始化统一LLM客户端
@@ -112,6 +238,61 @@ class P2LNativeBackendService:
         self.p2l_loading = False
         self.p2l_loaded = False
         
+        # checkpoint热切换状态
+        self.reload_task = None
+        self.reload_status = {"state": "idle"}
+        
+        # 候选checkpoint影子评估
+        self.shadow_config = service_config.get("shadow", {})
+        self.checkpoint_dir = service_config.get("p2l_checkpoints", {}).get("dir") or MODELS_DIR
+        self.shadow_evaluator = None
+        
+        # 请求控制：截止时间与P2L推理队列
+        self.request_config = service_config.get("requests", {})
+        self.inference_queue = InferenceQueue(
+            max_concurrency=self.request_config.get("inference_concurrency", 1),
+            max_pending=self.request_config.get("inference_max_pending", 64)
+        )
+        
+        # 延迟遥测：UnifiedLLMClient记录实测延迟，启用时路由器的速度评分使用实测值
+        self.latency_telemetry = get_latency_telemetry()
+        self.use_live_latency = service_config.get("latency_telemetry", {}).get("enabled", True)
+        
+        # 熔断器：UnifiedLLMClient记录上游调用结果，路由器排除熔断中的模型
+        self.breaker_config = service_config.get("circuit_breaker", {})
+        self.circuit_breakers = get_circuit_breakers()
+        
+        # 负载跟踪：UnifiedLLMClient记录进行中请求数和429，启用时路由器计入排队延迟
+        self.load_tracker = get_load_tracker()
+        self.use_load_balancing = service_config.get("load_balancing", {}).get("enabled", True)
+        
+        # 租户预算节奏：生成接口记录实际支出，分析接口按影子价格路由
+        self.budget_pacing = get_budget_pacing()
+        
+        # 上游连接池：所有LLM调用（含聊天会话）共享keep-alive连接，随应用启动预热、关闭时释放
+        self.connection_pool = get_connection_pool()
+        
+        # 上游限流：按提供商令牌桶排队，429/5xx按退避重试（聊天轮次优先出队）
+        self.rate_limits = get_rate_limits()
+        
+        # 响应缓存：temperature=0的相同生成请求直接返回缓存结果
+        self.response_cache = get_response_cache()
+        self.cassette = get_cassette()
+        self.context_budget = get_context_budget()
+        self.compare_config = service_config.get("compare", {})
+        
+        # 批量生成：按提供商限制并发，结果写入检查点
+        self.bulk_config = service_config.get("bulk_generation", {})
+        
+        # WebSocket聊天会话
+        chat_config = service_config.get("chat_sessions", {})
+        self.chat_sessions = ChatSessionManager(
+            max_sessions=chat_config.get("max_sessions", 1000),
+            idle_timeout=chat_config.get("idle_timeout", 1800),
+            max_history_messages=chat_config.get("max_history_messages", 40),
+            coefficient_cache_size=chat_config.get("coefficient_cache_size", 32)
+        )
+        
         logger.info("🚀 P2L原生后端服务初始化完成（P2L模型将在后台加载）")
     
     def _detect_device(self) -> torch.device:
@@ -127,6 +308,11 @@ class P2LNativeBackendService:
             logger.info("💻 使用CPU运行")
         return device
     
+    @property
+    def p2l_engine(self):
+        """当前活跃的P2L引擎（未加载时为None）"""
+        return self.engine_registry.peek_active()
+    
     async def _load_p2l_model_async(self):
         """异步加载P2L模型"""
         try:
@@ -135,37 +321,309 @@ class P2LNativeBackendService:
             
             # 在后台线程中加载模型，避免阻塞主线程
             loop = asyncio.get_event_loop()
-            self.p2l_engine = await loop.run_in_executor(
-                None, lambda: P2LEngine(device=str(self.device))
+            await loop.run_in_executor(
+                None, lambda: self.engine_registry.activate(device=str(self.device))
             )
             
-            # 初始化P2L原生评分器
+            # 初始化P2L原生评分器（每次推理从注册表租用活跃引擎，支持热切换）
             self.p2l_model_scorer = P2LModelScorer(
                 model_configs=self.all_models,
-                p2l_engine=self.p2l_engine
+                engine_registry=self.engine_registry,
+                custom_mode_weights=service_config.get("routing", {}).get("custom_modes"),
+                latency_telemetry=self.latency_telemetry if self.use_live_latency else None,
+                latency_slo_config=service_config.get("routing", {}).get("latency_slo"),
+                circuit_breakers=self.circuit_breakers if self.circuit_breakers.enabled else None,
+                health_penalty=self.breaker_config.get("health_penalty", 1.0),
+                load_tracker=self.load_tracker if self.use_load_balancing else None,
+                load_weights=service_config.get("routing", {}).get("load_weights")
             )
             
             self.p2l_loaded = True
             self.p2l_loading = False
             logger.info("✅ P2L原生模型和评分器加载完成")
             
+            if self.shadow_config.get("model_path"):
+                try:
+                    await self.start_shadow(ShadowStartRequest(model_path=self.shadow_config["model_path"]))
+                except Exception as e:
+                    logger.error(f"❌ 影子评估启动失败: {e}")
+            
         except Exception as e:
             self.p2l_loading = False
             self.p2l_loaded = False
             logger.error(f"❌ P2L模型加载失败: {e}")
             logger.info("💡 服务将以降级模式运行，部分功能可能不可用")
     
+    def get_request_deadline(self, headers) -> RequestDeadline:
+        """根据请求头和配置生成请求截止时间"""
+        return RequestDeadline.from_headers(
+            headers,
+            default_timeout=self.request_config.get("default_timeout", 150),
+            max_timeout=self.request_config.get("max_timeout")
+        )
+    
+    def _resolve_checkpoint_path(self, model_path: str) -> str:
+        """解析checkpoint路径：MODEL_MAPPING中的模型名，或checkpoint目录下的路径（目录之外的路径被拒绝）"""
+        if model_path in MODEL_MAPPING:
+            return os.path.join(MODELS_DIR, MODEL_MAPPING[model_path]["local_name"])
+        
+        checkpoint_dir = os.path.realpath(self.checkpoint_dir)
+        resolved = os.path.realpath(os.path.join(checkpoint_dir, model_path))
+        if os.path.commonpath([checkpoint_dir, resolved]) != checkpoint_dir:
+            raise HTTPException(
+                status_code=400,
+                detail=f"checkpoint必须是MODEL_MAPPING中的模型名或位于 {checkpoint_dir} 下"
+            )
+        return resolved
+    
+    def start_p2l_reload(self, request: P2LReloadRequest) -> Dict:
+        """启动后台checkpoint加载与热切换"""
+        if self.reload_task is not None and not self.reload_task.done():
+            raise HTTPException(status_code=409, detail="已有checkpoint切换正在进行")
+        
+        model_path = self._resolve_checkpoint_path(request.model_path)
+        if not os.path.exists(model_path):
+            raise HTTPException(status_code=404, detail=f"checkpoint不存在: {model_path}")
+        
+        device = request.device or str(self.device)
+        self.reload_status = {
+            "state": "loading",
+            "model_path": model_path,
+            "device": device,
+            "started_at": time.time()
+        }
+        self.reload_task = asyncio.create_task(self._reload_p2l_model(model_path, device, request.warmup))
+        return self.reload_status
+    
+    async def _reload_p2l_model(self, model_path: str, device: str, warmup: bool):
+        """后台加载并预热新checkpoint，然后原子切换，进行中的请求在旧引擎上完成"""
+        logger.info(f"🔄 开始热切换P2L checkpoint: {model_path}")
+        try:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                None, lambda: self.engine_registry.load_and_swap(model_path, device=device, warmup=warmup)
+            )
+            self.reload_status = {"state": "completed", "finished_at": time.time(), **result}
+            logger.info(f"✅ P2L checkpoint热切换完成: {result}")
+        except Exception as e:
+            self.reload_status = {
+                "state": "failed",
+                "model_path": model_path,
+                "device": device,
+                "error": str(e),
+                "finished_at": time.time()
+            }
+            logger.error(f"❌ P2L checkpoint热切换失败: {e}")
+    
+    async def start_shadow(self, request: ShadowStartRequest) -> Dict:
+        """加载候选checkpoint并开启影子评估"""
+        if self.shadow_evaluator is not None:
+            raise HTTPException(status_code=409, detail="影子评估已在运行")
+        if not self.p2l_loaded:
+            raise HTTPException(status_code=503, detail="P2L模型未加载，无法开启影子评估")
+        
+        model_path = self._resolve_checkpoint_path(request.model_path)
+        if not os.path.exists(model_path):
+            raise HTTPException(status_code=404, detail=f"checkpoint不存在: {model_path}")
+        
+        loop = asyncio.get_event_loop()
+        candidate = await loop.run_in_executor(
+            None, lambda: self.engine_registry.acquire(model_path, device=str(self.device))
+        )
+        if not candidate.is_loaded:
+            self.engine_registry.release(candidate)
+            raise HTTPException(status_code=500, detail=f"候选checkpoint加载失败: {model_path}")
+        
+        config = self.shadow_config
+        self.shadow_evaluator = ShadowEvaluator(
+            candidate_engine=candidate,
+            model_list=self.p2l_model_scorer.model_list,
+            log_path=config.get("log_path", os.path.join("logs", "p2l_shadow.jsonl")),
+            sample_rate=request.sample_rate if request.sample_rate is not None else config.get("sample_rate", 0.05),
+            batch_size=request.batch_size or config.get("batch_size", 8),
+            max_queue=config.get("max_queue", 256),
+            cpu_budget=request.cpu_budget if request.cpu_budget is not None else config.get("cpu_budget", 0.2)
+        )
+        self.shadow_evaluator.start()
+        return self.shadow_evaluator.get_stats()
+    
+    async def stop_shadow(self) -> Dict:
+        """停止影子评估并释放候选引擎"""
+        if self.shadow_evaluator is None:
+            raise HTTPException(status_code=404, detail="影子评估未运行")
+        
+        evaluator = self.shadow_evaluator
+        self.shadow_evaluator = None
+        await evaluator.stop()
+        self.engine_registry.release(evaluator.candidate_engine)
+        return evaluator.get_stats()
+    
     async def _get_llm_client(self) -> UnifiedLLMClient:
         """获取统一LLM客户端实例"""
         if self.llm_client is None:
-            self.llm_client = UnifiedLLMClient()
+            self.llm_client = UnifiedLLMClient(pool=self.connection_pool)
         return self.llm_client
     
-    async def analyze_prompt(self, request: P2LAnalysisRequest) -> Dict:
-        """P2L原生智能分析主接口"""
+    async def prewarm_connections(self) -> Dict[str, bool]:
+        """预先建立到已配置API密钥的提供商的连接"""
+        if not self.connection_pool.enabled or not self.connection_pool.prewarm_enabled or self.cassette.replaying:
+            return {}
+        api_config = get_api_config()
+        providers = {
+            provider: url for provider, url in api_config["base_urls"].items()
+            if api_config["api_keys"].get(provider)
+        }
+        return await self.connection_pool.prewarm(providers)
+    
+    def create_bulk_generator(self, request: BulkGenerationRequest) -> BulkGenerator:
+        """按服务配置创建批量生成调度器（任务数、并发上限与检查点路径在这里校验）"""
+        max_jobs = self.bulk_config.get("max_jobs", 10000)
+        if len(request.jobs) > max_jobs:
+            raise ValueError(f"任务数 {len(request.jobs)} 超过上限 {max_jobs}")
+        max_concurrency = self.bulk_config.get("max_concurrency", 32)
+        if request.max_concurrency:
+            max_concurrency = max(1, min(request.max_concurrency, max_concurrency))
+        
+        checkpoint_path = None
+        if request.checkpoint:
+            if not re.fullmatch(r"[\w.-]+", request.checkpoint) or request.checkpoint.startswith("."):
+                raise ValueError(f"无效的检查点名称: {request.checkpoint}")
+            checkpoint_dir = self.bulk_config.get("checkpoint_dir", "checkpoints/bulk")
+            checkpoint_path = os.path.join(checkpoint_dir, f"{request.checkpoint}.jsonl")
+        
+        return BulkGenerator(
+            UnifiedLLMClient(pool=self.connection_pool),
+            max_concurrency=max_concurrency,
+            provider_concurrency=self.bulk_config.get("provider_concurrency", 8),
+            provider_limits=self.bulk_config.get("provider_limits"),
+            checkpoint_path=checkpoint_path
+        )
+    
+    async def generate_bulk(self, request: BulkGenerationRequest, generator: BulkGenerator):
+        """执行批量生成，逐行产出NDJSON（每个任务一行，最后一行为汇总）"""
+        params = {}
+        if request.use_cache is not None:
+            params["use_cache"] = request.use_cache
+        jobs = [
+            {
+                "model": job.model, "prompt": job.prompt, "messages": job.messages, "id": job.id,
+                "params": {"max_tokens": job.max_tokens, "temperature": job.temperature, **params}
+            }
+            for job in request.jobs
+        ]
+        # 进入客户端上下文：未启用共享连接池时在这里创建会话，结束后关闭
+        async with generator.client:
+            async for result in generator.run(jobs):
+                if not result.get("error") and not result.get("resumed"):
+                    self.budget_pacing.record_spend(request.tenant_id, result.get("cost") or 0.0)
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        logger.info(f"✅ 批量生成完成: {generator.stats}")
+        yield json.dumps({"done": True, "summary": generator.stats}, ensure_ascii=False) + "\n"
+    
+    async def rank_compare_models(self, request: CompareRequest, deadline: Optional[RequestDeadline] = None) -> Dict:
+        """多模型对比的路由：P2L推理一次，返回排名前k的模型"""
+        max_k = self.compare_config.get("max_k", 5)
+        if not 1 <= request.k <= max_k:
+            raise ValueError(f"k必须在1到{max_k}之间")
+        if not self.p2l_loaded:
+            raise HTTPException(status_code=503, detail="P2L模型未加载，服务暂时不可用")
+        
+        coefficients = await self.inference_queue.run(
+            self.p2l_model_scorer.get_p2l_coefficients, request.prompt, deadline=deadline
+        )
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.maybe_submit(request.prompt, coefficients)
+        
+        model_rankings, routing_info = self.p2l_model_scorer.calculate_p2l_scores(
+            prompt=request.prompt,
+            priority=request.priority,
+            enabled_models=request.enabled_models,
+            budget=request.budget,
+            p2l_coefficients=coefficients,
+            shadow_price=self.budget_pacing.shadow_price(request.tenant_id)
+        )
+        if not model_rankings:
+            raise ValueError("无可用模型")
+        
+        top = model_rankings[:request.k]
+        return {
+            "models": [r["model"] for r in top],
+            "strategy": routing_info.get("strategy", "unknown"),
+            "recommendations": [
+                {"model": r["model"], "score": r["score"], "provider": r["provider"]} for r in top
+            ]
+        }
+    
+    @staticmethod
+    def _sse_event(event: str, data: Dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    async def stream_compare(self, request: CompareRequest, routing: Dict, deadline: Optional[RequestDeadline] = None):
+        """并发生成各模型的回答，按到达顺序以SSE推送（事件中的model标明所属模型）
+        
+        事件依次为 routing、token/done/error（各模型交错）、end
+        """
+        start_time = time.time()
+        models = routing["models"]
+        yield self._sse_event("routing", routing)
+        
+        kwargs = {
+            'max_tokens': request.max_tokens,
+            'temperature': request.temperature,
+            'deadline': deadline,
+            'queue_priority': INTERACTIVE_QUEUE_PRIORITY
+        }
+        if request.messages:
+            kwargs['messages'] = request.messages
+        
+        completed = 0
+        client = await self._get_llm_client()
+        async with client:
+            async for model, item in client.stream_multiple(models, request.prompt, **kwargs):
+                if isinstance(item, Exception):
+                    logger.error(f"❌ 对比生成失败: {model} - {item}")
+                    yield self._sse_event("error", {"model": model, "message": client.format_error_message(model, str(item))})
+                elif item.done:
+                    response = item.response
+                    completed += 1
+                    self.budget_pacing.record_spend(request.tenant_id, response.cost)
+                    yield self._sse_event("done", {
+                        "model": model,
+                        "tokens_used": response.tokens_used,
+                        "cost": response.cost,
+                        "response_time": round(response.response_time, 3),
+                        "ttft": round(response.ttft, 3) if response.ttft is not None else None
+                    })
+                else:
+                    yield self._sse_event("token", {"model": model, "delta": item.delta})
+        
+        elapsed = round(time.time() - start_time, 3)
+        logger.info(f"✅ 多模型对比完成: {completed}/{len(models)} 个模型, 耗时: {elapsed}s")
+        yield self._sse_event("end", {"completed": completed, "failed": len(models) - completed, "elapsed": elapsed})
+    
+    async def analyze_prompt(self, request: P2LAnalysisRequest, deadline: Optional[RequestDeadline] = None) -> Dict:
+        """P2L原生智能分析主接口
+        
+        response_mode="compact" 时直接返回序列化好的FastJSONResponse
+        """
         logger.info(f"🧠 收到P2L原生分析请求: {request.prompt[:50]}...")
         start_time = time.time()
         
+        compact = request.response_mode == "compact"
+        if request.response_mode not in ("full", "compact"):
+            raise HTTPException(status_code=422, detail=f"未知的响应模式: {request.response_mode}")
+        if request.top_k is not None and request.top_k < 1:
+            raise HTTPException(status_code=422, detail="top_k必须大于0")
+        if request.priority == "latency" and request.latency_budget is None:
+            raise HTTPException(status_code=422, detail="latency模式需要提供latency_budget")
+        if request.latency_budget is not None and request.latency_budget <= 0:
+            raise HTTPException(status_code=422, detail="latency_budget必须大于0")
+        if compact:
+            try:
+                compact_fields = validate_fields(request.fields)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+        
         # 检查P2L模型状态
         if not self.p2l_loaded:
             if self.p2l_loading:
@@ -174,14 +632,71 @@ class P2LNativeBackendService:
                 raise HTTPException(status_code=503, detail="P2L模型未加载，服务暂时不可用")
         
         try:
-            # 使用P2L原生评分器进行分析
-            model_rankings, routing_info = self.p2l_model_scorer.calculate_p2l_scores(
-                prompt=request.prompt,
-                priority=request.priority,
-                enabled_models=request.enabled_models,
-                budget=request.budget
+            # P2L推理经过推理队列，排队期间过期的请求不会开始推理
+            p2l_coefficients = await self.inference_queue.run(
+                self.p2l_model_scorer.get_p2l_coefficients,
+                request.prompt,
+                deadline=deadline
             )
             
+            # 租户预算节奏：读取当前影子价格（O(1)）
+            shadow_price = self.budget_pacing.shadow_price(request.tenant_id)
+            
+            # 使用P2L原生评分器进行路由和排名
+            mode_results = None
+            if request.all_modes:
+                # 一次计算所有优先模式，请求的模式作为主结果
+                mode_results = self.p2l_model_scorer.calculate_p2l_scores_all_modes(
+                    prompt=request.prompt,
+                    enabled_models=request.enabled_models,
+                    budget=request.budget,
+                    p2l_coefficients=p2l_coefficients,
+                    shadow_price=shadow_price
+                )
+            if mode_results is not None and request.priority in mode_results:
+                model_rankings, routing_info = mode_results[request.priority]
+            else:
+                # latency模式依赖延迟预算，不在全模式结果中，单独路由
+                model_rankings, routing_info = self.p2l_model_scorer.calculate_p2l_scores(
+                    prompt=request.prompt,
+                    priority=request.priority,
+                    enabled_models=request.enabled_models,
+                    budget=request.budget,
+                    p2l_coefficients=p2l_coefficients,
+                    latency_budget=request.latency_budget if request.priority == "latency" else None,
+                    expected_output_tokens=request.expected_output_tokens,
+                    shadow_price=shadow_price
+                )
+            
+            # 抽样提交影子评估（后台批量执行，不增加请求延迟）
+            if self.shadow_evaluator is not None:
+                self.shadow_evaluator.maybe_submit(request.prompt, p2l_coefficients)
+            
+            if compact:
+                reasoning = None
+                if "reasoning" in compact_fields and model_rankings:
+                    reasoning = self.p2l_model_scorer.generate_recommendation_reasoning(
+                        model_rankings[0], routing_info, request.priority
+                    )
+                content = build_compact_analysis(
+                    rankings=model_rankings,
+                    routing_info=routing_info,
+                    model_list=self.p2l_model_scorer.model_list,
+                    p2l_coefficients=p2l_coefficients,
+                    processing_time=round(time.time() - start_time, 3),
+                    top_k=request.top_k,
+                    fields=request.fields,
+                    reasoning=reasoning
+                )
+                if mode_results is not None:
+                    content["modes"] = build_compact_mode_analyses(
+                        mode_results, self.p2l_model_scorer.model_list, p2l_coefficients, top_k=request.top_k
+                    )
+                return FastJSONResponse(content)
+            
+            if request.top_k:
+                model_rankings = model_rankings[:request.top_k]
+            
             # 生成推荐理由
             if model_rankings:
                 best_model = model_rankings[0]
@@ -193,45 +708,81 @@ class P2LNativeBackendService:
             
             processing_time = round(time.time() - start_time, 3)
             
-            # 转换为前端期望的格式
-            recommendations = []
-            for ranking in model_rankings:
-                recommendations.append({
-                    "model": ranking["model"],
-                    "score": ranking["score"],
-                    "p2l_coefficient": ranking.get("p2l_coefficient", 0),
-                    "provider": ranking["provider"],
-                    "cost_per_1k": ranking["cost_per_1k"],
-                    "avg_response_time": ranking["avg_response_time"]
-                })
+            result = build_full_analysis(
+                rankings=model_rankings,
+                routing_info=routing_info,
+                reasoning=reasoning,
+                processing_time=processing_time,
+                device=str(self.device)
+            )
             
-            result = {
-                "model_ranking": model_rankings,
-                "recommendations": recommendations,
-                "recommended_model": model_rankings[0]["model"] if model_rankings else None,
-                "confidence": model_rankings[0]["score"] if model_rankings else 0,
-                "reasoning": reasoning,
-                "processing_time": processing_time,
-                "device": str(self.device),
-                "p2l_native": True,  # 标识这是P2L原生结果
-                "routing_info": routing_info,  # 完整的路由信息
-                # 兼容旧版本前端
-                "recommendation": {
-                    "model": model_rankings[0]["model"] if model_rankings else None,
-                    "score": model_rankings[0]["score"] if model_rankings else 0,
-                    "reasoning": reasoning
+            if mode_results is not None:
+                reasonings = {
+                    mode: self.p2l_model_scorer.generate_recommendation_reasoning(rankings[0], info, mode)
+                    for mode, (rankings, info) in mode_results.items() if rankings
                 }
-            }
+                result["modes"] = build_mode_analyses(mode_results, reasonings, top_k=request.top_k)
             
             logger.info(f"✅ P2L原生分析完成，策略: {routing_info.get('strategy', 'unknown')}, 耗时: {processing_time}s")
             return result
             
+        except (DeadlineExceeded, InferenceQueueFull, asyncio.CancelledError):
+            raise
         except Exception as e:
             logger.error(f"❌ P2L原生分析失败: {e}")
             raise HTTPException(status_code=500, detail=f"P2L原生分析失败: {str(e)}")
     
-    async def generate_llm_response(self, request: LLMRequest) -> Dict:
-        """LLM响应生成接口（保持不变）"""
+    async def budget_frontier(self, request: P2LFrontierRequest, deadline: Optional[RequestDeadline] = None) -> Dict:
+        """预算-得分前沿接口：一次推理返回所有预算下的最优混合策略（分段线性）"""
+        logger.info(f"📈 收到预算前沿请求: {request.prompt[:50]}...")
+        start_time = time.time()
+        
+        if request.strategy not in ("simple-lp", "optimal-lp"):
+            raise HTTPException(status_code=422, detail=f"预算前沿只支持 simple-lp / optimal-lp 策略: {request.strategy}")
+        if not self.p2l_loaded:
+            raise HTTPException(status_code=503, detail="P2L模型未加载，服务暂时不可用")
+        
+        p2l_coefficients = await self.inference_queue.run(
+            self.p2l_model_scorer.get_p2l_coefficients,
+            request.prompt,
+            deadline=deadline
+        )
+        
+        model_list = self.p2l_model_scorer.model_list
+        try:
+            frontier = self.p2l_model_scorer.p2l_router.budget_frontier(
+                p2l_coefficients, model_list, self.all_models,
+                enabled_models=request.enabled_models, strategy=request.strategy
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        
+        result = frontier.to_dict(model_list)
+        result["strategy"] = request.strategy
+        
+        if request.budgets:
+            # 逐个预算给出混合策略（只列出概率大于0的模型）
+            values = frontier.value_at(request.budgets)
+            evaluations = []
+            for budget, value in zip(request.budgets, values):
+                if budget < frontier.min_budget:
+                    evaluations.append({"budget": budget, "feasible": False})
+                    continue
+                ps = frontier.strategy_at(budget)
+                evaluations.append({
+                    "budget": budget,
+                    "feasible": True,
+                    "value": float(value),
+                    "strategy": {model_list[i]: float(p) for i, p in enumerate(ps) if p > 0}
+                })
+            result["evaluations"] = evaluations
+        
+        result["processing_time"] = round(time.time() - start_time, 3)
+        logger.info(f"✅ 预算前沿完成: {len(result['vertices'])} 个顶点, 耗时: {result['processing_time']}s")
+        return result
+    
+    async def generate_llm_response(self, request: LLMRequest, deadline: Optional[RequestDeadline] = None) -> Dict:
+        """LLM响应生成接口"""
         logger.info(f"🤖 LLM请求: {request.model}")
         
         try:
@@ -240,18 +791,24 @@ class P2LNativeBackendService:
                 # 构建kwargs参数
                 kwargs = {
                     'max_tokens': request.max_tokens,
-                    'temperature': request.temperature
+                    'temperature': request.temperature,
+                    'deadline': deadline
                 }
+                if request.use_cache is not None:
+                    kwargs['use_cache'] = request.use_cache
                 
                 # 如果有messages参数，传递给客户端
                 if request.messages:
                     kwargs['messages'] = request.messages
                 
-                response = await client.generate_response(
+                response = await client.generate_hedged(
                     request.model, 
                     request.prompt,
+                    hedge_models=[m for m in (request.hedge_models or []) if m != request.model],
                     **kwargs
                 )
+                if response.provider != "error":
+                    self.budget_pacing.record_spend(request.tenant_id, response.cost)
                 
                 return {
                     "content": response.content,
@@ -259,9 +816,13 @@ class P2LNativeBackendService:
                     "tokens_used": response.tokens_used,
                     "cost": response.cost,
                     "response_time": response.response_time,
-                    "provider": response.provider
+                    "provider": response.provider,
+                    "hedged": response.hedged,
+                    "cached": response.cached
                 }
             
+        except (DeadlineExceeded, ContextLimitExceeded):
+            raise
         except Exception as e:
             logger.error(f"❌ LLM调用失败: {e}")
             
@@ -313,6 +874,213 @@ class P2LNativeBackendService:
             logger.error(f"❌ P2L推理失败: {e}")
             raise HTTPException(status_code=500, detail=f"P2L推理失败: {str(e)}")
     
+    async def route_chat_turn(
+        self,
+        session,
+        prompt: str,
+        model: Optional[str] = None,
+        keep_model: bool = False,
+        deadline: Optional[RequestDeadline] = None
+    ) -> Dict:
+        """为聊天会话的一轮对话选择模型
+        
+        优先级：客户端指定模型 > 沿用上一轮模型 > P2L路由（同一提示词的系数从会话缓存读取）
+        """
+        if model:
+            if model not in self.all_models:
+                raise ValueError(f"不支持的模型: {model}")
+            return {"model": model, "strategy": "user_selected", "cached": False, "recommendations": []}
+        
+        if keep_model and session.previous_model:
+            return {"model": session.previous_model, "strategy": "keep_previous", "cached": False, "recommendations": []}
+        
+        if not self.p2l_loaded:
+            raise ValueError("P2L模型未加载，请指定模型或稍后重试")
+        
+        # 热切换后旧引擎的系数不再有效，缓存键包含引擎路径
+        cache_key = (str(getattr(self.p2l_engine, "model_path", "")), prompt)
+        coefficients = session.get_cached_coefficients(cache_key)
+        cached = coefficients is not None
+        if not cached:
+            coefficients = await self.inference_queue.run(
+                self.p2l_model_scorer.get_p2l_coefficients, prompt, deadline=deadline
+            )
+            session.cache_coefficients(cache_key, coefficients)
+            if self.shadow_evaluator is not None:
+                self.shadow_evaluator.maybe_submit(prompt, coefficients)
+        
+        model_rankings, routing_info = self.p2l_model_scorer.calculate_p2l_scores(
+            prompt=prompt,
+            priority=session.priority,
+            enabled_models=session.enabled_models,
+            budget=session.budget,
+            p2l_coefficients=coefficients,
+            shadow_price=self.budget_pacing.shadow_price(session.tenant_id)
+        )
+        if not model_rankings:
+            raise ValueError("无可用模型")
+        
+        return {
+            "model": model_rankings[0]["model"],
+            "strategy": routing_info.get("strategy", "unknown"),
+            "cached": cached,
+            "recommendations": [
+                {"model": r["model"], "score": r["score"], "provider": r["provider"]}
+                for r in model_rankings[:5]
+            ]
+        }
+    
+    async def handle_chat_websocket(
+        self,
+        websocket: WebSocket,
+        session_id: Optional[str] = None,
+        tenant_id: Optional[str] = None
+    ):
+        """WebSocket聊天会话
+        
+        客户端消息：
+          {"type": "message", "content": "...", "model"?, "keep_model"?, "max_tokens"?, "temperature"?}
+          {"type": "config", "priority"?, "enabled_models"?, "budget"?, "tenant_id"?}
+          {"type": "cancel"} / {"type": "reset"}
+        服务端消息：session / routing / token / done / cancelled / error
+        """
+        await websocket.accept()
+        try:
+            session = await self.chat_sessions.open(session_id, tenant_id)
+        except ValueError as e:
+            await websocket.send_json({"type": "error", "message": str(e)})
+            await websocket.close(code=1008)
+            return
+        
+        logger.info(f"💬 聊天会话已连接: {session.session_id}")
+        await websocket.send_json({"type": "session", **session.get_info()})
+        
+        turn_task = None
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except ValueError:
+                    await websocket.send_json({"type": "error", "message": "无效的JSON消息"})
+                    continue
+                if not isinstance(message, dict):
+                    await websocket.send_json({"type": "error", "message": "消息必须是JSON对象"})
+                    continue
+                
+                msg_type = message.get("type", "message")
+                try:
+                    if msg_type == "message":
+                        if turn_task is not None and not turn_task.done():
+                            await websocket.send_json({"type": "error", "message": "上一轮对话尚未完成"})
+                            continue
+                        turn = ChatTurnMessage.model_validate(message)
+                        turn_task = asyncio.create_task(self._run_chat_turn(websocket, session, turn))
+                    elif msg_type == "cancel":
+                        if turn_task is not None and not turn_task.done():
+                            turn_task.cancel()
+                    elif msg_type == "config":
+                        self._apply_chat_config(session, ChatConfigMessage.model_validate(message))
+                        await websocket.send_json({"type": "session", **session.get_info()})
+                    elif msg_type == "reset":
+                        session.reset()
+                        await websocket.send_json({"type": "session", **session.get_info()})
+                    else:
+                        await websocket.send_json({"type": "error", "message": f"未知的消息类型: {msg_type}"})
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "message": f"无效的{msg_type}消息: {self._format_validation_error(e)}"})
+        except WebSocketDisconnect:
+            logger.info(f"🔌 聊天会话已断开: {session.session_id}")
+        finally:
+            if turn_task is not None and not turn_task.done():
+                turn_task.cancel()
+                try:
+                    await turn_task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            self.chat_sessions.detach(session)
+    
+    @staticmethod
+    def _apply_chat_config(session, config: ChatConfigMessage):
+        """把校验后的配置写入会话（priority不能为null，enabled_models/budget/tenant_id为null表示不限制）"""
+        for key in ("priority", "enabled_models", "budget", "tenant_id"):
+            if key in config.model_fields_set:
+                value = getattr(config, key)
+                if key == "priority" and value is None:
+                    continue
+                setattr(session, key, value)
+    
+    @staticmethod
+    def _format_validation_error(error: ValidationError) -> str:
+        return "; ".join(
+            f"{'.'.join(str(part) for part in item['loc']) or 'message'}: {item['msg']}" for item in error.errors()
+        )
+    
+    async def _run_chat_turn(self, websocket: WebSocket, session, message: ChatTurnMessage):
+        """执行一轮对话：推送路由决策，然后流式推送回答"""
+        prompt = message.content.strip()
+        if not prompt:
+            await websocket.send_json({"type": "error", "message": "消息内容不能为空"})
+            return
+        
+        deadline = RequestDeadline.after(self.request_config.get("default_timeout", 150))
+        stream = None
+        try:
+            routing = await self.route_chat_turn(
+                session,
+                prompt,
+                model=message.model,
+                keep_model=message.keep_model,
+                deadline=deadline
+            )
+            await websocket.send_json({"type": "routing", **routing})
+            
+            client = await session.get_client()
+            # P2L路由的轮次可对冲到排名中的下一个模型
+            hedge_models = [r["model"] for r in routing["recommendations"][1:]]
+            stream = client.stream_hedged(
+                routing["model"],
+                prompt,
+                hedge_models=hedge_models,
+                messages=session.build_messages(prompt),
+                max_tokens=message.max_tokens,
+                temperature=message.temperature,
+                deadline=deadline,
+                queue_priority=INTERACTIVE_QUEUE_PRIORITY
+            )
+            response = None
+            async for chunk in stream:
+                if chunk.done:
+                    response = chunk.response
+                else:
+                    await websocket.send_json({"type": "token", "delta": chunk.delta})
+            
+            session.add_turn(prompt, response.content, response.model, response.tokens_used, response.cost)
+            self.budget_pacing.record_spend(session.tenant_id, response.cost)
+            await websocket.send_json({
+                "type": "done",
+                "model": response.model,
+                "hedged": response.hedged,
+                "tokens_used": response.tokens_used,
+                "cost": response.cost,
+                "response_time": response.response_time,
+                "ttft": response.ttft,
+                "turns": session.turns
+            })
+        except asyncio.CancelledError:
+            try:
+                await websocket.send_json({"type": "cancelled"})
+            except Exception:
+                pass  # 连接已断开
+        except Exception as e:
+            logger.error(f"❌ 聊天会话 {session.session_id} 本轮失败: {e}")
+            try:
+                await websocket.send_json({"type": "error", "message": str(e)})
+            except Exception:
+                pass
+        finally:
+            if stream is not None:
+                await stream.aclose()  # 及时关闭上游流式连接
+    
     def get_health_status(self) -> Dict:
         """健康检查"""
         if self.p2l_loaded and self.p2l_engine:
@@ -334,6 +1102,10 @@ class P2LNativeBackendService:
             "llm_client_available": True,
             "real_api_enabled": True,
             "p2l_native_scorer": self.p2l_model_scorer is not None,
+            "inference_queue": self.inference_queue.get_stats(),
+            "p2l_reload": self.reload_status.get("state"),
+            "p2l_shadow": self.shadow_evaluator is not None,
+            "chat_sessions": self.chat_sessions.get_stats(),
             "service_type": "p2l_native"  # 标识服务类型
         }
     
@@ -363,12 +1135,50 @@ def create_app() -> FastAPI:
     # 初始化P2L原生服务
     service = P2LNativeBackendService()
     
+    async def run_request(http_request: Request, handler, payload, deadline: Optional[RequestDeadline] = None):
+        """在请求截止时间内执行处理函数，客户端断开时取消（未给出deadline时按请求头创建）"""
+        if deadline is None:
+            deadline = service.get_request_deadline(http_request.headers)
+        try:
+            return await run_until_disconnect(
+                http_request, handler(payload, deadline=deadline), deadline=deadline
+            )
+        except DeadlineExceeded as e:
+            raise HTTPException(status_code=504, detail=f"请求超时: {str(e)}")
+        except ContextLimitExceeded as e:
+            raise HTTPException(status_code=413, detail=f"请求超出模型上下文窗口: {str(e)}")
+        except InferenceQueueFull as e:
+            raise HTTPException(status_code=503, detail=f"服务繁忙: {str(e)}")
+        except ClientDisconnected:
+            # 客户端已离开，响应不会被读取（沿用Nginx的499约定）
+            return Response(status_code=499)
+    
+    admin_token = os.getenv("P2L_ADMIN_TOKEN")
+    
+    def check_admin(http_request: Request):
+        """管理接口鉴权：要求X-Admin-Token请求头与P2L_ADMIN_TOKEN一致，未配置令牌时管理接口不可用"""
+        if not admin_token:
+            raise HTTPException(status_code=403, detail="未配置P2L_ADMIN_TOKEN，管理接口已禁用")
+        provided = http_request.headers.get("x-admin-token", "")
+        if not hmac.compare_digest(provided.encode(), admin_token.encode()):
+            raise HTTPException(status_code=403, detail="管理接口鉴权失败")
+    
     # 启动事件：开始异步加载P2L模型
     @app.on_event("startup")
     async def startup_event():
         """应用启动时的异步任务"""
         if service.p2l_engine is None and not service.p2l_loading:
             asyncio.create_task(service._load_p2l_model_async())
+        app.state.prewarm_task = asyncio.create_task(service.prewarm_connections())
+    
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        """关闭聊天会话持有的上游连接和共享连接池"""
+        prewarm_task = getattr(app.state, "prewarm_task", None)
+        if prewarm_task is not None and not prewarm_task.done():
+            prewarm_task.cancel()
+        await service.chat_sessions.close_all()
+        await service.connection_pool.close()
     
     # API路由
     @app.get("/health")
@@ -382,14 +1192,126 @@ def create_app() -> FastAPI:
         return service.get_health_status()
     
     @app.post("/api/p2l/analyze")
-    async def analyze_prompt(request: P2LAnalysisRequest):
+    async def analyze_prompt(request: P2LAnalysisRequest, http_request: Request):
         """P2L原生智能分析接口"""
-        return await service.analyze_prompt(request)
+        return await run_request(http_request, service.analyze_prompt, request)
+    
+    @app.post("/api/p2l/frontier")
+    async def p2l_frontier(request: P2LFrontierRequest, http_request: Request):
+        """P2L预算-得分前沿接口"""
+        return await run_request(http_request, service.budget_frontier, request)
+    
+    @app.get("/api/telemetry/latency")
+    async def get_latency_telemetry_stats():
+        """各模型实测延迟统计（首token延迟、总延迟、输出速度的p50/p90）"""
+        return {
+            "live_routing": service.use_live_latency,
+            "quantile": service.latency_telemetry.quantile,
+            "models": service.latency_telemetry.snapshot()
+        }
+    
+    @app.get("/api/circuit-breakers")
+    async def get_circuit_breaker_states():
+        """各提供商和模型的熔断器状态"""
+        return {
+            "enabled": service.circuit_breakers.enabled,
+            **service.circuit_breakers.snapshot()
+        }
+    
+    @app.get("/api/telemetry/load")
+    async def get_load_stats():
+        """各提供商和模型的进行中请求数与近期429次数"""
+        return {
+            "enabled": service.use_load_balancing,
+            **service.load_tracker.snapshot()
+        }
+    
+    @app.get("/api/telemetry/connections")
+    async def get_connection_stats():
+        """各上游的连接复用、进行中请求数与预热状态"""
+        return service.connection_pool.snapshot()
+    
+    @app.get("/api/telemetry/rate-limits")
+    async def get_rate_limit_stats():
+        """各提供商的限额、排队、等待时间与重试统计"""
+        return service.rate_limits.snapshot()
+    
+    @app.get("/api/telemetry/response-cache")
+    async def get_response_cache_stats():
+        """响应缓存的命中率（内存/磁盘）、绕过次数与容量"""
+        return service.response_cache.snapshot()
+    
+    @app.delete("/api/response-cache")
+    async def clear_response_cache(http_request: Request):
+        """清空响应缓存（管理接口）"""
+        check_admin(http_request)
+        service.response_cache.clear()
+        return service.response_cache.snapshot()
+    
+    @app.get("/api/telemetry/context-budget")
+    async def get_context_budget_stats():
+        """上下文预检的裁剪、收紧生成长度与拒绝次数，以及各提供商的token估算校准系数"""
+        return service.context_budget.snapshot()
+    
+    @app.get("/api/telemetry/cassette")
+    async def get_cassette_stats():
+        """上游流量磁带的模式、录制数与回放命中统计"""
+        return service.cassette.snapshot()
+    
+    @app.get("/api/telemetry/hedging")
+    async def get_hedging_stats():
+        """上游请求对冲计数（发起、胜出、因比例上限跳过）"""
+        return get_hedging_policy().snapshot()
+    
+    @app.get("/api/budget-pacing")
+    async def get_budget_pacing_stats():
+        """各租户的预算节奏状态（支出、影子价格、单次请求目标支出）"""
+        return {
+            "enabled": service.budget_pacing.enabled,
+            "tenants": service.budget_pacing.snapshot()
+        }
+    
+    @app.put("/api/budget-pacing/{tenant_id}")
+    async def set_tenant_budget(tenant_id: str, request: BudgetPacingRequest, http_request: Request):
+        """设置租户在时间窗口内的预算（管理接口）"""
+        check_admin(http_request)
+        try:
+            pacer = service.budget_pacing.set_budget(tenant_id, request.budget)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"tenant_id": tenant_id, **pacer.snapshot()}
     
     @app.post("/api/llm/generate")
-    async def generate_response(request: LLMRequest):
+    async def generate_response(request: LLMRequest, http_request: Request):
         """LLM响应生成接口"""
-        return await service.generate_llm_response(request)
+        return await run_request(http_request, service.generate_llm_response, request)
+    
+    @app.post("/api/llm/bulk")
+    async def generate_bulk(request: BulkGenerationRequest, http_request: Request):
+        """批量生成接口：按完成顺序以NDJSON流式返回每个任务的结果，最后一行为汇总（管理接口）"""
+        check_admin(http_request)
+        try:
+            generator = service.create_bulk_generator(request)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return StreamingResponse(service.generate_bulk(request, generator), media_type="application/x-ndjson")
+    
+    @app.post("/api/llm/compare")
+    async def compare_models(request: CompareRequest, http_request: Request):
+        """多模型对比：P2L推理一次，排名前k的模型并发生成，通过一个SSE连接按模型标记推送"""
+        # 路由和生成共用同一个截止时间，整个对比请求只有一份时间预算
+        deadline = service.get_request_deadline(http_request.headers)
+        try:
+            routing = await run_request(http_request, service.rank_compare_models, request, deadline=deadline)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if isinstance(routing, Response):
+            return routing  # 客户端已断开
+        return StreamingResponse(
+            service.stream_compare(request, routing, deadline),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # Nginx不缓冲，逐个事件推送
+        )
     
     @app.post("/api/p2l/inference")
     async def p2l_inference(request: P2LInferenceRequest):
@@ -409,16 +1331,17 @@ def create_app() -> FastAPI:
         """获取P2L推理模型信息"""
         try:
             # 使用当前P2L引擎的信息
-            if service.p2l_engine:
-                p2l_status = service.p2l_engine.get_status()
+            engine = service.p2l_engine
+            if engine:
+                p2l_status = engine.get_status()
                 model_info = {
-                    "model_name": "p2l-135m-grk",
-                    "model_path": str(service.p2l_engine.model_path),
+                    "model_name": engine.model_path.name,
+                    "model_path": str(engine.model_path),
                     "model_type": "P2L",
                     "tokenizer_type": "AutoTokenizer",
                     "is_loaded": p2l_status.get("is_loaded", False),
-                    "device": service.p2l_engine.device,
-                    "current_model_key": "p2l-135m-grk",
+                    "device": engine.device,
+                    "current_model_key": engine.model_path.name,
                     "service_type": "p2l_native",
                     "native_scorer_loaded": service.p2l_model_scorer is not None,
                     "supported_models_count": p2l_status.get("supported_models", 0)
@@ -460,16 +1383,59 @@ def create_app() -> FastAPI:
                 "timestamp": time.time()
             }
     
+    @app.post("/api/admin/p2l/reload", status_code=202)
+    async def reload_p2l_checkpoint(request: P2LReloadRequest, http_request: Request):
+        """后台加载新P2L checkpoint并热切换"""
+        check_admin(http_request)
+        return service.start_p2l_reload(request)
+    
+    @app.get("/api/admin/p2l/reload")
+    async def get_reload_status(http_request: Request):
+        """获取checkpoint热切换状态"""
+        check_admin(http_request)
+        return service.reload_status
+    
+    @app.get("/api/admin/p2l/engines")
+    async def get_engine_registry_stats(http_request: Request):
+        """获取P2L引擎注册表状态"""
+        check_admin(http_request)
+        return service.engine_registry.get_stats()
+    
+    @app.post("/api/admin/p2l/shadow")
+    async def start_shadow_evaluation(request: ShadowStartRequest, http_request: Request):
+        """开启候选checkpoint影子评估"""
+        check_admin(http_request)
+        return await service.start_shadow(request)
+    
+    @app.get("/api/admin/p2l/shadow")
+    async def get_shadow_stats(http_request: Request):
+        """获取影子评估统计"""
+        check_admin(http_request)
+        if service.shadow_evaluator is None:
+            return {"running": False}
+        return service.shadow_evaluator.get_stats()
+    
+    @app.delete("/api/admin/p2l/shadow")
+    async def stop_shadow_evaluation(http_request: Request):
+        """停止影子评估"""
+        check_admin(http_request)
+        return await service.stop_shadow()
+    
+    @app.websocket("/api/chat/ws")
+    async def chat_websocket(websocket: WebSocket, session_id: Optional[str] = None, tenant_id: Optional[str] = None):
+        """WebSocket聊天会话：服务端保存对话状态，流式推送路由决策和回答"""
+        await service.handle_chat_websocket(websocket, session_id, tenant_id)
+    
     # 兼容性路由 (保持向后兼容)
     @app.post("/analyze")
-    async def analyze_prompt_compat(request: P2LAnalysisRequest):
+    async def analyze_prompt_compat(request: P2LAnalysisRequest, http_request: Request):
         """P2L原生智能分析接口 (兼容性)"""
-        return await service.analyze_prompt(request)
+        return await run_request(http_request, service.analyze_prompt, request)
     
     @app.post("/generate")
-    async def generate_response_compat(request: LLMRequest):
+    async def generate_response_compat(request: LLMRequest, http_request: Request):
         """LLM响应生成接口 (兼容性)"""
-        return await service.generate_llm_response(request)
+        return await run_request(http_request, service.generate_llm_response, request)
     
     @app.get("/models")
     async def get_models_compat():
@@ -481,14 +1447,89 @@ def create_app() -> FastAPI:
 
     # Nginx代理路由 (去掉/api前缀后的路由)
     @app.post("/p2l/analyze")
-    async def p2l_analyze_nginx(request: P2LAnalysisRequest):
+    async def p2l_analyze_nginx(request: P2LAnalysisRequest, http_request: Request):
         """P2L原生智能分析接口 (Nginx代理)"""
-        return await service.analyze_prompt(request)
+        return await run_request(http_request, service.analyze_prompt, request)
+
+    @app.post("/p2l/frontier")
+    async def p2l_frontier_nginx(request: P2LFrontierRequest, http_request: Request):
+        """P2L预算-得分前沿接口 (Nginx代理)"""
+        return await run_request(http_request, service.budget_frontier, request)
+
+    @app.get("/telemetry/latency")
+    async def get_latency_telemetry_stats_nginx():
+        """各模型实测延迟统计 (Nginx代理)"""
+        return await get_latency_telemetry_stats()
+
+    @app.get("/circuit-breakers")
+    async def get_circuit_breaker_states_nginx():
+        """各提供商和模型的熔断器状态 (Nginx代理)"""
+        return await get_circuit_breaker_states()
+
+    @app.get("/telemetry/load")
+    async def get_load_stats_nginx():
+        """各提供商和模型的进行中请求数与近期429次数 (Nginx代理)"""
+        return await get_load_stats()
+
+    @app.get("/telemetry/connections")
+    async def get_connection_stats_nginx():
+        """各上游的连接复用与预热状态 (Nginx代理)"""
+        return await get_connection_stats()
+
+    @app.get("/telemetry/rate-limits")
+    async def get_rate_limit_stats_nginx():
+        """各提供商的限额、排队与重试统计 (Nginx代理)"""
+        return await get_rate_limit_stats()
+
+    @app.get("/telemetry/response-cache")
+    async def get_response_cache_stats_nginx():
+        """响应缓存的命中率与容量 (Nginx代理)"""
+        return await get_response_cache_stats()
+
+    @app.delete("/response-cache")
+    async def clear_response_cache_nginx(http_request: Request):
+        """清空响应缓存 (Nginx代理)"""
+        return await clear_response_cache(http_request)
+
+    @app.get("/telemetry/context-budget")
+    async def get_context_budget_stats_nginx():
+        """上下文预检统计 (Nginx代理)"""
+        return await get_context_budget_stats()
+
+    @app.get("/telemetry/cassette")
+    async def get_cassette_stats_nginx():
+        """上游流量磁带统计 (Nginx代理)"""
+        return await get_cassette_stats()
+
+    @app.get("/telemetry/hedging")
+    async def get_hedging_stats_nginx():
+        """上游请求对冲计数 (Nginx代理)"""
+        return await get_hedging_stats()
+
+    @app.get("/budget-pacing")
+    async def get_budget_pacing_stats_nginx():
+        """各租户的预算节奏状态 (Nginx代理)"""
+        return await get_budget_pacing_stats()
+
+    @app.put("/budget-pacing/{tenant_id}")
+    async def set_tenant_budget_nginx(tenant_id: str, request: BudgetPacingRequest, http_request: Request):
+        """设置租户预算 (Nginx代理)"""
+        return await set_tenant_budget(tenant_id, request, http_request)
 
     @app.post("/llm/generate")
-    async def llm_generate_nginx(request: LLMRequest):
+    async def llm_generate_nginx(request: LLMRequest, http_request: Request):
         """LLM响应生成接口 (Nginx代理)"""
-        return await service.generate_llm_response(request)
+        return await run_request(http_request, service.generate_llm_response, request)
+
+    @app.post("/llm/compare")
+    async def compare_models_nginx(request: CompareRequest, http_request: Request):
+        """多模型对比 (Nginx代理)"""
+        return await compare_models(request, http_request)
+
+    @app.post("/llm/bulk")
+    async def generate_bulk_nginx(request: BulkGenerationRequest, http_request: Request):
+        """批量生成接口 (Nginx代理)"""
+        return await generate_bulk(request, http_request)
 
     @app.post("/p2l/inference")
     async def p2l_inference_nginx(request: P2LInferenceRequest):
@@ -499,6 +1540,41 @@ def create_app() -> FastAPI:
     async def p2l_model_info_nginx():
         """获取P2L推理模型信息 (Nginx代理)"""
         return await get_p2l_model_info()
+
+    @app.post("/admin/p2l/reload", status_code=202)
+    async def reload_p2l_checkpoint_nginx(request: P2LReloadRequest, http_request: Request):
+        """后台加载新P2L checkpoint并热切换 (Nginx代理)"""
+        return await reload_p2l_checkpoint(request, http_request)
+
+    @app.get("/admin/p2l/reload")
+    async def get_reload_status_nginx(http_request: Request):
+        """获取checkpoint热切换状态 (Nginx代理)"""
+        return await get_reload_status(http_request)
+
+    @app.get("/admin/p2l/engines")
+    async def get_engine_registry_stats_nginx(http_request: Request):
+        """获取P2L引擎注册表状态 (Nginx代理)"""
+        return await get_engine_registry_stats(http_request)
+
+    @app.post("/admin/p2l/shadow")
+    async def start_shadow_evaluation_nginx(request: ShadowStartRequest, http_request: Request):
+        """开启候选checkpoint影子评估 (Nginx代理)"""
+        return await start_shadow_evaluation(request, http_request)
+
+    @app.get("/admin/p2l/shadow")
+    async def get_shadow_stats_nginx(http_request: Request):
+        """获取影子评估统计 (Nginx代理)"""
+        return await get_shadow_stats(http_request)
+
+    @app.delete("/admin/p2l/shadow")
+    async def stop_shadow_evaluation_nginx(http_request: Request):
+        """停止影子评估 (Nginx代理)"""
+        return await stop_shadow_evaluation(http_request)
+    
+    @app.websocket("/chat/ws")
+    async def chat_websocket_nginx(websocket: WebSocket, session_id: Optional[str] = None, tenant_id: Optional[str] = None):
+        """WebSocket聊天会话 (Nginx代理)"""
+        await service.handle_chat_websocket(websocket, session_id, tenant_id)
     
     return app
 
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+本地LLM替身服务
+实现UnifiedLLMClient与p2l/route/chat.py使用的OpenAI chat completions和Anthropic messages接口
+（含流式格式），按模型配置首token延迟分布、输出速率、错误与429注入，并统计用量，
+用于在没有网络的环境中做可复现的吞吐和尾延迟压测
+
+用法:
+    python stub_server.py --port 8900 --profiles profiles.json --seed 0
+然后把各提供商的BASE_URL指向该服务（启动时会打印需要设置的环境变量）
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+try:
+    from .token_estimator import estimate_message_tokens
+except ImportError:
+    from token_estimator import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+# 生成回复使用的词表（每个词按1个token计）
+_WORDS = ("the", "model", "answer", "is", "based", "on", "prompt", "routing", "latency", "token",
+          "result", "example", "value", "with", "and", "for", "data", "test", "stub", "response")
+
+# 替身服务的提供商（启动时打印对应的BASE_URL环境变量）
+STUB_PROVIDERS = ("openai", "anthropic", "google", "deepseek", "meta", "dashscope")
+
+
+@dataclass
+class LatencyProfile:
+    """
+    单个模型的延迟与错误模型
+
+    首token延迟服从对数正态分布（中位数ttft_median，对数标准差ttft_sigma），
+    之后按tokens_per_second逐个产出token；输出长度在output_tokens附近均匀抖动，不超过max_tokens
+    """
+    ttft_median: float = 0.3            # 首token延迟中位数（秒）
+    ttft_sigma: float = 0.5             # 首token延迟的对数标准差（越大尾部越长）
+    tokens_per_second: float = 80.0     # 输出速率
+    output_tokens: int = 120            # 平均输出token数
+    output_jitter: float = 0.3          # 输出长度的相对抖动
+    error_rate: float = 0.0             # 返回500的概率
+    rate_limit_rate: float = 0.0        # 随机返回429的概率
+    requests_per_minute: Optional[int] = None  # 模拟提供商配额：滑动窗口内超出时返回429
+    retry_after: Optional[float] = 1.0  # 429响应的Retry-After（秒），None表示不带该响应头
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "LatencyProfile":
+        known = {f.name for f in fields(cls)}
+        unknown = set(values) - known
+        if unknown:
+            raise ValueError(f"未知的延迟配置项: {sorted(unknown)}")
+        return cls(**values)
+
+
+class StubLLMServer:
+    """
+    LLM替身服务
+
+    按请求路径后缀分发：*/chat/completions为OpenAI兼容格式，*/messages为Anthropic原生格式，
+    因此任意BASE_URL前缀（/v1、/compatible-mode/v1等）都可以指向同一个服务。
+    """
+
+    def __init__(
+        self,
+        profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+        default_profile: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+        time_scale: float = 1.0
+    ):
+        """
+        Args:
+            profiles: 各模型（请求体中的model）的延迟配置
+            default_profile: 未单独配置的模型使用的延迟配置
+            seed: 随机种子（相同种子和请求顺序得到相同的延迟与错误序列）
+            time_scale: 所有延迟乘以该系数（测试时可缩短）
+        """
+        self.default_profile = LatencyProfile.from_dict(default_profile or {})
+        self.profiles = {model: LatencyProfile.from_dict(values) for model, values in (profiles or {}).items()}
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._windows: Dict[str, deque] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.usage: Dict[str, Dict[str, float]] = {}
+        self.app = web.Application()
+        self.app.router.add_post("/{path:.*}", self._dispatch)
+        self.app.router.add_get("/stats", self._stats)
+        self.app.router.add_get("/health", self._health)
+        self.app.router.add_get("/{path:.*}/models", self._models)
+        self.app.router.add_route("HEAD", "/{path:.*}", self._health)
+
+    def profile(self, model: str) -> LatencyProfile:
+        return self.profiles.get(model, self.default_profile)
+
+    def _usage(self, model: str) -> Dict[str, float]:
+        usage = self.usage.get(model)
+        if usage is None:
+            usage = self.usage[model] = {
+                "requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "busy_time": 0.0
+            }
+        return usage
+
+    # ---------- 延迟与错误模型 ----------
+
+    def _sample(self, profile: LatencyProfile, max_tokens: Optional[int]) -> Tuple[float, int]:
+        """抽样首token延迟（秒）与输出token数"""
+        ttft = profile.ttft_median * self._rng.lognormvariate(0.0, profile.ttft_sigma)
+        jitter = 1.0 + self._rng.uniform(-profile.output_jitter, profile.output_jitter)
+        n_tokens = max(1, int(round(profile.output_tokens * jitter)))
+        if max_tokens:
+            n_tokens = min(n_tokens, int(max_tokens))
+        return ttft * self.time_scale, n_tokens
+
+    def _rejection(self, model: str, profile: LatencyProfile) -> Optional[web.Response]:
+        """按配额与注入概率决定是否返回429/500"""
+        usage = self._usage(model)
+        if profile.requests_per_minute:
+            window = self._windows.setdefault(model, deque())
+            now = time.monotonic()
+            while window and now - window[0] > 60.0 * self.time_scale:
+                window.popleft()
+            if len(window) >= profile.requests_per_minute:
+                return self._rate_limited(usage, profile)
+            window.append(now)
+        if profile.rate_limit_rate and self._rng.random() < profile.rate_limit_rate:
+            return self._rate_limited(usage, profile)
+        if profile.error_rate and self._rng.random() < profile.error_rate:
+            usage["errors"] += 1
+            return web.json_response({"error": {"type": "server_error", "message": "stub injected error"}}, status=500)
+        return None
+
+    @staticmethod
+    def _rate_limited(usage: Dict[str, float], profile: LatencyProfile) -> web.Response:
+        usage["rate_limited"] += 1
+        headers = {"Retry-After": f"{profile.retry_after:g}"} if profile.retry_after is not None else None
+        return web.json_response(
+            {"error": {"type": "rate_limit_error", "message": "stub rate limit exceeded"}}, status=429, headers=headers
+        )
+
+    def _words(self, n_tokens: int) -> List[str]:
+        return [("" if i == 0 else " ") + self._rng.choice(_WORDS) for i in range(n_tokens)]
+
+    # ---------- 路由 ----------
+
+    async def _dispatch(self, request: web.Request) -> web.StreamResponse:
+        path = request.match_info["path"]
+        if path.endswith("chat/completions"):
+            return await self._chat_completions(request)
+        if path.endswith("messages"):
+            return await self._anthropic_messages(request)
+        if path == "stats/reset":
+            self.usage = {}
+            self._windows = {}
+            return web.json_response({"reset": True})
+        raise web.HTTPNotFound()
+
+    async def _prepare(self, request: web.Request):
+        body = await request.json()
+        model = body.get("model", "unknown")
+        profile = self.profile(model)
+        rejection = self._rejection(model, profile)
+        messages = list(body.get("messages") or [])
+        if isinstance(body.get("system"), str):
+            messages.insert(0, {"role": "system", "content": body["system"]})
+        prompt_tokens = estimate_message_tokens(messages)
+        return body, model, profile, rejection, prompt_tokens
+
+    def _account(self, model: str, prompt_tokens: int, completion_tokens: int, started: float, streamed: bool):
+        usage = self._usage(model)
+        usage["requests"] += 1
+        usage["streamed"] += int(streamed)
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+        usage["busy_time"] += time.monotonic() - started
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        """OpenAI兼容的chat completions（stream=True时为SSE，stream_options.include_usage时最后一个事件携带用量）"""
+        started = time.monotonic()
+        body, model, profile, rejection, prompt_tokens = await self._prepare(request)
+        if rejection is not None:
+            return rejection
+        ttft, n_tokens = self._sample(profile, body.get("max_tokens") or body.get("max_completion_tokens"))
+        words = self._words(n_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens, "total_tokens": prompt_tokens + n_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + n_tokens / profile.tokens_per_second * self.time_scale)
+            self._account(model, prompt_tokens, n_tokens, started, streamed=False)
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, with_usage: bool = False) -> Dict:
+            event = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if with_usage:
+                event["choices"] = []
+                event["usage"] = usage
+            return event
+
+        response = await self._start_sse(request)
+        await asyncio.sleep(ttft)
+        await self._send_event(response, chunk({"role": "assistant", "content": ""}))
+        for word in words:
+            await self._send_event(response, chunk({"content": word}))
+            await asyncio.sleep(self.time_scale / profile.tokens_per_second)
+        await self._send_event(response, chunk({}, finish_reason="stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await self._send_event(response, chunk({}, with_usage=True))
+        await response.write(b"data: [DONE]\n\n")
+        self._account(model, prompt_tokens, n_tokens, started, streamed=True)
+        return response
+
+    async def _anthropic_messages(self, request: web.Request) -> web.StreamResponse:
+        """Anthropic原生messages（stream=True时按message_start/content_block_delta/message_delta等事件输出）"""
+        started = time.monotonic()
+        body, model, profile, rejection, prompt_tokens = await self._prepare(request)
+        if rejection is not None:
+            return rejection
+        ttft, n_tokens = self._sample(profile, body.get("max_tokens"))
+        words = self._words(n_tokens)
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+        message = {
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": 0}
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + n_tokens / profile.tokens_per_second * self.time_scale)
+            self._account(model, prompt_tokens, n_tokens, started, streamed=False)
+            return web.json_response({
+                **message,
+                "content": [{"type": "text", "text": "".join(words)}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": prompt_tokens, "output_tokens": n_tokens}
+            })
+
+        response = await self._start_sse(request)
+        await asyncio.sleep(ttft)
+        await self._send_event(response, {"type": "message_start", "message": message}, "message_start")
+        await self._send_event(response, {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        for word in words:
+            await self._send_event(response, {"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": word}}, "content_block_delta")
+            await asyncio.sleep(self.time_scale / profile.tokens_per_second)
+        await self._send_event(response, {"type": "content_block_stop", "index": 0}, "content_block_stop")
+        await self._send_event(response, {"type": "message_delta",
+                                          "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                          "usage": {"output_tokens": n_tokens}}, "message_delta")
+        await self._send_event(response, {"type": "message_stop"}, "message_stop")
+        self._account(model, prompt_tokens, n_tokens, started, streamed=True)
+        return response
+
+    @staticmethod
+    async def _start_sse(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        return response
+
+    @staticmethod
+    async def _send_event(response: web.StreamResponse, data: Dict[str, Any], event: Optional[str] = None):
+        prefix = f"event: {event}\n" if event else ""
+        await response.write(f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    async def _models(self, request: web.Request) -> web.Response:
+        models = sorted(self.profiles)
+        return web.json_response({"object": "list", "data": [{"id": m, "object": "model"} for m in models]})
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        """各模型的请求数、错误与429次数、token用量"""
+        totals = {"requests": 0, "errors": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        for usage in self.usage.values():
+            for key in totals:
+                totals[key] += usage[key]
+        return {"models": {m: {k: round(v, 3) for k, v in u.items()} for m, u in self.usage.items()}, "totals": totals}
+
+    # ---------- 启停 ----------
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务，返回根地址（port=0时自动选择端口）"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_host, bound_port = self._runner.addresses[0][:2]
+        return f"http://{bound_host}:{bound_port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def stub_base_urls(root: str) -> Dict[str, str]:
+    """指向替身服务的各提供商BASE_URL（Anthropic使用原生messages接口，其余使用OpenAI兼容接口）"""
+    return {provider: root if provider == "anthropic" else f"{root}/v1" for provider in STUB_PROVIDERS}
+
+
+def load_profiles(path: Optional[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+    """读取延迟配置文件：{"default": {...}, "models": {"model-name": {...}}}"""
+    if not path:
+        return {}, {}
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    return config.get("models", {}), config.get("default", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地LLM替身服务（OpenAI/Anthropic兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profiles", help="延迟配置JSON文件")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有延迟乘以该系数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    profiles, default_profile = load_profiles(args.profiles)
+    server = StubLLMServer(profiles, default_profile, seed=args.seed, time_scale=args.time_scale)
+
+    async def serve():
+        root = await server.start(args.host, args.port)
+        print(f"🧪 LLM替身服务已启动: {root}")
+        print("📋 将后端指向替身服务:")
+        for provider, url in stub_base_urls(root).items():
+            print(f"    export {provider.upper()}_BASE_URL={url}")
+            print(f"    export {provider.upper()}_API_KEY=stub")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 替身服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+P2L分析响应序列化基准
+对比完整响应（FastAPI默认编码）与紧凑响应（float32 + orjson / 标准库json）的字节数和编码耗时
+
+用法: python test/benchmark_analyze_response.py [--iterations 2000] [--top-k 5]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+import response_format
+from config import get_all_models
+from p2l_router import P2LRouter
+from response_format import build_full_analysis, build_compact_analysis, encode_json
+
+
+def build_sample(mode: str):
+    """用随机P2L系数生成一次真实的路由结果"""
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.random.default_rng(0).normal(0.5, 0.2, len(model_list))
+
+    router = P2LRouter()
+    with contextlib.redirect_stdout(io.StringIO()):  # 路由器的调试输出
+        _, routing_info = router.route_models(
+            p2l_coefficients=coefficients,
+            model_list=model_list,
+            model_configs=model_configs,
+            mode=mode,
+            budget=0.01 if mode == "cost" else None
+        )
+        rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode=mode)
+    return rankings, routing_info, model_list, coefficients
+
+
+def encode_fastapi_default(content) -> bytes:
+    """FastAPI默认路径：jsonable_encoder + JSONResponse.render"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def measure(label: str, fn, iterations: int) -> dict:
+    """测量每次响应的编码耗时和字节数"""
+    body = fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"  {label:<36} {len(body):>8} bytes  {per_call_us:>9.1f} µs/响应")
+    return {"bytes": len(body), "us": per_call_us}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="P2L分析响应序列化基准")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", default="balanced")
+    args = parser.parse_args()
+
+    rankings, routing_info, model_list, coefficients = build_sample(args.mode)
+    reasoning = "P2L模型高度推荐；综合表现最优"
+    print(f"📊 模式={args.mode}, 模型数={len(model_list)}, 迭代={args.iterations}, orjson={response_format.ORJSON_AVAILABLE}\n")
+
+    def full():
+        return encode_fastapi_default(build_full_analysis(rankings, routing_info, reasoning, 0.012, "cpu"))
+
+    def compact():
+        return encode_json(build_compact_analysis(
+            rankings, routing_info, model_list, coefficients, 0.012, top_k=args.top_k
+        ))
+
+    def compact_stdlib():
+        orjson_available = response_format.ORJSON_AVAILABLE
+        response_format.ORJSON_AVAILABLE = False
+        try:
+            return compact()
+        finally:
+            response_format.ORJSON_AVAILABLE = orjson_available
+
+    results = {
+        "full": measure("完整响应 (jsonable_encoder + json)", full, args.iterations),
+        "compact": measure(f"紧凑响应 top_k={args.top_k} (encode_json)", compact, args.iterations),
+        "compact_stdlib": measure(f"紧凑响应 top_k={args.top_k} (标准库json)", compact_stdlib, args.iterations),
+    }
+
+    base = results["full"]
+    print()
+    for name in ("compact", "compact_stdlib"):
+        r = results[name]
+        print(f"  {name}: 字节数 {r['bytes'] / base['bytes']:.1%}，编码耗时 {r['us'] / base['us']:.1%}（相对完整响应）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+测试公用工具
+"""
+
+import asyncio
+import re
+import time
+from collections import Counter
+
+from circuit_breaker import CircuitBreakerRegistry
+from hedging import HedgingPolicy
+from latency_telemetry import LatencyTelemetry
+from load_tracker import LoadTracker
+from unified_client import LLMResponse, LLMStreamChunk, UnifiedLLMClient
+
+
+class FakeClock:
+    """可手动推进的时钟"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def isolated_components(**overrides):
+    """UnifiedLLMClient的独立组件（不共享全局单例，默认关闭对冲），overrides逐项替换"""
+    components = {
+        "telemetry": LatencyTelemetry(),
+        "breakers": CircuitBreakerRegistry(),
+        "load_tracker": LoadTracker(),
+        "hedging": HedgingPolicy(enabled=False),
+    }
+    components.update(overrides)
+    return components
+
+
+class ScriptedClient(UnifiedLLMClient):
+    """
+    上游调用由测试脚本控制的客户端（非流式与流式调用共用同一脚本）
+
+    outcomes: 依次消费的调用结果，异常则抛出，其他值（或用完后）返回respond()的回答（content与cost）
+    delays: 各模型的上游耗时，None表示上游报错；delay_each_chunk时流式的每个片段都等待一次
+    gate: 设置后调用在该asyncio.Event被set之前等待
+    记录 calls / requests（模型、提示词与参数）/ started / cancelled / 各提供商的active与peak并发
+    """
+    def __init__(self, outcomes=(), delays=None, delay_each_chunk=False, gate=None, content="ok", cost=0.0, **kwargs):
+        super().__init__(**isolated_components(**kwargs))
+        self.outcomes = list(outcomes)
+        self.delays = delays or {}
+        self.delay_each_chunk = delay_each_chunk
+        self.gate = gate
+        self.content = content
+        self.cost = cost
+        self.calls = 0
+        self.requests = []
+        self.started = []
+        self.cancelled = []
+        self.active = Counter()
+        self.peak = Counter()
+
+    def respond(self, model, provider, prompt, **kwargs) -> LLMResponse:
+        """默认回答，子类可覆盖（抛出异常即上游报错）"""
+        return LLMResponse(
+            content=self.content, model=model, tokens_used=10, cost=self.cost, response_time=0.0, provider=provider
+        )
+
+    async def _scripted_call(self, model, provider, prompt, kwargs) -> LLMResponse:
+        self.calls += 1
+        self.requests.append({"model": model, "prompt": prompt, **kwargs})
+        self.started.append(model)
+        if self.gate is not None:
+            await self.gate.wait()
+        delay = self.delays.get(model, 0.0)
+        if delay is None:
+            raise RuntimeError("upstream 500")
+        for key in (provider, "total"):
+            self.active[key] += 1
+            self.peak[key] = max(self.peak[key], self.active[key])
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            for key in (provider, "total"):
+                self.active[key] -= 1
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return self.respond(model, provider, prompt, **kwargs)
+
+    async def _call(self, model, provider, prompt, kwargs) -> LLMResponse:
+        try:
+            return await self._scripted_call(model, provider, prompt, kwargs)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+
+    async def _call_deepseek(self, model, prompt, **kwargs):
+        return await self._call(model, "deepseek", prompt, kwargs)
+
+    async def _call_openai(self, model, prompt, **kwargs):
+        return await self._call(model, "openai", prompt, kwargs)
+
+    async def _stream_upstream(self, model, provider, model_config, prompt, start_time, **kwargs):
+        try:
+            response = await self._scripted_call(model, provider, prompt, kwargs)
+            # 回答按词切分为片段："one two three" -> "one ", "two ", "three"
+            for index, delta in enumerate(re.findall(r"\S+\s*", response.content)):
+                if index and self.delay_each_chunk:
+                    await asyncio.sleep(self.delays.get(model) or 0.0)
+                yield LLMStreamChunk(delta=delta)
+            response.response_time = time.time() - start_time
+            yield LLMStreamChunk(delta="", done=True, response=response)
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+测试管理接口鉴权与checkpoint路径限制
+验证未配置P2L_ADMIN_TOKEN时管理接口禁用、令牌不一致时拒绝，
+以及热切换/影子评估只能加载MODEL_MAPPING中的模型或checkpoint目录下的路径
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import service_p2l_native
+from service_p2l_native import MODELS_DIR, P2LNativeBackendService, create_app
+
+
+def _engines_status(token, headers=None):
+    """在给定P2L_ADMIN_TOKEN下创建应用并访问一个管理接口（不触发启动事件，不加载模型）"""
+    previous = os.environ.pop("P2L_ADMIN_TOKEN", None)
+    if token is not None:
+        os.environ["P2L_ADMIN_TOKEN"] = token
+    try:
+        client = TestClient(create_app())
+        return client.get("/api/admin/p2l/engines", headers=headers or {})
+    finally:
+        os.environ.pop("P2L_ADMIN_TOKEN", None)
+        if previous is not None:
+            os.environ["P2L_ADMIN_TOKEN"] = previous
+
+
+def test_admin_token():
+    """测试未配置令牌时管理接口禁用，令牌缺失或不一致时返回403"""
+    print("🧪 测试管理接口鉴权")
+
+    response = _engines_status(None)
+    assert response.status_code == 403 and "未配置" in response.json()["detail"]
+
+    assert _engines_status("secret").status_code == 403
+    assert _engines_status("secret", {"X-Admin-Token": "wrong"}).status_code == 403
+    assert _engines_status("secret", {"X-Admin-Token": "secret"}).status_code == 200
+    print("✅ 管理接口鉴权正确")
+
+
+def test_checkpoint_path_restriction():
+    """测试checkpoint路径只能位于配置目录下或为MODEL_MAPPING中的模型名"""
+    print("🧪 测试checkpoint路径限制")
+
+    service = P2LNativeBackendService()
+    with tempfile.TemporaryDirectory() as directory:
+        service.checkpoint_dir = directory
+        resolved = service._resolve_checkpoint_path("candidate-01")
+        assert resolved == os.path.join(os.path.realpath(directory), "candidate-01")
+        assert service._resolve_checkpoint_path(resolved) == resolved  # 目录内的绝对路径
+
+        for path in ("/etc", "../outside", "candidate/../../outside"):
+            try:
+                service._resolve_checkpoint_path(path)
+                assert False, f"应当拒绝 {path}"
+            except HTTPException as e:
+                assert e.status_code == 400
+
+    for name, config in service_p2l_native.MODEL_MAPPING.items():
+        assert service._resolve_checkpoint_path(name) == os.path.join(MODELS_DIR, config["local_name"])
+    print("✅ checkpoint路径限制正确")
+
+
+if __name__ == "__main__":
+    test_admin_token()
+    test_checkpoint_path_restriction()
+    print("\n🎉 管理接口鉴权测试完成！")
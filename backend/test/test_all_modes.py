@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试全模式评分
+验证一次计算的所有优先模式排名/选择与逐个模式调用的结果一致，以及自定义模式权重
+"""
+
+import contextlib
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models
+from p2l_router import P2LRouter
+from response_format import build_mode_analyses, build_compact_mode_analyses
+
+
+CUSTOM_MODES = {"quality_value": {"p2l": 0.7, "cost": 0.3, "speed": 0.0}}
+
+
+def test_matches_single_mode():
+    """测试全模式结果与逐个模式调用一致"""
+    print("🧪 测试全模式 vs 单模式")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    router = P2LRouter(custom_mode_weights=CUSTOM_MODES)
+    rng = np.random.default_rng(0)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # 路由器的调试输出
+        for trial in range(30):
+            coefficients = rng.normal(0.5, 0.3, len(model_list))
+            enabled = None if trial % 2 else model_list[:8]
+            budget = None if trial % 3 == 0 else float(rng.uniform(0.001, 0.03))
+
+            results = router.route_all_modes(coefficients, model_list, model_configs, budget=budget, enabled_models=enabled)
+            assert list(results) == ["performance", "cost", "speed", "balanced", "quality_value"]
+
+            for mode, (rankings, routing_info) in results.items():
+                expected = router.generate_model_ranking(coefficients, model_list, model_configs, mode=mode, enabled_models=enabled)
+                assert [r["model"] for r in rankings] == [r["model"] for r in expected], (trial, mode)
+                assert np.allclose([r["score"] for r in rankings], [r["score"] for r in expected])
+
+                if mode in ("performance", "cost", "speed"):  # 确定性策略
+                    selected, _ = router.route_models(coefficients, model_list, model_configs, mode=mode, budget=budget, enabled_models=enabled)
+                    assert routing_info["selected_model"] == selected, (trial, mode)
+                elif mode == "quality_value":
+                    assert routing_info["strategy"] == "weighted"
+                    assert routing_info["selected_model"] == rankings[0]["model"]
+
+    print("✅ 30次全模式结果一致")
+
+
+def test_mode_analyses():
+    """测试每个模式的响应结构"""
+    print("🧪 测试全模式响应")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.random.default_rng(1).normal(0.5, 0.3, len(model_list))
+    results = P2LRouter().route_all_modes(coefficients, model_list, model_configs, budget=0.01)
+
+    analyses = build_mode_analyses(results, {"cost": "成本效益最优"}, top_k=3)
+    assert set(analyses) == {"performance", "cost", "speed", "balanced"}
+    assert len(analyses["cost"]["recommendations"]) == 3
+    assert "model_ranking" not in analyses["cost"]  # 完整排名只在顶层返回一次
+    assert analyses["cost"]["recommended_model"] == results["cost"][0][0]["model"]
+    assert analyses["cost"]["reasoning"] == "成本效益最优"
+
+    compact = build_compact_mode_analyses(results, model_list, coefficients, top_k=2)
+    assert set(compact["speed"]) == {"recommended_model", "confidence", "ranking", "routing"}
+    assert len(compact["speed"]["ranking"]["models"]) == 2
+
+    try:
+        P2LRouter(custom_mode_weights={"bad": {"p2l": 1.0}})
+        assert False, "缺少权重应报错"
+    except ValueError:
+        pass
+    print("✅ 响应结构正确")
+
+
+if __name__ == "__main__":
+    test_matches_single_mode()
+    test_mode_analyses()
+    print("\n🎉 全模式评分测试完成！")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+测试批量路由
+验证 solve_budget_lp_batch 与逐行闭式解一致，route_models_batch 与 route_models 的确定性策略一致
+"""
+
+import contextlib
+import io
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models
+from p2l_router import (
+    P2LRouter, UnfulfillableException,
+    solve_budget_lp, solve_budget_lp_batch, sample_from_probabilities
+)
+
+
+def test_batch_lp_matches_rowwise():
+    """测试批量LP与逐行solve_budget_lp一致"""
+    print("🧪 测试批量LP vs 逐行闭式解")
+
+    rng = np.random.default_rng(0)
+    n_rows, n_models = 1000, 15
+    costs = rng.uniform(0.0005, 0.03, n_models)
+    values = rng.normal(0.0, 1.0, (n_rows, n_models))
+    budgets = rng.uniform(costs.min() * 0.5, costs.max(), n_rows)
+    budgets[::10] = np.nan  # 无预算
+
+    start = time.perf_counter()
+    probs = solve_budget_lp_batch(costs, values, budgets, chunk_size=64)
+    elapsed = time.perf_counter() - start
+
+    for row in range(n_rows):
+        if np.isnan(budgets[row]):
+            expected = np.eye(n_models)[values[row].argmax()]
+        else:
+            try:
+                expected = solve_budget_lp(costs, values[row], budgets[row])
+            except UnfulfillableException:
+                expected = np.zeros(n_models)  # 无法满足的行全为0
+        assert np.allclose(probs[row], expected, atol=1e-9), (row, probs[row], expected)
+
+    indices = sample_from_probabilities(probs, rng)
+    feasible = probs.sum(axis=1) > 0
+    assert (probs[feasible, indices[feasible]] > 0).all()
+    print(f"✅ {n_rows}行一致，批量求解 {elapsed * 1e3:.1f}ms")
+
+
+def test_route_models_batch_matches_route_models():
+    """测试批量路由与逐次route_models的选择一致（确定性策略）"""
+    print("🧪 测试route_models_batch vs route_models")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    costs = np.array([model_configs[m]["cost_per_1k"] for m in model_list])
+
+    rng = np.random.default_rng(1)
+    n_rows = 200
+    coefficients = rng.normal(0.5, 0.3, (n_rows, len(model_list)))
+    modes = rng.choice(["performance", "speed", "cost"], n_rows)
+    budgets = rng.uniform(costs.min() * 0.5, costs.max(), n_rows)
+
+    router = P2LRouter()
+    batch = router.route_models_batch(coefficients, model_list, model_configs, modes=modes, budgets=budgets, rng=rng)
+    assert batch["probabilities"].shape == (n_rows, len(model_list))
+
+    fallbacks = 0
+    with contextlib.redirect_stdout(io.StringIO()):  # 路由器的调试输出
+        for row in range(n_rows):
+            selected, info = router.route_models(
+                coefficients[row], model_list, model_configs, mode=modes[row], budget=budgets[row]
+            )
+            assert batch["selected_models"][row] == selected, (row, modes[row], selected)
+            fallbacks += info["strategy"].startswith("fallback")
+            assert info["strategy"].startswith("fallback") == batch["strategies"][row].startswith("fallback")
+
+    print(f"✅ {n_rows}行选择一致（其中{fallbacks}行预算不足回退）")
+
+
+def test_enabled_models():
+    """测试启用模型过滤"""
+    print("🧪 测试批量路由的启用模型过滤")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    enabled = model_list[:3]
+
+    coefficients = np.random.default_rng(2).normal(0.5, 0.3, (50, len(model_list)))
+    batch = P2LRouter().route_models_batch(coefficients, model_list, model_configs, modes="performance", enabled_models=enabled)
+
+    assert set(batch["selected_models"]) <= set(enabled)
+    assert (batch["probabilities"][:, 3:] == 0).all()
+    print("✅ 只在启用模型中选择")
+
+
+if __name__ == "__main__":
+    test_batch_lp_matches_rowwise()
+    test_route_models_batch_matches_route_models()
+    test_enabled_models()
+    print("\n🎉 批量路由测试完成！")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+测试预算-得分前沿
+验证前沿在任意预算下的混合策略与逐次LP求解一致，以及前沿的单调性和凹性
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models
+from p2l_router import (
+    OptimalLPCostOptimizer, P2LRouter, UnfulfillableException,
+    compute_budget_frontier, solve_budget_lp_cvxpy
+)
+
+
+def test_frontier_matches_lp():
+    """测试前沿查询与cvxpy逐次求解一致"""
+    print("🧪 测试前沿 vs 逐次LP")
+
+    rng = np.random.default_rng(3)
+    for trial in range(30):
+        n_models = int(rng.integers(2, 20))
+        costs = rng.uniform(0.0005, 0.03, n_models)
+        values = rng.normal(0.0, 1.0, n_models)
+        frontier = compute_budget_frontier(costs, values)
+
+        for budget in rng.uniform(costs.min(), costs.max() * 1.1, 5):
+            ps = frontier.strategy_at(budget)
+            reference = solve_budget_lp_cvxpy(costs, values, budget)
+            assert abs(values @ ps - values @ reference) < 1e-6, trial
+            assert abs(frontier.value_at(budget) - values @ ps) < 1e-12
+
+        # 成本和得分严格递增，边际得分递减（凹）
+        assert (np.diff(frontier.costs) > 0).all() and (np.diff(frontier.values) > 0).all()
+        assert (np.diff(frontier.slopes) <= 1e-12).all()
+        assert frontier.saturation_budget == costs[values.argmax()]
+
+    try:
+        frontier.strategy_at(frontier.min_budget / 2)
+        assert False, "低于最低成本的预算应无法满足"
+    except UnfulfillableException:
+        pass
+    assert np.isnan(frontier.value_at(frontier.min_budget / 2))
+    print("✅ 30个随机实例一致")
+
+
+def test_router_frontier():
+    """测试路由器前沿（启用模型子集与optimal-lp得分）"""
+    print("🧪 测试路由器预算前沿")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.random.default_rng(4).normal(0.5, 0.3, len(model_list))
+    router = P2LRouter()
+
+    enabled = model_list[::2]
+    frontier = router.budget_frontier(coefficients, model_list, model_configs, enabled_models=enabled)
+    assert all(model_list[i] in enabled for i in frontier.model_indices)
+
+    result = frontier.to_dict(model_list)
+    assert len(result["segments"]) == len(result["vertices"]) - 1
+    assert result["vertices"][-1]["model"] == max(enabled, key=lambda m: coefficients[model_list.index(m)])
+
+    # optimal-lp：前沿得分为 W @ q
+    frontier = router.budget_frontier(coefficients, model_list, model_configs, strategy="optimal-lp")
+    table = router.get_routing_table(model_list, model_configs)
+    Wq = OptimalLPCostOptimizer._construct_W(coefficients, coefficients) @ table.opponent_distribution()
+    assert np.allclose(frontier.values, Wq[frontier.model_indices])
+    print(f"✅ 前沿顶点: {[v['model'] for v in result['vertices']]}")
+
+
+if __name__ == "__main__":
+    test_frontier_matches_lp()
+    test_router_frontier()
+    print("\n🎉 预算前沿测试完成！")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+测试预算节奏控制
+验证影子价格的更新方向、预算耗尽与窗口滚动、路由器按影子价格偏向便宜模型，
+以及在请求流上累计支出贴合预算
+"""
+
+import contextlib
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from budget_pacing import BudgetPacer, BudgetPacingRegistry
+from config import get_all_models
+from helpers import FakeClock
+from p2l_router import P2LRouter
+
+
+def test_shadow_price_updates():
+    """测试超支时影子价格上升、低于目标时回落，预算耗尽与窗口滚动"""
+    print("🧪 测试影子价格更新")
+
+    clock = FakeClock()
+    pacer = BudgetPacer(budget=100.0, window=100.0, learning_rate=0.5, max_shadow_price=5.0, min_elapsed=1.0, clock=clock)
+    # 每秒1个请求 → 目标支出约每请求1美元
+    for i in range(10):
+        clock.now = float(i)
+        pacer.record_spend(3.0)
+    overspent = pacer.current_shadow_price()
+    assert overspent > 0
+    for i in range(10, 30):
+        clock.now = float(i)
+        pacer.record_spend(0.0)
+    assert pacer.current_shadow_price() < overspent
+
+    # 预算耗尽：取上限
+    pacer.record_spend(1000.0)
+    assert pacer.current_shadow_price() == 5.0
+
+    # 新窗口：支出清零，影子价格保留为初值
+    clock.now = 100.0
+    assert pacer.current_shadow_price() < 5.0 and pacer.spent == 0.0
+
+    # 注册表：未配置预算的租户不控制
+    registry = BudgetPacingRegistry(tenants={"team-a": 10.0}, clock=clock)
+    assert registry.shadow_price("team-b") == 0.0 and registry.get(None) is None
+    registry.record_spend("team-a", 20.0)
+    assert registry.shadow_price("team-a") == registry.get("team-a").max_shadow_price
+    assert BudgetPacingRegistry(default_budget=5.0).get("team-c") is not None
+    print("✅ 影子价格更新正确")
+
+
+def test_router_consumes_shadow_price():
+    """测试影子价格使路由偏向便宜的模型，批量路由与单次路由一致"""
+    print("🧪 测试路由器使用影子价格")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    router = P2LRouter()
+    table = router.get_routing_table(model_list, model_configs)
+    coefficients = np.random.default_rng(5).normal(0.0, 1.0, len(model_list))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        unpaced, info = router.route_models(coefficients, model_list, model_configs, mode='performance')
+        same, _ = router.route_models(coefficients, model_list, model_configs, mode='performance', shadow_price=0.0)
+        paced, paced_info = router.route_models(coefficients, model_list, model_configs, mode='performance', shadow_price=30.0)
+        rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode='performance', shadow_price=30.0)
+    assert same == unpaced and "shadow_price" not in info
+    assert table.costs[model_list.index(paced)] <= table.costs[model_list.index(unpaced)]
+    assert paced_info["shadow_price"] == 30.0 and "影子价格" in router.get_routing_explanation(paced_info)
+    assert rankings[0]["model"] == paced
+
+    # 批量路由：每行使用自己的影子价格
+    prices = np.array([0.0, 30.0])
+    batch = router.route_models_batch(np.tile(coefficients, (2, 1)), model_list, model_configs,
+                                      modes='performance', shadow_prices=prices)
+    assert batch["selected_models"] == [unpaced, paced]
+    all_modes = router.route_all_modes(coefficients, model_list, model_configs, shadow_price=30.0)
+    assert all_modes['performance'][1]["selected_model"] == paced
+    print(f"✅ 影子价格30时 {unpaced} → {paced}")
+
+
+def test_pacing_tracks_budget():
+    """测试请求流上的累计支出贴合预算，且质量高于只选最便宜的模型"""
+    print("🧪 测试请求流预算节奏")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    router = P2LRouter()
+    costs = router.get_routing_table(model_list, model_configs).costs
+    n_requests = 1000
+    coefficient_matrix = np.random.default_rng(0).normal(0.0, 1.0, (n_requests, len(model_list)))
+
+    unpaced = router.route_models_batch(coefficient_matrix, model_list, model_configs, modes='performance')
+    unpaced_spend = costs[unpaced["selected_indices"]].sum()
+
+    clock = FakeClock()
+    budget = 0.4 * unpaced_spend
+    pacer = BudgetPacer(budget=budget, window=float(n_requests), min_elapsed=10.0, clock=clock)
+    quality = 0.0
+    for i in range(n_requests):
+        clock.now = float(i)
+        result = router.route_models_batch(
+            coefficient_matrix[i:i + 1], model_list, model_configs, modes='performance',
+            shadow_prices=pacer.current_shadow_price()
+        )
+        selected = result["selected_indices"][0]
+        pacer.record_spend(costs[selected])
+        quality += coefficient_matrix[i, selected]
+
+    cheapest_quality = coefficient_matrix[:, costs.argmin()].sum()
+    assert abs(pacer.spent / budget - 1.0) < 0.05, pacer.spent / budget
+    assert quality > cheapest_quality
+    print(f"✅ 预算使用 {pacer.spent / budget:.1%}，平均P2L系数 {quality / n_requests:.3f}")
+
+
+if __name__ == "__main__":
+    test_shadow_price_updates()
+    test_router_consumes_shadow_price()
+    test_pacing_tracks_budget()
+    print("\n🎉 预算节奏控制测试完成！")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+测试批量生成
+验证按提供商与全局限制并发、慢提供商不阻塞其他提供商、结果按完成顺序产出，
+以及检查点续跑只重新执行未完成和失败的任务
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_generation import BulkGenerator, BulkJob
+from connection_pool import ConnectionPoolManager
+from helpers import ScriptedClient
+from rate_limiting import RateLimitRegistry, BULK_QUEUE_PRIORITY
+
+FAST = "deepseek-v3"
+SLOW = "gpt-4o-mini-2024-07-18"
+
+
+class ConcurrencyClient(ScriptedClient):
+    """openai较慢、fail_prompts中的提示词上游报错的客户端"""
+    def __init__(self, fail_prompts=(), **kwargs):
+        super().__init__(delays={FAST: 0.01, SLOW: 0.2}, rate_limits=RateLimitRegistry(enabled=False), **kwargs)
+        self.fail_prompts = set(fail_prompts)
+
+    def respond(self, model, provider, prompt, **kwargs):
+        if prompt in self.fail_prompts:
+            raise RuntimeError("upstream failed")
+        return super().respond(model, provider, prompt, **kwargs)
+
+    @property
+    def prompts(self):
+        return [request["prompt"] for request in self.requests]
+
+
+def _jobs():
+    jobs = [{"model": SLOW, "prompt": f"slow-{i}", "id": f"slow-{i}"} for i in range(4)]
+    jobs += [{"model": FAST, "prompt": f"fast-{i}", "id": f"fast-{i}"} for i in range(20)]
+    return jobs
+
+
+def test_bounded_concurrency():
+    """测试并发上限、慢提供商不阻塞快提供商、按完成顺序产出"""
+    print("🧪 测试批量生成并发")
+
+    client = ConcurrencyClient()
+    generator = BulkGenerator(client, max_concurrency=5, provider_concurrency=4, provider_limits={"openai": 2})
+
+    async def run():
+        return [result async for result in generator.run(_jobs() + [{"model": "unknown", "prompt": "x"}])]
+
+    start = time.monotonic()
+    results = asyncio.run(run())
+    elapsed = time.monotonic() - start
+    assert len(results) == 25 and generator.stats["completed"] == 24 and generator.stats["failed"] == 1
+    assert client.peak["openai"] == 2 and client.peak["deepseek"] <= 4 and client.peak["total"] <= 5
+    assert {request["queue_priority"] for request in client.requests} == {BULK_QUEUE_PRIORITY}
+    # 快提供商的任务在慢提供商的第一批完成之前就已全部返回
+    order = [r["id"] for r in results if not r["error"]]
+    assert all(name.startswith("fast") for name in order[:20]), order
+    assert elapsed < 0.6, elapsed  # 4个慢任务按并发2需要两轮（0.4s），快任务与之重叠
+    assert sorted(r["index"] for r in results) == list(range(25))
+    print(f"✅ 24个任务用时 {elapsed:.2f}s")
+
+
+def test_checkpoint_resume():
+    """测试中断后续跑：已完成的任务从检查点返回，失败和未执行的任务重新执行"""
+    print("🧪 测试检查点续跑")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run", "job.jsonl")
+        client = ConcurrencyClient(fail_prompts={"fast-3"})
+        generator = BulkGenerator(client, max_concurrency=2, provider_concurrency=2, checkpoint_path=path)
+
+        async def interrupted():
+            results = []
+            stream = generator.run(_jobs())
+            async for result in stream:
+                results.append(result)
+                if len(results) == 10:
+                    break  # 模拟中断
+            await stream.aclose()
+            await asyncio.sleep(0.3)  # 被取消的任务不再写入检查点
+            return results
+
+        first = asyncio.run(interrupted())
+        with open(path, encoding="utf-8") as f:
+            checkpointed = [json.loads(line) for line in f]
+        # 中断前已完成的任务都已写入检查点（同一轮完成的任务可能比已产出的多）
+        assert {r["id"] for r in first} <= {r["id"] for r in checkpointed} and len(checkpointed) < 24
+        finished = {r["id"] for r in checkpointed if not r["error"]}
+        assert "fast-3" in {r["id"] for r in first if r["error"]}
+
+        client = ConcurrencyClient()
+        resumed = BulkGenerator(client, max_concurrency=4, checkpoint_path=path)
+        results = asyncio.run(resumed.run_all([BulkJob(**{k if k != "id" else "job_id": v for k, v in job.items()})
+                                               for job in _jobs()]))
+        assert [r["id"] for r in results] == [job["id"] for job in _jobs()]
+        assert {r["id"] for r in results if r.get("resumed")} == finished
+        assert "fast-3" in client.prompts and not finished & set(client.prompts)
+        assert resumed.stats["resumed"] == len(finished) and resumed.stats["failed"] == 0
+
+        # 检查点是JSONL，每行一个结果
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == len(checkpointed) + len(client.prompts)
+    print(f"✅ 续跑跳过 {len(finished)} 个已完成任务")
+
+
+class SessionCheckingClient(ScriptedClient):
+    """上游调用时记录是否已有HTTP会话（未启用共享连接池时会话在进入上下文时创建）"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sessions = []
+
+    def respond(self, model, provider, prompt, **kwargs):
+        self.sessions.append(self.session is not None)
+        return super().respond(model, provider, prompt, **kwargs)
+
+
+def test_service_bulk_without_shared_pool():
+    """测试服务端批量生成在未启用共享连接池时进入客户端上下文，结束后关闭会话"""
+    print("🧪 测试服务端批量生成（未启用共享连接池）")
+
+    from service_p2l_native import BulkGenerationRequest, P2LNativeBackendService
+
+    service = P2LNativeBackendService()
+    service.connection_pool = ConnectionPoolManager(enabled=False)
+    request = BulkGenerationRequest(jobs=[{"model": FAST, "prompt": f"p{i}"} for i in range(3)])
+    generator = service.create_bulk_generator(request)
+    client = generator.client = SessionCheckingClient(pool=service.connection_pool)
+
+    async def run():
+        return [json.loads(line) async for line in service.generate_bulk(request, generator)]
+
+    lines = asyncio.run(run())
+    assert lines[-1]["done"] and lines[-1]["summary"]["completed"] == 3
+    assert client.sessions == [True] * 3 and client.session is None
+    print("✅ 批量生成使用了客户端会话")
+
+
+if __name__ == "__main__":
+    test_bounded_concurrency()
+    test_checkpoint_resume()
+    test_service_bulk_without_shared_pool()
+    print("\n🎉 批量生成测试完成！")
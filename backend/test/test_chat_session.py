@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+测试WebSocket聊天会话
+验证会话状态（历史、系数缓存、重连）以及统一客户端的流式响应解析
+"""
+
+import asyncio
+import copy
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from aiohttp import web
+from fastapi import WebSocketDisconnect
+from chat_session import ChatSession, ChatSessionManager
+from helpers import ScriptedClient
+from unified_client import UnifiedLLMClient
+
+
+def test_session_history_and_cache():
+    """测试会话历史裁剪和P2L系数缓存"""
+    print("🧪 测试会话历史与系数缓存")
+
+    session = ChatSession(session_id="test", max_history_messages=4, coefficient_cache_size=2)
+    for i in range(3):
+        session.add_turn(f"问题{i}", f"回答{i}", "gpt-4o-2024-08-06", tokens_used=10, cost=0.001)
+
+    assert len(session.history) == 4
+    assert session.history[0]["content"] == "问题1"
+    assert session.build_messages("问题3")[-1] == {"role": "user", "content": "问题3"}
+    assert session.previous_model == "gpt-4o-2024-08-06"
+    assert session.turns == 3 and session.total_tokens == 30
+
+    session.cache_coefficients("a", np.array([1.0]))
+    session.cache_coefficients("b", np.array([2.0]))
+    assert session.get_cached_coefficients("a") is not None  # a变为最近使用
+    session.cache_coefficients("c", np.array([3.0]))
+    assert session.get_cached_coefficients("b") is None
+    assert session.get_cached_coefficients("a") is not None
+
+    session.reset()
+    assert session.history == [] and session.previous_model is None
+    print("✅ 历史裁剪和LRU缓存正确")
+
+
+def test_session_manager_resume_and_evict():
+    """测试会话重连恢复和空闲淘汰"""
+    print("🧪 测试会话重连与淘汰")
+
+    async def run():
+        manager = ChatSessionManager(max_sessions=2, idle_timeout=60)
+        first = await manager.open()
+        first.add_turn("你好", "你好！", "deepseek-v3")
+
+        # 连接中的会话不能被另一个连接占用
+        try:
+            await manager.open(first.session_id)
+            assert False, "会话已连接时应拒绝重连"
+        except ValueError:
+            pass
+
+        manager.detach(first)
+        resumed = await manager.open(first.session_id)
+        assert resumed is first and resumed.turns == 1
+
+        # 达到上限时淘汰最久未活跃的已断开会话
+        manager.detach(first)
+        second = await manager.open()
+        third = await manager.open()
+        assert first.session_id not in manager.sessions
+        assert {second.session_id, third.session_id} == set(manager.sessions)
+
+        # 空闲超时淘汰
+        manager.detach(second)
+        second.last_active -= 120
+        await manager.evict_idle()
+        assert second.session_id not in manager.sessions
+        return manager.get_stats()
+
+    stats = asyncio.run(run())
+    assert stats["resumed"] == 1 and stats["evicted"] == 2
+    print(f"✅ 会话管理正确: {stats}")
+
+
+def test_stream_response_openai_format():
+    """测试OpenAI兼容格式的流式响应解析"""
+    print("🧪 测试流式响应解析")
+
+    events = [
+        {"choices": [{"delta": {"role": "assistant"}}]},
+        {"choices": [{"delta": {"content": "你好"}}]},
+        {"choices": [{"delta": {"content": "，世界"}}]},
+        {"choices": [], "usage": {"total_tokens": 42}},
+    ]
+    received = {}
+
+    async def handle(request):
+        received["body"] = await request.json()
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        for event in events:
+            await resp.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await resp.write(b"data: [DONE]\n\n")
+        return resp
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        client = UnifiedLLMClient()
+        client.config = copy.deepcopy(client.config)
+        client.config["base_urls"]["openai"] = f"http://127.0.0.1:{port}/v1"
+        client.config["api_keys"]["openai"] = "test-key"
+
+        chunks = []
+        try:
+            async with client:
+                async for chunk in client.stream_response(
+                    "gpt-4o-2024-08-06", "hi",
+                    messages=[{"role": "user", "content": "hi"}, {"role": "assistant", "content": "  "}]
+                ):
+                    chunks.append(chunk)
+        finally:
+            await runner.cleanup()
+        return chunks
+
+    chunks = asyncio.run(run())
+    assert [c.delta for c in chunks if not c.done] == ["你好", "，世界"]
+    final = chunks[-1]
+    assert final.done and final.response.content == "你好，世界"
+    assert final.response.tokens_used == 42
+    assert final.response.ttft is not None
+    assert received["body"]["stream"] is True
+    # 空内容消息在发送前被过滤
+    assert received["body"]["messages"] == [{"role": "user", "content": "hi"}]
+    print(f"✅ 流式解析正确: {final.response.content}, TTFT={final.response.ttft:.3f}s")
+
+
+WAIT_FOR_TURN = object()
+
+
+class FakeWebSocket:
+    """按顺序送出客户端消息的WebSocket；WAIT_FOR_TURN等待上一轮结束，消息用完后断开"""
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+    async def receive_text(self):
+        while self.messages and self.messages[0] is WAIT_FOR_TURN:
+            self.messages.pop(0)
+            while not self.sent or self.sent[-1]["type"] not in ("done", "error", "cancelled"):
+                await asyncio.sleep(0.01)
+        if not self.messages:
+            raise WebSocketDisconnect()
+        message = self.messages.pop(0)
+        return message if isinstance(message, str) else json.dumps(message)
+
+
+def _run_handler(messages, service=None, tenant_id=None):
+    """用FakeWebSocket驱动WebSocket聊天处理函数，返回服务端消息、会话和上游客户端"""
+    from service_p2l_native import P2LNativeBackendService
+
+    service = service or P2LNativeBackendService()
+    client = ScriptedClient(cost=0.001)
+    opened = {}
+    open_session = service.chat_sessions.open
+
+    async def open_with_client(session_id=None, tenant_id=None):
+        session = await open_session(session_id, tenant_id)
+        session._client = client
+        opened["session"] = session
+        return session
+
+    service.chat_sessions.open = open_with_client
+    websocket = FakeWebSocket(messages)
+    asyncio.run(service.handle_chat_websocket(websocket, tenant_id=tenant_id))
+    return websocket.sent, opened["session"], client
+
+
+def test_websocket_rejects_invalid_messages():
+    """测试无效的消息返回error事件，不写入会话，处理函数继续处理后续消息"""
+    print("🧪 测试WebSocket消息校验")
+
+    sent, session, client = _run_handler([
+        "[1, 2]",
+        "not json",
+        {"type": "config", "priority": 123, "enabled_models": "gpt-4o", "budget": "x"},
+        {"type": "config", "budget": -1},
+        {"type": "message", "content": "hi", "model": "deepseek-v3", "max_tokens": "lots"},
+        {"type": "message", "content": "hi", "model": "deepseek-v3", "temperature": 5},
+        {"type": "config", "priority": "cost", "enabled_models": ["deepseek-v3"], "budget": 0.5},
+    ])
+    errors = [event["message"] for event in sent if event["type"] == "error"]
+    assert len(errors) == 6
+    assert "JSON对象" in errors[0] and "JSON消息" in errors[1]
+    assert all(field in errors[2] for field in ("priority", "enabled_models", "budget"))
+    assert "max_tokens" in errors[4] and "temperature" in errors[5]
+    assert sent[-1]["type"] == "session" and sent[-1]["priority"] == "cost"
+    assert session.enabled_models == ["deepseek-v3"] and session.budget == 0.5
+    assert client.calls == 0  # 无效的对话消息没有调用上游
+    print("✅ 无效消息被拒绝")
+
+
+def test_websocket_turn():
+    """测试一轮对话：推送路由、增量和完成事件，生成参数来自校验后的消息"""
+    print("🧪 测试WebSocket对话")
+
+    sent, session, client = _run_handler([
+        {"type": "config", "budget": None},
+        {"type": "message", "content": " 你好 ", "model": "deepseek-v3", "max_tokens": 100, "temperature": 0.2},
+        WAIT_FOR_TURN,
+    ])
+    types = [event["type"] for event in sent]
+    assert types == ["session", "session", "routing", "token", "done"]
+    assert sent[2]["model"] == "deepseek-v3" and sent[2]["strategy"] == "user_selected"
+    assert [(r["max_tokens"], r["temperature"]) for r in client.requests] == [(100, 0.2)]
+    assert session.turns == 1 and session.history[0]["content"] == "你好"
+    print("✅ WebSocket对话正确")
+
+
+class ShadowPriceScorer:
+    """记录路由时收到的影子价格的P2L评分器"""
+    def __init__(self):
+        self.shadow_prices = []
+
+    def get_p2l_coefficients(self, prompt):
+        return np.zeros(2)
+
+    def calculate_p2l_scores(self, prompt, priority, enabled_models, budget, p2l_coefficients, shadow_price=0.0):
+        self.shadow_prices.append(shadow_price)
+        return [{"model": "deepseek-v3", "score": 1.0, "provider": "deepseek"}], {"strategy": priority}
+
+
+def test_websocket_budget_pacing():
+    """测试会话租户：P2L路由使用租户的影子价格，每轮支出计入租户预算节奏"""
+    print("🧪 测试WebSocket聊天的预算节奏")
+
+    from service_p2l_native import P2LNativeBackendService
+
+    service = P2LNativeBackendService()
+    service.p2l_loaded = True
+    service.p2l_model_scorer = ShadowPriceScorer()
+    service.budget_pacing.set_budget("team-a", 10.0).shadow_price = 0.5
+    service.budget_pacing.set_budget("team-b", 10.0)
+
+    sent, session, _ = _run_handler([
+        {"type": "message", "content": "hi"},
+        WAIT_FOR_TURN,
+        {"type": "config", "tenant_id": "team-b"},
+        {"type": "message", "content": "again", "model": "deepseek-v3"},
+        WAIT_FOR_TURN,
+    ], service=service, tenant_id="team-a")
+    assert sent[0]["tenant_id"] == "team-a" and session.tenant_id == "team-b"
+    assert [event["type"] for event in sent].count("done") == 2
+    assert service.p2l_model_scorer.shadow_prices == [0.5]
+    pacing = service.budget_pacing.snapshot()
+    assert pacing["team-a"]["requests"] == 1 and pacing["team-a"]["spent"] == 0.001
+    assert pacing["team-b"]["requests"] == 1
+    print("✅ 聊天轮次使用并更新了租户的影子价格")
+
+
+if __name__ == "__main__":
+    test_session_history_and_cache()
+    test_session_manager_resume_and_evict()
+    test_stream_response_openai_format()
+    test_websocket_rejects_invalid_messages()
+    test_websocket_turn()
+    test_websocket_budget_pacing()
+    print("\n🎉 聊天会话测试完成！")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+测试熔断器
+验证熔断状态机（错误率、连续超时、半开探测）、提供商级熔断、
+UnifiedLLMClient的快速失败，以及路由器排除熔断中的模型
+"""
+
+import asyncio
+import contextlib
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from config import get_all_models
+from helpers import FakeClock, ScriptedClient
+from rate_limiting import RateLimitRegistry
+from p2l_router import P2LRouter
+from unified_client import UpstreamAPIError
+
+
+def test_breaker_state_machine():
+    """测试错误率熔断、冷却后半开探测和冷却时间加倍"""
+    print("🧪 测试熔断状态机")
+
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_requests=4, failure_rate_threshold=0.5, open_duration=10, clock=clock)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # 请求数不足
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow_request() and breaker.health == 0.0
+
+    # 冷却后只放行一个探测请求
+    clock.now = 10.0
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request() and not breaker.allow_request()
+
+    # 探测失败：再次熔断且冷却时间加倍
+    breaker.record_failure()
+    clock.now = 25.0
+    assert breaker.state == OPEN
+    clock.now = 30.0
+    assert breaker.state == HALF_OPEN
+
+    # 探测成功：恢复并清空窗口
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.error_rate == 0.0 and breaker.trips == 2
+    print("✅ 状态转换正确")
+
+
+def test_consecutive_timeouts_and_provider_scope():
+    """测试连续超时熔断，以及单个模型故障不熔断整个提供商"""
+    print("🧪 测试连续超时与提供商熔断")
+
+    clock = FakeClock()
+    registry = CircuitBreakerRegistry(consecutive_timeouts=3, min_requests=100, clock=clock)
+    for _ in range(3):
+        assert registry.allow("gpt-4o", "openai")
+        registry.record_failure("gpt-4o", "openai", timeout=True)
+    assert registry.state("gpt-4o", "openai") == OPEN
+    assert not registry.allow("gpt-4o", "openai")
+    # 同提供商的其他模型不受影响
+    assert registry.state("gpt-4o-mini", "openai") == CLOSED
+
+    # 第二个模型也连续超时：提供商熔断
+    for _ in range(3):
+        registry.record_failure("gpt-4o-mini", "openai", timeout=True)
+    assert registry.state("gpt-3.5-turbo", "openai") == OPEN
+    assert not registry.allow("gpt-3.5-turbo", "openai")
+
+    health = registry.health(["gpt-3.5-turbo", "deepseek-v3"], ["openai", "deepseek"])
+    assert health.tolist() == [0.0, 1.0]
+
+    # 关闭后放行所有调用
+    disabled = CircuitBreakerRegistry(enabled=False)
+    disabled.record_failure("m", "p", timeout=True)
+    assert disabled.allow("m", "p")
+    print("✅ 超时熔断与提供商范围正确")
+
+
+def test_client_fails_fast():
+    """测试客户端记录失败并在熔断期间不再调用上游"""
+    print("🧪 测试客户端快速失败")
+
+    clock = FakeClock()
+    breakers = CircuitBreakerRegistry(consecutive_timeouts=2, min_requests=3, open_duration=10, clock=clock)
+    outcomes = [
+        UpstreamAPIError("DeepSeek API错误 400: bad request", status=400),  # 请求本身的错误，不计入
+        asyncio.TimeoutError(),
+        asyncio.TimeoutError(),
+        "ok"
+    ]
+    # 关闭重试：每次调用只访问一次上游，便于核对熔断计数
+    client = ScriptedClient(outcomes, breakers=breakers, rate_limits=RateLimitRegistry(enabled=False))
+
+    async def run():
+        results = []
+        for _ in range(4):
+            results.append(await client.generate_response("deepseek-v3", "hi"))
+        clock.now = 10.0
+        results.append(await client.generate_response("deepseek-v3", "hi"))
+        return results
+
+    results = asyncio.run(run())
+    assert client.calls == 4  # 第4次调用在熔断期间被拒绝，冷却后的探测请求才到达上游
+    assert results[3].provider == "error" and "暂停调用" in results[3].content
+    assert results[4].content == "ok"
+    assert breakers.state("deepseek-v3", "deepseek") == CLOSED
+    print("✅ 熔断期间不调用上游，探测成功后恢复")
+
+
+def test_local_errors_not_counted():
+    """测试本地错误（缺少API密钥、参数错误）只归还探测名额，不计入熔断统计"""
+    print("🧪 测试本地错误不计入熔断")
+
+    clock = FakeClock()
+    breakers = CircuitBreakerRegistry(min_requests=2, open_duration=10, clock=clock)
+    outcomes = [KeyError("deepseek"), TypeError("bad argument")] * 3 + [
+        UpstreamAPIError("DeepSeek API错误 503", status=503),
+        UpstreamAPIError("DeepSeek API错误 503", status=503)
+    ]
+    client = ScriptedClient(outcomes, breakers=breakers, rate_limits=RateLimitRegistry(enabled=False))
+
+    async def run(count):
+        return [await client.generate_response("deepseek-v3", "hi") for _ in range(count)]
+
+    assert all(r.provider == "error" for r in asyncio.run(run(6)))
+    assert breakers.state("deepseek-v3", "deepseek") == CLOSED
+
+    # 熔断冷却后的探测请求遇到本地错误：归还名额，下一个探测仍可放行
+    asyncio.run(run(2))
+    assert breakers.state("deepseek-v3", "deepseek") == OPEN
+    clock.now = 10.0
+    client.outcomes = [KeyError("deepseek"), "ok"]
+    results = asyncio.run(run(2))
+    assert client.calls == 10 and results[1].content == "ok"
+    assert breakers.state("deepseek-v3", "deepseek") == CLOSED
+    print("✅ 本地错误不影响熔断状态")
+
+
+def test_router_excludes_open_circuits():
+    """测试路由、排名和批量路由排除熔断中的模型并对半开模型降权"""
+    print("🧪 测试路由排除熔断模型")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.linspace(-1.0, 1.0, len(model_list))
+    best, second = model_list[-1], model_list[-2]
+
+    clock = FakeClock()
+    breakers = CircuitBreakerRegistry(consecutive_timeouts=1, open_duration=10, clock=clock)
+    router = P2LRouter(circuit_breakers=breakers, health_penalty=5.0)
+    breakers.record_failure(best, model_configs[best]["provider"], timeout=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(coefficients, model_list, model_configs, mode='performance')
+        rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode='performance')
+    assert selected == second and info["excluded_models"] == [best]
+    assert best not in [r["model"] for r in rankings] and rankings[0]["model"] == second
+
+    batch = router.route_models_batch(np.tile(coefficients, (3, 1)), model_list, model_configs, modes='performance')
+    assert batch["selected_models"] == [second] * 3 and batch["probabilities"][:, -1].sum() == 0
+
+    all_modes = router.route_all_modes(coefficients, model_list, model_configs)
+    assert all(best not in [r["model"] for r in rankings] for rankings, _ in all_modes.values())
+
+    # 半开：重新参与路由但被降权
+    clock.now = 10.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(coefficients, model_list, model_configs, mode='performance')
+    assert selected == second and "excluded_models" not in info
+
+    # 只启用熔断中的模型时不排除，避免无模型可用
+    with contextlib.redirect_stdout(io.StringIO()):
+        breakers.record_failure(best, model_configs[best]["provider"], timeout=True)
+        selected, info = router.route_models(coefficients, model_list, model_configs, enabled_models=[best])
+    assert selected == best
+    print(f"✅ 熔断模型 {best} 被排除，选择 {second}")
+
+
+if __name__ == "__main__":
+    test_breaker_state_machine()
+    test_consecutive_timeouts_and_provider_scope()
+    test_client_fails_fast()
+    test_local_errors_not_counted()
+    test_router_excludes_open_circuits()
+    print("\n🎉 熔断器测试完成！")
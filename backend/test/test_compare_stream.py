@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试多模型对比流式接口
+验证多个模型并发生成（总耗时取决于最慢的模型）、片段按模型标记交错推送、
+单个模型失败不影响其他模型，以及P2L只推理一次并取排名前k的模型
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitBreakerRegistry
+from helpers import ScriptedClient
+
+MODELS = ["deepseek-v3", "deepseek-v2.5", "gpt-4o-mini-2024-07-18"]
+
+
+def _delayed_client(delays):
+    """各模型每个片段的间隔由测试控制，delay为None的模型上游报错"""
+    return ScriptedClient(
+        delays=delays, delay_each_chunk=True, content="one two three", cost=0.001,
+        breakers=CircuitBreakerRegistry(enabled=False)
+    )
+
+
+def test_stream_multiple():
+    """测试并发生成：总耗时约等于最慢的模型，片段交错到达，失败的模型单独报错"""
+    print("🧪 测试并发多模型流")
+
+    client = _delayed_client({MODELS[0]: 0.02, MODELS[1]: 0.1, MODELS[2]: None})
+
+    async def run():
+        start = time.monotonic()
+        items = [item async for item in client.stream_multiple(MODELS, "hi")]
+        return items, time.monotonic() - start
+
+    items, elapsed = asyncio.run(run())
+    assert elapsed < 0.45  # 串行需要 0.06 + 0.3
+    order = [model for model, item in items if not isinstance(item, Exception)]
+    assert order[-1] == MODELS[1]  # 慢模型最后结束
+    assert order[:4].count(MODELS[0]) >= 3
+
+    errors = [(model, item) for model, item in items if isinstance(item, Exception)]
+    assert len(errors) == 1 and errors[0][0] == MODELS[2]
+    for model in MODELS[:2]:
+        chunks = [item for m, item in items if m == model and not isinstance(item, Exception)]
+        assert "".join(c.delta for c in chunks) == "one two three" and chunks[-1].done
+    print(f"✅ 并发完成，耗时 {elapsed:.2f}s")
+
+
+def test_early_close_cancels():
+    """测试调用方中途关闭时取消所有上游流"""
+    print("🧪 测试中途关闭")
+
+    client = _delayed_client({MODELS[0]: 0.01, MODELS[1]: 5.0})
+
+    async def run():
+        stream = client.stream_multiple(MODELS[:2], "hi")
+        first = await stream.__anext__()
+        start = time.monotonic()
+        await stream.aclose()
+        return first, time.monotonic() - start
+
+    first, close_time = asyncio.run(run())
+    assert first[0] == MODELS[0] and close_time < 1.0
+    print("✅ 中途关闭取消了上游流")
+
+
+class FakeScorer:
+    """记录推理次数、按固定顺序排名的P2L评分器"""
+    def __init__(self):
+        self.inferences = 0
+
+    def get_p2l_coefficients(self, prompt):
+        self.inferences += 1
+        return [0.0]
+
+    def calculate_p2l_scores(self, prompt, priority, enabled_models, budget, p2l_coefficients, shadow_price=0.0):
+        rankings = [{"model": m, "score": 1.0 - i * 0.1, "provider": "deepseek"} for i, m in enumerate(MODELS)]
+        return rankings, {"strategy": priority}
+
+
+def _parse_events(lines):
+    events = []
+    for block in "".join(lines).strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_service_compare():
+    """测试服务端：P2L只推理一次取前k个模型，SSE事件按模型标记，k超出上限时拒绝"""
+    print("🧪 测试对比接口")
+
+    from service_p2l_native import CompareRequest, P2LNativeBackendService
+
+    service = P2LNativeBackendService()
+    service.p2l_loaded = True
+    service.p2l_model_scorer = FakeScorer()
+    service.llm_client = _delayed_client({MODELS[0]: 0.01, MODELS[1]: 0.03, MODELS[2]: None})
+
+    async def run(request):
+        routing = await service.rank_compare_models(request)
+        return routing, [line async for line in service.stream_compare(request, routing)]
+
+    routing, lines = asyncio.run(run(CompareRequest(prompt="hi", k=2)))
+    assert routing["models"] == MODELS[:2] and service.p2l_model_scorer.inferences == 1
+
+    events = _parse_events(lines)
+    assert events[0] == ("routing", routing) and events[-1][0] == "end"
+    assert events[-1][1]["completed"] == 2 and events[-1][1]["failed"] == 0
+    for model in MODELS[:2]:
+        tokens = [data["delta"] for name, data in events if name == "token" and data["model"] == model]
+        assert "".join(tokens) == "one two three"
+        assert any(name == "done" and data["model"] == model for name, data in events)
+    assert not any(data.get("model") == MODELS[2] for _, data in events[1:])
+
+    _, lines = asyncio.run(run(CompareRequest(prompt="hi", k=3)))
+    events = _parse_events(lines)
+    assert [data["model"] for name, data in events if name == "error"] == [MODELS[2]]
+    assert events[-1][1]["failed"] == 1
+
+    try:
+        asyncio.run(run(CompareRequest(prompt="hi", k=service.compare_config.get("max_k", 5) + 1)))
+        assert False, "k超出上限应当报错"
+    except ValueError:
+        pass
+    print("✅ 对比接口事件正确")
+
+
+if __name__ == "__main__":
+    test_stream_multiple()
+    test_early_close_cancels()
+    test_service_compare()
+    print("\n🎉 多模型对比测试完成！")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试上游连接池
+用本地HTTP服务模拟上游，验证多个请求和多个客户端实例复用同一批连接、
+启动预热后首次调用不再新建连接、进行中请求数统计，以及关闭共享时按旧方式每次新建会话
+"""
+
+import asyncio
+import copy
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from connection_pool import ConnectionPoolManager
+from helpers import isolated_components
+from unified_client import UnifiedLLMClient
+
+MODEL = "deepseek-v3"
+
+
+async def _start_upstream(delay: float = 0.0):
+    """启动返回OpenAI兼容响应的本地上游，返回(runner, base_url)"""
+    async def chat_completions(request):
+        await request.json()
+        await asyncio.sleep(delay)
+        return web.json_response({
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10}
+        })
+
+    async def root(request):
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_route("HEAD", "/", root)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def _make_client(pool: ConnectionPoolManager, base_url: str) -> UnifiedLLMClient:
+    client = UnifiedLLMClient(**isolated_components(pool=pool))
+    client.config = copy.deepcopy(client.config)
+    client.config["base_urls"]["deepseek"] = base_url
+    client.config["api_keys"]["deepseek"] = "test-key"
+    return client
+
+
+def test_connections_reused_across_clients():
+    """测试多个请求、多个客户端实例共享连接，预热后首次调用直接复用"""
+    print("🧪 测试跨请求连接复用")
+
+    async def run():
+        runner, base_url = await _start_upstream()
+        pool = ConnectionPoolManager(base_urls={"deepseek": base_url})
+        try:
+            warmed = await pool.prewarm()
+            assert list(warmed.values()) == [True]
+
+            for _ in range(5):
+                # 服务按请求进入/退出客户端上下文，共享连接池时不关闭连接
+                async with _make_client(pool, base_url) as client:
+                    response = await client.generate_response(MODEL, "你好")
+                    assert response.content == "ok"
+
+            stats = pool.snapshot()["upstreams"][pool.origin(base_url)]
+            assert stats["provider"] == "deepseek" and stats["prewarmed"]
+            assert stats["requests"] == 5 and stats["in_flight"] == 0
+            assert stats["connections_created"] == 1, stats
+            assert stats["connections_reused"] == 5 and stats["reuse_rate"] > 0.8
+        finally:
+            await pool.close()
+            await runner.cleanup()
+        return stats
+
+    stats = asyncio.run(run())
+    print(f"✅ 6次连接获取只新建 {stats['connections_created']} 个连接")
+
+
+def test_in_flight_and_concurrency():
+    """测试并发请求的进行中计数与连接上限"""
+    print("🧪 测试进行中请求统计")
+
+    async def run():
+        runner, base_url = await _start_upstream(delay=0.1)
+        pool = ConnectionPoolManager(limit_per_host=4, base_urls={"deepseek": base_url})
+        client = _make_client(pool, base_url)
+        try:
+            tasks = [asyncio.create_task(client.generate_response(MODEL, "你好")) for _ in range(8)]
+            await asyncio.sleep(0.05)
+            during = pool.snapshot()["upstreams"][pool.origin(base_url)]
+            await asyncio.gather(*tasks)
+            after = pool.snapshot()["upstreams"][pool.origin(base_url)]
+        finally:
+            await pool.close()
+            await runner.cleanup()
+        return during, after
+
+    during, after = asyncio.run(run())
+    assert during["in_flight"] == 8 and during["utilization"] == 2.0
+    assert after["in_flight"] == 0 and after["peak_in_flight"] == 8
+    # 超出连接上限的请求排队等待已有连接，而不是新建连接
+    assert after["connections_created"] <= 4
+    assert after["connections_created"] + after["connections_reused"] == 8
+    print(f"✅ 8个并发请求使用 {after['connections_created']} 个连接")
+
+
+def test_shared_pool_disabled():
+    """测试关闭共享时每次进入上下文新建会话，退出时关闭"""
+    print("🧪 测试关闭连接共享")
+
+    async def run():
+        runner, base_url = await _start_upstream()
+        pool = ConnectionPoolManager(enabled=False)
+        try:
+            client = _make_client(pool, base_url)
+            async with client:
+                session = client.session
+                assert session is not None
+                assert (await client.generate_response(MODEL, "你好")).content == "ok"
+            assert session.closed and client.session is None
+            assert pool.snapshot()["upstreams"] == {}
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+    # 会话绑定事件循环：在新的事件循环中自动重建
+    async def get_session(pool):
+        session = pool.session_for("http://127.0.0.1:1/v1")
+        assert pool.session_for("http://127.0.0.1:1/other") is session
+        return session
+
+    async def check_rebuilt(pool, previous):
+        assert await get_session(pool) is not previous
+        await pool.close()
+
+    pool = ConnectionPoolManager()
+    first = asyncio.run(get_session(pool))
+    asyncio.run(check_rebuilt(pool, first))
+    print("✅ 关闭共享时按请求新建会话")
+
+
+if __name__ == "__main__":
+    test_connections_reused_across_clients()
+    test_in_flight_and_concurrency()
+    test_shared_pool_disabled()
+    print("\n🎉 连接池测试完成！")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试上下文预检与历史裁剪
+验证超出上下文窗口时按轮次裁剪并保留摘要、生成长度收紧、放不下的请求直接拒绝、
+按实际用量校准估算，以及客户端只把裁剪后的消息发给上游
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_budget import ContextBudget, ContextLimitExceeded
+from helpers import ScriptedClient
+
+MODEL = "deepseek-v3"
+SMALL_MODEL = {"provider": "deepseek", "context_window": 1000, "max_tokens": 500}
+
+
+def _conversation(turns: int, words: int = 80):
+    """system + 多轮问答，每条消息约words个token"""
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "word " * words})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "text " * words})
+    messages.append({"role": "user", "content": "final question"})
+    return messages
+
+
+def test_trim_history():
+    """测试按轮次从最早开始裁剪，system与最后一轮保留，被裁剪的轮次压缩成摘要"""
+    print("🧪 测试历史裁剪")
+
+    budget = ContextBudget(safety_margin=0.0, summary_max_tokens=120)
+    messages = _conversation(10)
+    original = budget.estimate(messages)
+    result = budget.preflight(MODEL, SMALL_MODEL, "", messages, max_tokens=300)
+
+    assert original > 700 and result.input_tokens <= 700
+    assert result.dropped_messages > 0 and result.dropped_messages % 2 == 0  # 整轮丢弃
+    kept = result.messages
+    assert kept[0]["role"] == "system" and kept[-1]["content"] == "final question"
+    assert kept[1]["role"] == "user" and kept[1]["content"].startswith("[已省略较早的")
+    assert result.summarized and not result.clamped
+    # 保留的是最近的轮次
+    assert "question 9" in kept[-3]["content"]
+
+    no_summary = ContextBudget(safety_margin=0.0, summarize=False).preflight(MODEL, SMALL_MODEL, "", messages, 300)
+    assert not no_summary.summarized and len(no_summary.messages) >= len(kept)
+
+    # 放得下的请求原样返回
+    short = _conversation(1)
+    assert budget.preflight(MODEL, SMALL_MODEL, "", short, 300).messages == short
+    stats = budget.snapshot()
+    assert stats["trimmed"] == 1 and stats["summarized"] == 1 and stats["tokens_trimmed"] > 0
+    print(f"✅ {original} → {result.input_tokens} tokens，丢弃 {result.dropped_messages} 条消息")
+
+
+def test_clamp_and_reject():
+    """测试生成长度超过模型上限时收紧、只剩最后一轮时收紧到剩余空间、放不下时拒绝"""
+    print("🧪 测试收紧与拒绝")
+
+    budget = ContextBudget(safety_margin=0.0, min_output_tokens=100)
+    result = budget.preflight(MODEL, SMALL_MODEL, "hi", None, max_tokens=4000)
+    assert result.clamped and result.max_tokens == 500
+
+    # 最后一条消息约700 tokens：裁剪后仍放不下500的生成长度，收紧到剩余空间
+    long_prompt = "word " * 560
+    result = budget.preflight(MODEL, SMALL_MODEL, long_prompt, None, max_tokens=500)
+    assert result.clamped and 100 <= result.max_tokens < 500
+    assert result.input_tokens + result.max_tokens <= 1000
+
+    try:
+        budget.preflight(MODEL, SMALL_MODEL, "word " * 1200, None, max_tokens=500)
+        assert False, "应当拒绝"
+    except ContextLimitExceeded as e:
+        assert "上下文窗口" in str(e)
+
+    capped = ContextBudget(max_input_tokens=50)
+    try:
+        capped.preflight(MODEL, SMALL_MODEL, "word " * 100, None, max_tokens=10)
+        assert False, "应当拒绝"
+    except ContextLimitExceeded:
+        pass
+    assert budget.snapshot()["rejected"] == 1 and capped.snapshot()["rejected"] == 1
+    print("✅ 收紧与拒绝正确")
+
+
+def test_calibration():
+    """测试按实际输入token数修正提供商的校准系数"""
+    print("🧪 测试估算校准")
+
+    budget = ContextBudget(calibration={"anthropic": 1.2}, calibration_alpha=0.5)
+    messages = [{"role": "user", "content": "word " * 100}]
+    raw = budget.estimate(messages)
+    assert budget.estimate(messages, "anthropic") == round(raw * 1.2 + 0.5)
+
+    budget.observe("deepseek", 100, 150)
+    assert budget.factor("deepseek") == 1.25
+    budget.observe("deepseek", 100, 1000)  # 异常值按上限2.0计入
+    assert budget.factor("deepseek") == 1.625
+    budget.observe("deepseek", 10, 1000)  # 样本太短，不计入
+    assert budget.factor("deepseek") == 1.625
+    print("✅ 校准系数正确")
+
+
+class RecordingClient(ScriptedClient):
+    """上游报告的输入token数为本地估算的两倍"""
+    def respond(self, model, provider, prompt, **kwargs):
+        response = super().respond(model, provider, prompt, **kwargs)
+        response.output_tokens = 10
+        response.tokens_used = self.context_budget.estimate(kwargs.get("messages") or [{"content": prompt}]) * 2 + 10
+        return response
+
+
+def test_client_preflight():
+    """测试客户端只发送裁剪后的消息、拒绝的请求不访问上游、用量用于校准"""
+    print("🧪 测试客户端预检")
+
+    budget = ContextBudget(max_input_tokens=400, learn_calibration=True, calibration_alpha=1.0)
+    client = RecordingClient(context_budget=budget)
+
+    async def run():
+        response = await client.generate_response(MODEL, "", messages=_conversation(10), max_tokens=100)
+        try:
+            await client.generate_response(MODEL, "word " * 2000, max_tokens=100)
+            assert False, "应当拒绝"
+        except ContextLimitExceeded:
+            pass
+        chunks = []
+        try:
+            async for chunk in client.stream_response(MODEL, "word " * 2000):
+                chunks.append(chunk)
+        except ContextLimitExceeded:
+            pass
+        return response, chunks
+
+    response, chunks = asyncio.run(run())
+    assert response.provider == "deepseek" and not chunks
+    assert len(client.requests) == 1
+    messages, max_tokens = client.requests[0]["messages"], client.requests[0]["max_tokens"]
+    assert messages[-1]["content"].endswith("final question") and len(messages) < len(_conversation(10))
+    assert max_tokens == 100
+    # 上游报告的输入是估算的两倍：校准系数随之修正
+    assert budget.factor("deepseek") == 2.0
+    assert budget.snapshot()["rejected"] == 2
+    print("✅ 客户端预检正确")
+
+
+if __name__ == "__main__":
+    test_trim_history()
+    test_clamp_and_reject()
+    test_calibration()
+    test_client_preflight()
+    print("\n🎉 上下文预检测试完成！")
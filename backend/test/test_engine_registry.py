@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试P2L引擎注册表
+验证同一checkpoint只加载一份、热切换时进行中的请求继续使用旧引擎
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from p2l_engine import P2LEngineRegistry
+
+
+def test_single_copy_per_checkpoint():
+    """测试同一checkpoint在注册表中只有一份"""
+    print("🧪 测试同一checkpoint只加载一份")
+
+    registry = P2LEngineRegistry()
+    engine_a = registry.acquire("/tmp/p2l-registry-test-a", device="cpu")
+    engine_b = registry.acquire("/tmp/p2l-registry-test-a", device="cpu")
+    assert engine_a is engine_b
+
+    stats = registry.get_stats()
+    assert len(stats["engines"]) == 1
+    assert stats["engines"][0]["refcount"] == 2
+
+    registry.release(engine_a)
+    registry.release(engine_b)
+    assert registry.get_stats()["engines"] == []
+    print("✅ 同一checkpoint复用同一引擎，引用归零后卸载")
+
+
+def test_swap_keeps_leased_engine():
+    """测试切换活跃引擎时，进行中的租用仍持有旧引擎"""
+    print("🧪 测试热切换与进行中的请求")
+
+    registry = P2LEngineRegistry()
+    old_engine = registry.activate("/tmp/p2l-registry-test-old", device="cpu")
+
+    with registry.lease() as leased:
+        assert leased is old_engine
+
+        new_engine = registry.activate("/tmp/p2l-registry-test-new", device="cpu")
+        assert registry.peek_active() is new_engine
+
+        # 旧引擎仍被租用，不能卸载
+        paths = {e["model_path"]: e for e in registry.get_stats()["engines"]}
+        old_path = str(old_engine.model_path)
+        assert old_path in paths and paths[old_path]["refcount"] == 1
+        assert not paths[old_path]["active"]
+
+    # 租用结束后旧引擎被卸载，只剩活跃引擎
+    stats = registry.get_stats()
+    assert [e["model_path"] for e in stats["engines"]] == [str(new_engine.model_path)]
+    assert stats["swap_count"] == 1
+    print(f"✅ 租用结束后旧引擎已卸载: {stats}")
+
+
+def test_failed_reload_keeps_active_engine():
+    """测试加载失败的checkpoint不会被切换上线"""
+    print("🧪 测试加载失败不切换")
+
+    registry = P2LEngineRegistry()
+    active = registry.activate("/tmp/p2l-registry-test-active", device="cpu")
+
+    try:
+        registry.load_and_swap("/tmp/p2l-registry-test-missing", device="cpu")
+        assert False, "加载失败应抛出异常"
+    except RuntimeError as e:
+        print(f"   预期的失败: {e}")
+
+    assert registry.peek_active() is active
+    assert len(registry.get_stats()["engines"]) == 1
+    print("✅ 加载失败时保持当前引擎")
+
+
+if __name__ == "__main__":
+    test_single_copy_per_checkpoint()
+    test_swap_keeps_leased_engine()
+    test_failed_reload_keeps_active_engine()
+    print("\n🎉 引擎注册表测试完成！")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+测试上游请求对冲
+验证对冲延迟与对冲比例上限、非流式和流式调用的对冲（先返回者胜出、另一方被取消），
+以及主模型正常返回时不发起对冲
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitBreakerRegistry
+from hedging import HedgingPolicy
+from helpers import FakeClock, ScriptedClient
+from latency_telemetry import LatencyTelemetry
+from load_tracker import LoadTracker
+
+PRIMARY = "deepseek-v3"
+BACKUP = "deepseek-v2.5"
+
+
+class SlowClient(ScriptedClient):
+    """回答带上模型名，便于确认返回的是哪一方"""
+    def respond(self, model, provider, prompt, **kwargs):
+        response = super().respond(model, provider, prompt, **kwargs)
+        response.content = f"{model} ok"
+        return response
+
+
+def _client(delays, **policy_kwargs):
+    telemetry = LatencyTelemetry(refresh_interval=0.0)
+    for _ in range(20):
+        telemetry.record(PRIMARY, total_time=0.05, ttft=0.05)
+    policy = HedgingPolicy(min_delay=0.01, **policy_kwargs)
+    tracker = LoadTracker()
+    client = SlowClient(
+        delays=delays, telemetry=telemetry, breakers=CircuitBreakerRegistry(enabled=False),
+        load_tracker=tracker, hedging=policy
+    )
+    return client, policy, tracker
+
+
+def test_policy_delay_and_rate_cap():
+    """测试对冲延迟取实测分位数，以及令牌桶限制对冲比例"""
+    print("🧪 测试对冲策略")
+
+    telemetry = LatencyTelemetry(refresh_interval=0.0)
+    policy = HedgingPolicy(quantile=0.9, min_delay=0.5, max_hedge_rate=0.25, burst=1, clock=FakeClock())
+    assert policy.hedge_delay(telemetry, PRIMARY) is None  # 没有实测数据不对冲
+    for i in range(100):
+        telemetry.record(PRIMARY, total_time=1.0 + i / 10, ttft=0.1)
+    assert 9.0 < policy.hedge_delay(telemetry, PRIMARY) < 10.5
+    assert policy.hedge_delay(telemetry, PRIMARY, streaming=True) == 0.5  # 不低于min_delay
+
+    # 初始令牌用完后，每4个请求才允许一次对冲
+    fired = 0
+    for _ in range(20):
+        policy.register_request()
+        fired += policy.try_hedge()
+    assert fired == 5 and policy.hedges_suppressed == 15
+    assert policy.snapshot()["hedge_rate"] == 0.25
+    print("✅ 对冲延迟与比例上限正确")
+
+
+def test_generate_hedged():
+    """测试主模型超时未返回时对冲胜出并取消主模型"""
+    print("🧪 测试非流式对冲")
+
+    client, policy, tracker = _client({PRIMARY: 5.0, BACKUP: 0.01})
+    response = asyncio.run(client.generate_hedged(PRIMARY, "hi", hedge_models=[BACKUP]))
+    assert response.model == BACKUP and response.hedged and response.content == f"{BACKUP} ok"
+    assert client.cancelled == [PRIMARY]
+    assert policy.hedges_fired == 1 and policy.hedges_won == 1
+    assert tracker.in_flight(PRIMARY) == 0 and tracker.in_flight(BACKUP) == 0
+
+    # 主模型按时返回：不对冲
+    client, policy, _ = _client({PRIMARY: 0.0, BACKUP: 0.0})
+    response = asyncio.run(client.generate_hedged(PRIMARY, "hi", hedge_models=[BACKUP]))
+    assert response.model == PRIMARY and not response.hedged
+    assert client.started == [PRIMARY] and policy.hedges_fired == 0
+
+    # 对冲比例用尽：只等待主模型
+    client, policy, _ = _client({PRIMARY: 0.1, BACKUP: 0.0}, max_hedge_rate=0.0, burst=0.0)
+    response = asyncio.run(client.generate_hedged(PRIMARY, "hi", hedge_models=[BACKUP]))
+    assert response.model == PRIMARY and policy.hedges_suppressed == 1
+    print("✅ 对冲请求胜出，主模型被取消")
+
+
+def test_stream_hedged():
+    """测试流式对冲：先产出首token的一方胜出，另一方的流被关闭"""
+    print("🧪 测试流式对冲")
+
+    client, policy, tracker = _client({PRIMARY: 5.0, BACKUP: 0.01})
+
+    async def run():
+        deltas, final = [], None
+        async for chunk in client.stream_hedged(PRIMARY, "hi", hedge_models=[BACKUP]):
+            if chunk.done:
+                final = chunk.response
+            else:
+                deltas.append(chunk.delta)
+        return deltas, final
+
+    deltas, final = asyncio.run(run())
+    assert "".join(deltas) == f"{BACKUP} ok"
+    assert final.model == BACKUP and final.hedged
+    assert client.cancelled == [PRIMARY] and policy.hedges_won == 1
+    assert tracker.in_flight(PRIMARY) == 0 and tracker.in_flight(BACKUP) == 0
+
+    # 主模型先产出首token
+    client, policy, _ = _client({PRIMARY: 0.0, BACKUP: 0.0})
+    deltas, final = asyncio.run(run())
+    assert final.model == PRIMARY and not final.hedged and client.started == [PRIMARY]
+    print("✅ 流式对冲胜出，主模型流被关闭")
+
+
+if __name__ == "__main__":
+    test_policy_delay_and_rate_cap()
+    test_generate_hedged()
+    test_stream_hedged()
+    print("\n🎉 请求对冲测试完成！")
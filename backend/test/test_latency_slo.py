@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试延迟SLO路由
+验证token估算、完成时间预测（配置值与实测值）、SLO内最高分选择、无满足模型时的降级，
+以及排名、批量路由与单次路由的一致性
+"""
+
+import contextlib
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models
+from latency_telemetry import LatencyTelemetry
+from p2l_router import P2LRouter
+from token_estimator import estimate_output_tokens, estimate_tokens
+
+
+def _setup():
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.random.default_rng(3).normal(0.0, 1.0, len(model_list))
+    return model_configs, model_list, coefficients
+
+
+def test_token_estimation():
+    """测试token估算"""
+    print("🧪 测试token估算")
+
+    assert estimate_tokens("") == 0 and estimate_tokens(None) == 0
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("a" * 40) == 10
+    assert estimate_tokens("解释" + "x" * 8) == 4
+    assert estimate_output_tokens() == 400
+    assert estimate_output_tokens(1000, max_tokens=256) == 256
+    assert estimate_output_tokens(50) == 50
+    print("✅ token估算正确")
+
+
+def test_completion_time_prediction():
+    """测试完成时间预测：配置值拆分与实测值"""
+    print("🧪 测试完成时间预测")
+
+    model_configs, model_list, _ = _setup()
+    router = P2LRouter()
+    table = router.get_routing_table(model_list, model_configs)
+
+    # 没有遥测：参考输出长度、零提示词时等于avg_response_time
+    reference = router.latency_slo_config['reference_output_tokens']
+    assert np.allclose(router.predict_completion_times(table, 0, reference), table.response_times)
+    # 提示词和输出越长，预测时间越长
+    short = router.predict_completion_times(table, 100, 100)
+    long = router.predict_completion_times(table, 4000, 1000)
+    assert (long > short).all()
+
+    # 数组输入得到 [N, M]，每行与标量调用一致
+    batch = router.predict_completion_times(table, np.array([100, 4000]), np.array([100, 1000]))
+    assert batch.shape == (2, len(model_list))
+    assert np.allclose(batch[0], short) and np.allclose(batch[1], long)
+
+    # 有实测数据：首token延迟和输出速度向实测值收缩
+    telemetry = LatencyTelemetry(prior_weight=1, refresh_interval=0.0)
+    model = model_list[0]
+    for _ in range(200):
+        telemetry.record(model, total_time=10.5, ttft=0.5, output_tokens=100)  # 10 tokens/s
+    live_router = P2LRouter(latency_telemetry=telemetry)
+    predicted = live_router.predict_completion_times(table, 0, 500)
+    assert abs(predicted[0] - (0.5 + 500 / 10)) / predicted[0] < 0.05, predicted[0]
+    assert np.allclose(predicted[1:], router.predict_completion_times(table, 0, 500)[1:])
+    print(f"✅ 预测正确: {model} 500 tokens ≈ {predicted[0]:.1f}s")
+
+
+def test_latency_slo_selection():
+    """测试SLO内最高分选择与降级"""
+    print("🧪 测试延迟SLO选择")
+
+    model_configs, model_list, coefficients = _setup()
+    router = P2LRouter()
+    table = router.get_routing_table(model_list, model_configs)
+    predicted = router.predict_completion_times(table, 200, 400)
+
+    latency_budget = float(np.median(predicted))
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(
+            coefficients, model_list, model_configs, mode='latency',
+            latency_budget=latency_budget, prompt_tokens=200, output_tokens=400
+        )
+    feasible = predicted <= latency_budget
+    expected = model_list[int(np.where(feasible, coefficients, -np.inf).argmax())]
+    assert info["strategy"] == "latency_slo" and info["slo_met"] is True
+    assert selected == expected and info["predicted_time"] <= latency_budget
+
+    # 没有模型能满足：选择预测最快的模型
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(
+            coefficients, model_list, model_configs, mode='latency',
+            latency_budget=0.01, prompt_tokens=200, output_tokens=400
+        )
+    assert info["slo_met"] is False and selected == model_list[int(predicted.argmin())]
+    assert "预测最快" in router.get_routing_explanation(info)
+
+    # 缺少延迟预算：降级到最高分模型
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(coefficients, model_list, model_configs, mode='latency')
+    assert info["strategy"] == "fallback_max_score"
+    print(f"✅ 选择正确: 预算 {latency_budget:.2f}s → {expected}")
+
+
+def test_ranking_and_batch_consistency():
+    """测试排名第一和批量路由与单次路由一致"""
+    print("🧪 测试排名与批量路由一致性")
+
+    model_configs, model_list, _ = _setup()
+    router = P2LRouter()
+    rng = np.random.default_rng(11)
+    n_rows = 50
+    coefficient_matrix = rng.normal(0.0, 1.0, (n_rows, len(model_list)))
+    latency_budgets = rng.uniform(1.0, 6.0, n_rows)
+    prompt_tokens = rng.integers(10, 5000, n_rows)
+    budgets = np.where(rng.random(n_rows) < 0.3, 0.005, np.nan)
+
+    batch = router.route_models_batch(
+        coefficient_matrix, model_list, model_configs, modes='latency', budgets=budgets,
+        latency_budgets=latency_budgets, prompt_tokens=prompt_tokens, output_tokens=300
+    )
+    for i in range(n_rows):
+        budget = None if np.isnan(budgets[i]) else float(budgets[i])
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected, info = router.route_models(
+                coefficient_matrix[i], model_list, model_configs, mode='latency', budget=budget,
+                latency_budget=latency_budgets[i], prompt_tokens=prompt_tokens[i], output_tokens=300
+            )
+            rankings = router.generate_model_ranking(
+                coefficient_matrix[i], model_list, model_configs, mode='latency', budget=budget,
+                latency_budget=latency_budgets[i], prompt_tokens=prompt_tokens[i], output_tokens=300
+            )
+        assert batch["selected_models"][i] == selected == rankings[0]["model"], i
+        assert all("predicted_time" in r for r in rankings)
+    print(f"✅ {n_rows} 行批量路由、排名与单次路由一致")
+
+
+if __name__ == "__main__":
+    test_token_estimation()
+    test_completion_time_prediction()
+    test_latency_slo_selection()
+    test_ranking_and_batch_consistency()
+    print("\n🎉 延迟SLO路由测试完成！")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试延迟遥测
+验证分位数草图精度与时间衰减、实测值与配置值的收缩混合，以及速度模式使用实测延迟路由
+"""
+
+import contextlib
+import io
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models, process_singleton
+from helpers import FakeClock
+from latency_telemetry import DecayingQuantileSketch, LatencyTelemetry
+from p2l_router import P2LRouter
+
+
+def test_sketch_accuracy_and_decay():
+    """测试分位数相对误差与时间衰减"""
+    print("🧪 测试分位数草图")
+
+    clock = FakeClock()
+    sketch = DecayingQuantileSketch(relative_accuracy=0.02, half_life=60.0, clock=clock)
+    samples = np.random.default_rng(0).lognormal(0.5, 0.6, 5000)
+    for value in samples:
+        sketch.add(value)
+
+    for q in (0.5, 0.9, 0.99):
+        expected = np.quantile(samples, q)
+        assert abs(sketch.quantile(q) - expected) / expected < 0.03, (q, sketch.quantile(q), expected)
+
+    # 一个半衰期后旧样本权重减半；新样本很快主导分位数
+    clock.now = 60.0
+    assert abs(sketch.weight - 2500) < 1e-6
+    clock.now = 600.0
+    for _ in range(50):
+        sketch.add(20.0)
+    assert abs(sketch.quantile(0.5) - 20.0) / 20.0 < 0.02
+    print("✅ 分位数误差 < 3%，衰减正确")
+
+
+def test_blending_with_config():
+    """测试实测值与配置值的混合"""
+    print("🧪 测试响应时间估计")
+
+    clock = FakeClock()
+    telemetry = LatencyTelemetry(prior_weight=5, refresh_interval=0.0, clock=clock)
+    fallback = np.array([2.0, 3.0])
+
+    # 无数据：配置值
+    assert telemetry.estimate_response_times(["a", "b"], fallback).tolist() == [2.0, 3.0]
+
+    # 5个样本：实测与配置各占一半
+    for _ in range(5):
+        telemetry.record("a", 6.0, ttft=1.0, output_tokens=100)
+    estimate = telemetry.estimate_response_times(["a", "b"], fallback)
+    assert abs(estimate[0] - 4.0) < 0.1 and estimate[1] == 3.0
+
+    # 输出速度排除首token等待：100 tokens / 5s
+    assert abs(telemetry.estimate("a", "tokens_per_second") - 20.0) / 20.0 < 0.02
+    assert abs(telemetry.estimate("a", "ttft") - 1.0) <= 0.02 + 1e-9  # 相对误差上界
+    assert telemetry.snapshot()["a"]["requests"] == 5
+    print("✅ 估计值正确")
+
+
+def test_speed_mode_uses_live_latency():
+    """测试速度模式按实测延迟路由"""
+    print("🧪 测试速度模式使用实测延迟")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.full(len(model_list), 0.5)  # 系数相同，只比较速度
+
+    telemetry = LatencyTelemetry(prior_weight=1, refresh_interval=0.0)
+    router = P2LRouter(latency_telemetry=telemetry)
+
+    with contextlib.redirect_stdout(io.StringIO()):  # 路由器的调试输出
+        static_choice, _ = P2LRouter().route_models(coefficients, model_list, model_configs, mode="speed")
+
+        # 配置中最快的模型今天很慢，最便宜的另一个模型很快（排名中成本权重也偏向它）
+        slow = static_choice
+        fast = min((m for m in model_list if m != slow), key=lambda m: model_configs[m]["cost_per_1k"])
+        for _ in range(50):
+            telemetry.record(slow, 30.0)
+            telemetry.record(fast, 0.2)
+
+        live_choice, _ = router.route_models(coefficients, model_list, model_configs, mode="speed")
+        rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode="speed")
+
+    assert live_choice == fast, (static_choice, live_choice)
+    assert rankings[0]["model"] == fast
+    assert next(r for r in rankings if r["model"] == slow)["avg_response_time"] > 20
+    print(f"✅ 静态配置选择 {static_choice}，实测延迟选择 {live_choice}")
+
+
+def test_process_singleton():
+    """测试进程级实例只创建一次（并发首次调用），创建失败时异常抛给调用方且下次重试"""
+    print("🧪 测试进程级实例")
+
+    created = []
+
+    @process_singleton
+    def get_instance():
+        time.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_instance())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(result is created[0] for result in results)
+
+    outcomes = [ValueError("bad config"), "ok"]
+
+    @process_singleton
+    def get_configured():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    try:
+        get_configured()
+        assert False, "配置错误应当抛出"
+    except ValueError:
+        pass
+    assert get_configured() == "ok" and get_configured() == "ok" and not outcomes
+    print("✅ 进程级实例正确")
+
+
+if __name__ == "__main__":
+    test_sketch_accuracy_and_decay()
+    test_blending_with_config()
+    test_speed_mode_uses_live_latency()
+    test_process_singleton()
+    print("\n🎉 延迟遥测测试完成！")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+测试上游流量录制/回放
+用本地替身服务录制UnifiedLLMClient的非流式、流式和429交互，关闭替身服务后从磁带回放，
+验证内容与原始时间特征一致、时间缩放、匹配规则，以及SDK使用的httpx传输层
+"""
+
+import asyncio
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from connection_pool import ConnectionPoolManager
+from helpers import isolated_components
+from llm_cassette import Cassette, CassetteMiss
+from rate_limiting import RateLimitRegistry
+from response_cache import ResponseCache
+from stub_server import StubLLMServer, stub_base_urls
+from unified_client import UnifiedLLMClient
+
+MODEL = "deepseek-v3"
+ANTHROPIC_MODEL = "claude-3-5-haiku-20241022"
+
+
+def _make_client(cassette: Cassette, root: str = "http://127.0.0.1:9") -> UnifiedLLMClient:
+    client = UnifiedLLMClient(**isolated_components(
+        pool=ConnectionPoolManager(enabled=False),
+        rate_limits=RateLimitRegistry(enabled=True, backoff_base=0.01), response_cache=ResponseCache(enabled=False),
+        cassette=cassette
+    ))
+    client.config = copy.deepcopy(client.config)
+    client.config["base_urls"].update(stub_base_urls(root))
+    for provider in client.config["api_keys"]:
+        client.config["api_keys"][provider] = "stub"
+    return client
+
+
+async def _traffic(client: UnifiedLLMClient):
+    """一组固定的上游调用：非流式、OpenAI流式、Anthropic流式、先429后成功"""
+    plain = await client.generate_response(MODEL, "你好", max_tokens=10)
+    chunks = [chunk async for chunk in client.stream_response(MODEL, "讲个笑话", max_tokens=20)]
+    native = [chunk async for chunk in client.stream_response(ANTHROPIC_MODEL, "讲个笑话", max_tokens=20)]
+    # 第一次调用占满配额，第二次先收到429
+    await client.generate_response("gpt-4o-mini-2024-07-18", "占用配额", max_tokens=5)
+    limited = await client.generate_response("gpt-4o-mini-2024-07-18", "限流", max_tokens=5)
+    return plain, chunks[-1].response, native[-1].response, limited
+
+
+def test_record_and_replay():
+    """测试录制后离线回放：内容一致，首token时间保持原始值或按比例缩放"""
+    print("🧪 测试录制与回放")
+
+    # time_scale=0.002：配额窗口缩短为0.12秒，首token延迟75→0.15秒
+    server = StubLLMServer(
+        profiles={"gpt-4o-mini-2024-07-18": {"ttft_median": 0.0, "requests_per_minute": 1, "retry_after": 0.2,
+                                             "output_tokens": 5}},
+        default_profile={"ttft_median": 75, "ttft_sigma": 0.0, "tokens_per_second": 1, "output_tokens": 10},
+        seed=0, time_scale=0.002
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tapes", "session.jsonl.gz")
+
+        async def record():
+            root = await server.start()
+            try:
+                async with _make_client(Cassette(path, mode="record"), root) as client:
+                    return await _traffic(client), client.cassette.snapshot()
+            finally:
+                await server.stop()
+
+        recorded, stats = asyncio.run(record())
+        assert stats["recorded"] == 6  # 429也被录制
+        assert all(r.provider != "error" for r in recorded)
+
+        async def replay(time_scale):
+            cassette = Cassette(path, mode="replay", time_scale=time_scale)
+            async with _make_client(cassette) as client:
+                start = time.monotonic()
+                results = await _traffic(client)
+                return results, time.monotonic() - start, cassette.snapshot()
+
+        replayed, elapsed, stats = asyncio.run(replay(1.0))
+        for original, again in zip(recorded, replayed):
+            assert again.content == original.content and again.tokens_used == original.tokens_used
+        assert stats["replayed"] == 6 and stats["misses"] == 0 and stats["fallback"] == 0
+        assert abs(replayed[1].ttft - recorded[1].ttft) < 0.05 and replayed[1].ttft >= 0.15
+        assert replayed[3].provider == "openai"  # 回放的429带Retry-After，客户端重试后得到成功响应
+
+        fast, fast_elapsed, _ = asyncio.run(replay(0.0))
+        assert fast[1].content == recorded[1].content and fast[1].ttft < 0.05
+        assert fast_elapsed < elapsed
+    print(f"✅ 回放一致（原速 {elapsed:.2f}s，不等待 {fast_elapsed:.2f}s）")
+
+
+def test_matching_rules():
+    """测试同一请求按录制顺序返回、非严格模式按模型顺序回退、严格模式未命中时报错"""
+    print("🧪 测试回放匹配规则")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tape.jsonl")
+        body = {"model": MODEL, "messages": [{"role": "user", "content": "hi"}], "max_tokens": 5}
+        recorder = Cassette(path, mode="record")
+        for i in range(2):
+            interaction = recorder._new_interaction("http://x/v1/chat/completions", body)
+            interaction.update(status=200, chunks=[[0.0, json.dumps({"n": i})]])
+            recorder._append(interaction)
+
+        cassette = Cassette(path, mode="replay")
+        url = "http://other-host/v1/chat/completions"
+        assert [json.loads(cassette.find(url, body)["chunks"][0][1])["n"] for _ in range(3)] == [0, 1, 1]
+        changed = {**body, "messages": [{"role": "user", "content": "changed prompt"}]}
+        assert cassette.find(url, changed)["status"] == 200
+        assert cassette.snapshot()["fallback"] == 1
+
+        strict = Cassette(path, mode="replay", strict=True)
+        try:
+            strict.find(url, changed)
+            assert False, "严格模式应当报错"
+        except CassetteMiss:
+            pass
+        try:
+            Cassette(path, mode="rewind")
+            assert False, "未知模式应当报错"
+        except ValueError:
+            pass
+    print("✅ 匹配规则正确")
+
+
+def test_httpx_transport():
+    """测试SDK使用的httpx传输层：录制流式响应后回放，保留分块时间"""
+    print("🧪 测试httpx传输层")
+
+    def upstream(request):
+        def stream():
+            for word in ("a", "b", "c"):
+                time.sleep(0.05)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': word}}]})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream())
+
+    body = {"model": MODEL, "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sdk.jsonl")
+        recorder = Cassette(path, mode="record")
+        with httpx.Client(transport=recorder.httpx_transport(httpx.MockTransport(upstream))) as client:
+            with client.stream("POST", "https://api.example.com/v1/chat/completions", json=body) as response:
+                original = b"".join(response.iter_bytes())
+        assert recorder.snapshot()["recorded"] == 1
+
+        player = Cassette(path, mode="replay")
+        with httpx.Client(transport=player.httpx_transport()) as client:
+            start = time.monotonic()
+            with client.stream("POST", "https://stub.local/v1/chat/completions", json=body) as response:
+                assert response.headers["content-type"] == "text/event-stream"
+                replayed = b"".join(response.iter_bytes())
+            elapsed = time.monotonic() - start
+        assert replayed == original and elapsed >= 0.15
+    print(f"✅ httpx传输层回放一致（{elapsed:.2f}s）")
+
+
+if __name__ == "__main__":
+    test_record_and_replay()
+    test_matching_rules()
+    test_httpx_transport()
+    print("\n🎉 录制回放测试完成！")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试负载感知路由
+验证排队延迟估计（利用率与429衰减）、UnifiedLLMClient的进行中请求统计，
+以及路由器在负载高峰时把请求分散到相近模型而performance模式不受影响
+"""
+
+import asyncio
+import contextlib
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from circuit_breaker import CircuitBreakerRegistry
+from config import get_all_models
+from helpers import FakeClock, ScriptedClient
+from load_tracker import LoadTracker
+from p2l_router import P2LRouter
+from unified_client import UpstreamAPIError
+
+
+def test_queueing_delay_estimate():
+    """测试利用率排队延迟、提供商并发上限和429半衰期衰减"""
+    print("🧪 测试排队延迟估计")
+
+    clock = FakeClock()
+    tracker = LoadTracker(model_concurrency=4, provider_concurrency=8, rate_limit_penalty=2.0,
+                          rate_limit_half_life=60, clock=clock)
+    models, providers = ["a", "b", "c"], ["p", "p", "q"]
+    service_times = np.array([2.0, 2.0, 2.0])
+    assert tracker.queueing_delays(models, providers, service_times).tolist() == [0.0, 0.0, 0.0]
+
+    # a: 2/4 进行中 → rho=0.5 → 延迟 = 服务时间
+    tracker.acquire("a", "p")
+    tracker.acquire("a", "p")
+    delays = tracker.queueing_delays(models, providers, service_times)
+    assert np.isclose(delays[0], 2.0) and delays[2] == 0.0
+    # b 只受提供商利用率影响：2/8
+    assert np.isclose(delays[1], 2.0 * 0.25 / 0.75)
+
+    # 429：释放时计入，按半衰期衰减
+    tracker.release("a", "p", rate_limited=True)
+    tracker.release("a", "p")
+    assert tracker.in_flight("a") == 0 and tracker.in_flight("p", provider=True) == 0
+    delays = tracker.queueing_delays(models, providers, service_times)
+    assert np.isclose(delays[0], 2.0 * 2) and np.isclose(delays[1], 2.0)  # 模型与提供商各计一次
+    clock.now = 60.0
+    delays = tracker.queueing_delays(models, providers, service_times)
+    assert np.isclose(delays[0], 2.0) and np.isclose(delays[1], 1.0)
+
+    # 利用率上限避免发散
+    for _ in range(10):
+        tracker.acquire("c", "q")
+    assert np.isfinite(tracker.queueing_delays(models, providers, service_times)).all()
+    assert tracker.snapshot()["models"]["c"]["in_flight"] == 10
+    print("✅ 排队延迟估计正确")
+
+
+def test_client_tracks_in_flight():
+    """测试客户端在调用期间计入进行中请求并在429时记录限流"""
+    print("🧪 测试客户端负载统计")
+
+    tracker = LoadTracker(clock=FakeClock())
+    client = ScriptedClient(
+        ["ok", UpstreamAPIError("DeepSeek API错误 429: rate limited", status=429), "ok"],
+        breakers=CircuitBreakerRegistry(enabled=False), load_tracker=tracker
+    )
+
+    async def run():
+        client.gate = asyncio.Event()
+        tasks = [asyncio.create_task(client.generate_response("deepseek-v3", "hi")) for _ in range(3)]
+        await asyncio.sleep(0)
+        during = (tracker.in_flight("deepseek-v3"), tracker.in_flight("deepseek", provider=True))
+        client.gate.set()
+        await asyncio.gather(*tasks)
+        return during
+
+    during = asyncio.run(run())
+    assert during == (3, 3)
+    assert tracker.in_flight("deepseek-v3") == 0
+    snapshot = tracker.snapshot()
+    assert snapshot["models"]["deepseek-v3"]["recent_rate_limits"] == 1.0
+    assert snapshot["providers"]["deepseek"]["recent_rate_limits"] == 1.0
+    print(f"✅ 调用期间进行中请求数 {during[0]}，结束后归零并记录429")
+
+
+def test_router_spreads_load():
+    """测试负载高峰时路由分散到相近模型，performance模式与空闲时结果不变"""
+    print("🧪 测试负载感知路由")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    coefficients = np.linspace(-1.0, 1.0, len(model_list))
+    best = model_list[-1]
+
+    tracker = LoadTracker(clock=FakeClock())
+    router = P2LRouter(load_tracker=tracker)
+    baseline = P2LRouter()
+
+    # 空闲：与不跟踪负载的路由器一致
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mode in ('performance', 'speed', 'balanced'):
+            selected, info = router.route_models(coefficients, model_list, model_configs, mode=mode)
+            expected, _ = baseline.route_models(coefficients, model_list, model_configs, mode=mode)
+            assert selected == expected and "queueing_delays" not in info
+
+    # 最优模型满载并且刚被限流
+    for _ in range(8):
+        tracker.acquire(best, model_configs[best]["provider"])
+    tracker.release(best, model_configs[best]["provider"], rate_limited=True)
+    tracker.acquire(best, model_configs[best]["provider"])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        selected, info = router.route_models(coefficients, model_list, model_configs, mode='performance')
+        assert selected == best and "queueing_delays" not in info
+
+        selected, info = router.route_models(coefficients, model_list, model_configs, mode='speed')
+        assert selected != best and max(info["queueing_delays"]) > 0
+        rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode='speed')
+    assert rankings[0]["model"] != best
+
+    # 批量路由与全模式排名同样计入负载
+    batch = router.route_models_batch(np.tile(coefficients, (2, 1)), model_list, model_configs,
+                                      modes=['performance', 'speed'])
+    assert batch["selected_models"] == [best, selected]
+    all_modes = router.route_all_modes(coefficients, model_list, model_configs)
+    assert all_modes['performance'][0][0]["model"] == best
+    assert all_modes['speed'][0][0]["model"] == rankings[0]["model"]
+    print(f"✅ {best} 满载时speed模式改选 {selected}，performance模式不变")
+
+
+if __name__ == "__main__":
+    test_queueing_delay_estimate()
+    test_client_tracks_in_flight()
+    test_router_spreads_load()
+    print("\n🎉 负载感知路由测试完成！")
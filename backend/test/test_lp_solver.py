@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+测试LP闭式求解
+在随机实例上与cvxpy对比最优值和混合策略，覆盖SimpleLP和Bradley-Terry (W @ q) 两种目标
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from p2l_router import (
+    OptimalLPCostOptimizer, UnfulfillableException,
+    solve_budget_lp, solve_budget_lp_cvxpy
+)
+
+
+def _random_instance(rng, n_models):
+    costs = rng.uniform(0.0005, 0.03, n_models)
+    scores = rng.normal(0.0, 1.0, n_models)  # P2L系数可以为负
+    budget = rng.uniform(costs.min(), costs.max() * 1.1)
+    return costs, scores, budget
+
+
+def test_matches_cvxpy_simple_lp():
+    """测试SimpleLP目标与cvxpy结果一致"""
+    print("🧪 测试SimpleLP闭式解 vs cvxpy")
+
+    rng = np.random.default_rng(42)
+    closed_time = cvxpy_time = 0.0
+    for trial in range(100):
+        costs, scores, budget = _random_instance(rng, rng.integers(2, 25))
+
+        start = time.perf_counter()
+        ps = solve_budget_lp(costs, scores, budget)
+        closed_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        reference = solve_budget_lp_cvxpy(costs, scores, budget)
+        cvxpy_time += time.perf_counter() - start
+
+        assert abs(ps.sum() - 1.0) < 1e-12 and (ps >= 0).all()
+        assert costs @ ps <= budget + 1e-9
+        assert (ps > 0).sum() <= 2
+        assert abs(scores @ ps - scores @ reference) < 1e-6, (trial, scores @ ps, scores @ reference)
+        assert np.allclose(ps, reference, atol=1e-4), (trial, ps, reference)
+
+    print(f"✅ 100个随机实例一致: 闭式解 {closed_time * 1e4:.1f}µs/次, cvxpy {cvxpy_time * 10:.1f}ms/次")
+
+
+def test_matches_cvxpy_bradley_terry():
+    """测试W @ q目标与cvxpy结果一致"""
+    print("🧪 测试Bradley-Terry目标闭式解 vs cvxpy")
+
+    rng = np.random.default_rng(7)
+    for trial in range(50):
+        costs, scores, budget = _random_instance(rng, rng.integers(2, 25))
+        opponent_distribution = rng.dirichlet(np.ones(len(scores)))
+        Wq = OptimalLPCostOptimizer._construct_W(scores, scores) @ opponent_distribution
+
+        ps = solve_budget_lp(costs, Wq, budget)
+        reference = solve_budget_lp_cvxpy(costs, Wq, budget)
+        assert abs(Wq @ ps - Wq @ reference) < 1e-6, trial
+        assert np.allclose(ps, reference, atol=1e-4), (trial, ps, reference)
+
+    print("✅ 50个随机实例一致")
+
+
+def test_edge_cases():
+    """测试预算不足、预算充足和同成本模型"""
+    print("🧪 测试边界情况")
+
+    costs = np.array([0.01, 0.002, 0.02])
+    scores = np.array([0.5, -0.3, 0.9])
+
+    try:
+        solve_budget_lp(costs, scores, 0.001)
+        assert False, "预算低于最低成本应无法满足"
+    except UnfulfillableException:
+        pass
+
+    # 预算充足时选择得分最高的模型
+    assert solve_budget_lp(costs, scores, 1.0).tolist() == [0.0, 0.0, 1.0]
+    # 得分为负时仍然可以满足（不再把负的最优值当作无解）
+    assert solve_budget_lp(np.array([0.01]), np.array([-2.0]), 0.01).tolist() == [1.0]
+
+    # 同成本模型只保留得分更高的一个
+    ps = solve_budget_lp(np.array([0.01, 0.01, 0.03]), np.array([0.2, 0.4, 0.8]), 0.02)
+    assert ps[0] == 0.0 and abs(ps[1] - 0.5) < 1e-12 and abs(ps[2] - 0.5) < 1e-12
+    print("✅ 边界情况正确")
+
+
+if __name__ == "__main__":
+    test_matches_cvxpy_simple_lp()
+    test_matches_cvxpy_bradley_terry()
+    test_edge_cases()
+    print("\n🎉 LP闭式求解测试完成！")
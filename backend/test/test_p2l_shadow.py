@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+测试P2L影子评估
+验证系数对比指标和后台批量评估日志
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from p2l_engine import P2LEngine
+from p2l_shadow import ShadowEvaluator, compare_coefficients
+
+
+def test_compare_coefficients():
+    """测试系数对比指标"""
+    print("🧪 测试系数对比指标")
+
+    primary = np.array([0.8, 0.6, 0.4, 0.2])
+
+    same = compare_coefficients(primary, primary + 0.1)
+    assert same["top1_agreement"]
+    assert abs(same["spearman"] - 1.0) < 1e-9
+    assert abs(same["mean_abs_delta"] - 0.1) < 1e-9
+
+    reversed_result = compare_coefficients(primary, primary[::-1])
+    assert not reversed_result["top1_agreement"]
+    assert abs(reversed_result["spearman"] + 1.0) < 1e-9
+    assert abs(reversed_result["max_abs_delta"] - 0.6) < 1e-9
+
+    print(f"✅ 对比指标正确: spearman={reversed_result['spearman']:.2f}")
+
+
+def test_shadow_evaluator_logs_batches():
+    """测试影子评估器批量评估并写入日志"""
+    print("🧪 测试影子评估后台批量评估")
+
+    model_list = ["gpt-4o-2024-08-06", "claude-3-5-sonnet-20241022", "deepseek-v3"]
+    # 不存在的checkpoint会以模拟模式运行，足以验证评估流程
+    candidate = P2LEngine(model_path="/tmp/p2l-shadow-test-candidate")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "shadow.jsonl")
+
+        async def run():
+            evaluator = ShadowEvaluator(
+                candidate_engine=candidate,
+                model_list=model_list,
+                log_path=log_path,
+                sample_rate=1.0,
+                batch_size=4,
+                cpu_budget=0.5,
+                flush_interval=0.05
+            )
+
+            # 未启动时不抽样
+            assert not evaluator.maybe_submit("prompt", np.zeros(3))
+
+            evaluator.start()
+            for i in range(6):
+                assert evaluator.maybe_submit(f"测试提示词 {i}", np.array([0.9, 0.5, 0.1]))
+
+            for _ in range(100):
+                if evaluator.evaluated == 6:
+                    break
+                await asyncio.sleep(0.02)
+
+            stats = evaluator.get_stats()
+            await evaluator.stop()
+            return stats
+
+        stats = asyncio.run(run())
+        assert stats["evaluated"] == 6, stats
+        assert stats["dropped"] == 0
+
+        with open(log_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 6
+        assert set(records[0]["deltas"].keys()) == set(model_list)
+        assert records[0]["primary_top1"] == "gpt-4o-2024-08-06"
+        print(f"✅ 影子评估完成: {stats['evaluated']} 条, Top-1一致率={stats['top1_agreement_rate']}")
+
+
+if __name__ == "__main__":
+    test_compare_coefficients()
+    test_shadow_evaluator_logs_batches()
+    print("\n🎉 影子评估测试完成！")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+测试上游限流与重试
+验证Retry-After解析与退避等待、令牌桶、优先级队列按限额平滑放行，
+以及客户端对429/5xx的重试（遵守Retry-After、不重试请求本身的错误、不超过截止时间）
+"""
+
+import asyncio
+import time
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import FakeClock, ScriptedClient
+from latency_telemetry import LatencyTelemetry
+from rate_limiting import ProviderRateLimiter, RateLimitRegistry, TokenBucket, parse_retry_after
+from request_control import RequestDeadline
+from unified_client import UpstreamAPIError
+
+MODEL = "deepseek-v3"
+
+
+def test_retry_after_and_backoff():
+    """测试Retry-After解析、全抖动指数退避与重试上限"""
+    print("🧪 测试Retry-After与退避等待")
+
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+
+    registry = RateLimitRegistry(max_retries=3, backoff_base=0.5, backoff_max=2.0, max_retry_after=30, rng=lambda: 0.999)
+    delays = [registry.retry_delay(attempt) for attempt in range(4)]
+    assert delays[3] is None
+    assert [round(d, 2) for d in delays[:3]] == [0.5, 1.0, 2.0]  # 上限 min(2.0, 0.5 * 2^n)
+    assert abs(registry.retry_delay(0, retry_after=5.0) - 5.5) < 0.01
+    assert registry.retry_delay(0, retry_after=120.0) is None
+    print("✅ 退避等待正确")
+
+
+def test_token_bucket():
+    """测试令牌桶补充、超出容量的请求与欠账"""
+    print("🧪 测试令牌桶")
+
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_minute=60, burst_seconds=5, clock=clock)  # 每秒1个，容量5
+    for _ in range(5):
+        assert bucket.wait_time(1) == 0
+        bucket.consume(1)
+    assert bucket.wait_time(1) == 1.0
+    clock.now = 2.0
+    assert bucket.wait_time(1) == 0 and bucket.tokens == 2.0
+
+    # 大于容量的请求按容量等待，放行后形成欠账
+    assert bucket.wait_time(100) == 3.0
+    clock.now = 5.0
+    bucket.consume(100)
+    assert bucket.tokens == -95.0 and bucket.wait_time(1) == 96.0
+    bucket.refund(50)
+    assert bucket.tokens == -45.0
+    print("✅ 令牌桶正确")
+
+
+def test_priority_queue_paces_requests():
+    """测试超出限额的突发请求按速率平滑放行，高优先级先出队"""
+    print("🧪 测试优先级队列")
+
+    async def run():
+        limiter = ProviderRateLimiter(requests_per_minute=1200, burst_seconds=0.25)  # 每秒20个，容量5
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority=priority)
+            order.append(name)
+
+        start = time.monotonic()
+        tasks = [asyncio.create_task(request(f"low-{i}", 2)) for i in range(10)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request(f"high-{i}", 0)) for i in range(5)]
+        await asyncio.gather(*tasks)
+        return order, time.monotonic() - start, limiter.snapshot()
+
+    order, elapsed, stats = asyncio.run(run())
+    # 前5个占用突发容量直接放行，其余按每秒20个放行
+    assert order[:5] == [f"low-{i}" for i in range(5)]
+    assert order[5:10] == [f"high-{i}" for i in range(5)]
+    assert 0.4 <= elapsed < 1.0, elapsed
+    assert stats["admitted"] == 15 and stats["throttled"] == 10 and stats["queued"] == 0
+    assert stats["peak_queue"] == 10
+
+    async def timeout():
+        limiter = ProviderRateLimiter(requests_per_minute=60, burst_seconds=1)
+        await limiter.acquire()
+        try:
+            await limiter.acquire(timeout=0.05)
+        except asyncio.TimeoutError:
+            return limiter.snapshot()
+        raise AssertionError("排队应当超时")
+
+    assert asyncio.run(timeout())["queue_timeouts"] == 1
+    print(f"✅ 15个突发请求用时 {elapsed:.2f}s 放行")
+
+
+def test_client_retries():
+    """测试客户端重试429/5xx并遵守Retry-After，不重试400，不超过截止时间"""
+    print("🧪 测试客户端重试")
+
+    def registry():
+        return RateLimitRegistry(max_retries=3, backoff_base=0.01, rng=lambda: 0.0)
+
+    rate_limits = registry()
+    client = ScriptedClient([
+        UpstreamAPIError("DeepSeek API错误 429", status=429, retry_after=0.05),
+        UpstreamAPIError("DeepSeek API错误 503", status=503),
+        "ok"
+    ], rate_limits=rate_limits)
+    start = time.monotonic()
+    response = asyncio.run(client.generate_response(MODEL, "hi"))
+    assert response.content == "ok" and client.calls == 3
+    assert time.monotonic() - start >= 0.05
+    stats = rate_limits.snapshot()["providers"]["deepseek"]
+    assert stats["retries"] == 2 and stats["retry_after_pauses"] == 1
+    assert client.load_tracker.snapshot()["providers"]["deepseek"]["recent_rate_limits"] > 0
+
+    # 请求本身的错误不重试
+    client = ScriptedClient([UpstreamAPIError("DeepSeek API错误 400", status=400)], rate_limits=registry())
+    assert asyncio.run(client.generate_response(MODEL, "hi")).provider == "error" and client.calls == 1
+
+    # Retry-After超过截止时间的剩余部分时不再等待
+    async def with_deadline():
+        return await client.generate_response(MODEL, "hi", deadline=RequestDeadline.after(5.0))
+    client = ScriptedClient([UpstreamAPIError("DeepSeek API错误 429", status=429, retry_after=10.0)], rate_limits=registry())
+    assert asyncio.run(with_deadline()).provider == "error" and client.calls == 1
+
+    # 重试次数用尽
+    client = ScriptedClient([UpstreamAPIError("DeepSeek API错误 502", status=502)] * 4, rate_limits=registry())
+    assert asyncio.run(client.generate_response(MODEL, "hi")).provider == "error" and client.calls == 4
+    print("✅ 客户端重试正确")
+
+
+def test_stream_retries_before_first_chunk():
+    """测试流式调用在产出首个片段前的失败会重试"""
+    print("🧪 测试流式调用重试")
+
+    client = ScriptedClient([
+        UpstreamAPIError("DeepSeek 流式API错误 429", status=429),
+        "ok"
+    ], rate_limits=RateLimitRegistry(backoff_base=0.01, rng=lambda: 0.0))
+
+    async def run():
+        return [chunk async for chunk in client.stream_response(MODEL, "hi")]
+
+    chunks = asyncio.run(run())
+    assert client.calls == 2 and chunks[-1].done and chunks[-1].response.content == "ok"
+    print("✅ 流式调用重试正确")
+
+
+def test_null_max_tokens():
+    """测试max_tokens为null时按模型默认值估算，不计入熔断失败"""
+    print("🧪 测试max_tokens为null")
+
+    client = ScriptedClient(["ok"] * 6, rate_limits=RateLimitRegistry(backoff_base=0.01))
+
+    async def run():
+        responses = [await client.generate_response(MODEL, "hi", max_tokens=None) for _ in range(5)]
+        chunks = [chunk async for chunk in client.stream_response(MODEL, "hi", max_tokens=None)]
+        return responses, chunks
+
+    responses, chunks = asyncio.run(run())
+    assert all(r.provider == "deepseek" for r in responses) and chunks[-1].done
+    assert client.calls == 6 and client.breakers.state(MODEL, "deepseek") == "closed"
+    print("✅ max_tokens为null时正常调用")
+
+
+class RecordingTelemetry(LatencyTelemetry):
+    """记录写入遥测的耗时"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def record(self, model, total_time, ttft=None, output_tokens=None):
+        self.records.append((total_time, ttft))
+        super().record(model, total_time, ttft, output_tokens)
+
+
+def test_telemetry_excludes_backoff():
+    """测试遥测与首token延迟不含重试退避，返回给调用方的是总耗时"""
+    print("🧪 测试遥测不含退避时间")
+
+    def client():
+        flaky = ScriptedClient([UpstreamAPIError("DeepSeek API错误 429", status=429, retry_after=0.2), "ok"],
+                            rate_limits=RateLimitRegistry(backoff_base=0.01, rng=lambda: 0.0))
+        flaky.telemetry = RecordingTelemetry()
+        return flaky
+
+    plain = client()
+    response = asyncio.run(plain.generate_response(MODEL, "hi"))
+    assert response.response_time >= 0.2
+    assert len(plain.telemetry.records) == 1 and plain.telemetry.records[0][0] < 0.1
+
+    streaming = client()
+
+    async def run():
+        return [chunk async for chunk in streaming.stream_response(MODEL, "hi")]
+
+    final = asyncio.run(run())[-1].response
+    assert final.response_time >= 0.2
+    print(f"✅ 遥测记录 {plain.telemetry.records[0][0]:.3f}s，总耗时 {response.response_time:.2f}s")
+
+
+if __name__ == "__main__":
+    test_retry_after_and_backoff()
+    test_token_bucket()
+    test_priority_queue_paces_requests()
+    test_client_retries()
+    test_stream_retries_before_first_chunk()
+    test_null_max_tokens()
+    test_telemetry_excludes_backoff()
+    print("\n🎉 限流与重试测试完成！")
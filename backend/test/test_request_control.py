@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试请求截止时间传递与取消
+验证过期请求在推理前被丢弃、客户端断开时进行中的任务被取消
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_control import (
+    RequestDeadline, InferenceQueue, run_until_disconnect,
+    DeadlineExceeded, ClientDisconnected
+)
+
+
+class FakeHttpRequest:
+    """模拟Starlette请求，在指定时间后报告断开"""
+
+    def __init__(self, disconnect_after: float = None):
+        self.start = time.monotonic()
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        if self.disconnect_after is None:
+            return False
+        return time.monotonic() - self.start >= self.disconnect_after
+
+
+def test_deadline_from_headers():
+    """测试从请求头解析截止时间"""
+    print("🧪 测试截止时间请求头解析")
+
+    deadline = RequestDeadline.from_headers({}, default_timeout=30)
+    assert 29 < deadline.remaining() <= 30
+
+    deadline = RequestDeadline.from_headers({"x-request-timeout": "5"}, default_timeout=30)
+    assert 4 < deadline.remaining() <= 5
+
+    deadline = RequestDeadline.from_headers(
+        {"x-request-deadline": str(time.time() + 10)}, default_timeout=30
+    )
+    assert 9 < deadline.remaining() <= 10
+
+    # 超过上限时被截断，无效值回退到默认值
+    deadline = RequestDeadline.from_headers({"x-request-timeout": "9999"}, default_timeout=30, max_timeout=60)
+    assert deadline.remaining() <= 60
+    deadline = RequestDeadline.from_headers({"x-request-timeout": "abc"}, default_timeout=30)
+    assert 29 < deadline.remaining() <= 30
+    # nan/inf不是有效的超时，回退到默认值
+    for value in ("nan", "inf", "-inf"):
+        deadline = RequestDeadline.from_headers({"x-request-timeout": value}, default_timeout=30, max_timeout=60)
+        assert 29 < deadline.remaining() <= 30 and not deadline.expired
+    deadline = RequestDeadline.from_headers({"x-request-deadline": "nan"}, default_timeout=30)
+    assert 29 < deadline.remaining() <= 30
+
+    expired = RequestDeadline.from_headers({"x-request-deadline": str(time.time() - 1)}, default_timeout=30)
+    assert expired.expired
+    try:
+        expired.check("测试")
+        assert False, "过期的截止时间应抛出异常"
+    except DeadlineExceeded:
+        pass
+
+    print("✅ 截止时间解析正确")
+
+
+def test_expired_work_dropped_before_inference():
+    """测试排队期间过期的请求不会开始推理"""
+    print("🧪 测试过期请求在推理前被丢弃")
+
+    calls = []
+
+    def slow_inference(tag):
+        calls.append(tag)
+        time.sleep(0.3)
+        return tag
+
+    async def run():
+        queue = InferenceQueue(max_concurrency=1)
+        first = asyncio.ensure_future(queue.run(slow_inference, "first", deadline=RequestDeadline.after(5)))
+        await asyncio.sleep(0.05)
+        # 第二个请求的截止时间在第一个推理结束前到达
+        try:
+            await queue.run(slow_inference, "second", deadline=RequestDeadline.after(0.1))
+            assert False, "过期请求应被丢弃"
+        except DeadlineExceeded:
+            pass
+        assert await first == "first"
+        return queue.get_stats()
+
+    stats = asyncio.run(run())
+    assert calls == ["first"], calls
+    assert stats["dropped_expired"] == 1
+    assert stats["running"] == 0 and stats["pending"] == 0
+    print(f"✅ 过期请求已丢弃: {stats}")
+
+
+def test_cancel_on_disconnect():
+    """测试客户端断开时取消进行中的任务"""
+    print("🧪 测试客户端断开取消")
+
+    async def run():
+        cancelled = asyncio.Event()
+
+        async def upstream_call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        try:
+            await run_until_disconnect(
+                FakeHttpRequest(disconnect_after=0.1), upstream_call(), poll_interval=0.05
+            )
+            assert False, "应检测到客户端断开"
+        except ClientDisconnected:
+            pass
+        return cancelled.is_set()
+
+    assert asyncio.run(run()), "上游调用应被取消"
+    print("✅ 客户端断开后上游调用已取消")
+
+
+def test_cancel_on_deadline():
+    """测试截止时间到达时取消进行中的任务"""
+    print("🧪 测试截止时间到达取消")
+
+    async def run():
+        start = time.monotonic()
+        try:
+            await run_until_disconnect(
+                FakeHttpRequest(), asyncio.sleep(10), deadline=RequestDeadline.after(0.2)
+            )
+            assert False, "应超过截止时间"
+        except DeadlineExceeded:
+            pass
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+    assert elapsed < 1.0, elapsed
+    print(f"✅ 截止时间到达后取消，耗时 {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_deadline_from_headers()
+    test_expired_work_dropped_before_inference()
+    test_cancel_on_disconnect()
+    test_cancel_on_deadline()
+    print("\n🎉 请求控制测试完成！")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试确定性调用响应缓存
+验证缓存键的规范化、非确定性采样绕过、LRU与SQLite两层的命中与淘汰，
+以及客户端命中时不调用上游
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import FakeClock, ScriptedClient
+from response_cache import ResponseCache
+from unified_client import LLMResponse
+
+MODEL = "deepseek-v3"
+
+
+class CountingClient(ScriptedClient):
+    """每次上游调用返回不同的回答"""
+    def respond(self, model, provider, prompt, **kwargs):
+        return LLMResponse(content=f"answer {self.calls}", model=model, tokens_used=30, cost=0.01,
+                           response_time=0.0, provider=provider, output_tokens=20)
+
+
+def _body(content="你好", temperature=0.0, **params):
+    return {"model": MODEL, "messages": [{"role": "user", "content": content}], "temperature": temperature,
+            "max_tokens": 100, **params}
+
+
+def test_cache_key_and_bypass():
+    """测试缓存键忽略格式差异但区分参数，非确定性采样绕过缓存"""
+    print("🧪 测试缓存键与绕过规则")
+
+    key = ResponseCache.make_key("deepseek", _body())
+    padded = _body("  你好\n")
+    padded["messages"].insert(0, {"role": "system", "content": ""})
+    padded["stream"] = False
+    assert ResponseCache.make_key("deepseek", padded) == key
+    assert ResponseCache.make_key("openai", _body()) != key
+    assert ResponseCache.make_key("deepseek", _body(max_tokens=200)) != key
+    assert ResponseCache.make_key("deepseek", _body(seed=1)) != key
+
+    cache = ResponseCache(enabled=True)
+    assert cache.should_use(_body()) and not cache.should_use(_body(temperature=0.7))
+    assert not cache.should_use(_body(), use_cache=False)
+    assert ResponseCache(enabled=False).should_use(_body(), use_cache=True)
+    assert cache.snapshot()["bypassed"] == 1
+    print("✅ 缓存键与绕过规则正确")
+
+
+def test_memory_and_disk_tiers():
+    """测试内存LRU淘汰、磁盘层跨实例命中与容量淘汰、有效期"""
+    print("🧪 测试两层缓存")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache", "responses.sqlite")
+        clock = FakeClock()
+        cache = ResponseCache(enabled=True, max_entries=2, disk_path=path, max_disk_entries=3, ttl=100, clock=clock)
+        for i in range(4):
+            clock.now = float(i)
+            cache.put(f"k{i}", {"content": f"v{i}"})
+        stats = cache.snapshot()
+        assert stats["memory_entries"] == 2 and stats["disk_entries"] == 3
+
+        # k0在磁盘层也已淘汰，k1只在磁盘层
+        assert cache.get("k0") is None
+        assert cache.get("k1") == {"content": "v1"} and cache.get("k3") == {"content": "v3"}
+        stats = cache.snapshot()
+        assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1 and stats["misses"] == 1
+        cache.close()
+
+        # 新实例（进程重启）从磁盘层命中
+        reopened = ResponseCache(enabled=True, disk_path=path, ttl=100, clock=clock)
+        assert reopened.get("k2") == {"content": "v2"}
+        clock.now = 200.0
+        assert reopened.get("k3") is None  # 超过有效期
+        reopened.clear()
+        assert reopened.snapshot()["disk_entries"] == 0
+        reopened.close()
+    print("✅ 两层缓存正确")
+
+
+def test_client_uses_cache():
+    """测试temperature=0的重复调用只访问一次上游，命中响应不计成本"""
+    print("🧪 测试客户端响应缓存")
+
+    client = CountingClient(response_cache=ResponseCache(enabled=True))
+
+    async def run():
+        first = await client.generate_response(MODEL, "hi", temperature=0, max_tokens=100)
+        second = await client.generate_response(MODEL, "hi ", temperature=0, max_tokens=100)
+        sampled = await client.generate_response(MODEL, "hi", temperature=0.7, max_tokens=100)
+        forced = await client.generate_response(MODEL, "hi", temperature=0, max_tokens=100, use_cache=False)
+        return first, second, sampled, forced
+
+    first, second, sampled, forced = asyncio.run(run())
+    assert client.calls == 3
+    assert second.cached and not first.cached and second.content == first.content
+    assert second.cost == 0.0 and second.tokens_used == 30 and second.output_tokens == 20
+    assert not sampled.cached and not forced.cached
+    stats = client.response_cache.snapshot()
+    assert stats["memory_hits"] == 1 and stats["stores"] == 1 and stats["hit_rate"] == 0.5
+
+    # 默认关闭：单次调用可显式开启
+    client = CountingClient(response_cache=ResponseCache(enabled=False))
+
+    async def opt_in():
+        for _ in range(3):
+            await client.generate_response(MODEL, "hi", temperature=0, use_cache=True)
+        await client.generate_response(MODEL, "hi", temperature=0)
+
+    asyncio.run(opt_in())
+    assert client.calls == 2
+    print("✅ 重复调用命中缓存")
+
+
+if __name__ == "__main__":
+    test_cache_key_and_bypass()
+    test_memory_and_disk_tiers()
+    test_client_uses_cache()
+    print("\n🎉 响应缓存测试完成！")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+测试P2L分析紧凑响应
+验证字段选择、Top-K截断、float32数组以及orjson与标准库json的输出一致
+"""
+
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import response_format
+from response_format import build_compact_analysis, encode_json, validate_fields
+
+
+MODEL_LIST = ["gpt-4o-2024-08-06", "claude-3-5-sonnet-20241022", "deepseek-v3"]
+RANKINGS = [
+    {"model": "deepseek-v3", "score": 0.912345678, "p2l_coefficient": 0.7, "provider": "deepseek", "config": {"cost_per_1k": 0.002}},
+    {"model": "gpt-4o-2024-08-06", "score": 0.81, "p2l_coefficient": 0.9, "provider": "openai", "config": {"cost_per_1k": 0.01}},
+    {"model": "claude-3-5-sonnet-20241022", "score": 0.55, "p2l_coefficient": 0.6, "provider": "anthropic", "config": {"cost_per_1k": 0.015}},
+]
+ROUTING_INFO = {
+    "strategy": "simple-lp",
+    "mode": "balanced",
+    "budget": 0.01,
+    "selected_model": "deepseek-v3",
+    "p2l_scores": [0.9, 0.6, 0.7],
+    "model_costs": [0.01, 0.015, 0.002],
+}
+
+
+def test_compact_field_selection():
+    """测试字段选择与Top-K"""
+    print("🧪 测试紧凑响应字段选择")
+
+    result = build_compact_analysis(
+        RANKINGS, ROUTING_INFO, MODEL_LIST, np.array([0.9, 0.6, 0.7]), 0.01, top_k=2
+    )
+    assert set(result) == set(response_format.DEFAULT_COMPACT_FIELDS)
+    assert result["ranking"]["models"] == ["deepseek-v3", "gpt-4o-2024-08-06"]
+    assert result["ranking"]["scores"].dtype == np.float32
+    # 路由摘要不包含数组
+    assert "p2l_scores" not in result["routing"] and result["routing"]["strategy"] == "simple-lp"
+
+    scores_only = build_compact_analysis(
+        RANKINGS, ROUTING_INFO, MODEL_LIST, np.array([0.9, 0.6, 0.7]), 0.01, fields=["scores"]
+    )
+    assert list(scores_only) == ["scores"]
+    assert scores_only["scores"]["models"] == MODEL_LIST
+
+    try:
+        validate_fields(["config"])
+        assert False, "未知字段应报错"
+    except ValueError:
+        pass
+    print("✅ 字段选择正确")
+
+
+def test_encoders_agree():
+    """测试orjson与标准库json回退的输出语义一致"""
+    print("🧪 测试快速序列化")
+
+    content = build_compact_analysis(
+        RANKINGS, ROUTING_INFO, MODEL_LIST, np.array([0.9, 0.6, 0.7]), 0.01,
+        fields=list(response_format.COMPACT_FIELDS), reasoning="性能最优"
+    )
+    fast = json.loads(encode_json(content))
+
+    orjson_available = response_format.ORJSON_AVAILABLE
+    response_format.ORJSON_AVAILABLE = False
+    try:
+        fallback = json.loads(encode_json(content))
+    finally:
+        response_format.ORJSON_AVAILABLE = orjson_available
+
+    assert fast["recommended_model"] == fallback["recommended_model"] == "deepseek-v3"
+    assert fast["reasoning"] == "性能最优"
+    assert np.allclose(fast["ranking"]["scores"], fallback["ranking"]["scores"])
+    assert np.allclose(fast["scores"]["p2l_coefficients"], [0.9, 0.6, 0.7], atol=1e-6)
+    print(f"✅ 序列化一致 (orjson={orjson_available}): {len(encode_json(content))} bytes")
+
+
+if __name__ == "__main__":
+    test_compact_field_selection()
+    test_encoders_agree()
+    print("\n🎉 紧凑响应测试完成！")
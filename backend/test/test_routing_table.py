@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+测试路由表
+验证列数组与模型配置一致、启用模型掩码按frozenset缓存、对手分布预先归一化以及数组只读
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from config import get_all_models
+from p2l_router import P2LRouter
+from routing_table import RoutingTable, get_routing_table
+
+
+def test_columns_match_configs():
+    """测试列数组与模型配置一致"""
+    print("🧪 测试路由表列数组")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    table = RoutingTable(model_list, model_configs, P2LRouter.SAMPLING_WEIGHTS)
+
+    for model, i in table.index.items():
+        config = model_configs[model]
+        assert table.models[i] == model
+        assert table.costs[i] == config["cost_per_1k"]
+        assert table.response_times[i] == config["avg_response_time"]
+        assert table.providers[table.provider_ids[i]] == config["provider"]
+        assert table.sampling_weights[i] == P2LRouter.SAMPLING_WEIGHTS.get(model, 1)
+
+    try:
+        table.costs[0] = 0.0
+        assert False, "路由表数组应为只读"
+    except ValueError:
+        pass
+    print(f"✅ {table}")
+
+
+def test_mask_cache():
+    """测试启用模型掩码缓存"""
+    print("🧪 测试启用模型掩码")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    table = RoutingTable(model_list, model_configs, P2LRouter.SAMPLING_WEIGHTS)
+
+    enabled = [model_list[5], model_list[2], "not-a-model"]
+    columns = table.columns(enabled)
+    assert columns.tolist() == [2, 5]  # 与model_list顺序一致，未知模型忽略
+    assert table.mask(enabled).sum() == 2
+
+    # 顺序不同的同一集合命中缓存
+    hits = table.cache_info().hits
+    assert table.columns(list(reversed(enabled))) is columns
+    assert table.cache_info().hits == hits + 1
+
+    # 对手分布只在启用的模型上归一化
+    opponents = table.opponent_distribution(enabled)
+    expected = table.sampling_weights[[2, 5]] / table.sampling_weights[[2, 5]].sum()
+    assert np.allclose(opponents, expected)
+
+    assert table.mask(None).all() and len(table.columns([])) == len(model_list)
+    assert table.opponent_distribution(["not-a-model"]) is None
+    print("✅ 掩码缓存正确")
+
+
+def test_router_reuses_table():
+    """测试路由器对同一份配置只构建一次路由表"""
+    print("🧪 测试路由表复用")
+
+    model_configs = get_all_models()
+    model_list = list(model_configs.keys())
+    router = P2LRouter()
+
+    table = router.get_routing_table(model_list, model_configs)
+    assert router.get_routing_table(list(model_list), model_configs) is table
+    assert get_routing_table(model_list, model_configs, P2LRouter.SAMPLING_WEIGHTS) is table
+
+    coefficients = np.random.default_rng(0).normal(0.5, 0.3, len(model_list))
+    enabled = model_list[:4]
+    rankings = router.generate_model_ranking(coefficients, model_list, model_configs, mode="cost", enabled_models=enabled)
+    assert sorted(r["model"] for r in rankings) == sorted(enabled)
+    assert all(a["score"] >= b["score"] for a, b in zip(rankings, rankings[1:]))
+    assert rankings[0]["config"] is model_configs[rankings[0]["model"]]
+    print("✅ 路由表复用正确")
+
+
+if __name__ == "__main__":
+    test_columns_match_configs()
+    test_mask_cache()
+    test_router_reuses_table()
+    print("\n🎉 路由表测试完成！")
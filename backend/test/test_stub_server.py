@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+测试LLM替身服务
+用UnifiedLLMClient端到端访问本地替身服务，验证OpenAI兼容与Anthropic原生的非流式/流式格式、
+用量统计、按模型配置的首token延迟，以及注入的429携带Retry-After并被客户端重试
+"""
+
+import asyncio
+import copy
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_pool import ConnectionPoolManager
+from helpers import isolated_components
+from rate_limiting import RateLimitRegistry
+from response_cache import ResponseCache
+from stub_server import StubLLMServer, stub_base_urls
+from unified_client import UnifiedLLMClient
+
+OPENAI_MODEL = "deepseek-v3"
+ANTHROPIC_MODEL = "claude-3-5-haiku-20241022"
+
+
+def _make_client(root: str, rate_limits: RateLimitRegistry = None) -> UnifiedLLMClient:
+    client = UnifiedLLMClient(**isolated_components(
+        pool=ConnectionPoolManager(enabled=False),
+        rate_limits=rate_limits or RateLimitRegistry(enabled=False), response_cache=ResponseCache(enabled=False)
+    ))
+    client.config = copy.deepcopy(client.config)
+    client.config["base_urls"].update(stub_base_urls(root))
+    for provider in client.config["api_keys"]:
+        client.config["api_keys"][provider] = "stub"
+    return client
+
+
+async def _collect(client: UnifiedLLMClient, model: str):
+    chunks = [chunk async for chunk in client.stream_response(model, "讲个笑话", max_tokens=50)]
+    return "".join(chunk.delta for chunk in chunks), chunks[-1].response
+
+
+def test_formats_and_usage():
+    """测试两种接口格式的非流式与流式响应、用量统计和首token延迟"""
+    print("🧪 测试替身服务响应格式")
+
+    server = StubLLMServer(
+        profiles={ANTHROPIC_MODEL: {"ttft_median": 0.2, "ttft_sigma": 0.0, "output_tokens": 8, "output_jitter": 0.0}},
+        default_profile={"ttft_median": 0.01, "ttft_sigma": 0.0, "tokens_per_second": 1000, "output_tokens": 20},
+        seed=0
+    )
+
+    async def run():
+        root = await server.start()
+        try:
+            async with _make_client(root) as client:
+                plain = await client.generate_response(OPENAI_MODEL, "你好", max_tokens=5)
+                native = await client.generate_response(ANTHROPIC_MODEL, "你好")
+                streamed_text, streamed = await _collect(client, OPENAI_MODEL)
+                start = time.monotonic()
+                native_text, native_streamed = await _collect(client, ANTHROPIC_MODEL)
+                native_elapsed = time.monotonic() - start
+            return plain, native, streamed_text, streamed, native_text, native_streamed, native_elapsed
+        finally:
+            await server.stop()
+
+    plain, native, streamed_text, streamed, native_text, native_streamed, native_elapsed = asyncio.run(run())
+    assert plain.provider == "deepseek" and len(plain.content.split()) == 5 and plain.output_tokens == 5
+    assert native.provider == "anthropic" and native.output_tokens == 8
+    assert streamed.content == streamed_text and streamed.output_tokens == len(streamed_text.split())
+    assert native_streamed.content == native_text and native_streamed.output_tokens == 8
+    assert native_streamed.ttft >= 0.2 and native_elapsed >= 0.2
+
+    stats = server.stats()
+    assert stats["models"][OPENAI_MODEL]["requests"] == 2 and stats["models"][OPENAI_MODEL]["streamed"] == 1
+    assert stats["models"][ANTHROPIC_MODEL]["completion_tokens"] == 16
+    assert stats["totals"]["prompt_tokens"] > 0 and stats["totals"]["errors"] == 0
+    print(f"✅ 格式与用量正确（Anthropic首token {native_streamed.ttft:.2f}s）")
+
+
+def test_rate_limit_injection():
+    """测试配额用尽返回带Retry-After的429，客户端按Retry-After重试后成功；注入的500计入统计"""
+    print("🧪 测试429与错误注入")
+
+    server = StubLLMServer(
+        profiles={
+            OPENAI_MODEL: {"ttft_median": 0.0, "output_tokens": 3, "requests_per_minute": 1, "retry_after": 0.2},
+            "gpt-4o-mini-2024-07-18": {"ttft_median": 0.0, "error_rate": 1.0}
+        },
+        seed=0, time_scale=0.005  # 60秒的配额窗口缩短为0.3秒
+    )
+    rate_limits = RateLimitRegistry(enabled=True, max_retries=3, backoff_base=0.01)
+
+    async def run():
+        root = await server.start()
+        try:
+            async with _make_client(root, rate_limits) as client:
+                first = await client.generate_response(OPENAI_MODEL, "a")
+                start = time.monotonic()
+                second = await client.generate_response(OPENAI_MODEL, "b")
+                retried_after = time.monotonic() - start
+                failed = await client.generate_response("gpt-4o-mini-2024-07-18", "c")
+            return first, second, retried_after, failed
+        finally:
+            await server.stop()
+
+    first, second, retried_after, failed = asyncio.run(run())
+    assert first.provider == "deepseek" and second.provider == "deepseek"
+    assert retried_after >= 0.2
+    assert failed.provider == "error"
+    stats = server.stats()
+    assert stats["models"][OPENAI_MODEL]["rate_limited"] >= 1 and stats["models"][OPENAI_MODEL]["requests"] == 2
+    assert stats["totals"]["errors"] == 4  # 1次调用 + 3次重试
+    assert rate_limits.get("deepseek").retries >= 1
+    print(f"✅ 429重试成功（等待 {retried_after:.2f}s）")
+
+
+if __name__ == "__main__":
+    test_formats_and_usage()
+    test_rate_limit_injection()
+    print("\n🎉 替身服务测试完成！")
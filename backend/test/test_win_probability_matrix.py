@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+测试GRK胜率张量
+验证广播计算与逐对公式一致、批量与逐行一致、概率归一，
+以及calculate_win_probabilities与张量结果一致
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from p2l_engine import P2LCoefficients, P2LEngine, WIN_PROBABILITY_OUTCOMES
+
+
+def _pairwise_reference(coef_a, coef_b, eta):
+    """逐对GRK公式（向量化前的实现）"""
+    theta = np.exp(eta) + 1.000001
+    pi_a, pi_b = np.exp(coef_a), np.exp(coef_b)
+    p_win = pi_a / (pi_a + theta * pi_b + 1.0)
+    p_lose = pi_b / (pi_b + theta * pi_a + 1.0)
+    p_tie_bb = 1.0 / (1.0 + pi_a + pi_b)
+    return np.array([p_win, p_lose, 1.0 - p_win - p_lose - p_tie_bb, p_tie_bb])
+
+
+def test_matrix_matches_pairwise():
+    """测试 [M, M, 4] 张量与逐对公式一致"""
+    print("🧪 测试胜率张量与逐对公式一致")
+
+    rng = np.random.default_rng(0)
+    coefficients = rng.normal(0.0, 1.0, 40)
+    matrix = P2LEngine.calculate_win_probability_matrix(coefficients, eta=0.3)
+    assert matrix.shape == (40, 40, 4)
+    for i in range(40):
+        for j in range(40):
+            assert np.allclose(matrix[i, j], _pairwise_reference(coefficients[i], coefficients[j], 0.3))
+
+    # 概率归一，且a对b的胜率等于b对a的负率
+    assert np.allclose(matrix.sum(axis=-1), 1.0)
+    assert np.allclose(matrix[..., 0], matrix[..., 1].T)
+
+    # 大系数不溢出
+    extreme = P2LEngine.calculate_win_probability_matrix(np.array([800.0, -800.0, 0.0]))
+    assert np.isfinite(extreme).all() and np.isclose(extreme[0, 1, 0], 1.0)
+    print("✅ 张量与逐对公式一致")
+
+
+def test_batch_and_dict_api():
+    """测试批量 [N, M, M, 4] 与逐行一致，字典接口与张量一致"""
+    print("🧪 测试批量张量与字典接口")
+
+    rng = np.random.default_rng(1)
+    batch = rng.normal(0.0, 1.0, (5, 30))
+    etas = np.linspace(0.0, 1.0, 5)
+    tensor = P2LEngine.calculate_win_probability_matrix(batch, eta=etas)
+    assert tensor.shape == (5, 30, 30, 4)
+    for n in range(5):
+        assert np.allclose(tensor[n], P2LEngine.calculate_win_probability_matrix(batch[n], eta=etas[n]))
+
+    models = [f"model-{i}" for i in range(30)]
+    coefficients = P2LCoefficients(
+        model_coefficients=dict(zip(models, batch[0].tolist())), eta=0.0, model_list=models
+    )
+    engine = P2LEngine.__new__(P2LEngine)  # 不加载模型，只使用计算方法
+    probabilities = engine.calculate_win_probabilities(
+        coefficients, [("model-0", "model-1"), ("model-2", "unknown")]
+    )
+    assert list(probabilities) == [("model-0", "model-1")]
+    expected = _pairwise_reference(batch[0, 0], batch[0, 1], 0.0)
+    assert np.allclose([probabilities[("model-0", "model-1")][name] for name in WIN_PROBABILITY_OUTCOMES], expected)
+    print("✅ 批量张量与字典接口一致")
+
+
+def test_matrix_speed():
+    """测试130个模型的全部模型对不需要逐对循环"""
+    print("🧪 测试胜率张量耗时")
+
+    coefficients = np.random.default_rng(2).normal(0.0, 1.0, 130)
+    start = time.perf_counter()
+    for _ in range(10):
+        P2LEngine.calculate_win_probability_matrix(coefficients)
+    elapsed = (time.perf_counter() - start) / 10
+    assert elapsed < 0.05, elapsed
+    print(f"✅ 130个模型（{130 * 130}个模型对）耗时 {elapsed * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    test_matrix_matches_pairwise()
+    test_batch_and_dict_api()
+    test_matrix_speed()
+    print("\n🎉 胜率张量测试完成！")
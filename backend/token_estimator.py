@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Token估算模块
+不依赖分词器，按字符类别快速估算提示词token数，并给出预期输出长度，
+供延迟SLO路由预测各模型的完成时间
+"""
+
+import math
+import re
+from typing import Dict, List, Optional
+
+# 中日韩字符（含全角标点）：主流分词器中大约每字1个token
+_CJK_PATTERN = re.compile(
+    "[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+# 其他文本（英文、代码等）平均每个token的字符数
+CHARS_PER_TOKEN = 4.0
+CJK_TOKENS_PER_CHAR = 1.0
+
+# 每条对话消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 未指定时的预期输出token数
+DEFAULT_OUTPUT_TOKENS = 400
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的token数
+
+    中日韩字符按每字CJK_TOKENS_PER_CHAR个token，其余字符按每CHARS_PER_TOKEN个字符1个token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + other / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    """估算对话消息列表的token数（含每条消息的格式开销）"""
+    return sum(estimate_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def estimate_output_tokens(
+    expected_output_tokens: Optional[int] = None,
+    max_tokens: Optional[int] = None,
+    default: int = DEFAULT_OUTPUT_TOKENS
+) -> int:
+    """
+    预期输出token数：调用方给定值优先，否则使用默认值，且不超过max_tokens
+
+    Args:
+        expected_output_tokens: 调用方预期的输出长度（可选）
+        max_tokens: 生成长度上限（可选）
+        default: 默认输出长度
+    """
+    tokens = expected_output_tokens if expected_output_tokens is not None else default
+    if max_tokens is not None:
+        tokens = min(tokens, max_tokens)
+    return max(int(tokens), 0)
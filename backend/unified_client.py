@@ -10,16 +10,57 @@ import aiohttp
 import json
 import logging
 import time
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
 from dataclasses import dataclass
 
 try:
     from .config import get_api_config, get_model_config
+    from .request_control import DeadlineExceeded
+    from .latency_telemetry import LatencyTelemetry, get_latency_telemetry
+    from .circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, get_circuit_breakers
+    from .load_tracker import LoadTracker, get_load_tracker
+    from .hedging import HedgingPolicy, get_hedging_policy
+    from .connection_pool import ConnectionPoolManager, get_connection_pool
+    from .rate_limiting import (
+        RateLimitRegistry, get_rate_limits, parse_retry_after,
+        DEFAULT_QUEUE_PRIORITY, HEDGE_QUEUE_PRIORITY_OFFSET
+    )
+    from .token_estimator import estimate_tokens, estimate_message_tokens
+    from .response_cache import ResponseCache, get_response_cache
+    from .llm_cassette import Cassette, get_cassette
+    from .context_budget import ContextBudget, ContextLimitExceeded, PreflightResult, get_context_budget
 except ImportError:
     from config import get_api_config, get_model_config
+    from request_control import DeadlineExceeded
+    from latency_telemetry import LatencyTelemetry, get_latency_telemetry
+    from circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, get_circuit_breakers
+    from load_tracker import LoadTracker, get_load_tracker
+    from hedging import HedgingPolicy, get_hedging_policy
+    from connection_pool import ConnectionPoolManager, get_connection_pool
+    from rate_limiting import (
+        RateLimitRegistry, get_rate_limits, parse_retry_after,
+        DEFAULT_QUEUE_PRIORITY, HEDGE_QUEUE_PRIORITY_OFFSET
+    )
+    from token_estimator import estimate_tokens, estimate_message_tokens
+    from response_cache import ResponseCache, get_response_cache
+    from llm_cassette import Cassette, get_cassette
+    from context_budget import ContextBudget, ContextLimitExceeded, PreflightResult, get_context_budget
 
 logger = logging.getLogger(__name__)
 
+# 计入熔断统计的HTTP状态码：鉴权失败、限流和服务端错误（其余4xx视为请求本身的问题）
+BREAKER_FAILURE_STATUSES = {401, 403, 408, 429}
+
+# 可重试的HTTP状态码：请求超时、限流和临时性服务端错误
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class UpstreamAPIError(Exception):
+    """上游API返回非200状态（retry_after为Retry-After响应头给出的等待秒数）"""
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
 @dataclass
 class LLMResponse:
     content: str
@@ -28,15 +69,67 @@ class LLMResponse:
     cost: float
     response_time: float
     provider: str
+    ttft: Optional[float] = None  # 首token延迟（仅流式调用）
+    output_tokens: Optional[int] = None  # 输出token数（上游返回用量时）
+    hedged: bool = False  # 是否由对冲请求返回（model为实际作答的模型）
+    cached: bool = False  # 是否来自响应缓存（未调用上游，cost为0）
+
+@dataclass
+class LLMStreamChunk:
+    """流式响应片段：delta为增量文本，最后一个片段done=True并携带完整响应"""
+    delta: str
+    done: bool = False
+    response: Optional[LLMResponse] = None
 
 class UnifiedLLMClient:
     """统一的LLM客户端，整合所有API调用功能"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        telemetry: Optional[LatencyTelemetry] = None,
+        breakers: Optional[CircuitBreakerRegistry] = None,
+        load_tracker: Optional[LoadTracker] = None,
+        hedging: Optional[HedgingPolicy] = None,
+        pool: Optional[ConnectionPoolManager] = None,
+        rate_limits: Optional[RateLimitRegistry] = None,
+        response_cache: Optional[ResponseCache] = None,
+        cassette: Optional[Cassette] = None,
+        context_budget: Optional[ContextBudget] = None
+    ):
+        """
+        Args:
+            telemetry: 延迟遥测（可选），默认使用进程级实例，路由器据此估计响应时间
+            breakers: 熔断器注册表（可选），默认使用进程级实例，路由器据此排除熔断中的模型
+            load_tracker: 负载跟踪（可选），默认使用进程级实例，路由器据此估计排队延迟
+            hedging: 对冲策略（可选），默认使用进程级实例，见generate_hedged/stream_hedged
+            pool: 连接池（可选），默认使用进程级实例；启用时请求之间复用连接，
+                  进入/退出上下文不再新建/关闭会话
+            rate_limits: 上游限流（可选），默认使用进程级实例；启用时调用前在提供商队列中排队，
+                         429/5xx按退避重试（可选参数queue_priority指定排队优先级，越小越先）
+            response_cache: 响应缓存（可选），默认使用进程级实例；temperature=0的非流式调用
+                            命中时不调用上游（可选参数use_cache覆盖是否使用缓存）
+            cassette: 流量磁带（可选），默认使用进程级实例；record模式录制上游交互，
+                      replay模式不访问网络，按录制的时间回放
+            context_budget: 上下文预算（可选），默认使用进程级实例；调用前按模型的context_window
+                            与max_tokens裁剪历史、收紧生成长度，放不下的请求抛出ContextLimitExceeded
+        """
         self.session = None
         self.config = get_api_config()
+        self.telemetry = telemetry or get_latency_telemetry()
+        self.breakers = breakers or get_circuit_breakers()
+        self.load_tracker = load_tracker or get_load_tracker()
+        self.hedging = hedging or get_hedging_policy()
+        self.pool = pool or get_connection_pool()
+        self.rate_limits = rate_limits or get_rate_limits()
+        self.response_cache = response_cache or get_response_cache()
+        self.cassette = cassette or get_cassette()
+        self.context_budget = context_budget or get_context_budget()
         
     async def __aenter__(self):
+        if self.pool.enabled:
+            # 共享连接池由应用生命周期管理，这里不新建会话
+            return self
+        
         pool_config = self.config["connection_pool"]
         timeout_config = self.config["timeouts"]
         
@@ -60,11 +153,23 @@ class UnifiedLLMClient:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
+            self.session = None
     
     async def generate_response(self, model: str, prompt: str, **kwargs) -> LLMResponse:
-        """统一的响应生成接口"""
+        """统一的响应生成接口
+        
+        可选参数 deadline (RequestDeadline)：截止时间已过则不发起上游调用，
+        上游请求的超时也会被限制在剩余时间以内。
+        超出模型上下文窗口且无法裁剪的请求抛出ContextLimitExceeded，不返回错误响应。
+        """
         start_time = time.time()
+        deadline = kwargs.get('deadline')
+        if deadline is not None:
+            deadline.check(f"{model} 上游调用")
         
+        provider = None
+        in_flight = False
+        rate_limited = False
         try:
             # 获取模型配置
             model_config = get_model_config(model)
@@ -74,41 +179,69 @@ class UnifiedLLMClient:
             provider = model_config["provider"]
             
             # 处理消息过滤 - 移除空内容消息
-            messages = kwargs.get('messages', [])
-            if messages:
-                filtered_messages = []
-                for msg in messages:
-                    content = msg.get("content", "")
-                    if content and content.strip():  # 只保留非空且非纯空白的消息
-                        filtered_messages.append({
-                            "role": msg["role"],
-                            "content": content.strip()
-                        })
-                kwargs['messages'] = filtered_messages
+            self._filter_messages(kwargs)
+            
+            # 按上下文窗口裁剪历史、收紧生成长度（放不下时直接拒绝，不访问上游）
+            preflight = self._preflight(model, model_config, prompt, kwargs)
+            
+            # 确定性调用命中缓存时直接返回，不占用熔断探测名额和上游配额
+            cache_key = self._cache_key(model, provider, prompt, kwargs)
+            if cache_key is not None:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"💾 响应缓存命中: {model}")
+                    return LLMResponse(
+                        model=model, provider=provider, cost=0.0, cached=True,
+                        response_time=time.time() - start_time, **cached
+                    )
             
-            # 根据提供商调用相应的API
-            if provider == "openai":
-                response = await self._call_openai(model, prompt, **kwargs)
-            elif provider == "anthropic":
-                response = await self._call_anthropic(model, prompt, **kwargs)
-            elif provider == "google":
-                response = await self._call_google(model, prompt, **kwargs)
-            elif provider == "dashscope":
-                response = await self._call_dashscope(model, prompt, **kwargs)
-            elif provider == "deepseek":
-                response = await self._call_deepseek(model, prompt, **kwargs)
-            else:
-                raise ValueError(f"不支持的提供商: {provider}")
+            # 熔断中直接失败，不等待上游超时
+            if not self.breakers.allow(model, provider):
+                provider = None  # 未占用探测名额，无需记录
+                raise CircuitOpenError(f"{model} 熔断中，暂时停止调用")
             
+            self.load_tracker.acquire(model, provider)
+            in_flight = True
+            
+            response = await self._call_with_retries(model, provider, prompt, **kwargs)
+            
+            # 遥测只记录成功那次上游调用的耗时（不含限流排队与重试退避），返回给调用方的是总耗时
+            self.telemetry.record(model, response.response_time, response.ttft, response.output_tokens)
             response.response_time = time.time() - start_time
+            self.breakers.record_success(model, provider)
+            self._observe_input_tokens(provider, preflight, response)
+            if cache_key is not None:
+                self.response_cache.put(cache_key, {
+                    "content": response.content,
+                    "tokens_used": response.tokens_used,
+                    "output_tokens": response.output_tokens
+                })
             logger.info(f"✅ {provider} API调用成功: {model}")
             return response
             
+        except asyncio.CancelledError:
+            # 调用方取消（如对冲中落败）：不计入熔断统计，只归还探测名额
+            if provider is not None:
+                self.breakers.release(model, provider)
+            raise
+        except ContextLimitExceeded:
+            # 请求本身放不下，调用方需要缩短内容（尚未占用探测名额）
+            logger.warning(f"⚠️ {model} 请求超出上下文窗口，未调用上游")
+            raise
         except Exception as e:
+            expired = deadline is not None and deadline.expired
+            rate_limited = self._is_rate_limited(e)
+            if provider is not None:
+                self._record_breaker_failure(model, provider, e, expired)
+            
+            # 截止时间已过：调用方已不再等待结果，直接向上抛出
+            if expired:
+                raise DeadlineExceeded(f"{model} 上游调用超过截止时间") from e
+            
             logger.error(f"❌ LLM API调用失败: {model} - {e}")
             
             # 返回错误响应而不是抛出异常
-            error_message = self._format_error_message(model, str(e))
+            error_message = self.format_error_message(model, str(e))
             return LLMResponse(
                 content=error_message,
                 model=model,
@@ -117,10 +250,583 @@ class UnifiedLLMClient:
                 response_time=time.time() - start_time,
                 provider="error"
             )
+        finally:
+            if in_flight:
+                self.load_tracker.release(model, provider, rate_limited)
+    
+    async def _call_provider(self, model: str, provider: str, prompt: str, **kwargs) -> LLMResponse:
+        """根据提供商调用相应的API"""
+        if provider == "openai":
+            return await self._call_openai(model, prompt, **kwargs)
+        elif provider == "anthropic":
+            return await self._call_anthropic(model, prompt, **kwargs)
+        elif provider == "google":
+            return await self._call_google(model, prompt, **kwargs)
+        elif provider == "dashscope":
+            return await self._call_dashscope(model, prompt, **kwargs)
+        elif provider == "deepseek":
+            return await self._call_deepseek(model, prompt, **kwargs)
+        else:
+            raise ValueError(f"不支持的提供商: {provider}")
+    
+    async def _call_with_retries(self, model: str, provider: str, prompt: str, **kwargs) -> LLMResponse:
+        """在提供商限流队列中排队后调用上游，可重试的错误按退避等待后重试
+        
+        返回的response_time为成功那次上游调用的耗时，从排队放行后开始计时
+        """
+        if not self.rate_limits.enabled:
+            upstream_start = time.time()
+            response = await self._call_provider(model, provider, prompt, **kwargs)
+            response.response_time = time.time() - upstream_start
+            return response
+        
+        limiter = self.rate_limits.get(provider)
+        estimated = self._estimate_request_tokens(model, prompt, kwargs)
+        attempt = 0
+        while True:
+            await self._acquire_rate_limit(limiter, estimated, kwargs)
+            upstream_start = time.time()
+            try:
+                response = await self._call_provider(model, provider, prompt, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt, kwargs.get('deadline'))
+                if delay is None:
+                    raise
+                if self._is_rate_limited(e):
+                    self.load_tracker.record_rate_limit(model, provider)
+                logger.warning(f"🔁 {model} 第{attempt + 1}次重试，等待 {delay:.2f}s: {e}")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            limiter.settle(estimated, response.tokens_used)
+            response.response_time = time.time() - upstream_start
+            return response
+    
+    async def _acquire_rate_limit(self, limiter, estimated: int, kwargs: Dict[str, Any]):
+        """在提供商队列中排队，排队时间不超过请求截止时间"""
+        deadline = kwargs.get('deadline')
+        await limiter.acquire(
+            estimated,
+            priority=kwargs.get('queue_priority', DEFAULT_QUEUE_PRIORITY),
+            timeout=deadline.remaining() if deadline is not None else None
+        )
+    
+    def _retry_delay(self, limiter, error: BaseException, attempt: int, deadline=None) -> Optional[float]:
+        """重试前的等待秒数，不可重试、重试次数用尽或等待会超过截止时间时返回None"""
+        if isinstance(error, UpstreamAPIError):
+            if error.status not in RETRYABLE_STATUSES:
+                return None
+            retry_after = error.retry_after
+        elif isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError)):
+            retry_after = None
+        else:
+            return None
+        
+        delay = self.rate_limits.retry_delay(attempt, retry_after)
+        if delay is None or (deadline is not None and deadline.remaining() <= delay):
+            return None
+        if retry_after is not None:
+            # 整个提供商暂停到Retry-After，避免队列中的其他请求继续触发429
+            limiter.pause(retry_after)
+        limiter.retries += 1
+        return delay
+    
+    def _estimate_request_tokens(self, model: str, prompt: str, kwargs: Dict[str, Any]) -> int:
+        """预计消耗的token数（输入 + 最大输出），用于token数令牌桶"""
+        messages = kwargs.get('messages')
+        input_tokens = estimate_message_tokens(messages) if messages else estimate_tokens(prompt)
+        model_config = get_model_config(model) or {}
+        max_tokens = kwargs.get('max_tokens') or self._default_max_tokens(model_config.get("provider"), model_config)
+        return input_tokens + int(max_tokens)
+    
+    @staticmethod
+    def _default_max_tokens(provider: str, model_config: Dict) -> int:
+        """未指定max_tokens时发给上游的生成长度上限"""
+        if provider in ("openai", "dashscope"):
+            return model_config.get('max_tokens', 2000)
+        return 2000
+    
+    def _preflight(self, model: str, model_config: Dict, prompt: str, kwargs: Dict[str, Any]) -> PreflightResult:
+        """上下文预检（原地修改kwargs中的messages和max_tokens）"""
+        provider = model_config.get("provider")
+        max_tokens = kwargs.get('max_tokens') or self._default_max_tokens(provider, model_config)
+        result = self.context_budget.preflight(model, model_config, prompt, kwargs.get('messages'), max_tokens)
+        if result.messages is not None:
+            kwargs['messages'] = result.messages
+        if result.clamped:
+            kwargs['max_tokens'] = result.max_tokens
+        return result
+    
+    def _observe_input_tokens(self, provider: str, preflight: PreflightResult, response: LLMResponse):
+        """用上游返回的实际输入token数（总用量 - 输出）校准估算"""
+        if response.cached or response.output_tokens is None or not response.tokens_used:
+            return
+        self.context_budget.observe(provider, preflight.raw_input_tokens, int(response.tokens_used) - response.output_tokens)
+    
+    def _cache_key(self, model: str, provider: str, prompt: str, kwargs: Dict[str, Any]) -> Optional[str]:
+        """响应缓存键（不使用缓存时为None），由实际发给上游的请求体计算"""
+        if not self.response_cache.enabled and not kwargs.get('use_cache'):
+            return None
+        _, _, data = self._build_request(model, prompt, **kwargs)
+        if not self.response_cache.should_use(data, kwargs.get('use_cache')):
+            return None
+        return self.response_cache.make_key(provider, data)
+    
+    @staticmethod
+    def _retry_after(resp) -> Optional[float]:
+        """读取上游响应的Retry-After（秒）"""
+        headers = getattr(resp, 'headers', None) or {}
+        return parse_retry_after(headers.get('Retry-After'))
+    
+    @staticmethod
+    def _hedge_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """对冲请求在限流队列中排在原请求之后"""
+        priority = kwargs.get('queue_priority', DEFAULT_QUEUE_PRIORITY) + HEDGE_QUEUE_PRIORITY_OFFSET
+        return {**kwargs, 'queue_priority': priority}
+    
+    async def generate_hedged(self, model: str, prompt: str, hedge_models: Optional[List[str]] = None, **kwargs) -> LLMResponse:
+        """带对冲的响应生成
+        
+        主模型在其实测p90总延迟内未返回时，向hedge_models中第一个模型（P2L排名中的下一个）
+        发送相同请求，采用先成功返回的结果并取消另一个。未启用对冲、没有备选模型
+        或主模型没有实测数据时等同于generate_response。
+        """
+        delay = self._hedge_delay(model, hedge_models, streaming=False)
+        if delay is None:
+            return await self.generate_response(model, prompt, **kwargs)
+        
+        primary = asyncio.create_task(self.generate_response(model, prompt, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedging.try_hedge():
+            return await primary
+        
+        hedge_model = hedge_models[0]
+        logger.info(f"🪁 {model} 超过 {delay:.2f}s 未返回，对冲请求 {hedge_model}")
+        hedge = asyncio.create_task(self.generate_response(hedge_model, prompt, **self._hedge_kwargs(kwargs)))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 优先采用成功的结果；都失败时返回主模型的错误响应
+                for task in (primary, hedge):
+                    if task in done and not task.exception() and task.result().provider != "error":
+                        if task is hedge:
+                            self.hedging.record_win()
+                            task.result().hedged = True
+                        return task.result()
+            return await primary
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def _hedge_delay(self, model: str, hedge_models: Optional[List[str]], streaming: bool) -> Optional[float]:
+        """对冲延迟（不对冲时为None），同时计入对冲比例的请求数"""
+        if not self.hedging.enabled or not hedge_models:
+            return None
+        self.hedging.register_request()
+        return self.hedging.hedge_delay(self.telemetry, model, streaming=streaming)
+    
+    @staticmethod
+    def _is_rate_limited(error: BaseException) -> bool:
+        """上游是否返回了限流（429）"""
+        return isinstance(error, UpstreamAPIError) and error.status == 429
+    
+    def _record_breaker_failure(self, model: str, provider: str, error: BaseException, expired: bool = False):
+        """按错误类型记录熔断统计：超时、连接错误、限流和服务端错误计为失败，其余只归还探测名额
+        
+        本地错误（如缺少API密钥、参数类型错误）与上游健康无关，不计入熔断统计
+        """
+        if expired:
+            # 截止时间由调用方设定，不代表上游故障
+            self.breakers.release(model, provider)
+        elif isinstance(error, asyncio.TimeoutError):
+            self.breakers.record_failure(model, provider, timeout=True)
+        elif isinstance(error, aiohttp.ClientError) or (
+            isinstance(error, UpstreamAPIError) and error.status is not None
+            and (error.status >= 500 or error.status in BREAKER_FAILURE_STATUSES)
+        ):
+            self.breakers.record_failure(model, provider)
+        else:
+            self.breakers.release(model, provider)
+    
+    @staticmethod
+    def _output_tokens(usage: Dict[str, Any]) -> Optional[int]:
+        """从用量中读取输出token数（OpenAI兼容格式为completion_tokens，Anthropic为output_tokens）"""
+        value = usage.get('completion_tokens', usage.get('output_tokens'))
+        return int(value) if value is not None else None
+    
+    @staticmethod
+    def _filter_messages(kwargs: Dict[str, Any]):
+        """移除空内容消息（原地修改kwargs）"""
+        messages = kwargs.get('messages', [])
+        if messages:
+            filtered_messages = []
+            for msg in messages:
+                content = msg.get("content", "")
+                if content and content.strip():  # 只保留非空且非纯空白的消息
+                    filtered_messages.append({
+                        "role": msg["role"],
+                        "content": content.strip()
+                    })
+            kwargs['messages'] = filtered_messages
+    
+    async def stream_response(self, model: str, prompt: str, **kwargs) -> AsyncIterator[LLMStreamChunk]:
+        """流式响应生成接口
+        
+        逐个产出增量文本片段，最后一个片段done=True并携带完整的LLMResponse。
+        与generate_response不同，上游错误直接抛出，由调用方决定如何通知客户端；
+        模型或提供商熔断中时立即抛出CircuitOpenError。
+        """
+        start_time = time.time()
+        deadline = kwargs.get('deadline')
+        if deadline is not None:
+            deadline.check(f"{model} 上游流式调用")
+        
+        model_config = get_model_config(model)
+        if not model_config:
+            raise ValueError(f"不支持的模型: {model}")
+        provider = model_config["provider"]
+        
+        self._filter_messages(kwargs)
+        preflight = self._preflight(model, model_config, prompt, kwargs)
+        limiter = self.rate_limits.get(provider) if self.rate_limits.enabled else None
+        estimated = self._estimate_request_tokens(model, prompt, kwargs)
+        
+        # 占用探测名额之后到try之间不能再有可能抛出异常的步骤，否则名额无法归还
+        if not self.breakers.allow(model, provider):
+            raise CircuitOpenError(f"{model} 熔断中，暂时停止调用")
+        
+        stream = None
+        rate_limited = False
+        self.load_tracker.acquire(model, provider)
+        try:
+            attempt = 0
+            while True:
+                if limiter is not None:
+                    await self._acquire_rate_limit(limiter, estimated, kwargs)
+                # 每次尝试在排队放行后重新计时，首token延迟与遥测不含排队和退避时间
+                stream = self._stream_upstream(model, provider, model_config, prompt, time.time(), **kwargs)
+                started = False
+                try:
+                    async for chunk in stream:
+                        started = True
+                        if chunk.done:
+                            self._observe_input_tokens(provider, preflight, chunk.response)
+                            if limiter is not None:
+                                limiter.settle(estimated, chunk.response.tokens_used)
+                            chunk.response.response_time = time.time() - start_time
+                        yield chunk
+                    break
+                except Exception as e:
+                    # 已向调用方产出内容后不能重试，只重试尚未产出首个片段的失败
+                    delay = None if started or limiter is None else self._retry_delay(limiter, e, attempt, deadline)
+                    if delay is None:
+                        raise
+                    if self._is_rate_limited(e):
+                        self.load_tracker.record_rate_limit(model, provider)
+                    logger.warning(f"🔁 {model} 流式调用第{attempt + 1}次重试，等待 {delay:.2f}s: {e}")
+                    await stream.aclose()
+                    attempt += 1
+                    await asyncio.sleep(delay)
+        except Exception as e:
+            rate_limited = self._is_rate_limited(e)
+            self._record_breaker_failure(model, provider, e, deadline is not None and deadline.expired)
+            raise
+        except BaseException:
+            # 调用方中途关闭流（客户端断开、任务取消）：不计入统计
+            self.breakers.release(model, provider)
+            raise
+        finally:
+            self.load_tracker.release(model, provider, rate_limited)
+            if stream is not None:
+                await stream.aclose()
+    
+    async def stream_hedged(
+        self, model: str, prompt: str, hedge_models: Optional[List[str]] = None, **kwargs
+    ) -> AsyncIterator[LLMStreamChunk]:
+        """带对冲的流式响应
+        
+        主模型在其实测p90首token延迟内没有产出首个片段时，向hedge_models中第一个模型
+        发送相同请求，先产出首个片段的一方胜出，另一方的流立即关闭。
+        最后一个片段的response.model为实际作答的模型。
+        """
+        delay = self._hedge_delay(model, hedge_models, streaming=True)
+        primary = self.stream_response(model, prompt, **kwargs)
+        if delay is None:
+            async for chunk in self._forward_stream(primary):
+                yield chunk
+            return
+        
+        primary_first = asyncio.ensure_future(primary.__anext__())
+        done, _ = await asyncio.wait({primary_first}, timeout=delay)
+        if done or not self.hedging.try_hedge():
+            async for chunk in self._forward_stream(primary, primary_first):
+                yield chunk
+            return
+        
+        hedge_model = hedge_models[0]
+        logger.info(f"🪁 {model} 超过 {delay:.2f}s 未产出首token，对冲请求 {hedge_model}")
+        hedge = self.stream_response(hedge_model, prompt, **self._hedge_kwargs(kwargs))
+        firsts = {primary_first: primary, asyncio.ensure_future(hedge.__anext__()): hedge}
+        pending = set(firsts)
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 优先采用成功产出首个片段的一方（主模型优先）；都失败时抛出主模型的错误
+                for task in sorted(done, key=lambda t: firsts[t] is not primary):
+                    if not task.exception():
+                        winner = task
+                        break
+            if winner is None:
+                primary_first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            for task, stream in firsts.items():
+                if task is not winner:
+                    await stream.aclose()
+        
+        hedged = firsts[winner] is hedge
+        if hedged:
+            self.hedging.record_win()
+        async for chunk in self._forward_stream(firsts[winner], winner):
+            if chunk.done and hedged:
+                chunk.response.hedged = True
+            yield chunk
+    
+    async def stream_multiple(
+        self, models: List[str], prompt: str, **kwargs
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """并发流式调用多个模型，按到达顺序产出 (模型, 片段)
+        
+        总耗时取决于最慢的模型而不是各模型之和。某个模型失败时产出 (模型, 异常)，
+        不影响其他模型；调用方中途关闭时取消所有上游流。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        
+        async def pump(model: str):
+            stream = self.stream_response(model, prompt, **kwargs)
+            try:
+                async for chunk in stream:
+                    queue.put_nowait((model, chunk))
+            except Exception as e:
+                queue.put_nowait((model, e))
+            finally:
+                await stream.aclose()
+                queue.put_nowait((model, finished))
+        
+        tasks = [asyncio.create_task(pump(model)) for model in models]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                model, item = await queue.get()
+                if item is finished:
+                    remaining -= 1
+                    continue
+                yield model, item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    @staticmethod
+    async def _forward_stream(stream, first=None) -> AsyncIterator[LLMStreamChunk]:
+        """转发流式片段（first为已取得首个片段的任务），结束或中途关闭时关闭上游流"""
+        try:
+            if first is not None:
+                yield await first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            if first is not None and not first.done():
+                first.cancel()
+            await stream.aclose()
+    
+    async def _stream_upstream(
+        self, model: str, provider: str, model_config: Dict, prompt: str, start_time: float, **kwargs
+    ) -> AsyncIterator[LLMStreamChunk]:
+        """流式调用上游并解析SSE，见stream_response"""
+        deadline = kwargs.get('deadline')
+        self._filter_messages(kwargs)
+        url, headers, data = self._build_request(model, prompt, stream=True, **kwargs)
+        native_anthropic = provider == "anthropic" and not self._uses_anthropic_proxy(self.config["base_urls"]["anthropic"])
+        
+        parts = []
+        ttft = None
+        input_tokens = 0
+        output_tokens = None
+        total_tokens = None
+        
+        async with self._post(url, headers, data, deadline) as resp:
+            if resp.status != 200:
+                error_text = await resp.text()
+                raise UpstreamAPIError(f"{provider} 流式API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
+            
+            async for event in self._iter_sse_events(resp):
+                delta = ""
+                if native_anthropic:
+                    event_type = event.get("type")
+                    if event_type == "content_block_delta":
+                        delta = event.get("delta", {}).get("text", "")
+                    elif event_type == "message_start":
+                        input_tokens = event.get("message", {}).get("usage", {}).get("input_tokens", 0)
+                    elif event_type == "message_delta":
+                        output_tokens = event.get("usage", {}).get("output_tokens", output_tokens)
+                    elif event_type == "error":
+                        # 流中途的错误事件（如overloaded_error）来自服务端，按5xx计入熔断统计
+                        raise UpstreamAPIError(f"Anthropic流式API错误: {event.get('error')}", status=500)
+                else:
+                    choices = event.get("choices") or []
+                    if choices:
+                        delta = (choices[0].get("delta") or {}).get("content") or ""
+                    if event.get("usage"):
+                        total_tokens = event["usage"].get("total_tokens")
+                        output_tokens = self._output_tokens(event["usage"])
+                
+                if delta:
+                    if ttft is None:
+                        ttft = time.time() - start_time
+                    parts.append(delta)
+                    yield LLMStreamChunk(delta=delta)
+        
+        content = "".join(parts)
+        if native_anthropic:
+            total_tokens = input_tokens + (output_tokens or 0)
+        if not total_tokens:
+            total_tokens = len(content.split()) * 1.3
+        
+        response_time = time.time() - start_time
+        self.telemetry.record(model, response_time, ttft, output_tokens)
+        self.breakers.record_success(model, provider)
+        logger.info(f"✅ {provider} 流式API调用完成: {model}")
+        yield LLMStreamChunk(
+            delta="",
+            done=True,
+            response=LLMResponse(
+                content=content,
+                model=model,
+                tokens_used=int(total_tokens),
+                cost=(total_tokens / 1000) * model_config.get('cost_per_1k', 0.002),
+                response_time=response_time,
+                provider=provider,
+                ttft=ttft,
+                output_tokens=output_tokens
+            )
+        )
+    
+    @staticmethod
+    async def _iter_sse_events(resp) -> AsyncIterator[Dict[str, Any]]:
+        """解析SSE响应中的data行（OpenAI兼容格式与Anthropic原生格式通用）"""
+        async for raw_line in resp.content:
+            line = raw_line.strip()
+            if not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                return
+            try:
+                yield json.loads(payload)
+            except ValueError:
+                logger.warning(f"⚠️ 无法解析的流式数据: {payload[:100]}")
+    
+    @staticmethod
+    def _uses_anthropic_proxy(base_url: str) -> bool:
+        """Anthropic是否通过OpenAI兼容的中转服务调用"""
+        return 'yinli.one' in base_url or 'openai' in base_url.lower()
+    
+    def _build_request(self, model: str, prompt: str, stream: bool = False, **kwargs) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构造上游请求的URL、请求头和请求体"""
+        api_keys = self.config["api_keys"]
+        base_urls = self.config["base_urls"]
+        model_config = get_model_config(model) or {}
+        provider = model_config.get("provider")
+        
+        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
+        temperature = kwargs.get('temperature', 0.7)
+        
+        if provider == "anthropic" and not self._uses_anthropic_proxy(base_urls['anthropic']):
+            # 原生Anthropic Messages API
+            url = f'{base_urls["anthropic"]}/messages'
+            headers = {
+                'x-api-key': api_keys['anthropic'],
+                'Content-Type': 'application/json',
+                'anthropic-version': '2023-06-01'
+            }
+            data = {
+                'model': model,
+                'max_tokens': kwargs.get('max_tokens') or 2000,
+                'temperature': temperature,
+                'messages': messages
+            }
+            if stream:
+                data['stream'] = True
+            return url, headers, data
+        
+        # OpenAI兼容接口
+        if provider == "google":
+            request_model = model_config.get('request_name', model)  # 使用配置中的request_name
+        elif provider == "dashscope":
+            request_model = model if model.startswith('qwen') else 'qwen2.5-72b-instruct'
+        else:
+            request_model = model
+        
+        default_max_tokens = self._default_max_tokens(provider, model_config)
+        
+        url = f'{base_urls[provider]}/chat/completions'
+        headers = {
+            'Authorization': f'Bearer {api_keys[provider]}',
+            'Content-Type': 'application/json'
+        }
+        data = {
+            'model': request_model,
+            'messages': messages,
+            'max_tokens': kwargs.get('max_tokens') or default_max_tokens,
+            'temperature': temperature
+        }
+        if provider == "dashscope":
+            data['stream'] = False
+        if stream:
+            data['stream'] = True
+            data['stream_options'] = {'include_usage': True}  # 最后一个事件携带用量
+        return url, headers, data
+    
+    def _post(self, url: str, headers: Dict[str, str], data: Dict[str, Any], deadline=None):
+        """发送POST请求（启用连接池时使用共享连接），超时不超过请求截止时间的剩余部分
+        
+        磁带为replay模式时从磁带回放，不访问网络；record模式时录制真实响应
+        """
+        timeout = None
+        if deadline is not None:
+            timeout_config = self.config["timeouts"]
+            timeout = aiohttp.ClientTimeout(
+                total=deadline.clamp(timeout_config["total"]),
+                connect=timeout_config["connect"]
+            )
+        
+        if self.cassette.replaying:
+            return self.cassette.replay(url, data, timeout)
+        
+        if self.pool.enabled:
+            request = self.pool.post(url, headers, data, timeout)
+        elif timeout is None:
+            request = self.session.post(url, headers=headers, json=data)
+        else:
+            request = self.session.post(url, headers=headers, json=data, timeout=timeout)
+        if self.cassette.recording:
+            return self.cassette.record(url, data, request)
+        return request
     
-    def _format_error_message(self, model: str, error: str) -> str:
-        """格式化错误消息"""
-        if "timeout" in error.lower():
+    def format_error_message(self, model: str, error: str) -> str:
+        """把上游错误格式化为面向用户的提示（也用于调用方自行处理的流式错误）"""
+        if "熔断中" in error:
+            return f"服务暂时不可用：{model} 近期连续出错，已暂停调用，请稍后重试或选择其他模型"
+        elif "timeout" in error.lower():
             return f"请求超时：{model} 正在处理复杂问题，请稍后重试"
         elif "rate limit" in error.lower():
             return f"API调用频率限制：{model} 请稍后重试"
@@ -133,29 +839,14 @@ class UnifiedLLMClient:
     
     async def _call_openai(self, model: str, prompt: str, **kwargs) -> LLMResponse:
         """调用OpenAI API"""
-        api_keys = self.config["api_keys"]
-        base_urls = self.config["base_urls"]
         model_config = get_model_config(model)
         
-        url = base_urls['openai'] + '/chat/completions'
-        headers = {
-            'Authorization': f'Bearer {api_keys["openai"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
+        url, headers, data = self._build_request(model, prompt, **kwargs)
         
-        data = {
-            'model': model,
-            'messages': messages,
-            'max_tokens': kwargs.get('max_tokens', model_config.get('max_tokens', 2000)),
-            'temperature': kwargs.get('temperature', 0.7)
-        }
-        
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"OpenAI API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"OpenAI API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             result = await resp.json()
             content = result['choices'][0]['message']['content']
@@ -168,44 +859,28 @@ class UnifiedLLMClient:
                 tokens_used=tokens_used,
                 cost=cost,
                 response_time=0,
-                provider='openai'
+                provider='openai',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
     
     async def _call_anthropic(self, model: str, prompt: str, **kwargs) -> LLMResponse:
         """调用Anthropic API（支持中转服务）"""
-        api_keys = self.config["api_keys"]
-        base_urls = self.config["base_urls"]
-        base_url = base_urls['anthropic']
+        base_url = self.config["base_urls"]['anthropic']
         
         # 检查是否使用中转服务
-        if 'yinli.one' in base_url or 'openai' in base_url.lower():
+        if self._uses_anthropic_proxy(base_url):
             return await self._call_anthropic_proxy(model, prompt, base_url, **kwargs)
         else:
             return await self._call_anthropic_native(model, prompt, base_url, **kwargs)
     
     async def _call_anthropic_proxy(self, model: str, prompt: str, base_url: str, **kwargs) -> LLMResponse:
         """调用中转服务的Anthropic API"""
-        api_keys = self.config["api_keys"]
+        url, headers, data = self._build_request(model, prompt, **kwargs)
         
-        url = f'{base_url}/chat/completions'
-        headers = {
-            'Authorization': f'Bearer {api_keys["anthropic"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
-        
-        data = {
-            'model': model,
-            'messages': messages,
-            'max_tokens': kwargs.get('max_tokens', 2000),
-            'temperature': kwargs.get('temperature', 0.7)
-        }
-        
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"Anthropic中转API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"Anthropic中转API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             # 尝试解析JSON，不检查content-type（兼容中转服务）
             try:
@@ -226,33 +901,18 @@ class UnifiedLLMClient:
                 tokens_used=int(tokens_used),
                 cost=cost,
                 response_time=0,
-                provider='anthropic'
+                provider='anthropic',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
     
     async def _call_anthropic_native(self, model: str, prompt: str, base_url: str, **kwargs) -> LLMResponse:
         """调用原生Anthropic API"""
-        api_keys = self.config["api_keys"]
+        url, headers, data = self._build_request(model, prompt, **kwargs)
         
-        url = f'{base_url}/messages'
-        headers = {
-            'x-api-key': api_keys['anthropic'],
-            'Content-Type': 'application/json',
-            'anthropic-version': '2023-06-01'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
-        
-        data = {
-            'model': model,
-            'max_tokens': kwargs.get('max_tokens', 2000),
-            'temperature': kwargs.get('temperature', 0.7),
-            'messages': messages
-        }
-        
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"Anthropic原生API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"Anthropic原生API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             result = await resp.json()
             content = result['content'][0]['text']
@@ -266,37 +926,18 @@ class UnifiedLLMClient:
                 tokens_used=total_tokens,
                 cost=cost,
                 response_time=0,
-                provider='anthropic'
+                provider='anthropic',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
     
     async def _call_google(self, model: str, prompt: str, **kwargs) -> LLMResponse:
         """调用Google Gemini API"""
-        api_keys = self.config["api_keys"]
-        base_urls = self.config["base_urls"]
-        model_config = get_model_config(model)
-        
-        # 使用配置中的request_name
-        request_model = model_config.get('request_name', model)
-        
-        url = f'{base_urls["google"]}/chat/completions'
-        headers = {
-            'Authorization': f'Bearer {api_keys["google"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
-        
-        data = {
-            'model': request_model,
-            'messages': messages,
-            'max_tokens': kwargs.get('max_tokens', 2000),
-            'temperature': kwargs.get('temperature', 0.7)
-        }
+        url, headers, data = self._build_request(model, prompt, **kwargs)
         
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"Google API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"Google API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             # 尝试解析JSON，不检查content-type（兼容中转服务）
             try:
@@ -317,36 +958,21 @@ class UnifiedLLMClient:
                 tokens_used=int(tokens_used),
                 cost=cost,
                 response_time=0,
-                provider='google'
+                provider='google',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
     
     async def _call_dashscope(self, model: str, prompt: str, **kwargs) -> LLMResponse:
         """调用阿里云通义千问API"""
-        api_keys = self.config["api_keys"]
-        base_urls = self.config["base_urls"]
         model_config = get_model_config(model)
         
-        url = f'{base_urls["dashscope"]}/chat/completions'
-        headers = {
-            'Authorization': f'Bearer {api_keys["dashscope"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
-        qwen_model = model if model.startswith('qwen') else 'qwen2.5-72b-instruct'
-        
-        data = {
-            'model': qwen_model,
-            'messages': messages,
-            'max_tokens': kwargs.get('max_tokens', model_config.get('max_tokens', 2000)),
-            'temperature': kwargs.get('temperature', 0.7),
-            'stream': False
-        }
+        url, headers, data = self._build_request(model, prompt, **kwargs)
+        qwen_model = data['model']
         
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"千问API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"千问API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             result = await resp.json()
             content = result['choices'][0]['message']['content']
@@ -359,34 +985,20 @@ class UnifiedLLMClient:
                 tokens_used=int(total_tokens),
                 cost=cost,
                 response_time=0,
-                provider='dashscope'
+                provider='dashscope',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
     
     async def _call_deepseek(self, model: str, prompt: str, **kwargs) -> LLMResponse:
         """调用DeepSeek API"""
-        api_keys = self.config["api_keys"]
-        base_urls = self.config["base_urls"]
         model_config = get_model_config(model)
         
-        url = f'{base_urls["deepseek"]}/chat/completions'
-        headers = {
-            'Authorization': f'Bearer {api_keys["deepseek"]}',
-            'Content-Type': 'application/json'
-        }
-        
-        messages = kwargs.get('messages', [{'role': 'user', 'content': prompt}])
-        
-        data = {
-            'model': model,
-            'messages': messages,
-            'max_tokens': kwargs.get('max_tokens', 2000),
-            'temperature': kwargs.get('temperature', 0.7)
-        }
+        url, headers, data = self._build_request(model, prompt, **kwargs)
         
-        async with self.session.post(url, headers=headers, json=data) as resp:
+        async with self._post(url, headers, data, kwargs.get('deadline')) as resp:
             if resp.status != 200:
                 error_text = await resp.text()
-                raise Exception(f"DeepSeek API错误 {resp.status}: {error_text}")
+                raise UpstreamAPIError(f"DeepSeek API错误 {resp.status}: {error_text}", status=resp.status, retry_after=self._retry_after(resp))
             
             result = await resp.json()
             content = result['choices'][0]['message']['content']
@@ -399,7 +1011,8 @@ class UnifiedLLMClient:
                 tokens_used=tokens_used,
                 cost=cost,
                 response_time=0,
-                provider='deepseek'
+                provider='deepseek',
+                output_tokens=self._output_tokens(result.get('usage', {}))
             )
 
 # 全局客户端实例
@@ -15,6 +15,10 @@ export const useP2LStore = defineStore('p2l', {
     currentAnalysis: null,
     recommendations: [],
     
+    // 全模式分析结果（一次推理返回所有优先模式），以及对应的提示词和启用模型
+    modeAnalyses: null,
+    modeAnalysesKey: null,
+    
     // 聊天历史
     chatHistory: [],
     
@@ -185,6 +189,14 @@ export const useP2LStore = defineStore('p2l', {
           ? this.enabledModels 
           : this.availableModels.map(m => m.name)
         
+        // 同一提示词和启用模型已有全模式结果时，只切换模式不重新推理
+        const analysisKey = JSON.stringify([prompt, enabledModels])
+        if (this.modeAnalysesKey === analysisKey && this.modeAnalyses?.[mode]) {
+          console.log('♻️ [P2L Store] 复用全模式分析结果:', mode)
+          this.applyModeAnalysis(mode)
+          return this.currentAnalysis
+        }
+        
         // 使用竞速请求
         const response = await requestRacer.raceP2LAnalysis(prompt, mode, enabledModels)
         
@@ -195,6 +207,8 @@ export const useP2LStore = defineStore('p2l', {
         
         this.currentAnalysis = response.data
         this.recommendations = response.data.recommendations || []
+        this.modeAnalyses = response.data.modes || null
+        this.modeAnalysesKey = analysisKey
         
         return response.data
       } catch (error) {
@@ -219,14 +233,18 @@ export const useP2LStore = defineStore('p2l', {
       try {
         console.log(`🔄 [P2L Fallback] 传统重试 (${retryCount + 1}/${maxRetries + 1})`)
         
+        const enabledModels = this.enabledModels.length > 0 ? this.enabledModels : this.availableModels.map(m => m.name)
         const response = await p2lApi.post('/p2l/analyze', {
           prompt,
           priority: mode,
-          enabled_models: this.enabledModels.length > 0 ? this.enabledModels : this.availableModels.map(m => m.name)
+          enabled_models: enabledModels,
+          all_modes: true
         })
         
         this.currentAnalysis = response.data
         this.recommendations = response.data.recommendations || []
+        this.modeAnalyses = response.data.modes || null
+        this.modeAnalysesKey = JSON.stringify([prompt, enabledModels])
         
         return response.data
       } catch (error) {
@@ -332,8 +350,8 @@ export const useP2LStore = defineStore('p2l', {
           content: prompt
         })
         
-        // 使用竞速请求
-        const response = await requestRacer.raceLLMGeneration(model, prompt, messages)
+        // 使用竞速请求（P2L排名中的后续模型作为后端对冲目标）
+        const response = await requestRacer.raceLLMGeneration(model, prompt, messages, this.hedgeModelsFor(model))
         
         // 检查后端是否返回了错误状态
         if (response.data.provider === 'error') {
@@ -394,7 +412,8 @@ export const useP2LStore = defineStore('p2l', {
           model,
           prompt,
           messages,
-          max_tokens: 2000
+          max_tokens: 2000,
+          hedge_models: this.hedgeModelsFor(model)
         })
         
         if (response.data.provider === 'error') {
@@ -498,9 +517,37 @@ export const useP2LStore = defineStore('p2l', {
       }
     },
 
-    // 设置优先模式
+    // 设置优先模式（已有全模式结果时立即切换推荐列表）
     setPriorityMode(mode) {
       this.priorityMode = mode
+      if (this.modeAnalyses?.[mode]) {
+        this.applyModeAnalysis(mode)
+      }
+    },
+
+    // 当前推荐列表中排在所选模型之后的模型，后端在所选模型超过p90未返回时对冲到第一个
+    hedgeModelsFor(model) {
+      return this.recommendations.map(r => r.model).filter(m => m !== model).slice(0, 2)
+    },
+
+    // 用全模式结果中的指定模式替换当前分析结果（各模式不含完整排名，以recommendations为准）
+    applyModeAnalysis(mode) {
+      const analysis = this.modeAnalyses[mode]
+      this.currentAnalysis = {
+        ...this.currentAnalysis,
+        model_ranking: null,
+        recommendations: analysis.recommendations,
+        recommended_model: analysis.recommended_model,
+        confidence: analysis.confidence,
+        reasoning: analysis.reasoning,
+        routing_info: analysis.routing_info,
+        recommendation: {
+          model: analysis.recommended_model,
+          score: analysis.confidence,
+          reasoning: analysis.reasoning
+        }
+      }
+      this.recommendations = analysis.recommendations || []
     },
 
     // 设置启用的模型
@@ -566,6 +613,8 @@ export const useP2LStore = defineStore('p2l', {
       this.chatHistory = []
       this.currentAnalysis = null
       this.recommendations = []
+      this.modeAnalyses = null
+      this.modeAnalysesKey = null
     }
   }
 })
\ No newline at end of file
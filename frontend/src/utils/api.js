@@ -34,6 +34,10 @@ const createApiInstance = () => {
   instance.interceptors.request.use(
     (config) => {
       config.metadata = { startTime: new Date() }
+      // 将前端超时作为截止时间传给后端，超时后后端不再继续推理和上游调用
+      if (config.timeout && !config.headers['X-Request-Timeout']) {
+        config.headers['X-Request-Timeout'] = String(Math.floor(config.timeout / 1000))
+      }
       console.log(`📤 API请求: ${config.method?.toUpperCase()} ${config.url}`)
       return config
     },
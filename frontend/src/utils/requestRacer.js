@@ -209,7 +209,8 @@ class RequestRacer {
       data: {
         prompt,
         priority: mode,
-        enabled_models: enabledModels
+        enabled_models: enabledModels,
+        all_modes: true // 一次返回所有优先模式，切换模式时无需重新请求
       }
     }
 
@@ -232,7 +233,8 @@ class RequestRacer {
         ...baseRequest,
         data: {
           prompt,
-          priority: mode
+          priority: mode,
+          all_modes: true
         }
       }
     ]
@@ -249,7 +251,7 @@ class RequestRacer {
   /**
    * LLM生成竞速请求 - 优化版本
    */
-  async raceLLMGeneration(model, prompt, messages = []) {
+  async raceLLMGeneration(model, prompt, messages = [], hedgeModels = []) {
     const baseRequest = {
       method: 'post',
       url: '/llm/generate',
@@ -258,7 +260,8 @@ class RequestRacer {
         prompt,
         messages,
         temperature: 0.7,
-        max_tokens: 2000
+        max_tokens: 2000,
+        hedge_models: hedgeModels // 后端对冲目标，取P2L排名中的后续模型
       }
     }
 
@@ -4,6 +4,7 @@ from abc import ABC, abstractmethod
 import openai
 from openai import OpenAI
 import anthropic
+import httpx
 from route.utils import get_registry_decorator
 import time
 from route.datatypes import (
@@ -66,6 +67,21 @@ CHAT_HANDLERS: Dict[str, BaseChatHandler] = {}
 
 register = get_registry_decorator(CHAT_HANDLERS)
 
+# Optional httpx.Client shared by the OpenAI and Anthropic SDK clients, e.g. one
+# wrapping a record/replay transport. None keeps the SDK defaults.
+HTTP_CLIENT: httpx.Client | None = None
+
+
+def set_http_client(http_client: httpx.Client | None) -> None:
+
+    global HTTP_CLIENT
+    HTTP_CLIENT = http_client
+
+
+def _http_client_kwargs() -> Dict:
+
+    return {"http_client": HTTP_CLIENT} if HTTP_CLIENT is not None else {}
+
 
 @register("openai")
 class OpenAIChatHandler(BaseChatHandler):
@@ -81,11 +97,12 @@ class OpenAIChatHandler(BaseChatHandler):
             client = openai.OpenAI(
                 base_url=base_url,
                 api_key=api_key,
+                **_http_client_kwargs(),
             )
 
         else:
 
-            client = openai.OpenAI()
+            client = openai.OpenAI(**_http_client_kwargs())
 
         return client
 
@@ -355,7 +372,9 @@ class AnthropicChatHandler(BaseChatHandler):
 
     @staticmethod
     def _create_client(model_config: ModelConfig):
-        client = anthropic.Anthropic(api_key=model_config.get_api_key())
+        client = anthropic.Anthropic(
+            api_key=model_config.get_api_key(), **_http_client_kwargs()
+        )
         return client
 
     @staticmethod
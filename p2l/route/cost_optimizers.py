@@ -1,15 +1,208 @@
 from abc import ABC, abstractmethod
 from route.utils import get_registry_decorator
 from typing import List, Dict
+import importlib.util
 import numpy as np
-import cvxpy as cp
 from scipy.special import expit
 
+# cvxpy is only needed as a fallback for the closed-form LP solver, so it is imported lazily.
+CVXPY_AVAILABLE = importlib.util.find_spec("cvxpy") is not None
+
 
 class UnfulfillableException(Exception):
     pass
 
 
+def solve_budget_lp(
+    costs: np.ndarray[float], values: np.ndarray[float], budget: float
+) -> np.ndarray[float]:
+    """
+    Exact solution of max values @ p s.t. costs @ p <= budget, sum(p) == 1, p >= 0.
+
+    The optimum is the upper concave envelope of the (cost, value) points evaluated at
+    the budget, so it mixes at most two adjacent vertices of the upper convex hull.
+    Runs in O(M log M).
+    """
+
+    costs = np.asarray(costs, dtype=float)
+    values = np.asarray(values, dtype=float)
+
+    if not (np.all(np.isfinite(costs)) and np.all(np.isfinite(values))):
+        raise ValueError("Costs and values must be finite.")
+
+    # Cost ascending, ties broken by value descending.
+    order = np.lexsort((-values, costs))
+
+    if costs[order[0]] > budget:
+        raise UnfulfillableException(
+            f"Cost of {budget} impossible to fulfill, cheapest model costs {costs[order[0]]}."
+        )
+
+    # Upper hull over the non-dominated points (strictly increasing cost and value).
+    hull: List[int] = []
+    best_value = -np.inf
+
+    for idx in order:
+
+        if values[idx] <= best_value:
+            continue
+
+        best_value = values[idx]
+
+        while len(hull) >= 2:
+
+            a, b = hull[-2], hull[-1]
+
+            # Drop b if it lies on or below the segment a -> idx.
+            if (values[b] - values[a]) * (costs[idx] - costs[a]) <= (
+                values[idx] - values[a]
+            ) * (costs[b] - costs[a]):
+                hull.pop()
+
+            else:
+                break
+
+        hull.append(int(idx))
+
+    ps = np.zeros(len(costs))
+
+    # Last hull vertex within budget.
+    k = int(np.searchsorted(costs[hull], budget, side="right")) - 1
+
+    if k == len(hull) - 1:
+        ps[hull[k]] = 1.0
+        return ps
+
+    i, j = hull[k], hull[k + 1]
+    weight = (budget - costs[i]) / (costs[j] - costs[i])
+
+    ps[i] = 1.0 - weight
+    ps[j] = weight
+
+    return ps
+
+
+def solve_budget_lp_cvxpy(
+    costs: np.ndarray[float], values: np.ndarray[float], budget: float
+) -> np.ndarray[float]:
+
+    import cvxpy as cp
+
+    p = cp.Variable(len(costs))
+
+    prob = cp.Problem(
+        cp.Maximize(values @ p), [costs.T @ p <= budget, cp.sum(p) == 1, p >= 0]
+    )
+
+    prob.solve()
+
+    if prob.status in (cp.INFEASIBLE, cp.INFEASIBLE_INACCURATE) or p.value is None:
+        raise UnfulfillableException(
+            f"Cost of {budget} impossible to fulfill with costs {costs}."
+        )
+
+    ps = np.clip(p.value, a_min=0.0, a_max=1.0)
+
+    return ps / ps.sum()
+
+
+def solve_budget_lp_batch(
+    costs: np.ndarray[float],
+    values: np.ndarray[float],
+    budgets: float | np.ndarray[float] | None,
+    chunk_size: int | None = None,
+) -> np.ndarray[float]:
+    """
+    Row-wise solve_budget_lp for an [N, M] value matrix in pure numpy.
+
+    The optimum is either the best affordable single model or a budget-tight mix of a
+    pair (i, j) with c_i <= B < c_j, so all pairs are scored as an [n, M, M] tensor per
+    chunk of rows. NaN budgets are unconstrained. Rows that cannot be fulfilled are all zeros.
+    """
+
+    costs = np.asarray(costs, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_rows, n_models = values.shape
+
+    if budgets is None:
+        budgets = np.nan
+
+    budgets = np.broadcast_to(np.asarray(budgets, dtype=float), (n_rows,))
+    probs = np.zeros((n_rows, n_models))
+
+    unconstrained = np.isnan(budgets) | (budgets >= costs.max())
+    free_rows = np.flatnonzero(unconstrained)
+    probs[free_rows, values[free_rows].argmax(axis=1)] = 1.0
+
+    constrained = np.flatnonzero(~unconstrained)
+
+    if len(constrained) == 0:
+        return probs
+
+    if chunk_size is None:
+        chunk_size = max(1, (1 << 22) // (n_models * n_models))
+
+    dc = costs[None, :] - costs[:, None]
+    inv_dc = np.divide(1.0, dc, out=np.zeros_like(dc), where=dc > 0)
+    diag = np.arange(n_models)
+
+    for start in range(0, len(constrained), chunk_size):
+
+        rows = constrained[start : start + chunk_size]
+        v = values[rows]
+        b = budgets[rows]
+        n = len(rows)
+
+        affordable = costs[None, :] <= b[:, None]
+        weight = (b[:, None, None] - costs[None, :, None]) * inv_dc[None]
+        objective = v[:, :, None] + weight * (v[:, None, :] - v[:, :, None])
+        valid = affordable[:, :, None] & ~affordable[:, None, :]
+        objective = np.where(valid, objective, -np.inf)
+        objective[:, diag, diag] = np.where(affordable, v, -np.inf)
+
+        flat = objective.reshape(n, -1).argmax(axis=1)
+        feasible = np.isfinite(objective.reshape(n, -1)[np.arange(n), flat])
+        i, j = np.divmod(flat, n_models)
+        w = np.where(i == j, 0.0, weight[np.arange(n), i, j])
+
+        rows, i, j, w = rows[feasible], i[feasible], j[feasible], w[feasible]
+        probs[rows, i] += 1.0 - w
+        probs[rows, j] += w
+
+    return probs
+
+
+def sample_from_probabilities(
+    probs: np.ndarray[float], rng: np.random.Generator | None = None
+) -> np.ndarray[int]:
+    """Sample one column index per row; rows of all zeros give -1."""
+
+    rng = rng or np.random.default_rng()
+
+    u = rng.random(len(probs))[:, None]
+    indices = np.minimum((np.cumsum(probs, axis=1) < u).sum(axis=1), probs.shape[1] - 1)
+
+    return np.where(probs.sum(axis=1) > 0, indices, -1)
+
+
+def _solve_lp(
+    costs: np.ndarray[float], values: np.ndarray[float], budget: float
+) -> np.ndarray[float]:
+
+    try:
+        return solve_budget_lp(costs, values, budget)
+
+    except UnfulfillableException:
+        raise
+
+    except Exception:
+
+        if not CVXPY_AVAILABLE:
+            raise
+
+        return solve_budget_lp_cvxpy(costs, values, budget)
+
+
 class BaseCostOptimizer(ABC):
     def __init__(self):
         super().__init__()
@@ -34,6 +227,17 @@ class BaseCostOptimizer(ABC):
 
         return model_list[max_idx]
 
+    @staticmethod
+    @abstractmethod
+    def select_model_probabilities_batch(
+        cost: float | np.ndarray[float] | None,
+        model_costs: np.ndarray[float],
+        model_scores: np.ndarray[float],
+        **kwargs,
+    ) -> np.ndarray[float]:
+        """[N, M] scores -> [N, M] selection probabilities, all-zero rows are unfulfillable."""
+        pass
+
 
 COST_OPTIMIZERS: Dict[str, BaseCostOptimizer] = {}
 
@@ -79,6 +283,29 @@ class StrictCostOptimizer(BaseCostOptimizer):
 
         return best_model
 
+    @staticmethod
+    def select_model_probabilities_batch(
+        cost: float | np.ndarray[float] | None,
+        model_costs: np.ndarray[float],
+        model_scores: np.ndarray[float],
+        **kwargs,
+    ) -> np.ndarray[float]:
+
+        n_rows = model_scores.shape[0]
+
+        budgets = np.broadcast_to(
+            np.asarray(np.nan if cost is None else cost, dtype=float), (n_rows,)
+        )
+
+        affordable = np.isnan(budgets)[:, None] | (model_costs[None, :] <= budgets[:, None])
+        masked = np.where(affordable, model_scores, -np.inf)
+        feasible = np.flatnonzero(affordable.any(axis=1))
+
+        probs = np.zeros(model_scores.shape)
+        probs[feasible, masked[feasible].argmax(axis=1)] = 1.0
+
+        return probs
+
 
 @register("simple-lp")
 class SimpleLPCostOptimizer(BaseCostOptimizer):
@@ -98,24 +325,19 @@ class SimpleLPCostOptimizer(BaseCostOptimizer):
         if cost == None:
             return StrictCostOptimizer.select_max_score_model(model_list, model_scores)
 
-        p = cp.Variable(len(model_costs))
-
-        prob = cp.Problem(
-            cp.Maximize(cp.sum(model_scores @ p)),
-            [model_costs.T @ p <= cost, cp.sum(p) == 1, p >= 0],
-        )
-
-        status = prob.solve()
+        ps = _solve_lp(model_costs, model_scores, cost)
 
-        if status < 0.0:
-            raise UnfulfillableException(
-                f"Cost of {cost} impossible to fulfill with available models {model_list} with costs {model_costs}."
-            )
+        return np.random.choice(model_list, p=ps)
 
-        ps = np.clip(p.value, a_min=0.0, a_max=1.0)
-        ps = ps / ps.sum()
+    @staticmethod
+    def select_model_probabilities_batch(
+        cost: float | np.ndarray[float] | None,
+        model_costs: np.ndarray[float],
+        model_scores: np.ndarray[float],
+        **kwargs,
+    ) -> np.ndarray[float]:
 
-        return np.random.choice(model_list, p=ps)
+        return solve_budget_lp_batch(model_costs, model_scores, cost)
 
 
 @register("optimal-lp")
@@ -141,23 +363,34 @@ class OptimalLPCostOptimizer(BaseCostOptimizer):
 
         Wq = W @ opponent_distribution
 
-        p = cp.Variable(len(model_costs))
+        ps = _solve_lp(model_costs, Wq, cost)
 
-        prob = cp.Problem(
-            cp.Maximize(p @ Wq), [model_costs.T @ p <= cost, cp.sum(p) == 1, p >= 0]
-        )
+        return np.random.choice(model_list, p=ps)
 
-        status = prob.solve()
+    @staticmethod
+    def select_model_probabilities_batch(
+        cost: float | np.ndarray[float] | None,
+        model_costs: np.ndarray[float],
+        model_scores: np.ndarray[float],
+        opponent_scores: np.ndarray[float] = None,
+        opponent_distribution: np.ndarray[float] = None,
+        **kwargs,
+    ) -> np.ndarray[float]:
 
-        if status < 0.0:
-            raise UnfulfillableException(
-                f"Cost of {cost} impossible to fulfill with available models {model_list} with costs {model_costs}."
-            )
+        # Wq[n, i] = sum_j expit(s[n, i] - o[n, j]) * q[j], one row at a time in memory per chunk.
+        n_rows = model_scores.shape[0]
+        chunk_size = max(1, (1 << 22) // (model_scores.shape[1] * opponent_scores.shape[1]))
 
-        ps = np.clip(p.value, a_min=0.0, a_max=1.0)
-        ps = ps / ps.sum()
+        Wq = np.empty(model_scores.shape)
 
-        return np.random.choice(model_list, p=ps)
+        for start in range(0, n_rows, chunk_size):
+
+            rows = slice(start, start + chunk_size)
+
+            diff = model_scores[rows, :, None] - opponent_scores[rows, None, :]
+            Wq[rows] = expit(diff) @ opponent_distribution
+
+        return solve_budget_lp_batch(model_costs, Wq, cost)
 
     @staticmethod
     def _construct_W(
@@ -6,7 +6,11 @@ from route.utils import (
     get_p2l_endpoint_models,
 )
 from route.datatypes import ModelConfigContainer, Roles, ChatMessage, RouterOutput
-from route.cost_optimizers import COST_OPTIMIZERS, BaseCostOptimizer
+from route.cost_optimizers import (
+    COST_OPTIMIZERS,
+    BaseCostOptimizer,
+    sample_from_probabilities,
+)
 import numpy as np
 from scipy.special import expit
 
@@ -84,6 +88,38 @@ class BaseRouter(ABC):
             model_scores=model_scores_dict,
         )
 
+    def _get_batch_scores(
+        self, coefs: np.ndarray[float]
+    ) -> Tuple[np.ndarray[float], Dict]:
+        """Map an [N, K] matrix of raw router outputs to [N, M] choice scores and optimizer kwargs."""
+
+        return coefs, {}
+
+    def route_batch(
+        self,
+        coefs: np.ndarray[float],
+        cost: float | np.ndarray[float] | None = None,
+        rng: np.random.Generator | None = None,
+    ) -> Tuple[List[str | None], np.ndarray[float]]:
+        """
+        Route N logged prompts at once from their [N, K] router outputs.
+
+        cost may be a scalar or a per-row array (NaN for no budget). Returns the chosen
+        model names (None where the budget is unfulfillable) and the [N, M] mixed strategies.
+        """
+
+        model_scores, optimizer_kwargs = self._get_batch_scores(np.asarray(coefs, dtype=float))
+
+        probs = self.cost_optimizer.select_model_probabilities_batch(
+            cost, self.model_costs, model_scores, **optimizer_kwargs
+        )
+
+        indices = sample_from_probabilities(probs, rng)
+
+        model_names = np.asarray(self.model_list + [None], dtype=object)
+
+        return model_names[indices].tolist(), probs
+
 
 ROUTERS: Dict[str, BaseRouter] = {}
 
@@ -241,6 +277,15 @@ class EndpointP2LRouter(BaseRouter):
             model_scores=model_scores_dict,
         )
 
+    def _get_batch_scores(
+        self, coefs: np.ndarray[float]
+    ) -> Tuple[np.ndarray[float], Dict]:
+
+        return coefs[:, self.mask], {
+            "opponent_scores": coefs[:, self.q_mask],
+            "opponent_distribution": self.q,
+        }
+
 
 @register("bag-endpoint")
 @register("grk-endpoint")
@@ -290,3 +335,9 @@ class EndpointP2LRouter(BaseRouter):
         model_scores: np.ndarray[float] = expit(coefs)
 
         return model_scores[self.mask]
+
+    def _get_batch_scores(
+        self, coefs: np.ndarray[float]
+    ) -> Tuple[np.ndarray[float], Dict]:
+
+        return expit(coefs)[:, self.mask], {}